@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+
+# Part of every cache key; bump it when a change to the analyzers changes
+# what they report or the state they checkpoint, so entries written by
+# older code stop matching.
+ANALYSIS_VERSION = 2
+
+ENTRY = 'entry.json'
+CHECKPOINT = 'checkpoint.pkl'
+
+# status is 'hit' (entry holds the finished report), 'tail' (entry analyzed
+# a prefix of the capture and can be resumed) or 'miss'. key names the
+# entry the capture as it is now will be stored under.
+Lookup = namedtuple('Lookup', ['status', 'entry', 'key', 'sha256', 'size'])
+
+def config_key(config):
+    """Short hash of everything besides the capture that shapes a report."""
+    text = json.dumps(dict(config, version=ANALYSIS_VERSION), sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+def hash_capture(path, offsets=(), chunk_size=1 << 20):
+    """SHA-256 of a file and of its first n bytes for each n in offsets, in one pass.
+
+    Returns (size, hex digest, {n: hex digest}); offsets past the end are left out.
+    """
+    wanted = sorted(set(offsets))
+    prefixes = {}
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            while wanted and wanted[0] <= size:
+                if wanted.pop(0) == size:
+                    prefixes[size] = hasher.hexdigest()
+            # Reads stop exactly at the next wanted offset
+            chunk = f.read(min(chunk_size, wanted[0] - size) if wanted else chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            size += len(chunk)
+    return size, hasher.hexdigest(), prefixes
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _dirs, files in os.walk(path) for name in files)
+
+class AnalysisCache:
+    """Finished analyses on disk, keyed by capture content and analysis config.
+
+    Each entry is a directory named <config key>-<capture sha256> with the
+    report, entry.json and checkpoint.pkl: the analysis state just before
+    its final flush, plus the record offset reading stopped at. A capture
+    that has only grown since (one still being written) matches the entry
+    of its longest cached prefix, and the analysis resumes from there.
+    Entries are deleted least recently used first once they take more than
+    max_bytes.
+    """
+
+    def __init__(self, cache_dir='output/analysis_cache', max_bytes=1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.tails = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entries(self):
+        for name in os.listdir(self.cache_dir):
+            try:
+                with open(os.path.join(self.cache_dir, name, ENTRY)) as f:
+                    yield name, json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def _touch(self, name):
+        path = os.path.join(self.cache_dir, name, ENTRY)
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+
+    def lookup(self, capture_path, config):
+        prefix = config_key(config)
+        resumable = {name: entry['resume'] for name, entry in self._entries()
+                     if entry['config_key'] == prefix and entry.get('resume')}
+        size, digest, prefixes = hash_capture(capture_path, [r['offset'] for r in resumable.values()])
+        key = f'{prefix}-{digest}'
+        if os.path.exists(os.path.join(self.cache_dir, key, ENTRY)):
+            self.hits += 1
+            self._touch(key)
+            return Lookup('hit', os.path.join(self.cache_dir, key), key, digest, size)
+        matches = [(r['offset'], name) for name, r in resumable.items() if prefixes.get(r['offset']) == r['sha256']]
+        if matches:
+            _offset, name = max(matches)
+            self.tails += 1
+            self._touch(name)
+            return Lookup('tail', os.path.join(self.cache_dir, name), key, digest, size)
+        self.misses += 1
+        return Lookup('miss', None, key, digest, size)
+
+    def begin(self):
+        """A staging directory to write a new entry's files into."""
+        return tempfile.mkdtemp(prefix='.staging-', dir=self.cache_dir)
+
+    def commit(self, lookup, staging, config, report, capture_path, checkpoint=None):
+        """Turn a staging directory holding report into the entry for lookup.key.
+
+        checkpoint is the resumable analysis state; its 'offset' must be a
+        record boundary of the capture. Returns the entry directory.
+        """
+        entry = {'config_key': lookup.key.split('-')[0], 'config': config, 'report': report,
+                 'capture': {'name': os.path.basename(capture_path), 'size': lookup.size, 'sha256': lookup.sha256},
+                 'created': time.time(), 'resume': None}
+        if checkpoint is not None:
+            offset = checkpoint['offset']
+            if offset == lookup.size:
+                sha256 = lookup.sha256
+            else:
+                # A trailing partial record, or the capture grew during the analysis
+                sha256 = hash_capture(capture_path, [offset])[2].get(offset)
+            if sha256 is not None:
+                with open(os.path.join(staging, CHECKPOINT), 'wb') as f:
+                    pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+                entry['resume'] = {'offset': offset, 'sha256': sha256}
+        with open(os.path.join(staging, ENTRY), 'w') as f:
+            json.dump(entry, f, indent=2, default=str)
+        final = os.path.join(self.cache_dir, lookup.key)
+        shutil.rmtree(final, ignore_errors=True)
+        os.rename(staging, final)
+        self._evict(keep=lookup.key)
+        return final
+
+    def discard(self, staging):
+        shutil.rmtree(staging, ignore_errors=True)
+
+    def report_path(self, entry_dir):
+        with open(os.path.join(entry_dir, ENTRY)) as f:
+            return os.path.join(entry_dir, json.load(f)['report'])
+
+    def load_checkpoint(self, entry_dir):
+        with open(os.path.join(entry_dir, CHECKPOINT), 'rb') as f:
+            return pickle.load(f)
+
+    def _evict(self, keep=None):
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            # Left behind by analyses that were killed
+            if name.startswith('.staging-') and os.path.getmtime(path) < time.time() - 86400:
+                shutil.rmtree(path, ignore_errors=True)
+        entries = []
+        total = 0
+        for name, _entry in self._entries():
+            path = os.path.join(self.cache_dir, name)
+            size = _dir_size(path)
+            entries.append((os.path.getmtime(os.path.join(path, ENTRY)), name, size))
+            total += size
+        for _mtime, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'tails': self.tails}
@@ -0,0 +1,121 @@
+import fnmatch
+import glob
+import json
+import os
+from analyzer.histogram import merge_histograms
+
+# Rotated captures (tcpdump -C/-G) get a counter appended to the name
+CAPTURE_PATTERNS = ('*.pcap', '*.pcapng', '*.cap', '*.pcap[0-9]*', '*.pcapng[0-9]*')
+
+def _is_capture(name):
+    return any(fnmatch.fnmatch(name, pattern) for pattern in CAPTURE_PATTERNS)
+
+def find_captures(paths):
+    """Absolute paths of the captures named by paths, largest first.
+
+    paths are files, directories (searched recursively for names matching
+    CAPTURE_PATTERNS) or glob patterns. Largest first, so that the longest
+    analyses start early rather than finishing last.
+    """
+    found = set()
+    for path in paths:
+        matches = glob.glob(path, recursive=True) if any(c in path for c in '*?[') else [path]
+        if not matches:
+            raise FileNotFoundError(f"No capture matches {path}")
+        for match in matches:
+            if os.path.isdir(match):
+                for root, _dirs, files in os.walk(match):
+                    found.update(os.path.join(root, name) for name in files if _is_capture(name))
+            elif os.path.isfile(match):
+                found.add(match)
+            else:
+                raise FileNotFoundError(f"No such capture: {match}")
+    return sorted({os.path.abspath(p) for p in found}, key=lambda p: (-os.path.getsize(p), p))
+
+def report_names(captures):
+    """Per capture, its path below the directory all captures share: unique where base names are not."""
+    root = os.path.commonpath([os.path.dirname(c) for c in captures])
+    return {capture: os.path.relpath(capture, root) for capture in captures}
+
+class BatchState:
+    """Outcome of every capture of a batch, kept in a JSON file as they finish.
+
+    A capture counts as done while it has the size and mtime it was
+    analyzed at, its report is still there and the analysis config is the
+    same, so running a batch again after a crash only analyzes the rest.
+    Failed captures are retried.
+    """
+
+    def __init__(self, path, config_key):
+        self.path = path
+        self.config_key = config_key
+        self.files = {}
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            if state['config_key'] == config_key:
+                self.files = state['files']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def done(self, capture):
+        entry = self.files.get(capture)
+        if entry is None or 'error' in entry:
+            return False
+        stat = os.stat(capture)
+        return (entry['size'], entry['mtime_ns']) == (stat.st_size, stat.st_mtime_ns) and os.path.exists(entry['report'])
+
+    def record(self, capture, entry, stat):
+        """Store a capture's outcome; stat is the capture's os.stat() from before it was analyzed."""
+        self.files[capture] = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'config_key': self.config_key, 'files': self.files}, f, indent=2)
+        os.replace(self.path + '.tmp', self.path)
+
+def capture_summary(report):
+    """What a batch summary needs of one report (a ReportReader or a report dict)."""
+    issue_summary = report.get('issue_summary') or {}
+    llm = report.get('llm') or {}
+    return {
+        'packets': report.get('total_packets', 0),
+        'issues': issue_summary.get('total', 0),
+        'issues_by_type': {t: entry['count'] for t, entry in issue_summary.get('by_type', {}).items()},
+        'session_latency': report.get('session_latency'),
+        'order_latency': (report.get('order_latency') or {}).get('latency'),
+        'llm_calls': llm.get('llm_calls', 0),
+        'llm_failures': llm.get('llm_failures', 0),
+    }
+
+def _latency(histograms):
+    merged = merge_histograms(h for h in histograms if h)
+    return merged.summary() if merged is not None else None
+
+def combine_summaries(captures, files):
+    """Per-capture rows and merged totals of a batch; files maps captures to capture_summary() entries.
+
+    Latency percentiles are in nanoseconds; the merged ones come from the
+    merged histograms, not from averaging per-capture percentiles.
+    """
+    rows = []
+    failed = []
+    merged = {'packets': 0, 'issues': 0, 'issues_by_type': {}, 'llm_calls': 0, 'llm_failures': 0}
+    for capture in captures:
+        entry = files.get(capture)
+        if entry is None:
+            continue
+        if 'error' in entry:
+            failed.append({'capture': capture, 'error': entry['error']})
+            continue
+        rows.append(dict({key: entry[key] for key in ('packets', 'issues', 'issues_by_type', 'llm_calls',
+                                                       'llm_failures', 'report', 'seconds')},
+                         capture=capture, session_latency=_latency([entry['session_latency']]),
+                         order_latency=_latency([entry['order_latency']])))
+        for key in ('packets', 'issues', 'llm_calls', 'llm_failures'):
+            merged[key] += entry[key]
+        for issue_type, count in entry['issues_by_type'].items():
+            merged['issues_by_type'][issue_type] = merged['issues_by_type'].get(issue_type, 0) + count
+    done = [files[row['capture']] for row in rows]
+    merged['session_latency'] = _latency(entry['session_latency'] for entry in done)
+    merged['order_latency'] = _latency(entry['order_latency'] for entry in done)
+    return {'captures': len(captures), 'done': len(rows), 'failed': failed, 'files': rows, 'merged': merged}
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from analyzer.packet_table import (FLOW_KEY_COLUMNS, NO_TIMESTAMP, PACKET_DTYPE, _PROTOCOL_NUMBERS, PacketTable,
+                                   _pack_ip_str, split_ip)
+from analyzer.pcap_reader import (close_capture, decode_headers, decode_packet, iter_records, open_capture,
+                                  pcapng_contexts)
+
+INDEX_DIR = 'output/indexes'
+FORMAT_VERSION = 1
+# Packets per block: lookups decode whole blocks, the index stores one entry per block
+BLOCK_PACKETS = 256
+
+BLOCK_DTYPE = np.dtype([('offset', '<u8'), ('min_ts', '<i8'), ('max_ts', '<i8')])
+FLOW_DTYPE = np.dtype([(c, PACKET_DTYPE[c]) for c in FLOW_KEY_COLUMNS] +
+                      [('packets', '<u8'), ('first_ts', '<i8'), ('last_ts', '<i8'), ('blocks_start', '<u8')])
+_MAX_TIMESTAMP = np.iinfo(np.int64).max
+
+def index_path(pcap_file, index_dir=INDEX_DIR):
+    """Where the index of a capture goes; the hash of its full path tells same-named captures apart."""
+    digest = hashlib.sha256(os.path.abspath(pcap_file).encode()).hexdigest()[:8]
+    return os.path.join(index_dir, f'{os.path.basename(pcap_file)}.{digest}.index')
+
+def _capture_stat(pcap_file):
+    stat = os.stat(pcap_file)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def _raw_key(flow):
+    # (src_ip, src_port, dst_ip, dst_port) strings/ints -> the integer key of FLOW_KEY_COLUMNS
+    src_ip, src_port, dst_ip, dst_port = flow
+    return split_ip(_pack_ip_str(src_ip)) + split_ip(_pack_ip_str(dst_ip)) + (int(src_port), int(dst_port))
+
+def _reverse(key):
+    return key[2:4] + key[0:2] + (key[5], key[4])
+
+class CaptureIndexBuilder:
+    """Builds the index of a capture from the PacketTables an analysis reads, in capture order.
+
+    Packets are numbered as in reports (counting only the analyzed
+    protocols) and grouped into blocks of block_packets consecutive
+    packets. The index keeps, per block, the byte offset of its first
+    record and its time range, and per flow (one per direction) its
+    totals and the blocks it has packets in. Tables without
+    record_offsets (not read from the capture) make the index unusable.
+    """
+
+    def __init__(self, block_packets=BLOCK_PACKETS):
+        self.block_packets = block_packets
+        self.packets = 0
+        self.usable = True
+        self._block_offsets = []
+        self._block_min = np.empty(0, dtype=np.int64)
+        self._block_max = np.empty(0, dtype=np.int64)
+        self._flow_ids = {}
+        self._flows = []
+        self._pairs = []
+
+    def add(self, table):
+        n = len(table)
+        if not n or not self.usable:
+            return
+        if table.record_offsets is None:
+            self.usable = False
+            return
+        blocks = (self.packets + np.arange(n, dtype=np.int64)) // self.block_packets
+        self._block_offsets.append(table.record_offsets[(-self.packets) % self.block_packets::self.block_packets])
+        # Blocks are contiguous runs of packets; a table may start or end in the middle of one
+        timestamps = table.columns['timestamp_ns']
+        starts = np.flatnonzero(np.concatenate([[True], blocks[1:] != blocks[:-1]]))
+        ids = blocks[starts]
+        if ids[-1] >= len(self._block_min):
+            grow = int(ids[-1]) + 1 - len(self._block_min)
+            self._block_min = np.concatenate([self._block_min, np.full(grow, _MAX_TIMESTAMP)])
+            self._block_max = np.concatenate([self._block_max, np.full(grow, NO_TIMESTAMP)])
+        valid = np.where(timestamps == NO_TIMESTAMP, _MAX_TIMESTAMP, timestamps)
+        self._block_min[ids] = np.minimum(self._block_min[ids], np.minimum.reduceat(valid, starts))
+        self._block_max[ids] = np.maximum(self._block_max[ids], np.maximum.reduceat(timestamps, starts))
+
+        groups = table.group_flows()
+        keys = table.columns[list(FLOW_KEY_COLUMNS)][groups.first_index].tolist()
+        flow_ids = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            flow_id = self._flow_ids.get(key)
+            if flow_id is None:
+                flow_id = self._flow_ids[key] = len(self._flows)
+                self._flows.append([key, 0, int(timestamps[groups.first_index[i]]), 0])
+            flow = self._flows[flow_id]
+            flow[1] += int(groups.counts[i])
+            flow[3] = int(timestamps[groups.last_index[i]])
+            flow_ids[i] = flow_id
+        self._pairs.append(np.unique((flow_ids[groups.ids].astype(np.uint64) << np.uint64(32)) |
+                                     blocks.astype(np.uint64)))
+        self.packets += n
+
+    def finish(self, path, pcap_file, protocols):
+        """Write the index to the directory path; returns path, or None if the index is unusable."""
+        if not self.usable:
+            return None
+        pairs = np.unique(np.concatenate(self._pairs)) if self._pairs else np.empty(0, dtype=np.uint64)
+        flow_of = (pairs >> np.uint64(32)).astype(np.int64)
+        flow_blocks = (pairs & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+        flows = np.zeros(len(self._flows), dtype=FLOW_DTYPE)
+        if self._flows:
+            keys = np.array([f[0] for f in self._flows], dtype=np.uint64)
+            for i, column in enumerate(FLOW_KEY_COLUMNS):
+                flows[column] = keys[:, i]
+            flows['packets'] = [f[1] for f in self._flows]
+            flows['first_ts'] = [f[2] for f in self._flows]
+            flows['last_ts'] = [f[3] for f in self._flows]
+            flows['blocks_start'] = np.searchsorted(flow_of, np.arange(len(self._flows)))
+        blocks = np.zeros(len(self._block_min), dtype=BLOCK_DTYPE)
+        blocks['offset'] = np.concatenate(self._block_offsets) if self._block_offsets else []
+        blocks['min_ts'] = self._block_min
+        blocks['max_ts'] = self._block_max
+
+        # pcapng records can only be decoded knowing their section's interfaces
+        mm = open_capture(pcap_file)
+        try:
+            contexts = pcapng_contexts(mm)
+        finally:
+            close_capture(mm)
+
+        staging = path + '.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        np.save(os.path.join(staging, 'blocks.npy'), blocks)
+        np.save(os.path.join(staging, 'flows.npy'), flows)
+        np.save(os.path.join(staging, 'flow_blocks.npy'), flow_blocks)
+        np.save(os.path.join(staging, 'contexts.npy'), np.array([offset for offset, _ in contexts], dtype=np.uint64))
+        meta = {'format': 'exchlytics-index', 'version': FORMAT_VERSION,
+                'capture': dict(_capture_stat(pcap_file), path=os.path.abspath(pcap_file)),
+                'protocols': list(protocols), 'block_packets': self.block_packets, 'packets': self.packets,
+                'contexts': [context for _offset, context in contexts]}
+        with open(os.path.join(staging, 'index.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(staging, path)
+        return path
+
+def build_index(pcap_file, path=None, protocols=('tcp',), batch_size=65536):
+    """Index a capture on its own, without analyzing it; returns the index path."""
+    path = path or index_path(pcap_file)
+    builder = CaptureIndexBuilder()
+    for table in PacketTable.iter_pcap(pcap_file, batch_size=batch_size, protocols=protocols):
+        builder.add(table)
+    return builder.finish(path, pcap_file, protocols)
+
+def open_index(pcap_file, protocols=None, index_dir=INDEX_DIR):
+    """The CaptureIndex of a capture, or None if it has none or the capture changed since.
+
+    With protocols, an index counting packets of other protocols is not
+    returned either, as its packet numbers would not match a report's.
+    """
+    path = index_path(pcap_file, index_dir)
+    try:
+        index = CaptureIndex(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    if not index.fresh() or (protocols is not None and list(protocols) != index.protocols):
+        return None
+    return index
+
+class CaptureIndex:
+    """Random access to a capture's packets by flow, time and packet number.
+
+    Lookups find the blocks that can hold matching packets from the
+    memory-mapped index arrays, then decode only those blocks' records
+    from the memory-mapped capture.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'index.json')) as f:
+            meta = json.load(f)
+        if meta.get('format') != 'exchlytics-index' or meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a capture index this version can read")
+        self.capture = meta['capture']
+        self.protocols = meta['protocols']
+        self.block_packets = meta['block_packets']
+        self.packets = meta['packets']
+        self.contexts = [(endian, tuple(tuple(i) for i in interfaces)) for endian, interfaces in meta['contexts']]
+        self.blocks = np.load(os.path.join(path, 'blocks.npy'), mmap_mode='r')
+        self.flows = np.load(os.path.join(path, 'flows.npy'), mmap_mode='r')
+        self.flow_blocks = np.load(os.path.join(path, 'flow_blocks.npy'), mmap_mode='r')
+        self.context_offsets = np.load(os.path.join(path, 'contexts.npy'), mmap_mode='r')
+
+    def fresh(self):
+        """Whether the capture is still the one that was indexed."""
+        try:
+            return _capture_stat(self.capture['path']) == {k: self.capture[k] for k in ('size', 'mtime_ns')}
+        except OSError:
+            return False
+
+    def _flow_rows(self, keys):
+        mask = np.zeros(len(self.flows), dtype=bool)
+        for key in keys:
+            match = np.ones(len(self.flows), dtype=bool)
+            for column, value in zip(FLOW_KEY_COLUMNS, key):
+                match &= self.flows[column] == self.flows.dtype[column].type(value)
+            mask |= match
+        return np.flatnonzero(mask)
+
+    def flow(self, flow, both_directions=True):
+        """Packet count and first/last timestamp (ns) per direction of a (src_ip, src_port, dst_ip, dst_port) flow."""
+        key = _raw_key(flow)
+        keys = [key, _reverse(key)] if both_directions else [key]
+        return [{'packets': int(row['packets']), 'first_ts': int(row['first_ts']), 'last_ts': int(row['last_ts'])}
+                for row in self.flows[self._flow_rows(keys)]]
+
+    def _blocks(self, keys, start_ns, end_ns, numbers):
+        candidates = np.arange(len(self.blocks))
+        if keys is not None:
+            ends = np.append(self.flows['blocks_start'][1:], len(self.flow_blocks))
+            rows = self._flow_rows(keys)
+            candidates = np.unique(np.concatenate(
+                [self.flow_blocks[int(self.flows['blocks_start'][r]):int(ends[r])] for r in rows] +
+                [np.empty(0, dtype=np.uint32)])).astype(np.int64)
+        if start_ns is not None:
+            candidates = candidates[self.blocks['max_ts'][candidates] >= start_ns]
+        if end_ns is not None:
+            candidates = candidates[self.blocks['min_ts'][candidates] <= end_ns]
+        if numbers is not None:
+            candidates = np.intersect1d(candidates, np.unique(numbers // self.block_packets))
+        return candidates
+
+    def _context(self, offset):
+        if not self.contexts:
+            return None
+        return self.contexts[max(0, int(np.searchsorted(self.context_offsets, offset, side='right')) - 1)]
+
+    def query(self, flow=None, start=None, end=None, packets=None, both_directions=True, limit=None):
+        """Decoded packets that match every given filter, in capture order.
+
+        flow is (src_ip, src_port, dst_ip, dst_port), matched in both
+        directions unless both_directions is False; start/end are packet
+        timestamps in Unix seconds, as in reports; packets are packet numbers. Each
+        packet dict also has its 'packet' number and 'record_offset'.
+        """
+        keys = None
+        if flow is not None:
+            key = _raw_key(flow)
+            keys = {key, _reverse(key)} if both_directions else {key}
+        start_ns = None if start is None else int(round(start * 1e9))
+        end_ns = None if end is None else int(round(end * 1e9))
+        numbers = None if packets is None else np.asarray(sorted(set(int(p) for p in packets)), dtype=np.int64)
+        blocks = self._blocks(keys, start_ns, end_ns, numbers)
+        wanted = {_PROTOCOL_NUMBERS[p] for p in self.protocols}
+        found = []
+        if not len(blocks):
+            return found
+        mm = open_capture(self.capture['path'])
+        try:
+            # Consecutive blocks are decoded in one walk
+            runs = np.split(blocks, np.flatnonzero(np.diff(blocks) != 1) + 1)
+            for run in runs:
+                first, last = int(run[0]), int(run[-1])
+                offset = int(self.blocks['offset'][first])
+                end_offset = int(self.blocks['offset'][last + 1]) if last + 1 < len(self.blocks) else None
+                number = first * self.block_packets
+                stop = min((last + 1) * self.block_packets, self.packets)
+                for ts_ns, linktype, frame, record_offset in iter_records(mm, offset, end_offset,
+                                                                         self._context(offset)):
+                    headers = decode_headers(frame, linktype)
+                    if headers is None or headers[0] not in wanted:
+                        continue
+                    if number >= stop:
+                        break
+                    if self._matches(number, ts_ns, headers, keys, start_ns, end_ns, numbers):
+                        packet = decode_packet(frame, linktype, ts_ns)
+                        packet['raw_payload'] = bytes(packet['raw_payload'])
+                        packet['options'] = bytes(packet['options'])
+                        packet['packet'] = number
+                        packet['record_offset'] = record_offset
+                        found.append(packet)
+                        if limit is not None and len(found) >= limit:
+                            return found
+                    number += 1
+        finally:
+            close_capture(mm)
+        return found
+
+    @staticmethod
+    def _matches(number, ts_ns, headers, keys, start_ns, end_ns, numbers):
+        if numbers is not None:
+            i = np.searchsorted(numbers, number)
+            if i == len(numbers) or numbers[i] != number:
+                return False
+        if start_ns is not None and (ts_ns is None or ts_ns < start_ns):
+            return False
+        if end_ns is not None and (ts_ns is None or ts_ns > end_ns):
+            return False
+        if keys is not None:
+            _proto, src, dst, sport, dport = headers[:5]
+            if split_ip(src) + split_ip(dst) + (sport, dport) not in keys:
+                return False
+        return True
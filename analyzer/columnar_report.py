@@ -0,0 +1,372 @@
+import json
+import os
+import shutil
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from analyzer.issue_store import DETAIL_FIELDS
+
+# Report on disk: a directory with one Parquet file per table section and a
+# small manifest.json holding every other field plus the table index.
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+ROW_GROUP_SIZE = 65536
+
+_SESSION = [
+    ('src_ip', pa.string(), lambda r: r['session'][0]),
+    ('src_port', pa.int32(), lambda r: r['session'][1]),
+    ('dst_ip', pa.string(), lambda r: r['session'][2]),
+    ('dst_port', pa.int32(), lambda r: r['session'][3]),
+]
+
+_DETAIL_TYPES = {'protocol': pa.string(), 'src_ip': pa.string(), 'src_port': pa.int32(), 'dst_ip': pa.string(),
+                 'dst_port': pa.int32(), 'flags': pa.string(), 'seq': pa.int64(), 'ack': pa.int64(),
+                 'window': pa.int32(), 'payload_len': pa.int64(), 'header_len': pa.int16(),
+                 'checksum': pa.int64(), 'timestamp': pa.float64()}
+
+def _detail(name):
+    return lambda r: r['details'].get(name)
+
+# (column, type, getter from a report item) per table section. Issue
+# details and sessions are flattened into columns of their own.
+SECTIONS = {
+    'errors': [
+        ('type', pa.string(), lambda r: r['type']),
+        ('type_id', pa.int16(), lambda r: r.get('type_id')),
+        ('packet', pa.int64(), lambda r: r.get('packet')),
+        ('flow', pa.int64(), lambda r: r.get('flow')),
+        ('issue_group', pa.string(), lambda r: r.get('issue_group')),
+        ('llm_response', pa.string(), lambda r: r.get('llm_response')),
+    ] + [(name, _DETAIL_TYPES[name], _detail(name)) for name in DETAIL_FIELDS],
+    'latencies': _SESSION + [('latency_ms', pa.float64(), lambda r: r['latency_ms'])],
+    'unmatched_orders': _SESSION + [
+        ('cl_ord_id', pa.string(), lambda r: r['cl_ord_id']),
+        ('msg_type', pa.string(), lambda r: r['msg_type']),
+        ('packet_index', pa.int64(), lambda r: r['packet_index']),
+        ('timestamp', pa.float64(), lambda r: r['timestamp']),
+        ('status', pa.string(), lambda r: r['status']),
+        ('reason', pa.string(), lambda r: r['reason']),
+    ],
+    'issue_flows': [
+        ('flow', pa.int64(), lambda r: r['flow']),
+        ('type', pa.string(), lambda r: r['type']),
+        ('type_id', pa.int16(), lambda r: r['type_id']),
+        ('count', pa.int64(), lambda r: r['count']),
+        ('first_seen', pa.float64(), lambda r: r['first_seen']),
+        ('last_seen', pa.float64(), lambda r: r['last_seen']),
+        ('rate_per_s', pa.float64(), lambda r: r['rate_per_s']),
+        ('protocol', pa.string(), lambda r: r['protocol']),
+        ('src_ip', pa.string(), lambda r: r['src_ip']),
+        ('src_port', pa.int32(), lambda r: r['src_port']),
+        ('dst_ip', pa.string(), lambda r: r['dst_ip']),
+        ('dst_port', pa.int32(), lambda r: r['dst_port']),
+    ],
+}
+_ERROR_TOP = ('type', 'type_id', 'packet', 'flow', 'issue_group', 'llm_response')
+_SESSION_KEYS = ('src_ip', 'src_port', 'dst_ip', 'dst_port')
+
+def _rebuild(section, row):
+    # Inverse of the SECTIONS getters, for readers that want the JSON shapes
+    if section == 'errors':
+        item = {key: row[key] for key in _ERROR_TOP if key in row and row[key] is not None}
+        item['details'] = {key: value for key, value in row.items() if key not in _ERROR_TOP}
+        return item
+    if section in ('latencies', 'unmatched_orders') and all(key in row for key in _SESSION_KEYS):
+        item = {'session': [row[key] for key in _SESSION_KEYS]}
+        item.update((key, value) for key, value in row.items() if key not in _SESSION_KEYS)
+        return item
+    return row
+
+def schema(section):
+    return pa.schema([(name, kind) for name, kind, _get in SECTIONS[section]])
+
+def to_table(section, items):
+    """Report items of a table section as a pyarrow Table in its on-disk schema."""
+    columns = [pa.array([get(r) for r in items], type=kind) for _name, kind, get in SECTIONS[section]]
+    return pa.Table.from_arrays(columns, schema=schema(section))
+
+def _query_columns(filters, sort):
+    return sorted({column for column, _op, _value in filters or ()} | ({sort} if sort else set()))
+
+def _filter(table, filters):
+    # pyarrow can't type an empty value set: an empty 'in' matches nothing, an empty 'not in' everything
+    if any(op == 'in' and not len(value) for _column, op, value in filters or ()):
+        return table.slice(0, 0)
+    filters = [f for f in filters or () if not (f[1] == 'not in' and not len(f[2]))]
+    return table.filter(pq.filters_to_expression(filters)) if filters else table
+
+def _select(keys, filters, sort, descending):
+    # Row numbers of the rows of keys passing filters, in sort order
+    table = keys.append_column('_row', pa.array(np.arange(keys.num_rows, dtype=np.int64)))
+    table = _filter(table, filters)
+    if sort:
+        table = table.sort_by([(sort, 'descending' if descending else 'ascending')])
+    return table.column('_row').to_numpy()
+
+def _histogram(keys, column, bins, filters, log):
+    keys = _filter(keys, filters)
+    values = keys.column(column).to_numpy(zero_copy_only=False).astype(np.float64)
+    values = values[~np.isnan(values)]
+    if log:
+        values = values[values > 0]
+    if not len(values):
+        return []
+    low, high = values.min(), values.max()
+    if log:
+        edges = np.geomspace(low, high if high > low else low * 10, bins + 1)
+    else:
+        edges = np.linspace(low, high if high > low else low + 1, bins + 1)
+    counts, edges = np.histogram(values, edges)
+    return [(float(lo), float(hi), int(count)) for lo, hi, count in zip(edges[:-1], edges[1:], counts)]
+
+class ColumnarReportWriter:
+    """Writes a report directory incrementally.
+
+    Same interface as StreamingReportWriter: items of the table sections
+    are buffered and flushed as compressed Parquet row groups of
+    row_group_size rows, and finish() writes the manifest with the
+    remaining fields. Sections without items still get an empty file.
+    """
+
+    def __init__(self, output_dir, row_group_size=ROW_GROUP_SIZE, compression='zstd'):
+        self.output_dir = output_dir
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.counts = {}
+        self._buffers = {}
+        self._writers = {}
+
+    def __enter__(self):
+        if os.path.isdir(self.output_dir):
+            shutil.rmtree(self.output_dir)
+        os.makedirs(self.output_dir)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._writers or self._buffers:
+            # Analysis died: close what was written, there is no manifest
+            self._close_writers()
+
+    def _flush(self, section):
+        rows = self._buffers.pop(section, [])
+        if section not in self._writers:
+            self._writers[section] = pq.ParquetWriter(os.path.join(self.output_dir, f'{section}.parquet'),
+                                                      schema(section), compression=self.compression)
+        self._writers[section].write_table(to_table(section, rows))
+
+    def write_item(self, section, item):
+        buffer = self._buffers.setdefault(section, [])
+        buffer.append(item)
+        self.counts[section] = self.counts.get(section, 0) + 1
+        if len(buffer) >= self.row_group_size:
+            self._flush(section)
+
+    def write_error(self, err):
+        self.write_item('errors', err)
+
+    def write_latency(self, latency):
+        self.write_item('latencies', latency)
+
+    def _close_writers(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        self._buffers = {}
+
+    def finish(self, **fields):
+        if 'issue_summary' in fields:
+            # The per-flow aggregates are a table of their own
+            summary = dict(fields['issue_summary'])
+            flows = summary.pop('flows')
+            for entry in summary.pop('by_flow'):
+                self.write_item('issue_flows', dict(flows[entry['flow']], **entry))
+            fields['issue_summary'] = summary
+        for section in SECTIONS:
+            if section in self._buffers or section not in self._writers:
+                self._flush(section)
+        self._close_writers()
+        tables = {section: {'file': f'{section}.parquet', 'rows': self.counts.get(section, 0)}
+                  for section in SECTIONS}
+        manifest = dict(fields, format='exchlytics-report', version=FORMAT_VERSION, tables=tables)
+        with open(os.path.join(self.output_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+class ReportReader:
+    """Random access to a report directory.
+
+    The manifest is read up front; table sections are memory-mapped Parquet
+    files read only as far as asked: a subset of columns and a row range,
+    touching just the row groups that overlap it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self._files = {}
+
+    def get(self, key, default=None):
+        return self.manifest.get(key, default)
+
+    def rows(self, section):
+        return self.manifest['tables'][section]['rows']
+
+    def _file(self, section):
+        if section not in self._files:
+            self._files[section] = pq.ParquetFile(os.path.join(self.path, self.manifest['tables'][section]['file']),
+                                                  memory_map=True)
+        return self._files[section]
+
+    def read(self, section, columns=None, start=0, stop=None):
+        """pyarrow Table with rows [start, stop) of a section."""
+        parquet = self._file(section)
+        stop = self.rows(section) if stop is None else min(stop, self.rows(section))
+        groups = []
+        first_row = None
+        position = 0
+        for i in range(parquet.metadata.num_row_groups):
+            size = parquet.metadata.row_group(i).num_rows
+            if position < stop and position + size > start:
+                groups.append(i)
+                first_row = position if first_row is None else first_row
+            position += size
+        if not groups or start >= stop:
+            return schema(section).empty_table().select(columns or schema(section).names)
+        table = parquet.read_row_groups(groups, columns=columns)
+        return table.slice(start - first_row, stop - start)
+
+    def take(self, section, rows, columns=None):
+        """pyarrow Table of the given row numbers, in that order, read from the row groups holding them."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return schema(section).empty_table().select(columns or schema(section).names)
+        metadata = self._file(section).metadata
+        bounds = np.cumsum([0] + [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+        row_groups = np.searchsorted(bounds, rows, side='right') - 1
+        groups = np.unique(row_groups)
+        # Where each group starts among the groups read
+        group_starts = np.cumsum(bounds[groups + 1] - bounds[groups]) - (bounds[groups + 1] - bounds[groups])
+        local = rows - bounds[row_groups] + group_starts[np.searchsorted(groups, row_groups)]
+        return self._file(section).read_row_groups(groups.tolist(), columns=columns).take(local)
+
+    def query(self, section, filters=None, sort=None, descending=False, columns=None, start=0, stop=None):
+        needed = _query_columns(filters, sort)
+        if not needed:
+            return self.rows(section), self.records(section, columns, start, stop)
+        selected = _select(self.read(section, columns=needed), filters, sort, descending)
+        page = self.take(section, selected[start:stop], columns)
+        return len(selected), [_rebuild(section, row) for row in page.to_pylist()]
+
+    def histogram(self, section, column, bins=50, filters=None, log=False):
+        return _histogram(self.read(section, columns=_query_columns(filters, column)), column, bins, filters, log)
+
+    def records(self, section, columns=None, start=0, stop=None):
+        """Rows [start, stop) as the dicts the JSON report holds."""
+        return [_rebuild(section, row) for row in self.read(section, columns, start, stop).to_pylist()]
+
+    def issue_summary(self, flows=True):
+        summary = dict(self.manifest.get('issue_summary') or {})
+        if flows and summary:
+            by_flow = []
+            endpoints = {}
+            for row in self.read('issue_flows').to_pylist():
+                endpoints[row['flow']] = {key: row.pop(key) for key in ('protocol',) + _SESSION_KEYS}
+                by_flow.append(row)
+            summary['by_flow'] = by_flow
+            summary['flows'] = {str(flow): value for flow, value in endpoints.items()}
+        return summary
+
+    def to_dict(self):
+        """Everything, in the shape of the JSON report."""
+        report = {key: value for key, value in self.manifest.items()
+                  if key not in ('tables', 'format', 'version', 'issue_summary')}
+        if 'issue_summary' in self.manifest:
+            report['issue_summary'] = self.issue_summary()
+        for section in ('errors', 'latencies', 'unmatched_orders'):
+            report[section] = self.records(section)
+        return report
+
+def write_report(report_data, output_dir, row_group_size=ROW_GROUP_SIZE):
+    """Write an in-memory report dict as a report directory."""
+    with ColumnarReportWriter(output_dir, row_group_size) as writer:
+        fields = {}
+        for key, value in report_data.items():
+            if key in SECTIONS:
+                for item in value:
+                    writer.write_item(key, item)
+            else:
+                fields[key] = value
+        writer.finish(**fields)
+
+def _items(report, section):
+    if section == 'issue_flows' and section not in report:
+        # Report dicts keep the per-flow aggregates in the issue summary
+        summary = report.get('issue_summary') or {}
+        flows = summary.get('flows', {})
+        return [dict(flows.get(entry['flow'], flows.get(str(entry['flow']))), **entry)
+                for entry in summary.get('by_flow', [])]
+    return report.get(section, [])
+
+def table_rows(report, section):
+    """Row count of a table section, for a ReportReader or a report dict."""
+    if isinstance(report, ReportReader):
+        return report.rows(section)
+    return len(_items(report, section))
+
+def table_records(report, section, columns=None, start=0, stop=None):
+    """Rows [start, stop) of a table section, for a ReportReader or a report dict.
+
+    Readers only decode the given columns; dicts are sliced as they are.
+    """
+    if isinstance(report, ReportReader):
+        return report.records(section, columns, start, stop)
+    return _items(report, section)[start:stop]
+
+def query(report, section, filters=None, sort=None, descending=False, columns=None, start=0, stop=None):
+    """Filter, sort and page a table section; returns (rows matching, records on the page).
+
+    filters are (column, op, value) triples in pyarrow's filter format, e.g.
+    [('type', 'in', ['Dup ACK']), ('src_port', '==', 9000)], that must all
+    hold; sort is a column, with nulls last. Column names are those of the
+    section's Parquet file. A ReportReader reads only the filter and sort
+    columns in full, and the page's rows from the row groups holding them.
+    """
+    if isinstance(report, ReportReader):
+        return report.query(section, filters, sort, descending, columns, start, stop)
+    items = _items(report, section)
+    needed = _query_columns(filters, sort)
+    if not needed:
+        return len(items), items[start:stop]
+    selected = _select(to_table(section, items).select(needed), filters, sort, descending)
+    return len(selected), [items[i] for i in selected[start:stop].tolist()]
+
+def histogram(report, section, column, bins=50, filters=None, log=False):
+    """Counts of a numeric column of a table section in equal (log: geometric) bins.
+
+    Returns [(low, high, count)] over the rows passing filters, so charts
+    get a few bars instead of one point per row.
+    """
+    if isinstance(report, ReportReader):
+        return report.histogram(section, column, bins, filters, log)
+    return _histogram(to_table(section, _items(report, section)), column, bins, filters, log)
+
+def copy_report(src, dst):
+    """Copy a report directory or JSON report over whatever is at dst."""
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    if os.path.isdir(src):
+        shutil.copytree(src, dst)
+    else:
+        shutil.copyfile(src, dst)
+
+def open_report(path):
+    """A ReportReader for a report directory, the loaded dict for a JSON report."""
+    if os.path.isdir(path):
+        return ReportReader(path)
+    with open(path) as f:
+        return json.load(f)
+
+def load_report(path):
+    """A whole report as a dict, from a report directory or a JSON report."""
+    report = open_report(path)
+    return report.to_dict() if isinstance(report, ReportReader) else report
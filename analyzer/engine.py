@@ -0,0 +1,312 @@
+import logging
+import multiprocessing
+import pickle
+import queue
+import traceback
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks that the workers a result is awaited from are alive
+RESULT_POLL_INTERVAL = 1.0
+
+# Analyzers run by the engine, by name. Modules register their analyzers on
+# import with @register_analyzer.
+ANALYZERS = {}
+
+def register_analyzer(cls):
+    ANALYZERS[cls.name] = cls
+    return cls
+
+def get_analyzer(name):
+    if name not in ANALYZERS:
+        # The built-in analyzers register themselves when their module loads
+        import analyzer.error_detector  # noqa: F401
+        import analyzer.latency_checker  # noqa: F401
+        import analyzer.tcp_reassembly  # noqa: F401
+        import analyzer.itch_decoder  # noqa: F401
+        import analyzer.order_latency  # noqa: F401
+    return ANALYZERS[name]
+
+class FlowAnalyzer:
+    """Base class for analyzers driven by AnalysisEngine.
+
+    An instance only ever sees the packets of the connections hashed to its
+    partition (both directions), in capture order. feed() gets a PacketTable
+    batch plus the global packet numbers of its rows and may return records;
+    finish() may return final records. merge() runs in the parent and
+    combines the records of all partitions. Records must be picklable and
+    must not reference the batch buffers, which are released after feed().
+
+    An analyzer with a source builds on the records of another analyzer
+    instead of redoing its work: the engine runs the source first (adding
+    it if it wasn't asked for) and hands the source's records of the same
+    partition and call to feed(), expire() and finish() as an extra last
+    argument.
+    """
+
+    name = None
+    source = None
+
+    def feed(self, table, index):
+        return None
+
+    def expire(self, now, idle):
+        """Drop state of flows idle for idle ns at capture time now; may return records like feed()."""
+        return None
+
+    def finish(self):
+        return None
+
+    @classmethod
+    def merge(cls, partials):
+        return [record for partial in partials if partial for record in partial]
+
+def only_protocol(table, index, protocol):
+    """Restrict a batch to one IP protocol, keeping the rows' packet numbers."""
+    mask = table.columns['protocol'] == protocol
+    if mask.all():
+        return table, index
+    rows = np.flatnonzero(mask)
+    return table.take(rows), index[rows]
+
+def _share_table(table, partitions):
+    # Lay the batch out as [columns][payload offsets][partition ids][payloads]
+    # in one shared memory block the workers map without copying.
+    n = len(table)
+    first = int(table.payload_offsets[0])
+    last = int(table.payload_offsets[-1])
+    offsets = table.payload_offsets - np.uint64(first)
+    sizes = (table.columns.nbytes, offsets.nbytes, partitions.nbytes, last - first)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, sum(sizes)))
+    position = 0
+    for array in (table.columns, offsets, partitions):
+        shm.buf[position:position + array.nbytes] = array.view(np.uint8).reshape(-1) if array.nbytes else b''
+        position += array.nbytes
+    shm.buf[position:position + sizes[3]] = memoryview(table.payloads)[first:last]
+    return shm, (shm.name, n, sizes)
+
+def _attach_table(descriptor):
+    from analyzer.packet_table import PacketTable, PACKET_DTYPE
+
+    name, n, sizes = descriptor
+    shm = shared_memory.SharedMemory(name=name)
+    columns = np.ndarray(n, dtype=PACKET_DTYPE, buffer=shm.buf, offset=0)
+    offsets = np.ndarray(n + 1, dtype=np.uint64, buffer=shm.buf, offset=sizes[0])
+    partitions = np.ndarray(n, dtype=np.uint16, buffer=shm.buf, offset=sizes[0] + sizes[1])
+    payload_start = sizes[0] + sizes[1] + sizes[2]
+    payloads = shm.buf[payload_start:payload_start + sizes[3]]
+    return shm, PacketTable(columns, payloads, offsets), partitions
+
+def _call(analyzers, method, *args):
+    # One method of every analyzer, in order; analyzers with a source also get its records
+    outputs = {}
+    for analyzer in analyzers:
+        extra = (outputs[analyzer.source] or [],) if analyzer.source is not None else ()
+        outputs[analyzer.name] = getattr(analyzer, method)(*args, *extra)
+    return [outputs[analyzer.name] for analyzer in analyzers]
+
+def _with_sources(classes):
+    # Sources go before the analyzers built on them
+    ordered = []
+    for cls in classes:
+        if cls.source is not None and all(c.name != cls.source for c in ordered):
+            ordered.extend(_with_sources([get_analyzer(cls.source)]))
+        if all(c.name != cls.name for c in ordered):
+            ordered.append(cls)
+    return ordered
+
+def _worker_main(partition, analyzer_specs, tasks, results, state=None):
+    analyzers = pickle.loads(state) if state is not None else [cls(**kwargs) for cls, kwargs in analyzer_specs]
+    while True:
+        message = tasks.get()
+        try:
+            if message[0] == 'snapshot':
+                results.put((partition, pickle.dumps(analyzers, protocol=pickle.HIGHEST_PROTOCOL)))
+            elif message[0] == 'expire':
+                results.put((partition, _call(analyzers, 'expire', *message[1:])))
+            elif message[0] == 'feed':
+                _kind, descriptor, base = message
+                shm, table, partitions = _attach_table(descriptor)
+                rows = np.flatnonzero(partitions == partition)
+                # take() copies the partition's rows, so the block can go away
+                local = table.take(rows)
+                del table, partitions
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+                index = rows + base
+                results.put((partition, _call(analyzers, 'feed', local, index)))
+            else:
+                results.put((partition, _call(analyzers, 'finish')))
+                return
+        except Exception:
+            results.put((partition, traceback.format_exc()))
+            if message[0] not in ('feed', 'expire'):
+                return
+
+class AnalysisEngine:
+    """Runs FlowAnalyzers over packet batches, partitioned by connection.
+
+    With workers=1 everything runs in-process. Otherwise one long-lived
+    process per partition keeps its analyzers' per-flow state across
+    batches; each batch is placed in shared memory once and every worker
+    picks out its own connections. Usage:
+
+        with AnalysisEngine(['errors', 'latency'], workers=8) as engine:
+            for batch in batches:
+                per_batch = engine.feed(batch)
+            final = engine.finish()
+
+    snapshot() captures every partition's analyzer state before finish();
+    an engine built with that state (and the packet count it had seen)
+    carries on where it left off, with one partition per snapshot entry.
+    Long-running analyses call expire() now and then to drop idle flows.
+    """
+
+    def __init__(self, analyzers=('errors', 'latency'), workers=1, options=None, state=None, packets_seen=0):
+        options = options or {}
+        self.analyzer_classes = _with_sources([get_analyzer(a) if isinstance(a, str) else a for a in analyzers])
+        self.specs = [(cls, options.get(cls.name, {})) for cls in self.analyzer_classes]
+        # Connections are hashed to partitions by count, so a snapshot fixes it
+        self.workers = len(state) if state is not None else max(1, int(workers or 1))
+        self.state = state
+        self.packets_seen = packets_seen
+        self._local = None
+        self._processes = []
+        self._tasks = []
+        self._results = None
+        self._finished = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        if self.workers == 1:
+            if self.state is not None:
+                self._local = pickle.loads(self.state[0])
+            else:
+                self._local = [cls(**kwargs) for cls, kwargs in self.specs]
+            return
+        # Workers must share the parent's resource tracker, otherwise each one
+        # would try to clean up the parent's shared memory blocks on exit
+        resource_tracker.ensure_running()
+        self._results = multiprocessing.Queue()
+        for partition in range(self.workers):
+            tasks = multiprocessing.Queue()
+            state = None if self.state is None else self.state[partition]
+            process = multiprocessing.Process(
+                target=_worker_main, args=(partition, self.specs, tasks, self._results, state), daemon=True
+            )
+            process.start()
+            self._tasks.append(tasks)
+            self._processes.append(process)
+
+    def _gather(self):
+        partials = [None] * self.workers
+        waiting = set(range(self.workers))
+        dead = set()
+        while waiting:
+            try:
+                partition, outputs = self._results.get(timeout=RESULT_POLL_INTERVAL)
+            except queue.Empty:
+                # A worker that exited may still have had its result in the pipe,
+                # so it only counts as lost once a further poll brings nothing
+                if dead:
+                    partition = min(dead)
+                    raise RuntimeError(f"Analysis worker {partition} died "
+                                       f"(exit code {self._processes[partition].exitcode}), e.g. killed "
+                                       f"for running out of memory; its partition's results are lost")
+                dead = {p for p in waiting if not self._processes[p].is_alive()}
+                continue
+            if isinstance(outputs, str):
+                raise RuntimeError(f"Analysis worker {partition} failed:\n{outputs}")
+            partials[partition] = outputs
+            waiting.discard(partition)
+            dead.discard(partition)
+        return partials
+
+    def _merge_one(self, name, partials):
+        i = [cls.name for cls in self.analyzer_classes].index(name)
+        return self.analyzer_classes[i].merge([outputs[i] for outputs in partials])
+
+    def _merge(self, partials):
+        return {
+            cls.name: cls.merge([outputs[i] for outputs in partials])
+            for i, cls in enumerate(self.analyzer_classes)
+        }
+
+    def _feed_partials(self, table):
+        base = self.packets_seen
+        self.packets_seen += len(table)
+        if self._local is not None:
+            index = np.arange(base, base + len(table))
+            return [_call(self._local, 'feed', table, index)]
+        shm, descriptor = _share_table(table, table.flow_partitions(self.workers))
+        try:
+            for tasks in self._tasks:
+                tasks.put(('feed', descriptor, base))
+            return self._gather()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _finish_partials(self):
+        self._finished = True
+        if self._local is not None:
+            return [_call(self._local, 'finish')]
+        for tasks in self._tasks:
+            tasks.put(('finish',))
+        return self._gather()
+
+    def feed(self, table):
+        """Run every analyzer over one batch; returns {name: merged records}."""
+        return self._merge(self._feed_partials(table))
+
+    def expire(self, now, idle):
+        """Expire flows idle for idle ns at capture time now in every partition; returns {name: merged records}."""
+        if self._local is not None:
+            return self._merge([_call(self._local, 'expire', now, idle)])
+        for tasks in self._tasks:
+            tasks.put(('expire', now, idle))
+        return self._merge(self._gather())
+
+    def finish(self):
+        """Flush every analyzer; returns {name: merged final records}."""
+        return self._merge(self._finish_partials())
+
+    def snapshot(self):
+        """Pickled analyzer state of every partition, for AnalysisEngine(state=...)."""
+        if self._local is not None:
+            return [pickle.dumps(self._local, protocol=pickle.HIGHEST_PROTOCOL)]
+        for tasks in self._tasks:
+            tasks.put(('snapshot',))
+        return self._gather()
+
+    def run(self, table, before_finish=None):
+        """One-shot analysis of a whole table, merging feed and finish records.
+
+        before_finish(fed) is called once the table has been fed, e.g. to take a
+        snapshot(); fed(name) returns the merged feed() records of one analyzer.
+        """
+        partials = self._feed_partials(table)
+        if before_finish is not None:
+            before_finish(lambda name: self._merge_one(name, partials))
+        return self._merge(partials + self._finish_partials())
+
+    def close(self):
+        if self._processes and not self._finished:
+            for tasks in self._tasks:
+                tasks.put(('finish',))
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._tasks = []
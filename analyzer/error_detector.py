@@ -1,46 +1,141 @@
-def detect_errors(packet_list):
-    issues = []
-    session_tracker = {}
-    for pkt in packet_list:
-        sess_key = (pkt['src_ip'], pkt['src_port'], pkt['dst_ip'], pkt['dst_port'])
-        # Track sequence numbers for retransmission
-        if sess_key not in session_tracker:
-            session_tracker[sess_key] = set()
-        if pkt['seq'] in session_tracker[sess_key]:
-            issues.append({
-                'type': 'TCP Retransmission',
-                'details': pkt
-            })
-        else:
-            session_tracker[sess_key].add(pkt['seq'])
-        # Bogus TCP Payload
-        if pkt['payload_len'] == 0:
-            issues.append({
-                'type': 'Bogus TCP Payload',
-                'details': pkt
-            })
-        # Session Reset
-        if 'R' in pkt['flags']:
-            issues.append({
-                'type': 'Session Reset',
-                'details': pkt
-            })
-        # Bogus header length (should be at least 20 bytes)
-        if pkt.get('header_len') is not None and pkt['header_len'] < 5:
-            issues.append({
-                'type': 'Bogus TCP Header Length',
-                'details': pkt
-            })
-        # Invalid checksum (0 or None is suspicious)
-        if pkt.get('checksum') in [0, None]:
-            issues.append({
-                'type': 'Invalid TCP Checksum',
-                'details': pkt
-            })
-        # FIN misuse (FIN without proper session end)
-        if 'F' in pkt['flags'] and pkt['payload_len'] > 0:
-            issues.append({
-                'type': 'FIN with Data (Possible Misuse)',
-                'details': pkt
-            })
-    return issues 
\ No newline at end of file
+import numpy as np
+from analyzer.packet_table import PacketTable, FLAG_FIN, FLAG_RST, FLAG_SYN, FLAG_ACK
+from analyzer.seq_tracker import SeqTracker
+from analyzer.rules import rule, register_flow_state, issue_types, RuleSet, merge_rule_stats
+from analyzer.engine import FlowAnalyzer, register_analyzer, only_protocol
+from analyzer.pcap_reader import IPPROTO_TCP
+
+# Built-in detection rules; the registration order numbers the issue types
+
+@rule('retransmission', 'TCP Retransmission', state='seq')
+def _retransmission(cols, seq):
+    # Segments resending bytes that were already sent
+    return seq['retransmission']
+
+@rule('bogus_payload', 'Bogus TCP Payload', fields=('payload_len',))
+def _bogus_payload(cols):
+    return cols['payload_len'] == 0
+
+@rule('session_reset', 'Session Reset', fields=('flags',))
+def _session_reset(cols):
+    return (cols['flags'] & FLAG_RST) != 0
+
+@rule('bogus_header_length', 'Bogus TCP Header Length', fields=('header_len',), min_words=5)
+def _bogus_header_length(cols, min_words):
+    # Data offset in 32-bit words; a TCP header is at least 20 bytes
+    return cols['header_len'] < min_words
+
+@rule('invalid_checksum', 'Invalid TCP Checksum', fields=('checksum',))
+def _invalid_checksum(cols):
+    # 0 or missing is suspicious
+    return cols['checksum'] <= 0
+
+@rule('fin_with_data', 'FIN with Data (Possible Misuse)', fields=('flags', 'payload_len'))
+def _fin_with_data(cols):
+    return ((cols['flags'] & FLAG_FIN) != 0) & (cols['payload_len'] > 0)
+
+@rule('spurious_retransmission', 'TCP Spurious Retransmission', state='seq')
+def _spurious_retransmission(cols, seq):
+    return seq['spurious_retransmission']
+
+@rule('out_of_order', 'TCP Out-Of-Order', state='seq')
+def _out_of_order(cols, seq):
+    return seq['out_of_order']
+
+@rule('dup_ack', 'TCP Dup ACK', state='seq')
+def _dup_ack(cols, seq):
+    return seq['dup_ack']
+
+@rule('zero_window', 'TCP Zero Window', fields=('flags', 'window'), max_window=0)
+def _zero_window(cols, max_window):
+    # ACKs advertising a receive window of at most max_window bytes
+    flags = cols['flags']
+    return (cols['window'] <= max_window) & ((flags & FLAG_ACK) != 0) & ((flags & (FLAG_SYN | FLAG_FIN | FLAG_RST)) == 0)
+
+@rule('keep_alive', 'TCP Keep-Alive', state='seq')
+def _keep_alive(cols, seq):
+    return seq['keep_alive']
+
+register_flow_state('seq', SeqTracker)
+
+ISSUE_TYPES = issue_types()
+
+class ErrorDetector:
+    """Incremental detect_errors over a stream of PacketTable batches.
+
+    Runs the detection rules of a RuleSet; rules is its config (enabled,
+    disabled, params). Sequence-space rules share one SeqTracker, whose
+    per-flow state lives in a FlowStateStore, so max_memory bounds it by
+    spilling idle flows to disk.
+    """
+
+    def __init__(self, max_memory=None, spill_dir=None, rules=None):
+        self.rules = RuleSet(rules, max_memory=max_memory, spill_dir=spill_dir)
+
+    def find(self, table):
+        """Return (packet_index, issue_type_no) arrays for this batch, in packet order."""
+        return self.rules.find(table)
+
+    def feed(self, table, rows=None):
+        """Return the issues found in this batch, in packet order."""
+        return issues_from_hits(*self.find(table), table if rows is None else rows)
+
+    def close(self):
+        self.rules.close()
+
+def issues_from_hits(hit_index, hit_check, rows):
+    types = issue_types()
+    return [{'type': types[c], 'details': rows[int(i)]} for i, c in zip(hit_index, hit_check)]
+
+class RuleHits(tuple):
+    """(hit_index, hit_check) as merged by ErrorAnalyzer, plus the rule stats of finished partitions."""
+
+    def __new__(cls, hit_index, hit_check, stats=None):
+        hits = super().__new__(cls, (hit_index, hit_check))
+        hits.stats = stats
+        return hits
+
+@register_analyzer
+class ErrorAnalyzer(FlowAnalyzer):
+    """detect_errors as an AnalysisEngine analyzer.
+
+    feed() records are (index, type_no) arrays; finish() returns the
+    RuleSet stats, which merge() attaches to the RuleHits as .stats.
+    """
+
+    name = 'errors'
+
+    def __init__(self, max_memory=None, rules=None):
+        self.detector = ErrorDetector(max_memory=max_memory, rules=rules)
+
+    def feed(self, table, index):
+        table, index = only_protocol(table, index, IPPROTO_TCP)
+        hit_index, hit_check = self.detector.find(table)
+        return index[hit_index], hit_check
+
+    def expire(self, now, idle):
+        self.detector.rules.expire(now - idle)
+
+    def finish(self):
+        stats = self.detector.rules.stats()
+        self.detector.close()
+        return stats
+
+    @classmethod
+    def merge(cls, partials):
+        stats = [p for p in partials if isinstance(p, dict)]
+        partials = [p for p in partials if p is not None and not isinstance(p, dict)]
+        stats = merge_rule_stats(stats) if stats else None
+        if not partials:
+            return RuleHits(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), stats)
+        hit_index = np.concatenate([p[0] for p in partials])
+        hit_check = np.concatenate([p[1] for p in partials])
+        order = np.lexsort((hit_check, hit_index))
+        return RuleHits(hit_index[order], hit_check[order], stats)
+
+def detect_errors(packet_list, rules=None):
+    # Accepts a PacketTable or a list of packet dicts; either way the checks
+    # run as whole-column passes instead of a per-packet Python loop.
+    if isinstance(packet_list, PacketTable):
+        return ErrorDetector(rules=rules).feed(packet_list)
+    return ErrorDetector(rules=rules).feed(PacketTable.from_packets(packet_list), rows=packet_list)
@@ -1,10 +1,19 @@
 # Placeholder for FIX protocol decoding
+import numpy as np
+from analyzer.tcp_reassembly import StreamDecoder, register_stream_decoder
+
+SOH = 0x01
+FIX_BEGIN = b'8=FIX'
+# "10=" + three checksum digits + SOH
+CHECKSUM_FIELD_LEN = 7
+MAX_HEADER_PROBE = 32
 
 def decode_fix_message(payload_bytes):
     try:
         msg = payload_bytes.decode(errors='ignore')
         # Basic check for FIX header: Tag 8 (BeginString) should be present at the start
-        if not msg.startswith("8=FIX."):
+        # (FIXT.1.1 is the session layer used by FIX 5.0)
+        if not msg.startswith(("8=FIX.", "8=FIXT.")):
             return None # Not a FIX message
 
         fields = msg.split('\x01')
@@ -15,4 +24,301 @@ def decode_fix_message(payload_bytes):
                 fix_dict[tag] = value
         return fix_dict
     except Exception as e:
-        return {'error': str(e)} 
\ No newline at end of file
+        return {'error': str(e)}
+
+def frame_fix_messages(buf, start=0):
+    """Find complete FIX messages in buf using BodyLength (tag 9).
+
+    Returns ([(start, end), ...], consumed): the byte ranges of whole
+    messages and how far the caller may discard. Bytes before a message
+    start are skipped; a trailing partial message is left unconsumed.
+    """
+    frames = []
+    pos = start
+    size = len(buf)
+    while True:
+        begin = buf.find(FIX_BEGIN, pos)
+        if begin < 0:
+            # Keep a possible partial "8=FI" at the tail
+            return frames, max(pos, size - len(FIX_BEGIN) + 1)
+        soh = buf.find(b'\x01', begin)
+        if soh < 0 or soh - begin > MAX_HEADER_PROBE:
+            if soh < 0 and size - begin <= MAX_HEADER_PROBE:
+                return frames, begin
+            pos = begin + 1
+            continue
+        if buf[soh + 1:soh + 3] != b'9=':
+            if size - soh < 3:
+                return frames, begin
+            pos = begin + 1
+            continue
+        length_end = buf.find(b'\x01', soh + 3)
+        if length_end < 0:
+            if size - soh <= MAX_HEADER_PROBE:
+                return frames, begin
+            pos = begin + 1
+            continue
+        try:
+            body_length = int(buf[soh + 3:length_end])
+        except ValueError:
+            pos = begin + 1
+            continue
+        end = length_end + 1 + body_length + CHECKSUM_FIELD_LEN
+        if end > size:
+            return frames, begin
+        frames.append((begin, end))
+        pos = end
+
+@register_stream_decoder
+class FixStreamDecoder(StreamDecoder):
+    """Frames FIX messages out of a reassembled TCP stream.
+
+    Gives up on streams that show no FIX BeginString within probe_bytes,
+    and drops any single message larger than max_message. With fields set
+    to a tuple of int tags, messages go through decode_fix_batch and only
+    those tags are returned (plus 'valid' for CheckSum/BodyLength).
+    """
+
+    name = 'fix'
+
+    def __init__(self, probe_bytes=4096, max_message=1 << 20, fields=None):
+        self.buffer = bytearray()
+        self.fields = tuple(fields) if fields is not None else None
+        self.probe_bytes = probe_bytes
+        self.max_message = max_message
+        self.seen_bytes = 0
+        self.messages = 0
+
+    @property
+    def buffered_bytes(self):
+        return len(self.buffer)
+
+    def feed(self, data):
+        self.buffer += data
+        self.seen_bytes += len(data)
+        frames, consumed = frame_fix_messages(self.buffer)
+        messages = []
+        if self.fields is not None:
+            if frames:
+                messages = self._project([bytes(self.buffer[begin:end]) for begin, end in frames])
+        else:
+            for begin, end in frames:
+                fields = decode_fix_message(bytes(self.buffer[begin:end]))
+                if fields is not None:
+                    messages.append(fields)
+        del self.buffer[:consumed]
+        self.messages += len(messages)
+        if not self.messages and self.seen_bytes > self.probe_bytes:
+            self.active = False
+            self.buffer.clear()
+        elif len(self.buffer) > self.max_message:
+            self.buffer.clear()
+        return messages
+
+    def _project(self, frames):
+        batch = decode_fix_batch(frames, self.fields)
+        columns = [(str(tag), batch.columns[tag].tolist()) for tag in self.fields]
+        valid = batch.valid.tolist()
+        messages = []
+        for i in range(len(batch)):
+            message = {'valid': valid[i]}
+            for tag, values in columns:
+                value = values[i]
+                if isinstance(value, bytes):
+                    if value:
+                        message[tag] = value.decode(errors='ignore')
+                elif value >= 0:
+                    message[tag] = str(value)
+            messages.append(message)
+        return messages
+
+    def reset(self):
+        # Resync on the next BeginString after a gap
+        self.buffer.clear()
+
+# Bytes-level codec with integer tags. decode_fix_batch decodes a whole
+# buffer of messages with NumPy passes over the bytes instead of a Python
+# loop per field.
+
+DEFAULT_COLUMNS = (35, 34, 11, 52, 60)
+# Tags projected as integers rather than raw bytes
+NUMERIC_TAGS = frozenset((7, 9, 10, 16, 34, 36, 43, 97, 369))
+
+def fix_checksum(data):
+    """FIX CheckSum (tag 10) of the bytes preceding the trailer."""
+    return sum(data) % 256
+
+def parse_fix_fields(buf):
+    """Parse one framed message into {int tag: memoryview value}."""
+    view = memoryview(buf)
+    fields = {}
+    pos = 0
+    size = len(buf)
+    while pos < size:
+        eq = buf.find(b'=', pos)
+        if eq < 0:
+            break
+        soh = buf.find(b'\x01', eq)
+        if soh < 0:
+            soh = size
+        try:
+            fields[int(buf[pos:eq])] = view[eq + 1:soh]
+        except ValueError:
+            pass
+        pos = soh + 1
+    return fields
+
+def _parse_uint(arr, starts, ends, max_digits):
+    # ASCII digits in arr[starts:ends] to int64, -1 where not a plain number
+    lengths = ends - starts
+    value = np.zeros(len(starts), dtype=np.int64)
+    ok = (lengths > 0) & (lengths <= max_digits)
+    last = len(arr) - 1
+    for k in range(max_digits):
+        inside = k < lengths
+        if not inside.any():
+            break
+        digit = arr[np.minimum(starts + k, last)].astype(np.int64) - 48
+        ok &= ~inside | ((digit >= 0) & (digit <= 9))
+        value = np.where(inside, value * 10 + digit, value)
+    return np.where(ok, value, -1)
+
+def _gather_bytes(arr, starts, ends):
+    # Fixed-width 'S' array of arr[starts:ends] for every row
+    lengths = ends - starts
+    width = int(lengths.max()) if len(lengths) else 0
+    if width == 0:
+        return np.zeros(len(starts), dtype='S1')
+    idx = starts[:, None] + np.arange(width)
+    data = np.where(np.arange(width) < lengths[:, None], arr[np.minimum(idx, len(arr) - 1)], 0).astype(np.uint8)
+    return data.view(f'S{width}').reshape(-1)
+
+class FixBatch:
+    """Result of decode_fix_batch.
+
+    starts/ends are the byte ranges of each message in buffer;
+    checksum_ok and body_length_ok flag CheckSum and BodyLength
+    mismatches; columns maps each projected tag to one value per message
+    (int64 for NUMERIC_TAGS with -1 when absent, bytes otherwise).
+    """
+
+    def __init__(self, buffer, starts, ends, checksum_ok, body_length_ok, columns, field_table):
+        self.buffer = buffer
+        self.starts = starts
+        self.ends = ends
+        self.checksum_ok = checksum_ok
+        self.body_length_ok = body_length_ok
+        self.columns = columns
+        self._field_msg, self._field_tag, self._value_start, self._value_end = field_table
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def valid(self):
+        return self.checksum_ok & self.body_length_ok
+
+    def message(self, i):
+        return memoryview(self.buffer)[int(self.starts[i]):int(self.ends[i])]
+
+    def fields(self, i):
+        """Every field of message i as {int tag: memoryview}."""
+        lo, hi = np.searchsorted(self._field_msg, [i, i + 1])
+        view = memoryview(self.buffer)
+        return {int(tag): view[int(s):int(e)] for tag, s, e in
+                zip(self._field_tag[lo:hi], self._value_start[lo:hi], self._value_end[lo:hi])}
+
+def decode_fix_batch(data, tags=DEFAULT_COLUMNS):
+    """Decode many FIX messages in one call.
+
+    data is either a list of framed messages or one buffer of back-to-back
+    messages (e.g. a reassembled stream); in the latter case messages are
+    delimited by their CheckSum trailer and then checked against BodyLength.
+    """
+    if isinstance(data, (list, tuple)):
+        lengths = np.fromiter((len(m) for m in data), dtype=np.int64, count=len(data))
+        buffer = b''.join(bytes(m) for m in data)
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+    else:
+        buffer = data
+        starts = ends = None
+    arr = np.frombuffer(buffer, dtype=np.uint8)
+    size = len(arr)
+    soh = np.flatnonzero(arr == 1)
+    # "<SOH>10=" can only be the trailer, SOH never appears inside a value
+    cand = soh[soh + 3 < size]
+    trailers = cand[(arr[cand + 1] == 49) & (arr[cand + 2] == 48) & (arr[cand + 3] == 61)]
+    if starts is None:
+        end_at = np.searchsorted(soh, trailers + 1)
+        complete = end_at < len(soh)
+        ends = soh[end_at[complete]] + 1
+        starts = np.concatenate(([0], ends[:-1])).astype(np.int64)
+    n = len(starts)
+    empty = np.zeros(0, dtype=np.int64)
+    if n == 0:
+        return FixBatch(buffer, empty, empty, np.zeros(0, bool), np.zeros(0, bool), {}, (empty,) * 4)
+
+    # Field table: one row per SOH-terminated field. Messages are back to
+    # back, so a field is the last of its message when its SOH ends one.
+    fend = soh[:np.searchsorted(soh, ends[-1])]
+    message_end = np.zeros(size + 1, dtype=bool)
+    message_end[ends] = True
+    last = message_end[fend + 1]
+    field_msg = np.zeros(len(fend), dtype=np.int64)
+    np.cumsum(last[:-1], out=field_msg[1:])
+    fstart = np.empty(len(fend), dtype=np.int64)
+    fstart[1:] = fend[:-1] + 1
+    first = np.ones(len(fend), dtype=bool)
+    first[1:] = last[:-1]
+    fstart[first] = starts[field_msg[first]]
+    eqs = np.flatnonzero(arr == 61)
+    eq_at = np.searchsorted(eqs, fstart)
+    eq = eqs[np.minimum(eq_at, len(eqs) - 1)] if len(eqs) else fend
+    has_eq = (eq_at < len(eqs)) & (eq < fend)
+    eq = np.where(has_eq, eq, fend)
+    tag = np.where(has_eq, _parse_uint(arr, fstart, eq, 6), -1)
+    value_start = eq + 1
+    value_end = fend
+
+    def first_of(wanted):
+        # Field row of the first occurrence of tag `wanted` in every message (-1 if absent)
+        rows = np.flatnonzero(tag == wanted)
+        msgs = field_msg[rows]
+        keep = np.ones(len(rows), dtype=bool)
+        keep[1:] = msgs[1:] != msgs[:-1]
+        out = np.full(n, -1, dtype=np.int64)
+        out[msgs[keep]] = rows[keep]
+        return out
+
+    # CheckSum: byte sum from message start up to the trailer field
+    trailer_row = first_of(10)
+    has_trailer = trailer_row >= 0
+    trailer_start = np.where(has_trailer, fstart[np.maximum(trailer_row, 0)], ends)
+    bounds = np.empty(2 * n, dtype=np.int64)
+    bounds[0::2] = starts
+    bounds[1::2] = trailer_start
+    computed = np.add.reduceat(arr, np.minimum(bounds, size - 1), dtype=np.uint64)[0::2] % 256
+    computed = np.where(trailer_start > starts, computed, 0).astype(np.int64)
+    declared = _parse_uint(arr, value_start[np.maximum(trailer_row, 0)], value_end[np.maximum(trailer_row, 0)], 3)
+    checksum_ok = has_trailer & (computed == declared)
+
+    # BodyLength: bytes after the tag 9 field up to the trailer
+    length_row = first_of(9)
+    has_length = length_row >= 0
+    safe = np.maximum(length_row, 0)
+    declared_length = _parse_uint(arr, value_start[safe], value_end[safe], 9)
+    body_length_ok = has_length & has_trailer & (declared_length == trailer_start - (value_end[safe] + 1))
+
+    columns = {}
+    for wanted in tags:
+        rows = first_of(wanted)
+        present = rows >= 0
+        safe = np.maximum(rows, 0)
+        if wanted in NUMERIC_TAGS:
+            column = _parse_uint(arr, value_start[safe], value_end[safe], 18)
+            columns[wanted] = np.where(present, column, -1)
+        else:
+            columns[wanted] = _gather_bytes(arr, value_start[safe], np.where(present, value_end[safe], value_start[safe]))
+    return FixBatch(buffer, starts, ends, checksum_ok, body_length_ok, columns,
+                    (field_msg, tag, value_start, value_end))
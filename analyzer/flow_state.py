@@ -0,0 +1,162 @@
+import os
+import pickle
+import shelve
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+
+def parse_size(value):
+    """Parse '512M', '2G', '64k' or a plain byte count into bytes."""
+    if value is None or isinstance(value, int):
+        return value
+    text = str(value).strip().upper().rstrip('B')
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def _default_size_of(value):
+    nbytes = getattr(value, 'nbytes', None)
+    return nbytes if nbytes is not None else sys.getsizeof(value)
+
+class FlowStateStore:
+    """Per-flow state dict with a memory budget.
+
+    Flows are kept in LRU order. Once the estimated size of the in-memory
+    states exceeds max_bytes, the least recently used flows are pickled into
+    an on-disk shelf and transparently loaded back the next time they are
+    touched. With max_bytes=None it behaves like a plain dict.
+
+    Flows also remember when they were last stored, on a clock the owner
+    moves forward with advance() (capture time in ns, typically the newest
+    packet of each batch); expire() drops the ones idle since before a
+    given time, oldest first.
+    """
+
+    def __init__(self, max_bytes=None, size_of=_default_size_of, spill_dir=None):
+        self.max_bytes = parse_size(max_bytes)
+        self.size_of = size_of
+        self.spill_dir = spill_dir
+        self.spilled_flows = 0
+        self._memory = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._shelf = None
+        self._shelf_dir = None
+        self.now = 0
+        self._stored = OrderedDict()
+
+    def _spill_key(self, key):
+        return pickle.dumps(key).hex()
+
+    def _open_shelf(self):
+        if self._shelf is None:
+            self._shelf_dir = tempfile.mkdtemp(prefix='flow-state-', dir=self.spill_dir)
+            self._shelf = shelve.open(os.path.join(self._shelf_dir, 'flows'), protocol=pickle.HIGHEST_PROTOCOL)
+        return self._shelf
+
+    def __len__(self):
+        return len(self._memory) + (len(self._shelf) if self._shelf is not None else 0)
+
+    def __contains__(self, key):
+        if key in self._memory:
+            return True
+        return self._shelf is not None and self._spill_key(key) in self._shelf
+
+    def get(self, key, default=None):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        if self._shelf is not None:
+            spill_key = self._spill_key(key)
+            if spill_key in self._shelf:
+                _key, value = self._shelf.pop(spill_key)
+                self[key] = value
+                return value
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._bytes -= self._sizes.pop(key, 0)
+        size = self.size_of(value)
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        self._sizes[key] = size
+        self._bytes += size
+        self._stored[key] = self.now
+        self._stored.move_to_end(key)
+        self._maybe_spill()
+
+    def pop(self, key, default=None):
+        self._stored.pop(key, None)
+        if key in self._memory:
+            self._bytes -= self._sizes.pop(key)
+            return self._memory.pop(key)
+        if self._shelf is not None:
+            spill_key = self._spill_key(key)
+            if spill_key in self._shelf:
+                return self._shelf.pop(spill_key)[1]
+        return default
+
+    def advance(self, timestamps):
+        """Move the clock to the newest of timestamps (ns) if that is later."""
+        if len(timestamps):
+            self.now = max(self.now, int(timestamps.max()))
+
+    def expire(self, before):
+        """Remove the flows last stored before the given time; returns them as (key, value) pairs."""
+        expired = []
+        while self._stored:
+            key, stored = next(iter(self._stored.items()))
+            if stored >= before:
+                break
+            expired.append((key, self.pop(key)))
+        return expired
+
+    def items(self):
+        yield from list(self._memory.items())
+        if self._shelf is not None:
+            for spill_key in list(self._shelf.keys()):
+                yield self._shelf[spill_key]
+
+    def _maybe_spill(self):
+        if self.max_bytes is None:
+            return
+        # Always keep the most recent flow resident, it is about to be used
+        while self._bytes > self.max_bytes and len(self._memory) > 1:
+            key, value = self._memory.popitem(last=False)
+            self._bytes -= self._sizes.pop(key)
+            self._open_shelf()[self._spill_key(key)] = (key, value)
+            self.spilled_flows += 1
+
+    def __getstate__(self):
+        # The shelf belongs to this process: spilled flows are pulled back in,
+        # in front as they are the least recently used, and re-spilled on load
+        state = dict(self.__dict__, _shelf=None, _shelf_dir=None)
+        spilled = [self._shelf[k] for k in self._shelf.keys()] if self._shelf is not None else []
+        state['_memory'] = OrderedDict(spilled + list(self._memory.items()))
+        state['_sizes'] = {key: self.size_of(value) for key, value in state['_memory'].items()}
+        state['_bytes'] = sum(state['_sizes'].values())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._maybe_spill()
+
+    @property
+    def memory_bytes(self):
+        return self._bytes
+
+    def close(self):
+        if self._shelf is not None:
+            self._shelf.close()
+            shutil.rmtree(self._shelf_dir, ignore_errors=True)
+            self._shelf = None
+
+_MISSING = object()
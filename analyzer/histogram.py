@@ -0,0 +1,134 @@
+import math
+import numpy as np
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram in the style of HdrHistogram.
+
+    Values are non-negative integers (nanoseconds by default). Values below
+    sub_bucket_count get a bucket each; above that every power of two is
+    split into sub_bucket_count / 2 buckets, so any recorded value is known
+    to within 10 ** -significant_digits of itself. Histograms with the same
+    precision and unit merge by adding counts, so shards, flows and files
+    can each keep their own and combine them later.
+    """
+
+    def __init__(self, significant_digits=2, unit='ns'):
+        self.significant_digits = significant_digits
+        self.unit = unit
+        self.sub_bucket_bits = max(1, math.ceil(math.log2(2 * 10 ** significant_digits)))
+        self.sub_bucket_count = 1 << self.sub_bucket_bits
+        self.sub_bucket_half = self.sub_bucket_count // 2
+        self.counts = np.zeros(self.sub_bucket_count, dtype=np.int64)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, values):
+        _mantissa, bit_length = np.frexp(values.astype(np.float64))
+        shift = np.maximum(bit_length - self.sub_bucket_bits, 0).astype(np.int64)
+        return shift * self.sub_bucket_half + (values >> shift)
+
+    def _bucket_bounds(self, index):
+        # Lowest and highest value that land in each bucket
+        index = np.asarray(index, dtype=np.int64)
+        shift = np.maximum((index - self.sub_bucket_count) // self.sub_bucket_half + 1, 0)
+        sub = index - shift * self.sub_bucket_half
+        return sub << shift, ((sub + 1) << shift) - 1
+
+    def record(self, values):
+        """Record one value or an array of them (floats are rounded)."""
+        values = np.rint(np.atleast_1d(np.asarray(values, dtype=np.float64))).astype(np.int64)
+        values = values[values >= 0]
+        if not len(values):
+            return
+        index = self._index(values)
+        top = int(index.max()) + 1
+        if top > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(top - len(self.counts), dtype=np.int64)])
+        self.counts[:top] += np.bincount(index, minlength=top)
+        self.count += len(values)
+        self.total += int(values.sum())
+        low, high = int(values.min()), int(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other):
+        if (other.significant_digits, other.unit) != (self.significant_digits, self.unit):
+            raise ValueError("Can only merge histograms with the same precision and unit")
+        if len(other.counts) > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(len(other.counts) - len(self.counts), dtype=np.int64)])
+        self.counts[:len(other.counts)] += other.counts
+        self.count += other.count
+        self.total += other.total
+        for name, pick in (('min', min), ('max', max)):
+            theirs = getattr(other, name)
+            if theirs is not None:
+                mine = getattr(self, name)
+                setattr(self, name, theirs if mine is None else pick(mine, theirs))
+        return self
+
+    def percentile(self, p):
+        """Highest value equivalent to the p-th percentile (None when empty)."""
+        if not self.count:
+            return None
+        target = max(1, math.ceil(p / 100 * self.count))
+        index = int(np.searchsorted(np.cumsum(self.counts), target))
+        _low, high = self._bucket_bounds(index)
+        return int(min(high, self.max))
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def buckets(self):
+        """(low, high, count) for every non-empty bucket."""
+        index = np.flatnonzero(self.counts)
+        low, high = self._bucket_bounds(index)
+        return list(zip(low.tolist(), high.tolist(), self.counts[index].tolist()))
+
+    def summary(self):
+        summary = {'count': self.count, 'min': self.min, 'max': self.max, 'mean': self.mean()}
+        for p in PERCENTILES:
+            summary[f'p{p:g}'] = self.percentile(p)
+        return summary
+
+    def to_dict(self):
+        """JSON-friendly form: the summary plus sparse [index, count] buckets."""
+        index = np.flatnonzero(self.counts)
+        return dict(self.summary(), unit=self.unit, significant_digits=self.significant_digits,
+                    total=self.total, buckets=np.stack([index, self.counts[index]], axis=1).tolist())
+
+    @classmethod
+    def from_dict(cls, data):
+        hist = cls(data['significant_digits'], data['unit'])
+        if data['buckets']:
+            index, counts = np.asarray(data['buckets'], dtype=np.int64).T
+            hist.counts = np.zeros(max(len(hist.counts), int(index.max()) + 1), dtype=np.int64)
+            hist.counts[index] = counts
+        hist.count = data['count']
+        hist.total = data['total']
+        hist.min = data['min']
+        hist.max = data['max']
+        return hist
+
+def merge_histograms(histograms):
+    """Merge LatencyHistograms or their to_dict() forms; None if there are none."""
+    merged = None
+    for hist in histograms:
+        if isinstance(hist, dict):
+            hist = LatencyHistogram.from_dict(hist)
+        if merged is None:
+            merged = LatencyHistogram(hist.significant_digits, hist.unit)
+        merged.merge(hist)
+    return merged
+
+def format_ns(value):
+    """Human readable duration for a nanosecond value."""
+    if value is None:
+        return 'N/A'
+    for unit, scale in (('s', 1e9), ('ms', 1e6), ('µs', 1e3)):
+        if value >= scale:
+            return f'{value / scale:.2f} {unit}'
+    return f'{value:.0f} ns'
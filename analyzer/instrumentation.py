@@ -0,0 +1,181 @@
+import cProfile
+import io
+import os
+import pstats
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from analyzer.histogram import LatencyHistogram
+
+def _max_rss_bytes(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(who).ru_maxrss * 1024
+
+class Instruments:
+    """Wall/CPU time, peak memory and counters per stage of an analysis.
+
+    Code runs a stage inside `with instruments.stage(name):`; a stage
+    entered many times (once per batch when streaming) adds up. Every
+    entry is also kept as a span for to_trace(), up to max_spans. CPU time
+    is the calling process's; work done in engine worker processes only
+    shows in their wall time and in the workers' peak RSS.
+
+    With profile=True each stage additionally runs under its own
+    cProfile.Profile, written out by dump_profiles(). Stages must not be
+    nested then, as only one profiler can be active at a time.
+    """
+
+    def __init__(self, profile=False, max_spans=10000):
+        self.profile = profile
+        self.max_spans = max_spans
+        self.stages = {}
+        # Totals such as packets and issues, set by the analysis
+        self.counts = {}
+        self.spans = []
+        self.dropped_spans = 0
+        self.llm_latency = LatencyHistogram()
+        self.rules = {}
+        self.profiles = {}
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+        self._thread = threading.get_ident()
+
+    @contextmanager
+    def stage(self, name):
+        profiler = None
+        if self.profile:
+            profiler = self.profiles.get(name)
+            if profiler is None:
+                profiler = self.profiles[name] = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - start_cpu
+            if profiler is not None:
+                profiler.disable()
+            entry = self.stages.get(name)
+            if entry is None:
+                entry = self.stages[name] = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0}
+            entry['calls'] += 1
+            entry['wall_seconds'] += wall
+            entry['cpu_seconds'] += cpu
+            entry['peak_rss_bytes'] = _max_rss_bytes()
+            if len(self.spans) < self.max_spans:
+                self.spans.append((name, start, wall))
+            else:
+                self.dropped_spans += 1
+
+    def timed_iter(self, name, iterable):
+        """Yield from iterable, timing the production of every item as stage name."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def observe_llm_latencies(self, seconds):
+        self.llm_latency.record([s * 1e9 for s in seconds])
+
+    def summary(self):
+        """JSON-friendly totals, attached to reports as 'instrumentation'."""
+        wall = time.perf_counter() - self.started
+        summary = {
+            'wall_seconds': wall,
+            'cpu_seconds': time.process_time() - self.started_cpu,
+            'peak_rss_bytes': _max_rss_bytes(),
+            'worker_peak_rss_bytes': _max_rss_bytes(resource.RUSAGE_CHILDREN),
+            'stages': {name: dict(entry) for name, entry in self.stages.items()},
+            'counts': dict(self.counts),
+            'packets_per_second': self.counts.get('packets', 0) / wall if wall else 0.0,
+            'llm_latency': self.llm_latency.summary(),
+            'profiled': self.profile,
+        }
+        if self.dropped_spans:
+            summary['dropped_spans'] = self.dropped_spans
+        return summary
+
+    def to_prometheus(self, labels=None):
+        """The summary in the Prometheus text exposition format."""
+        summary = self.summary()
+        labels = labels or {}
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP exchlytics_{name} {help_text}')
+            lines.append(f'# TYPE exchlytics_{name} {kind}')
+            for suffix, extra, value in samples:
+                lines.append(f'exchlytics_{name}{suffix}{_labels(dict(labels, **extra))} {_number(value)}')
+
+        stages = summary['stages']
+        metric('stage_wall_seconds', 'gauge', 'Wall time spent in each analysis stage.',
+               [('', {'stage': s}, e['wall_seconds']) for s, e in stages.items()])
+        metric('stage_cpu_seconds', 'gauge', 'CPU time of the main process in each analysis stage.',
+               [('', {'stage': s}, e['cpu_seconds']) for s, e in stages.items()])
+        metric('stage_calls', 'gauge', 'Times each analysis stage was entered.',
+               [('', {'stage': s}, e['calls']) for s, e in stages.items()])
+        metric('wall_seconds', 'gauge', 'Wall time of the whole analysis.', [('', {}, summary['wall_seconds'])])
+        metric('cpu_seconds', 'gauge', 'CPU time of the main process over the whole analysis.',
+               [('', {}, summary['cpu_seconds'])])
+        metric('peak_rss_bytes', 'gauge', 'Peak resident set size of the analysis and of its largest worker.',
+               [('', {'process': 'main'}, summary['peak_rss_bytes']),
+                ('', {'process': 'workers'}, summary['worker_peak_rss_bytes'])])
+        for name, value in sorted(summary['counts'].items()):
+            metric(f'{name}_total', 'counter', f'{name.replace("_", " ").capitalize()} counted by the analysis.',
+                   [('', {}, value)])
+        metric('packets_per_second', 'gauge', 'Packets analyzed per second of wall time.',
+               [('', {}, summary['packets_per_second'])])
+        latency = summary['llm_latency']
+        samples = [('', {'quantile': q}, None if latency[p] is None else latency[p] / 1e9)
+                   for q, p in (('0.5', 'p50'), ('0.9', 'p90'), ('0.99', 'p99'))]
+        samples += [('_sum', {}, self.llm_latency.total / 1e9), ('_count', {}, latency['count'])]
+        metric('llm_request_seconds', 'summary', 'Latency of successful LLM requests.', samples)
+        if self.rules:
+            metric('rule_seconds', 'gauge', 'Time spent in each detection rule.',
+                   [('', {'rule': k}, e['seconds']) for k, e in self.rules.items()])
+            metric('rule_hits', 'gauge', 'Issues found by each detection rule.',
+                   [('', {'rule': k}, e['hits']) for k, e in self.rules.items()])
+        return '\n'.join(lines) + '\n'
+
+    def to_trace(self):
+        """Stage spans as Chrome trace events (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        events = [{'name': name, 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': self._thread,
+                   'ts': round((start - self.started) * 1e6, 3), 'dur': round(wall * 1e6, 3)}
+                  for name, start, wall in self.spans]
+        events += [{'name': name, 'cat': 'count', 'ph': 'C', 'pid': pid, 'tid': self._thread,
+                    'ts': round((time.perf_counter() - self.started) * 1e6, 3), 'args': {name: value}}
+                   for name, value in self.counts.items()]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': self.summary()}
+
+    def dump_profiles(self, directory, top=30):
+        """Write <stage>.prof (pstats/snakeviz) and <stage>.txt (top functions) per profiled stage."""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name, profiler in self.profiles.items():
+            path = os.path.join(directory, f'{name}.prof')
+            profiler.dump_stats(path)
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(top)
+            with open(os.path.join(directory, f'{name}.txt'), 'w') as f:
+                f.write(text.getvalue())
+            paths.append(path)
+        return paths
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,46 @@
+import hashlib
+import json
+
+# Issues that only differ in addresses, ports, sequence numbers, timestamps
+# or exact sizes get the same signature, so one LLM analysis can stand in
+# for the whole group.
+
+def _size_class(n):
+    if not n:
+        return '0'
+    # Power-of-two bucket, e.g. 100 -> '65-128'
+    high = 1 << (int(n) - 1).bit_length()
+    return f'{high // 2 + 1}-{high}' if high > 1 else '1'
+
+def issue_signature(issue):
+    """Normalized description of an issue, stable across flows and captures."""
+    details = issue['details']
+    src_port, dst_port = details.get('src_port'), details.get('dst_port')
+    checksum = details.get('checksum')
+    window = details.get('window')
+    return {
+        'type': issue['type'],
+        'protocol': details.get('protocol', 'tcp'),
+        # The side with the higher (ephemeral) port is usually the client
+        'role': 'client' if (src_port or 0) > (dst_port or 0) else 'server',
+        'flags': str(details.get('flags', '')),
+        'payload_len': _size_class(details.get('payload_len')),
+        'header_len': details.get('header_len'),
+        'window': None if window is None else ('zero' if window == 0 else 'open'),
+        'checksum': 'missing' if checksum is None or checksum <= 0 else 'present',
+        'has_ack': details.get('ack') not in (None, 0),
+    }
+
+def signature_key(signature):
+    return hashlib.sha1(json.dumps(signature, sort_keys=True).encode()).hexdigest()[:12]
+
+def group_issues(issues):
+    """{signature key: (signature, [issue, ...])} in first-seen order."""
+    groups = {}
+    for issue in issues:
+        signature = issue_signature(issue)
+        key = signature_key(signature)
+        if key not in groups:
+            groups[key] = (signature, [])
+        groups[key][1].append(issue)
+    return groups
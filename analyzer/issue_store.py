@@ -0,0 +1,114 @@
+import numpy as np
+from analyzer.packet_table import FLOW_KEY_COLUMNS, NO_TIMESTAMP, join_ip
+from analyzer.pcap_reader import PROTOCOL_NAMES, timestamp_ns_to_float
+from analyzer.rules import issue_types
+
+# Packet fields copied into an issue example. Payloads and options stay in
+# the capture; load_packets() fetches them by packet number when needed.
+DETAIL_FIELDS = ('protocol', 'src_ip', 'src_port', 'dst_ip', 'dst_port', 'flags', 'seq', 'ack', 'window',
+                 'payload_len', 'header_len', 'checksum', 'timestamp')
+
+_GROUP_DTYPE = np.dtype([(c, '<u8') for c in FLOW_KEY_COLUMNS] + [('protocol', '<u8'), ('type_id', '<u8')])
+
+class IssueStore:
+    """Issues as per-(flow, type) aggregates plus a capped set of examples.
+
+    add() takes detector hits (global packet numbers and issue type ids)
+    with the table holding those packets. Every hit counts towards its
+    flow/type aggregate (count, first and last timestamp); only the first
+    max_examples hits of each type (None for no cap) become example
+    records: {type, type_id, packet, flow, details}, where flow is an id
+    into flows() and details a small dict of header fields.
+    """
+
+    def __init__(self, max_examples=100):
+        self.max_examples = max_examples
+        self.flow_ids = {}
+        self.aggregates = {}
+        self.examples = {}
+        self.total = 0
+
+    def add(self, hit_index, hit_check, table, base=0):
+        """Aggregate one batch of hits; returns the new example records."""
+        if not len(hit_index):
+            return []
+        local = np.asarray(hit_index, dtype=np.int64) - base
+        cols = table.columns[local]
+        groups = np.empty(len(local), dtype=_GROUP_DTYPE)
+        for c in FLOW_KEY_COLUMNS + ('protocol',):
+            groups[c] = cols[c]
+        groups['type_id'] = hit_check
+        unique, inverse = np.unique(groups, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=len(unique))
+        ts = cols['timestamp_ns']
+        valid = ts != NO_TIMESTAMP
+        first = np.full(len(unique), np.iinfo(np.int64).max)
+        last = np.full(len(unique), NO_TIMESTAMP)
+        np.minimum.at(first, inverse[valid], ts[valid])
+        np.maximum.at(last, inverse[valid], ts[valid])
+        # Number new flows in order of their first issue, so ids don't depend on batching
+        first_hit = np.full(len(unique), len(local))
+        np.minimum.at(first_hit, inverse, np.arange(len(local)))
+        rows = unique.tolist()
+        group_flow = np.empty(len(unique), dtype=np.int64)
+        for g in np.argsort(first_hit).tolist():
+            row = rows[g]
+            flow = self.flow_ids.setdefault(row[:-1], len(self.flow_ids))
+            group_flow[g] = flow
+            aggregate = self.aggregates.setdefault((flow, row[-1]), [0, None, None])
+            aggregate[0] += int(counts[g])
+            if last[g] != NO_TIMESTAMP:
+                aggregate[1] = int(first[g]) if aggregate[1] is None else min(aggregate[1], int(first[g]))
+                aggregate[2] = int(last[g]) if aggregate[2] is None else max(aggregate[2], int(last[g]))
+        self.total += len(local)
+
+        types = issue_types()
+        new = []
+        for type_id in np.unique(hit_check).tolist():
+            kept = self.examples.setdefault(type_id, 0)
+            room = None if self.max_examples is None else max(0, self.max_examples - kept)
+            picks = np.flatnonzero(hit_check == type_id)[:room]
+            for k in picks.tolist():
+                row = table[int(local[k])]
+                new.append({'type': types[type_id], 'type_id': type_id, 'packet': int(hit_index[k]),
+                            'flow': int(group_flow[inverse[k]]), 'details': {f: row[f] for f in DETAIL_FIELDS}})
+            self.examples[type_id] = kept + len(picks)
+        # Back to packet order, then type order, like the detector's hits
+        new.sort(key=lambda record: (record['packet'], record['type_id']))
+        return new
+
+    def flows(self):
+        """{flow id: endpoints} for every flow with an issue."""
+        flows = {}
+        for key, flow in self.flow_ids.items():
+            src_hi, src_lo, dst_hi, dst_lo, src_port, dst_port, protocol = key
+            flows[flow] = {'src_ip': join_ip(src_hi, src_lo), 'src_port': src_port,
+                           'dst_ip': join_ip(dst_hi, dst_lo), 'dst_port': dst_port,
+                           'protocol': PROTOCOL_NAMES.get(protocol, str(protocol))}
+        return flows
+
+    def summary(self):
+        """Report surface: counts by type, and per flow/type with first/last seen and rate."""
+        types = issue_types()
+        by_type = {}
+        by_flow = []
+        for (flow, type_id), (count, first, last) in self.aggregates.items():
+            entry = by_type.setdefault(types[type_id], {'type_id': type_id, 'count': 0, 'flows': 0,
+                                                        'examples': self.examples.get(type_id, 0)})
+            entry['count'] += count
+            entry['flows'] += 1
+            span = (last - first) / 1e9 if first is not None else 0
+            by_flow.append({'flow': flow, 'type': types[type_id], 'type_id': type_id, 'count': count,
+                            'first_seen': timestamp_ns_to_float(first), 'last_seen': timestamp_ns_to_float(last),
+                            'rate_per_s': count / span if span > 0 else None})
+        by_flow.sort(key=lambda entry: (-entry['count'], entry['flow'], entry['type_id']))
+        return {'total': self.total, 'max_examples': self.max_examples, 'by_type': by_type,
+                'by_flow': by_flow, 'flows': self.flows()}
+
+def count_issues(report_data, issue_type):
+    """Total issues of a type in a report (older reports only have the list)."""
+    summary = report_data.get('issue_summary')
+    if summary is not None:
+        return summary['by_type'].get(issue_type, {}).get('count', 0)
+    return sum(1 for err in report_data.get('errors', []) if err['type'] == issue_type)
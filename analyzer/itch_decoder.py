@@ -0,0 +1,261 @@
+import numpy as np
+from analyzer.engine import FlowAnalyzer, register_analyzer
+from analyzer.pcap_reader import IPPROTO_UDP
+
+# NASDAQ TotalView-ITCH 5.0 carried over MoldUDP64. Every message type has a
+# fixed layout, so a batch is decoded by gathering the messages of each type
+# into a (count, size) byte matrix and viewing it through a NumPy dtype.
+
+MOLD_HEADER = np.dtype([('session', 'S10'), ('sequence', '>u8'), ('count', '>u2')])
+MOLD_END_OF_SESSION = 0xFFFF
+
+_COMMON = [('message_type', 'S1'), ('stock_locate', '>u2'), ('tracking_number', '>u2'), ('timestamp', 'u1', (6,))]
+
+def _message(*fields):
+    return np.dtype(_COMMON + list(fields))
+
+# Prices are integers with 4 implied decimals (8 for the MWCB levels);
+# timestamps are nanoseconds since midnight.
+ITCH_MESSAGES = {
+    b'S': ('system_event', _message(('event_code', 'S1'))),
+    b'R': ('stock_directory', _message(
+        ('stock', 'S8'), ('market_category', 'S1'), ('financial_status', 'S1'), ('round_lot_size', '>u4'),
+        ('round_lots_only', 'S1'), ('issue_classification', 'S1'), ('issue_subtype', 'S2'),
+        ('authenticity', 'S1'), ('short_sale_threshold', 'S1'), ('ipo_flag', 'S1'), ('luld_price_tier', 'S1'),
+        ('etp_flag', 'S1'), ('etp_leverage_factor', '>u4'), ('inverse_indicator', 'S1'))),
+    b'H': ('trading_action', _message(('stock', 'S8'), ('trading_state', 'S1'), ('reserved', 'S1'), ('reason', 'S4'))),
+    b'Y': ('reg_sho', _message(('stock', 'S8'), ('reg_sho_action', 'S1'))),
+    b'L': ('market_participant_position', _message(
+        ('mpid', 'S4'), ('stock', 'S8'), ('primary_market_maker', 'S1'), ('market_maker_mode', 'S1'),
+        ('participant_state', 'S1'))),
+    b'V': ('mwcb_decline_level', _message(('level1', '>u8'), ('level2', '>u8'), ('level3', '>u8'))),
+    b'W': ('mwcb_status', _message(('breached_level', 'S1'))),
+    b'K': ('ipo_quoting_period', _message(
+        ('stock', 'S8'), ('release_time', '>u4'), ('release_qualifier', 'S1'), ('ipo_price', '>u4'))),
+    b'J': ('luld_auction_collar', _message(
+        ('stock', 'S8'), ('reference_price', '>u4'), ('upper_price', '>u4'), ('lower_price', '>u4'),
+        ('extension', '>u4'))),
+    b'h': ('operational_halt', _message(('stock', 'S8'), ('market_code', 'S1'), ('halt_action', 'S1'))),
+    b'A': ('add_order', _message(
+        ('order_ref', '>u8'), ('side', 'S1'), ('shares', '>u4'), ('stock', 'S8'), ('price', '>u4'))),
+    b'F': ('add_order_mpid', _message(
+        ('order_ref', '>u8'), ('side', 'S1'), ('shares', '>u4'), ('stock', 'S8'), ('price', '>u4'),
+        ('attribution', 'S4'))),
+    b'E': ('order_executed', _message(('order_ref', '>u8'), ('executed_shares', '>u4'), ('match_number', '>u8'))),
+    b'C': ('order_executed_with_price', _message(
+        ('order_ref', '>u8'), ('executed_shares', '>u4'), ('match_number', '>u8'), ('printable', 'S1'),
+        ('execution_price', '>u4'))),
+    b'X': ('order_cancel', _message(('order_ref', '>u8'), ('cancelled_shares', '>u4'))),
+    b'D': ('order_delete', _message(('order_ref', '>u8'))),
+    b'U': ('order_replace', _message(
+        ('original_order_ref', '>u8'), ('new_order_ref', '>u8'), ('shares', '>u4'), ('price', '>u4'))),
+    b'P': ('trade', _message(
+        ('order_ref', '>u8'), ('side', 'S1'), ('shares', '>u4'), ('stock', 'S8'), ('price', '>u4'),
+        ('match_number', '>u8'))),
+    b'Q': ('cross_trade', _message(
+        ('shares', '>u8'), ('stock', 'S8'), ('cross_price', '>u4'), ('match_number', '>u8'), ('cross_type', 'S1'))),
+    b'B': ('broken_trade', _message(('match_number', '>u8'))),
+    b'I': ('noii', _message(
+        ('paired_shares', '>u8'), ('imbalance_shares', '>u8'), ('imbalance_direction', 'S1'), ('stock', 'S8'),
+        ('far_price', '>u4'), ('near_price', '>u4'), ('current_reference_price', '>u4'), ('cross_type', 'S1'),
+        ('price_variation', 'S1'))),
+    b'N': ('rpii', _message(('stock', 'S8'), ('interest_flag', 'S1'))),
+    b'O': ('dlcr_price_discovery', _message(
+        ('stock', 'S8'), ('open_eligibility', 'S1'), ('min_allowable_price', '>u4'),
+        ('max_allowable_price', '>u4'), ('near_execution_price', '>u4'), ('near_execution_time', '>u8'),
+        ('lower_price_collar', '>u4'), ('upper_price_collar', '>u4'))),
+}
+
+def _native_dtype(raw):
+    # Same fields in native byte order, with the 6-byte timestamp widened
+    fields = [('packet_index', 'i8'), ('sequence', 'u8')]
+    for name in raw.names:
+        base = raw.fields[name][0]
+        if name == 'timestamp':
+            fields.append((name, 'u8'))
+        elif base.kind == 'u':
+            fields.append((name, base.newbyteorder('=')))
+        else:
+            fields.append((name, base))
+    return np.dtype(fields)
+
+ITCH_DTYPES = {code: _native_dtype(raw) for code, (_name, raw) in ITCH_MESSAGES.items()}
+_TIMESTAMP_WEIGHTS = (1 << np.arange(40, -1, -8, dtype=np.uint64)).astype(np.uint64)
+
+def _gather(buf, starts, width):
+    # (len(starts), width) matrix of the bytes at each start
+    return buf[starts[:, None] + np.arange(width)]
+
+def decode_itch(buf, starts, lengths, packet_index=None, sequence=None):
+    """Decode ITCH messages at buf[starts[i]:starts[i] + lengths[i]].
+
+    Returns {type code: structured array} using ITCH_DTYPES, with each row's
+    packet_index and MoldUDP64 sequence number alongside the message fields.
+    Messages shorter than their type's layout, or of unknown type, are
+    counted under b'?' as {'count': n}.
+    """
+    buf = np.frombuffer(buf, dtype=np.uint8)
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if packet_index is None:
+        packet_index = np.full(len(starts), -1, dtype=np.int64)
+    if sequence is None:
+        sequence = np.zeros(len(starts), dtype=np.uint64)
+    codes = buf[starts] if len(starts) else np.zeros(0, dtype=np.uint8)
+    decoded = {}
+    handled = np.zeros(len(starts), dtype=bool)
+    for code, (_name, raw) in ITCH_MESSAGES.items():
+        rows = np.flatnonzero((codes == code[0]) & (lengths >= raw.itemsize))
+        if not len(rows):
+            continue
+        handled[rows] = True
+        fields = _gather(buf, starts[rows], raw.itemsize).view(raw).reshape(-1)
+        out = np.empty(len(rows), dtype=ITCH_DTYPES[code])
+        out['packet_index'] = packet_index[rows]
+        out['sequence'] = sequence[rows]
+        for name in raw.names:
+            if name == 'timestamp':
+                out[name] = fields[name].astype(np.uint64) @ _TIMESTAMP_WEIGHTS
+            else:
+                out[name] = fields[name]
+        decoded[code] = out
+    if not handled.all():
+        decoded[b'?'] = {'count': int((~handled).sum())}
+    return decoded
+
+def frame_moldudp64(buf, starts, ends):
+    """Split MoldUDP64 packets buf[starts[i]:ends[i]] into message blocks.
+
+    Returns (headers, packet, msg_start, msg_length, msg_sequence): the
+    parsed MOLD_HEADER of every packet long enough to carry one, and for
+    each message the row of its packet in headers, where its bytes start,
+    its length and its sequence number. All packets are walked in lock
+    step, one message position per iteration.
+    """
+    buf_array = np.frombuffer(buf, dtype=np.uint8)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    ok = ends - starts >= MOLD_HEADER.itemsize
+    starts, ends = starts[ok], ends[ok]
+    headers = _gather(buf_array, starts, MOLD_HEADER.itemsize).view(MOLD_HEADER).reshape(-1)
+    counts = headers['count'].astype(np.int64)
+    counts[counts == MOLD_END_OF_SESSION] = 0
+    pos = starts + MOLD_HEADER.itemsize
+    packet, msg_start, msg_length, msg_sequence = [], [], [], []
+    active = np.flatnonzero(counts > 0)
+    k = 0
+    while len(active):
+        # Every active packet needs room for a length prefix
+        active = active[pos[active] + 2 <= ends[active]]
+        at = pos[active]
+        length = (buf_array[at].astype(np.int64) << 8) | buf_array[at + 1]
+        fits = at + 2 + length <= ends[active]
+        active, at, length = active[fits], at[fits], length[fits]
+        packet.append(active)
+        msg_start.append(at + 2)
+        msg_length.append(length)
+        msg_sequence.append(headers['sequence'][active].astype(np.uint64) + np.uint64(k))
+        pos[active] = at + 2 + length
+        k += 1
+        active = active[counts[active] > k]
+    if packet:
+        return (headers, np.concatenate(packet), np.concatenate(msg_start), np.concatenate(msg_length),
+                np.concatenate(msg_sequence))
+    empty = np.zeros(0, dtype=np.int64)
+    return headers, empty, empty, empty, np.zeros(0, dtype=np.uint64)
+
+class ItchDecoder:
+    """MoldUDP64 session tracking plus ITCH decoding over PacketTable batches.
+
+    Only UDP rows are looked at. Per session the next expected sequence
+    number is kept across batches, so gaps (lost packets) and replays
+    (sequence numbers already seen) are counted as they arrive.
+    """
+
+    def __init__(self):
+        self.expected = {}
+        self.sessions = {}
+        self.by_type = {}
+        self.totals = {'packets': 0, 'messages': 0, 'heartbeats': 0, 'end_of_session': 0,
+                       'gaps': 0, 'missing_messages': 0, 'replayed_packets': 0, 'undecoded': 0}
+
+    def feed(self, table, index=None):
+        """Decode one batch; returns {type code: structured array}."""
+        if index is None:
+            index = np.arange(len(table))
+        rows = np.flatnonzero(table.columns['protocol'] == IPPROTO_UDP)
+        starts = table.payload_offsets[rows].astype(np.int64)
+        ends = table.payload_offsets[rows + 1].astype(np.int64)
+        headers, packet, msg_start, msg_length, msg_sequence = frame_moldudp64(table.payloads, starts, ends)
+        packet_rows = rows[ends - starts >= MOLD_HEADER.itemsize]
+        self._track_sequences(headers)
+        decoded = decode_itch(table.payloads, msg_start, msg_length, index[packet_rows[packet]], msg_sequence)
+        self.totals['messages'] += len(msg_start)
+        for code, records in decoded.items():
+            if code == b'?':
+                self.totals['undecoded'] += records['count']
+            else:
+                name = ITCH_MESSAGES[code][0]
+                self.by_type[name] = self.by_type.get(name, 0) + len(records)
+        return decoded
+
+    def _track_sequences(self, headers):
+        self.totals['packets'] += len(headers)
+        counts = headers['count'].astype(np.int64)
+        self.totals['end_of_session'] += int((counts == MOLD_END_OF_SESSION).sum())
+        self.totals['heartbeats'] += int((counts == 0).sum())
+        counts[counts == MOLD_END_OF_SESSION] = 0
+        for session in np.unique(headers['session']):
+            mine = headers['session'] == session
+            sequence = headers['sequence'][mine].astype(np.int64)
+            following = sequence + counts[mine]
+            expected = self.expected.get(session)
+            if expected is None:
+                expected = int(sequence[0])
+            # Highest sequence number promised by anything before each packet
+            before = np.maximum.accumulate(np.concatenate(([expected], following[:-1])))
+            missing = sequence - before
+            self.totals['gaps'] += int((missing > 0).sum())
+            self.totals['missing_messages'] += int(missing[missing > 0].sum())
+            self.totals['replayed_packets'] += int(((following <= before) & (counts[mine] > 0)).sum())
+            self.expected[session] = max(int(before[-1]), int(following[-1]))
+            name = session.decode(errors='replace').strip()
+            self.sessions[name] = self.sessions.get(name, 0) + int(mine.sum())
+
+    def summary(self):
+        return dict(self.totals, sessions=dict(self.sessions), by_type=dict(self.by_type))
+
+@register_analyzer
+class ItchAnalyzer(FlowAnalyzer):
+    """MoldUDP64/ITCH as an AnalysisEngine analyzer.
+
+    Records are only the per-partition summary emitted by finish(); set
+    keep_messages=True to also get the decoded arrays from every feed().
+    """
+
+    name = 'itch'
+
+    def __init__(self, keep_messages=False):
+        self.decoder = ItchDecoder()
+        self.keep_messages = keep_messages
+
+    def feed(self, table, index):
+        decoded = self.decoder.feed(table, index)
+        return [decoded] if self.keep_messages else None
+
+    def finish(self):
+        return [{'summary': self.decoder.summary()}]
+
+    @classmethod
+    def merge(cls, partials):
+        records = [r for partial in partials if partial for r in partial]
+        summaries = [r['summary'] for r in records if 'summary' in r]
+        if not summaries:
+            return records
+        merged = {name: sum(s[name] for s in summaries) for name in summaries[0] if name not in ('sessions', 'by_type')}
+        for name in ('sessions', 'by_type'):
+            merged[name] = {}
+            for s in summaries:
+                for key, count in s[name].items():
+                    merged[name][key] = merged[name].get(key, 0) + count
+        return [r for r in records if 'summary' not in r] + [{'summary': merged}]
@@ -0,0 +1,190 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+class JobCancelled(Exception):
+    """Raised in a job's thread by its next progress report once it was cancelled."""
+
+class Job:
+    """One submitted analysis and everything it has reported so far.
+
+    The job's function gets the Job and reports through progress(stage,
+    counts, partial): counts are the stage's running totals, and partial,
+    given once the stage is finished, holds results worth showing before
+    the whole job is. Every report is also where cancel() takes effect.
+    snapshot() can be called from any thread.
+    """
+
+    def __init__(self, owner, fn, label=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.owner = owner
+        self.fn = fn
+        self.label = label
+        self.status = 'queued'
+        self.stages = {}
+        self.partial = {}
+        self.insight = None
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    def progress(self, stage, counts, partial=None):
+        self.check()
+        with self._lock:
+            entry = self.stages.setdefault(stage, {'counts': {}, 'done': False})
+            entry['counts'].update(counts)
+            if partial is not None:
+                entry['done'] = True
+                self.partial.update(partial)
+
+    def on_insight(self, group, text):
+        """on_insight hook of generate_report: keeps the insight streaming in last."""
+        self.check()
+        with self._lock:
+            self.insight = (group, text)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _set(self, **fields):
+        with self._lock:
+            self.__dict__.update(fields)
+
+    def snapshot(self):
+        with self._lock:
+            end = self.finished or time.time()
+            return {'id': self.id, 'label': self.label, 'status': self.status,
+                    'stages': {stage: {'counts': dict(entry['counts']), 'done': entry['done']}
+                               for stage, entry in self.stages.items()},
+                    'partial': dict(self.partial), 'insight': self.insight, 'result': self.result,
+                    'error': self.error, 'elapsed': end - self.started if self.started else 0.0,
+                    'cancelling': self._cancel.is_set() and self.status == 'running'}
+
+class JobPool:
+    """Threads running Jobs for several owners (e.g. one per UI session).
+
+    Queued jobs wait in one queue per owner and free threads serve owners
+    round-robin, with at most per_owner running jobs per owner, so a user
+    who queues many analyses can't hold up everyone else's. Cancelling a
+    queued job drops it; a running one stops at its next progress report.
+    The last max_finished finished jobs are kept for their owners to
+    collect. Jobs do their heavy lifting in worker processes of their own,
+    so threads are enough here.
+    """
+
+    def __init__(self, workers=2, per_owner=1, max_finished=100):
+        self.per_owner = per_owner
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+        # Owners with queued jobs, in serving order
+        self._queues = OrderedDict()
+        self._running = {}
+        self._finished = deque()
+        self._closed = False
+        self._cond = threading.Condition()
+        self._threads = [threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, owner, fn, label=None):
+        """Queue fn(job) for owner; returns the Job."""
+        job = Job(owner, fn, label)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("job pool is shut down")
+            self._jobs[job.id] = job
+            self._queues.setdefault(owner, deque()).append(job)
+            self._cond.notify()
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def jobs(self, owner=None):
+        with self._cond:
+            return [job for job in self._jobs.values() if owner is None or job.owner == owner]
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.cancel()
+            if job.status == 'queued':
+                queue = self._queues[job.owner]
+                queue.remove(job)
+                if not queue:
+                    del self._queues[job.owner]
+                self._done(job, status='cancelled')
+            return True
+
+    def _next(self):
+        for owner, queue in self._queues.items():
+            if self._running.get(owner, 0) < self.per_owner:
+                job = queue.popleft()
+                # Served owners go to the back of the line
+                del self._queues[owner]
+                if queue:
+                    self._queues[owner] = queue
+                return job
+        return None
+
+    def _done(self, job, **fields):
+        job._set(finished=time.time(), **fields)
+        self._finished.append(job.id)
+        while len(self._finished) > self.max_finished:
+            self._jobs.pop(self._finished.popleft(), None)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next()
+                while job is None and not self._closed:
+                    self._cond.wait()
+                    job = self._next()
+                if job is None:
+                    return
+                self._running[job.owner] = self._running.get(job.owner, 0) + 1
+                job._set(status='running', started=time.time())
+            fields = {}
+            try:
+                fields['result'] = job.fn(job)
+                fields['status'] = 'done'
+            except JobCancelled:
+                fields['status'] = 'cancelled'
+            except Exception as e:
+                logger.exception(f"Job {job.id} ({job.label}) failed")
+                fields.update(status='failed', error=f"{type(e).__name__}: {e}")
+            with self._cond:
+                self._running[job.owner] -= 1
+                if not self._running[job.owner]:
+                    del self._running[job.owner]
+                self._done(job, **fields)
+                # A slot of this owner is free again
+                self._cond.notify_all()
+
+    def shutdown(self, wait=True):
+        """Cancel every job and stop the threads."""
+        with self._cond:
+            self._closed = True
+            for job in list(self._jobs.values()):
+                if job.status in ('queued', 'running'):
+                    self.cancel(job.id)
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
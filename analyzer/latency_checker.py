@@ -1,19 +1,90 @@
-# Placeholder for latency calculation between order and response
+from analyzer.packet_table import PacketTable, NO_TIMESTAMP
+from analyzer.flow_state import FlowStateStore
+from analyzer.engine import FlowAnalyzer, register_analyzer, only_protocol
+from analyzer.pcap_reader import IPPROTO_TCP
+
+def _flow_size(state):
+    # Small fixed-size list per flow; a function rather than a lambda so trackers pickle
+    return 200
+
+class LatencyTracker:
+    """Incremental calculate_latency over a stream of PacketTable batches.
+
+    Keeps [first_seen, session, first_ts, last_ts, count] per flow, where
+    first_seen is the global packet index used to report flows in capture
+    order.
+    """
+
+    def __init__(self, max_memory=None, spill_dir=None):
+        self.flows = FlowStateStore(max_memory, size_of=_flow_size, spill_dir=spill_dir)
+        self.packets_seen = 0
+
+    def feed(self, table, index=None):
+        # index maps table rows to global packet numbers (defaults to running count)
+        flows = table.group_flows()
+        timestamps = table.columns['timestamp_ns']
+        self.flows.advance(timestamps)
+        for flow in range(len(flows.counts)):
+            first, last = flows.first_index[flow], flows.last_index[flow]
+            key = table.raw_flow_key(first)
+            state = self.flows.get(key)
+            if state is None:
+                first_seen = self.packets_seen + int(first) if index is None else int(index[first])
+                state = [first_seen, table.flow_key(first), int(timestamps[first]), 0, 0]
+            state[3] = int(timestamps[last])
+            state[4] += int(flows.counts[flow])
+            self.flows[key] = state
+        self.packets_seen += len(table)
+
+    def ordered_results(self, flows=None):
+        """(first_seen, latency) pairs, first_seen being the flow's first packet number."""
+        latencies = []
+        for _key, (first_seen, session, start, end, count) in self.flows.items() if flows is None else flows:
+            # Assume packets are in order; use first and last for rough latency
+            if count > 1 and start != NO_TIMESTAMP and end != NO_TIMESTAMP:
+                latencies.append((first_seen, {'session': session, 'latency_ms': (end - start) / 1e6}))
+        latencies.sort(key=lambda pair: pair[0])
+        return latencies
+
+    def expire(self, before):
+        """ordered_results() of the flows idle since before, which are dropped."""
+        return self.ordered_results(self.flows.expire(before))
+
+    def results(self):
+        return [latency for _first_seen, latency in self.ordered_results()]
+
+    def close(self):
+        self.flows.close()
+
+@register_analyzer
+class LatencyAnalyzer(FlowAnalyzer):
+    """calculate_latency as an AnalysisEngine analyzer; emits its records on finish."""
+
+    name = 'latency'
+
+    def __init__(self, max_memory=None):
+        self.tracker = LatencyTracker(max_memory=max_memory)
+
+    def feed(self, table, index):
+        self.tracker.feed(*only_protocol(table, index, IPPROTO_TCP))
+
+    def expire(self, now, idle):
+        return self.tracker.expire(now - idle)
+
+    def finish(self):
+        results = self.tracker.ordered_results()
+        self.tracker.close()
+        return results
+
+    @classmethod
+    def merge(cls, partials):
+        merged = [pair for partial in partials if partial for pair in partial]
+        merged.sort(key=lambda pair: pair[0])
+        return [latency for _first_seen, latency in merged]
 
 def calculate_latency(packets):
     # Group packets by session (src_ip, src_port, dst_ip, dst_port)
-    from collections import defaultdict
-    import time
-    sessions = defaultdict(list)
-    for pkt in packets:
-        sess_key = (pkt['src_ip'], pkt['src_port'], pkt['dst_ip'], pkt['dst_port'])
-        sessions[sess_key].append(pkt)
-    latencies = []
-    for sess, pkts in sessions.items():
-        if len(pkts) > 1:
-            # Assume packets are in order; use first and last for rough latency
-            start = pkts[0].get('timestamp', None)
-            end = pkts[-1].get('timestamp', None)
-            if start is not None and end is not None:
-                latencies.append({'session': sess, 'latency_ms': (end - start) * 1000})
-    return latencies 
\ No newline at end of file
+    table = packets if isinstance(packets, PacketTable) else PacketTable.from_packets(packets)
+    tracker = LatencyTracker()
+    tracker.feed(table)
+    return tracker.results()
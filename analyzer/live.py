@@ -0,0 +1,180 @@
+import os
+import stat
+import sys
+import numpy as np
+from analyzer.histogram import LatencyHistogram
+from analyzer.packet_table import NO_TIMESTAMP, PacketTableBuilder, _PROTOCOL_NUMBERS
+from analyzer.pcap_reader import IPPROTO_TCP, capture_header_length, decode_headers, iter_records, timestamp_ns_to_float
+
+class CaptureTail:
+    """Decodes a pcap/pcapng capture while it is still being written.
+
+    path is a file a tap keeps appending to, or '-' (stdin) or a FIFO to
+    read as a stream. Each read() decodes the complete records that arrived
+    since the last one into a PacketTable (empty if there were none); a
+    record cut off at the end waits for the rest. eof is set once the
+    writer of a stream has closed it; files are followed until the caller
+    stops.
+    """
+
+    def __init__(self, path, protocols=('tcp',), max_bytes=16 << 20):
+        self.path = path
+        self.wanted = {_PROTOCOL_NUMBERS[p] for p in protocols}
+        self.max_bytes = max_bytes
+        if path == '-':
+            self.fd = sys.stdin.buffer.fileno()
+            self.stream = True
+        else:
+            self.fd = os.open(path, os.O_RDONLY)
+            self.stream = stat.S_ISFIFO(os.fstat(self.fd).st_mode)
+        if self.stream:
+            os.set_blocking(self.fd, False)
+        self.eof = False
+        self.bytes_read = 0
+        self.header = None
+        self.context = None
+        self._pending = b''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _read(self):
+        chunks = []
+        size = 0
+        while size < self.max_bytes:
+            try:
+                chunk = os.read(self.fd, min(1 << 20, self.max_bytes - size))
+            except BlockingIOError:
+                break
+            if not chunk:
+                # End of a stream means the writer is gone; a file may still grow
+                self.eof = self.stream
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        self.bytes_read += size
+        return b''.join(chunks)
+
+    def read(self):
+        builder = PacketTableBuilder()
+        data = self._pending + self._read()
+        # Where data starts in the capture
+        base = self.bytes_read - len(data)
+        start = len(self.header) if self.header is not None else None
+        if self.header is None:
+            length = capture_header_length(data)
+            if length is None:
+                self._pending = data
+                return builder.build()
+            self.header = data[:length]
+        else:
+            # Records are parsed behind a copy of the file header, as if the file were contiguous
+            data = self.header + data
+            base -= len(self.header)
+        position = {}
+        for ts_ns, linktype, frame, offset in iter_records(data, start, None, self.context, position):
+            headers = decode_headers(frame, linktype)
+            if headers is not None and headers[0] in self.wanted:
+                builder.append_headers(ts_ns, headers, frame, base + offset)
+        self.context = position['context']
+        self._pending = data[position['offset']:]
+        return builder.build()
+
+    @property
+    def backlog(self):
+        """Bytes written to a followed file that have not been read yet (0 for streams)."""
+        if self.stream:
+            return 0
+        return max(0, os.fstat(self.fd).st_size - self.bytes_read)
+
+    def close(self):
+        if self.path != '-':
+            os.close(self.fd)
+
+def _new_bucket():
+    return {'packets': 0, 'tcp_packets': 0, 'issues': {}, 'latency': {}}
+
+class RollingMetrics:
+    """Counters and latency histograms over the last window seconds of capture time.
+
+    Everything is counted in one bucket per capture-time second; snapshot()
+    drops the buckets more than window seconds older than the newest packet
+    and folds the rest into rates, issue counts and latency percentiles.
+    """
+
+    def __init__(self, window=60, retransmission='TCP Retransmission'):
+        self.window = window
+        self.retransmission = retransmission
+        self.buckets = {}
+        self.newest = None
+        self.first_second = None
+        self.totals = {'packets': 0, 'issues': 0}
+
+    def _seconds(self, timestamps):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        valid = timestamps != NO_TIMESTAMP
+        return timestamps[valid] // 1_000_000_000, valid
+
+    def add_packets(self, timestamps, protocols):
+        seconds, valid = self._seconds(timestamps)
+        self.totals['packets'] += len(timestamps)
+        if not len(seconds):
+            return
+        self.newest = max(self.newest or 0, int(np.asarray(timestamps)[valid].max()))
+        if self.first_second is None:
+            self.first_second = int(seconds.min())
+        tcp = np.asarray(protocols)[valid] == IPPROTO_TCP
+        for second, count in zip(*np.unique(seconds, return_counts=True)):
+            self.buckets.setdefault(int(second), _new_bucket())['packets'] += int(count)
+        for second, count in zip(*np.unique(seconds[tcp], return_counts=True)):
+            self.buckets[int(second)]['tcp_packets'] += int(count)
+
+    def add_issues(self, timestamps, issue_types):
+        """issue_types holds the type name of each issue."""
+        seconds, valid = self._seconds(timestamps)
+        self.totals['issues'] += len(timestamps)
+        for second, issue_type in zip(seconds.tolist(), np.asarray(issue_types, dtype=object)[valid].tolist()):
+            issues = self.buckets.setdefault(second, _new_bucket())['issues']
+            issues[issue_type] = issues.get(issue_type, 0) + 1
+
+    def add_latencies(self, name, timestamps, values_ns):
+        seconds, valid = self._seconds(timestamps)
+        values = np.asarray(values_ns, dtype=np.float64)[valid]
+        for second in np.unique(seconds).tolist():
+            latency = self.buckets.setdefault(second, _new_bucket())['latency']
+            if name not in latency:
+                latency[name] = LatencyHistogram()
+            latency[name].record(values[seconds == second])
+
+    def snapshot(self):
+        if self.newest is None:
+            return {'window_s': self.window, 'capture_time': None, 'totals': dict(self.totals)}
+        newest_second = self.newest // 1_000_000_000
+        for second in [s for s in self.buckets if s <= newest_second - self.window]:
+            del self.buckets[second]
+        span = min(self.window, newest_second - self.first_second + 1)
+        packets = sum(b['packets'] for b in self.buckets.values())
+        tcp_packets = sum(b['tcp_packets'] for b in self.buckets.values())
+        issues = {}
+        latency = {}
+        for bucket in self.buckets.values():
+            for issue_type, count in bucket['issues'].items():
+                issues[issue_type] = issues.get(issue_type, 0) + count
+            for name, hist in bucket['latency'].items():
+                latency.setdefault(name, LatencyHistogram()).merge(hist)
+        total_issues = sum(issues.values())
+        return {
+            'window_s': span,
+            'capture_time': timestamp_ns_to_float(self.newest),
+            'packets': packets,
+            'packets_per_s': packets / span,
+            'issues': total_issues,
+            'issues_per_s': total_issues / span,
+            'issues_by_type': issues,
+            'retransmission_rate': issues.get(self.retransmission, 0) / tcp_packets if tcp_packets else 0.0,
+            'latency': {name: hist.summary() for name, hist in latency.items()},
+            'totals': dict(self.totals),
+        }
@@ -0,0 +1,152 @@
+from collections import OrderedDict
+from analyzer.engine import FlowAnalyzer, register_analyzer
+from analyzer.pcap_reader import timestamp_ns_to_float
+from analyzer.histogram import LatencyHistogram, merge_histograms
+
+# NewOrderSingle, OrderCancelRequest, OrderCancelReplaceRequest
+ORDER_MSG_TYPES = frozenset(('D', 'F', 'G'))
+# ExecutionReport, OrderCancelReject
+RESPONSE_MSG_TYPES = frozenset(('8', '9'))
+
+class OrderLatencyMatcher:
+    """Pairs outbound orders with the first response carrying their ClOrdID.
+
+    Pending orders are keyed by (connection, ClOrdID) in insertion order,
+    so expiring the ones older than ttl seconds (capture time) or beyond
+    max_pending is a pop from the front. add() takes reassembled FIX
+    message records and returns matched/unmatched order records; matched
+    latencies also go into one LatencyHistogram (ns) per order MsgType.
+    """
+
+    def __init__(self, ttl=30.0, max_pending=1_000_000, significant_digits=2):
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self.significant_digits = significant_digits
+        self.histograms = {}
+        self.pending = OrderedDict()
+        self.stats = {'orders': 0, 'matched': 0, 'expired': 0, 'evicted': 0, 'no_response': 0,
+                      'duplicate_orders': 0, 'unmatched_responses': 0}
+
+    def add(self, records):
+        results = []
+        latencies = {}
+        for record in records:
+            message = record['message']
+            msg_type = message.get('35')
+            cl_ord_id = message.get('11')
+            timestamp = record['timestamp']
+            if cl_ord_id is None or timestamp is None:
+                continue
+            if msg_type in ORDER_MSG_TYPES:
+                self._expire(timestamp, results)
+                self._add_order(record, msg_type, cl_ord_id, results)
+            elif msg_type in RESPONSE_MSG_TYPES:
+                src, sport, dst, dport = record['session']
+                order = self.pending.pop(((dst, dport, src, sport), cl_ord_id), None)
+                if order is None:
+                    # Includes the later fills of an already acknowledged order
+                    self.stats['unmatched_responses'] += 1
+                    continue
+                self.stats['matched'] += 1
+                latency_us = (timestamp - order['timestamp']) * 1e6
+                latencies.setdefault(order['msg_type'], []).append(latency_us * 1000)
+                results.append({
+                    'status': 'matched',
+                    'session': order['session'],
+                    'cl_ord_id': cl_ord_id,
+                    'msg_type': order['msg_type'],
+                    'response_type': msg_type,
+                    'exec_type': message.get('150'),
+                    'order_packet': order['packet_index'],
+                    'response_packet': record['packet_index'],
+                    'latency_us': latency_us,
+                })
+        for msg_type, values in latencies.items():
+            hist = self.histograms.get(msg_type)
+            if hist is None:
+                hist = self.histograms[msg_type] = LatencyHistogram(self.significant_digits)
+            hist.record(values)
+        return results
+
+    def _add_order(self, record, msg_type, cl_ord_id, results):
+        key = (record['session'], cl_ord_id)
+        self.stats['orders'] += 1
+        if key in self.pending:
+            # Resent order (e.g. PossDup), keep timing from the first send
+            self.stats['duplicate_orders'] += 1
+            return
+        self.pending[key] = {
+            'session': record['session'],
+            'cl_ord_id': cl_ord_id,
+            'msg_type': msg_type,
+            'packet_index': record['packet_index'],
+            'timestamp': record['timestamp'],
+        }
+        while len(self.pending) > self.max_pending:
+            results.append(self._unmatched(self.pending.popitem(last=False)[1], 'evicted'))
+
+    def _expire(self, now, results):
+        while self.pending:
+            order = next(iter(self.pending.values()))
+            if now - order['timestamp'] <= self.ttl:
+                break
+            self.pending.popitem(last=False)
+            results.append(self._unmatched(order, 'expired'))
+
+    def _unmatched(self, order, reason):
+        self.stats[reason] += 1
+        return dict(order, status='unmatched', reason=reason)
+
+    def finish(self):
+        """Report every order still waiting for a response."""
+        results = [self._unmatched(order, 'no_response') for order in self.pending.values()]
+        self.pending.clear()
+        return results
+
+@register_analyzer
+class OrderLatencyAnalyzer(FlowAnalyzer):
+    """Order-to-execution wire latency as an AnalysisEngine analyzer.
+
+    Matches the FIX messages of the app_messages analyzer's TCP reassembly
+    of the same partition, so payloads are reassembled and framed once.
+    Both directions of a connection land in the same partition, so orders
+    and their responses always meet. Records are the matcher's order
+    records plus one {'stats': ...} from finish().
+    """
+
+    name = 'order_latency'
+    source = 'app_messages'
+
+    def __init__(self, ttl=30.0, max_pending=1_000_000, significant_digits=2):
+        self.matcher = OrderLatencyMatcher(ttl, max_pending, significant_digits)
+
+    def _fix(self, messages):
+        return self.matcher.add(m for m in messages if m.get('protocol') == 'fix')
+
+    def feed(self, table, index, messages):
+        return self._fix(messages)
+
+    def expire(self, now, idle, messages):
+        # Orders past their ttl expire here too when no new order comes along to do it
+        results = self._fix(messages)
+        self.matcher._expire(timestamp_ns_to_float(now), results)
+        return results
+
+    def finish(self, messages):
+        flushed = self._fix(messages)
+        histograms = {msg_type: hist.to_dict() for msg_type, hist in self.matcher.histograms.items()}
+        return flushed + self.matcher.finish() + [{'stats': dict(self.matcher.stats), 'histograms': histograms}]
+
+    @classmethod
+    def merge(cls, partials):
+        records = [r for partial in partials if partial for r in partial]
+        orders = [r for r in records if 'stats' not in r]
+        orders.sort(key=lambda r: r['response_packet'] if r['status'] == 'matched' else r['packet_index'])
+        finals = [r for r in records if 'stats' in r]
+        if finals:
+            stats = {name: sum(r['stats'][name] for r in finals) for name in finals[0]['stats']}
+            msg_types = sorted({t for r in finals for t in r['histograms']})
+            histograms = {t: merge_histograms(r['histograms'][t] for r in finals if t in r['histograms']).to_dict()
+                          for t in msg_types}
+            orders.append({'stats': stats, 'histograms': histograms})
+        return orders
@@ -0,0 +1,411 @@
+import socket
+from collections import namedtuple
+from collections.abc import Mapping
+import numpy as np
+from analyzer.pcap_reader import (
+    open_capture, close_capture, iter_records, decode_headers, timestamp_ns_to_float,
+    TCP_FLAG_STRINGS, PROTOCOL_NAMES, IPPROTO_TCP, IPPROTO_UDP,
+)
+
+# Columnar packet storage. One row per packet in a NumPy structured array,
+# with every payload packed into a single buffer indexed by an offsets array.
+# IP addresses are 128-bit (hi/lo uint64 halves); IPv4 is stored v4-mapped.
+
+PACKET_DTYPE = np.dtype([
+    ('timestamp_ns', '<i8'),
+    ('src_ip_hi', '<u8'),
+    ('src_ip_lo', '<u8'),
+    ('dst_ip_hi', '<u8'),
+    ('dst_ip_lo', '<u8'),
+    ('src_port', '<u2'),
+    ('dst_port', '<u2'),
+    ('protocol', 'u1'),
+    ('header_len', 'u1'),
+    ('flags', '<u2'),
+    ('seq', '<u4'),
+    ('ack', '<u4'),
+    ('window', '<u2'),
+    ('checksum', '<i4'),
+    ('payload_len', '<u4'),
+])
+
+FLOW_KEY_COLUMNS = ('src_ip_hi', 'src_ip_lo', 'dst_ip_hi', 'dst_ip_lo', 'src_port', 'dst_port')
+
+FLAG_FIN = 0x01
+FLAG_SYN = 0x02
+FLAG_RST = 0x04
+FLAG_PSH = 0x08
+FLAG_ACK = 0x10
+FLAG_URG = 0x20
+
+NO_TIMESTAMP = np.iinfo(np.int64).min
+NO_CHECKSUM = -1
+
+IPV4_MAPPED = 0xFFFF00000000
+_LOW64 = (1 << 64) - 1
+_PROTOCOL_NUMBERS = {name: number for number, name in PROTOCOL_NAMES.items()}
+_FLAG_BITS = {letter: 1 << bit for bit, letter in enumerate('FSRPAUECN')}
+
+PACKET_FIELDS = ('protocol', 'src_ip', 'dst_ip', 'src_port', 'dst_port', 'flags', 'seq', 'ack', 'window',
+                 'payload_len', 'header_len', 'checksum', 'options', 'raw_payload', 'timestamp')
+
+FlowGroups = namedtuple('FlowGroups', ['ids', 'first_index', 'last_index', 'counts'])
+
+
+def split_ip(packed):
+    value = int.from_bytes(packed, 'big')
+    if len(packed) == 4:
+        return 0, IPV4_MAPPED | value
+    return value >> 64, value & _LOW64
+
+
+def join_ip(hi, lo):
+    hi, lo = int(hi), int(lo)
+    if hi == 0 and lo >> 32 == 0xFFFF:
+        return socket.inet_ntoa((lo & 0xFFFFFFFF).to_bytes(4, 'big'))
+    return socket.inet_ntop(socket.AF_INET6, ((hi << 64) | lo).to_bytes(16, 'big'))
+
+
+def _pack_ip_str(ip):
+    if not ip:
+        return b'\x00' * 4
+    try:
+        return socket.inet_aton(ip) if ':' not in ip else socket.inet_pton(socket.AF_INET6, ip)
+    except OSError:
+        return b'\x00' * 4
+
+
+def _flag_bits(flags):
+    if isinstance(flags, int):
+        return flags
+    if isinstance(flags, str) and flags.startswith('0x'):
+        return int(flags, 16)
+    return sum(_FLAG_BITS.get(letter, 0) for letter in set(flags or ''))
+
+
+class PacketTableBuilder:
+    """Accumulates decoded packets into fixed-size NumPy chunks."""
+
+    def __init__(self, chunk_size=65536):
+        self.chunk_size = chunk_size
+        self._rows = []
+        self._chunks = []
+        self._payloads = bytearray()
+        self._offsets = [0]
+        self._records = []
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def append_headers(self, timestamp_ns, headers, frame, record_offset=None):
+        (proto, src, dst, sport, dport, flag_bits, seq, ack, window, header_len, checksum,
+         _options_start, payload_start, payload_end) = headers
+        src_hi, src_lo = split_ip(src)
+        dst_hi, dst_lo = split_ip(dst)
+        self._payloads += frame[payload_start:payload_end]
+        self._offsets.append(len(self._payloads))
+        if record_offset is not None:
+            self._records.append(record_offset)
+        self._add_row((
+            NO_TIMESTAMP if timestamp_ns is None else timestamp_ns,
+            src_hi, src_lo, dst_hi, dst_lo, sport, dport, proto, min(header_len, 255), flag_bits,
+            seq or 0, ack or 0, window or 0, checksum, payload_end - payload_start,
+        ))
+
+    def append_packet(self, pkt):
+        # Packet dicts from the pyshark/scapy paths, or hand-built in tests
+        src_hi, src_lo = split_ip(_pack_ip_str(pkt.get('src_ip')))
+        dst_hi, dst_lo = split_ip(_pack_ip_str(pkt.get('dst_ip')))
+        payload = pkt.get('raw_payload') or b''
+        if isinstance(payload, str):
+            payload = bytes.fromhex(payload)
+        self._payloads += payload
+        self._offsets.append(len(self._payloads))
+        timestamp = pkt.get('timestamp')
+        checksum = pkt.get('checksum')
+        header_len = pkt.get('header_len')
+        self._add_row((
+            NO_TIMESTAMP if timestamp is None else int(round(timestamp * 1e9)),
+            src_hi, src_lo, dst_hi, dst_lo, pkt.get('src_port') or 0, pkt.get('dst_port') or 0,
+            _PROTOCOL_NUMBERS.get(pkt.get('protocol', 'tcp'), IPPROTO_TCP),
+            5 if header_len is None else min(int(header_len), 255), _flag_bits(pkt.get('flags')),
+            pkt.get('seq') or 0, pkt.get('ack') or 0, pkt.get('window') or 0,
+            NO_CHECKSUM if checksum is None else int(checksum), pkt.get('payload_len', len(payload)),
+        ))
+
+    def _add_row(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._chunks.append(np.array(self._rows, dtype=PACKET_DTYPE))
+            self._rows = []
+
+    def build(self):
+        self._flush()
+        columns = np.concatenate(self._chunks) if self._chunks else np.empty(0, dtype=PACKET_DTYPE)
+        # Only tables read from a capture know where each packet's record is
+        records = np.array(self._records, dtype=np.uint64) if len(self._records) == len(columns) else None
+        table = PacketTable(columns, self._payloads, np.array(self._offsets, dtype=np.uint64), records)
+        self.__init__(self.chunk_size)
+        return table
+
+
+class PacketTable:
+    """Columnar view of a capture.
+
+    columns is a PACKET_DTYPE structured array; payload i is
+    payloads[payload_offsets[i]:payload_offsets[i + 1]]. Indexing with an int
+    returns a lazy PacketRow so code written against packet dicts keeps
+    working; slices share the underlying buffers. record_offsets, for
+    tables read from a capture, holds the byte offset of each packet's
+    record in it (None otherwise).
+    """
+
+    def __init__(self, columns, payloads=b'', payload_offsets=None, record_offsets=None):
+        self.columns = columns
+        self.payloads = payloads
+        if payload_offsets is None:
+            payload_offsets = np.zeros(len(columns) + 1, dtype=np.uint64)
+        self.payload_offsets = payload_offsets
+        self.record_offsets = record_offsets
+
+    @classmethod
+    def from_pcap(cls, file_path, protocols=('tcp',), start=None, end=None, context=None, position=None):
+        # start/end/context select a byte range from build_record_index; see iter_records for position
+        wanted = {_PROTOCOL_NUMBERS[p] for p in protocols}
+        builder = PacketTableBuilder()
+        mm = open_capture(file_path)
+        try:
+            for ts_ns, linktype, frame, offset in iter_records(mm, start, end, context, position):
+                headers = decode_headers(frame, linktype)
+                if headers is not None and headers[0] in wanted:
+                    builder.append_headers(ts_ns, headers, frame, offset)
+        finally:
+            close_capture(mm)
+        return builder.build()
+
+    @classmethod
+    def iter_pcap(cls, file_path, batch_size=65536, protocols=('tcp',), start=None, context=None, position=None):
+        """Yield the capture as consecutive tables of at most batch_size packets.
+
+        start/context resume reading at a record boundary; position gets
+        the next one once the capture is exhausted (see iter_records).
+        """
+        wanted = {_PROTOCOL_NUMBERS[p] for p in protocols}
+        builder = PacketTableBuilder(chunk_size=batch_size)
+        mm = open_capture(file_path)
+        try:
+            for ts_ns, linktype, frame, offset in iter_records(mm, start, None, context, position):
+                headers = decode_headers(frame, linktype)
+                if headers is not None and headers[0] in wanted:
+                    builder.append_headers(ts_ns, headers, frame, offset)
+                    if len(builder) >= batch_size:
+                        yield builder.build()
+            if len(builder):
+                yield builder.build()
+        finally:
+            close_capture(mm)
+
+    @classmethod
+    def from_packets(cls, packets):
+        builder = PacketTableBuilder()
+        for pkt in packets:
+            builder.append_packet(pkt)
+        return builder.build()
+
+    @classmethod
+    def concat(cls, tables):
+        tables = list(tables)
+        if not tables:
+            return PacketTableBuilder().build()
+        if len(tables) == 1:
+            return tables[0]
+        offsets = [np.zeros(1, dtype=np.uint64)]
+        base = 0
+        for table in tables:
+            first = int(table.payload_offsets[0])
+            offsets.append(table.payload_offsets[1:] - np.uint64(first) + np.uint64(base))
+            base += int(table.payload_offsets[-1]) - first
+        payloads = bytearray(base)
+        position = 0
+        for table in tables:
+            first, last = int(table.payload_offsets[0]), int(table.payload_offsets[-1])
+            payloads[position:position + last - first] = memoryview(table.payloads)[first:last]
+            position += last - first
+        records = None
+        if all(t.record_offsets is not None for t in tables):
+            records = np.concatenate([t.record_offsets for t in tables])
+        return cls(np.concatenate([t.columns for t in tables]), payloads, np.concatenate(offsets), records)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __iter__(self):
+        for i in range(len(self.columns)):
+            yield PacketRow(self, i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self.columns))
+            if step != 1:
+                raise ValueError("PacketTable slices must be contiguous")
+            return PacketTable(self.columns[start:stop], self.payloads, self.payload_offsets[start:stop + 1],
+                               None if self.record_offsets is None else self.record_offsets[start:stop])
+        if index < 0:
+            index += len(self.columns)
+        if not 0 <= index < len(self.columns):
+            raise IndexError(index)
+        return PacketRow(self, index)
+
+    def take(self, indices):
+        """Copy the given rows (and their payloads) into a new compact table."""
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = self.payload_offsets[indices].astype(np.int64)
+        lengths = self.payload_offsets[indices + 1].astype(np.int64) - starts
+        offsets = np.zeros(len(indices) + 1, dtype=np.uint64)
+        np.cumsum(lengths, out=offsets[1:])
+        total = int(offsets[-1])
+        source = np.frombuffer(self.payloads, dtype=np.uint8)
+        # Gather every selected payload byte in one vectorized pass
+        gather = np.arange(total, dtype=np.int64) + np.repeat(starts - offsets[:-1].astype(np.int64), lengths)
+        return PacketTable(self.columns[indices], bytearray(source[gather].tobytes()), offsets,
+                           None if self.record_offsets is None else self.record_offsets[indices])
+
+    def flow_partitions(self, n):
+        """Assign every packet to one of n partitions by connection.
+
+        The hash is symmetric in the two endpoints, so both directions of a
+        connection land in the same partition.
+        """
+        cols = self.columns
+        with np.errstate(over='ignore'):
+            src = (cols['src_ip_hi'] * np.uint64(0x9E3779B97F4A7C15) ^ cols['src_ip_lo']) \
+                * np.uint64(0xBF58476D1CE4E5B9) + cols['src_port'].astype(np.uint64)
+            dst = (cols['dst_ip_hi'] * np.uint64(0x9E3779B97F4A7C15) ^ cols['dst_ip_lo']) \
+                * np.uint64(0xBF58476D1CE4E5B9) + cols['dst_port'].astype(np.uint64)
+            mixed = (src + dst) * np.uint64(0x94D049BB133111EB)
+            mixed ^= mixed >> np.uint64(31)
+        return (mixed % np.uint64(n)).astype(np.uint16)
+
+    def payload(self, index):
+        start, end = self.payload_offsets[index], self.payload_offsets[index + 1]
+        return memoryview(self.payloads)[int(start):int(end)]
+
+    @property
+    def nbytes(self):
+        return self.columns.nbytes + self.payload_offsets.nbytes + len(self.payloads)
+
+    def group_flows(self):
+        """Number flows (4-tuples) in order of first appearance.
+
+        Returns FlowGroups(ids, first_index, last_index, counts) where ids has
+        one entry per packet and the other arrays one entry per flow.
+        """
+        n = len(self.columns)
+        if n == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return FlowGroups(empty, empty, empty, empty)
+        order = np.lexsort([self.columns[c] for c in reversed(FLOW_KEY_COLUMNS)])
+        sorted_cols = self.columns[order]
+        boundary = np.zeros(n, dtype=bool)
+        boundary[0] = True
+        for c in FLOW_KEY_COLUMNS:
+            boundary[1:] |= sorted_cols[c][1:] != sorted_cols[c][:-1]
+        group_sorted = np.cumsum(boundary) - 1
+        starts = np.flatnonzero(boundary)
+        # lexsort is stable, so each group's first/last entries are the
+        # earliest/latest packets of that flow
+        first = order[starts]
+        last = order[np.append(starts[1:], n) - 1]
+        counts = np.diff(np.append(starts, n))
+        # Renumber groups by first appearance in the capture
+        rank = np.empty(len(starts), dtype=np.int64)
+        appearance = np.argsort(first, kind='stable')
+        rank[appearance] = np.arange(len(starts))
+        ids = np.empty(n, dtype=np.int64)
+        ids[order] = rank[group_sorted]
+        return FlowGroups(ids, first[appearance], last[appearance], counts[appearance])
+
+    def raw_flow_key(self, index):
+        # Hashable integer 4-tuple key, cheaper than flow_key() for state dicts
+        row = self.columns[index]
+        return tuple(int(row[c]) for c in FLOW_KEY_COLUMNS)
+
+    def flow_key(self, index):
+        row = self.columns[index]
+        return (join_ip(row['src_ip_hi'], row['src_ip_lo']), int(row['src_port']),
+                join_ip(row['dst_ip_hi'], row['dst_ip_lo']), int(row['dst_port']))
+
+    def ip_strings(self, which='src'):
+        hi, lo = self.columns[f'{which}_ip_hi'], self.columns[f'{which}_ip_lo']
+        pairs = np.stack([hi, lo], axis=1)
+        unique, inverse = np.unique(pairs, axis=0, return_inverse=True)
+        names = np.array([join_ip(h, l) for h, l in unique], dtype=object)
+        return names[inverse.reshape(-1)]
+
+    def to_dataframe(self):
+        """Packet metadata (no payloads) as a pandas DataFrame."""
+        import pandas as pd
+
+        cols = self.columns
+        timestamps = cols['timestamp_ns'].astype(np.float64) / 1e9
+        timestamps[cols['timestamp_ns'] == NO_TIMESTAMP] = np.nan
+        return pd.DataFrame({
+            'timestamp': timestamps,
+            'src_ip': self.ip_strings('src'),
+            'src_port': cols['src_port'],
+            'dst_ip': self.ip_strings('dst'),
+            'dst_port': cols['dst_port'],
+            'protocol': np.array([PROTOCOL_NAMES.get(p, str(p)) for p in range(256)], dtype=object)[cols['protocol']],
+            'flags': np.array(TCP_FLAG_STRINGS, dtype=object)[cols['flags'] & 0x1FF],
+            'seq': cols['seq'],
+            'ack': cols['ack'],
+            'payload_len': cols['payload_len'],
+        })
+
+
+class PacketRow(Mapping):
+    """Read-only dict-like view of one PacketTable row."""
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, key):
+        row = self.table.columns[self.index]
+        if key == 'src_ip':
+            return join_ip(row['src_ip_hi'], row['src_ip_lo'])
+        if key == 'dst_ip':
+            return join_ip(row['dst_ip_hi'], row['dst_ip_lo'])
+        if key == 'protocol':
+            return PROTOCOL_NAMES.get(int(row['protocol']), str(row['protocol']))
+        if key == 'flags':
+            return TCP_FLAG_STRINGS[int(row['flags']) & 0x1FF]
+        if key in ('seq', 'ack', 'window'):
+            return None if row['protocol'] == IPPROTO_UDP else int(row[key])
+        if key == 'checksum':
+            return None if row['checksum'] == NO_CHECKSUM else int(row['checksum'])
+        if key == 'timestamp':
+            ts = int(row['timestamp_ns'])
+            return None if ts == NO_TIMESTAMP else timestamp_ns_to_float(ts)
+        if key == 'raw_payload':
+            return self.table.payload(self.index)
+        if key == 'options':
+            return b''  # TCP options are not kept in the columnar store
+        if key in ('src_port', 'dst_port', 'payload_len', 'header_len'):
+            return int(row[key])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(PACKET_FIELDS)
+
+    def __len__(self):
+        return len(PACKET_FIELDS)
+
+    def __repr__(self):
+        return f"PacketRow({self.index}, {dict(self)!r})"
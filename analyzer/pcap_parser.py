@@ -1,33 +1,172 @@
-import pyshark
-from scapy.all import rdpcap
 import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from analyzer.pcap_reader import (
+    read_packets, tcp_flags_to_str, PcapFormatError, open_capture, close_capture, build_record_index,
+    iter_records, decode_headers, decode_packet, PROTOCOL_NAMES,
+)
+from analyzer.packet_table import PacketTable
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def parse_pcap(file_path):
+# Records between two index entries; shards are built from whole entries
+INDEX_EVERY = 4096
+
+def parse_pcap(file_path, deep=False, as_table=False, workers=1, protocols=('tcp',), position=None):
+    """Parse TCP (and optionally UDP) packets from a pcap/pcapng capture.
+
+    The built-in memory-mapped reader is used by default. deep=True runs the
+    capture through tshark (pyshark) instead, which is much slower but
+    understands every protocol Wireshark does. as_table=True returns a
+    columnar PacketTable rather than a list of packet dicts. workers > 1
+    decodes the capture in parallel shards; the result is identical to the
+    single-process parse. protocols=('tcp', 'udp') also keeps UDP packets
+    (market data feeds); the deep and scapy paths are TCP-only. position,
+    a dict, gets the point to resume reading a growing capture from (see
+    iter_records); only the native reader fills it in.
+    """
+    if deep:
+        data = _parse_pcap_pyshark(file_path)
+        return PacketTable.from_packets(data) if as_table else data
+    try:
+        logger.info("Starting PCAP parsing with the native reader...")
+        if workers and workers > 1:
+            table = PacketTable.concat(iter_sharded_tables(file_path, workers, protocols=protocols, position=position))
+            data = table if as_table else [dict(row) for row in table]
+        else:
+            if as_table:
+                data = PacketTable.from_pcap(file_path, protocols, position=position)
+            else:
+                data = list(read_packets(file_path, protocols))
+        logger.info(f"Successfully parsed {len(data)} packets with the native reader")
+        return data
+    except (PcapFormatError, OSError) as e:
+        logger.warning(f"Error parsing PCAP with the native reader: {e}")
+        logger.info("Falling back to Scapy for parsing...")
+        data = _parse_pcap_scapy(file_path)
+        return PacketTable.from_packets(data) if as_table else data
+
+def iter_packet_batches(file_path, batch_size=65536, workers=1, protocols=('tcp',), start=None, context=None,
+                        position=None):
+    """Stream the capture as PacketTable batches for bounded-memory analysis.
+
+    start/context resume at a record boundary (such tails of a growing
+    capture are decoded in-process) and position gets the next one, as in
+    iter_records.
+    """
+    if workers and workers > 1 and start is None:
+        return iter_sharded_tables(file_path, workers, records_per_shard=batch_size, protocols=protocols,
+                                   position=position)
+    return PacketTable.iter_pcap(file_path, batch_size=batch_size, protocols=protocols, start=start, context=context,
+                                 position=position)
+
+def load_packets(file_path, indices, protocols=('tcp',)):
+    """Decode packets by number (counting only the given protocols), payloads included.
+
+    Returns {index: packet dict}. Walks the capture once, decoding only
+    the wanted packets, and stops after the last of them.
+    """
+    wanted = sorted(set(int(i) for i in indices))
+    packets = {}
+    if not wanted:
+        return packets
+    numbers = {number for number, name in PROTOCOL_NAMES.items() if name in protocols}
+    mm = open_capture(file_path)
+    try:
+        n = 0
+        for ts_ns, linktype, frame, _offset in iter_records(mm):
+            headers = decode_headers(frame, linktype)
+            if headers is None or headers[0] not in numbers:
+                continue
+            if n == wanted[len(packets)]:
+                pkt = decode_packet(frame, linktype, ts_ns)
+                pkt['raw_payload'] = bytes(pkt['raw_payload'])
+                pkt['options'] = bytes(pkt['options'])
+                packets[n] = pkt
+                if len(packets) == len(wanted):
+                    break
+            n += 1
+    finally:
+        close_capture(mm)
+    return packets
+
+def plan_shards(file_path, workers, records_per_shard=None, index_every=INDEX_EVERY):
+    """Split the capture into (start, end, context) byte ranges on record boundaries."""
+    mm = open_capture(file_path)
+    try:
+        index = build_record_index(mm, every=index_every)
+        size = len(mm)
+    finally:
+        close_capture(mm)
+    if not index:
+        return []
+    if records_per_shard:
+        step = max(1, records_per_shard // index_every)
+    else:
+        # A few shards per worker so a slow shard doesn't hold up the pool
+        step = max(1, len(index) // (workers * 4))
+    starts = index[::step]
+    ends = [offset for offset, _context in starts[1:]] + [size]
+    return [(offset, end, context) for (offset, context), end in zip(starts, ends)]
+
+def _parse_shard(args):
+    file_path, start, end, context, protocols = args
+    position = {}
+    table = PacketTable.from_pcap(file_path, protocols, start=start, end=end, context=context, position=position)
+    return table, position
+
+def iter_sharded_tables(file_path, workers, records_per_shard=None, index_every=INDEX_EVERY, protocols=('tcp',),
+                        position=None):
+    """Decode shards in a process pool and yield them back in file order.
+
+    At most 2 * workers shards are in flight, so memory stays bounded when
+    the consumer is slower than the pool. position gets the resume point
+    after the last shard, as in iter_records.
+    """
+    index_every = min(index_every, records_per_shard) if records_per_shard else index_every
+    shards = plan_shards(file_path, workers, records_per_shard, index_every)
+    if not shards:
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards), os.cpu_count() or 1)) as executor:
+        pending = deque()
+        for start, end, context in shards:
+            pending.append(executor.submit(_parse_shard, (file_path, start, end, context, protocols)))
+            if len(pending) >= 2 * workers:
+                table, last = pending.popleft().result()
+                yield table
+        while pending:
+            table, last = pending.popleft().result()
+            yield table
+    if position is not None:
+        position.update(last)
+
+def _parse_pcap_pyshark(file_path):
+    import pyshark
+
     data = []
     try:
         # Use display filter to only capture TCP packets
         cap = pyshark.FileCapture(file_path, display_filter='tcp')
         logger.info("Starting PCAP parsing with Pyshark...")
-        
+
         for pkt in cap:
             try:
                 if not hasattr(pkt, 'ip') or not hasattr(pkt, 'tcp'):
                     continue
-                    
+
                 # Extract only essential fields
                 data.append({
                     'src_ip': pkt.ip.src,
                     'dst_ip': pkt.ip.dst,
                     'src_port': int(pkt.tcp.srcport),
                     'dst_port': int(pkt.tcp.dstport),
-                    'flags': pkt.tcp.flags,
+                    'flags': tcp_flags_to_str(int(pkt.tcp.flags, 16)),
                     'seq': int(pkt.tcp.seq),
                     'ack': int(pkt.tcp.ack),
                     'payload_len': len(pkt.tcp.payload.raw_value) // 2 if hasattr(pkt.tcp.payload, 'raw_value') else 0,
-                    'header_len': int(pkt.tcp.hdr_len) if hasattr(pkt.tcp, 'hdr_len') else 20,
+                    'header_len': int(pkt.tcp.hdr_len) // 4 if hasattr(pkt.tcp, 'hdr_len') else 5,
                     'checksum': int(pkt.tcp.checksum, 16) if hasattr(pkt.tcp, 'checksum') else None,
                     'options': pkt.tcp.options if hasattr(pkt.tcp, 'options') else [],
                     'raw_payload': bytes.fromhex(pkt.tcp.payload.raw_value) if hasattr(pkt.tcp.payload, 'raw_value') else b'',
@@ -36,45 +175,53 @@ def parse_pcap(file_path):
             except Exception as packet_error:
                 logger.warning(f"Error parsing packet: {packet_error}")
                 continue
-                
+
         cap.close()
         logger.info(f"Successfully parsed {len(data)} packets with Pyshark")
         return data
-        
+
     except Exception as e:
-        logger.warning(f"Error parsing PCAP with Pyshark: {e}")
-        logger.info("Falling back to Scapy for parsing...")
-        
-        try:
-            packets = rdpcap(file_path)
-            data = []
-            for pkt in packets:
+        logger.error(f"Error parsing PCAP with Pyshark: {e}")
+        return []
+
+def _parse_pcap_scapy(file_path):
+    # Looked up at call time so the reader can be swapped out in tests
+    import scapy.all as scapy_all
+
+    try:
+        packets = scapy_all.rdpcap(file_path)
+        data = []
+        for pkt in packets:
+            try:
                 try:
-                    if 'IP' not in pkt or 'TCP' not in pkt:
-                        continue
-                        
-                    data.append({
-                        'src_ip': pkt['IP'].src,
-                        'dst_ip': pkt['IP'].dst,
-                        'src_port': pkt['TCP'].sport,
-                        'dst_port': pkt['TCP'].dport,
-                        'flags': str(pkt['TCP'].flags),
-                        'seq': pkt['TCP'].seq,
-                        'ack': pkt['TCP'].ack,
-                        'payload_len': len(pkt['TCP'].payload),
-                        'header_len': pkt['TCP'].dataofs if hasattr(pkt['TCP'], 'dataofs') else 20,
-                        'checksum': pkt['TCP'].chksum if hasattr(pkt['TCP'], 'chksum') else None,
-                        'options': pkt['TCP'].options if hasattr(pkt['TCP'], 'options') else [],
-                        'raw_payload': bytes(pkt['TCP'].payload),
-                        'timestamp': float(pkt.time) if hasattr(pkt, 'time') else None,
-                    })
-                except Exception as packet_error:
-                    logger.warning(f"Error parsing packet with Scapy: {packet_error}")
+                    ip_layer, tcp_layer = pkt['IP'], pkt['TCP']
+                except (IndexError, KeyError):
                     continue
-                    
-            logger.info(f"Successfully parsed {len(data)} packets with Scapy")
-            return data
-            
-        except Exception as scapy_e:
-            logger.error(f"Error falling back to Scapy: {scapy_e}")
-            return [] 
\ No newline at end of file
+                if ip_layer is None or tcp_layer is None:
+                    continue
+
+                data.append({
+                    'src_ip': ip_layer.src,
+                    'dst_ip': ip_layer.dst,
+                    'src_port': tcp_layer.sport,
+                    'dst_port': tcp_layer.dport,
+                    'flags': str(tcp_layer.flags),
+                    'seq': tcp_layer.seq,
+                    'ack': tcp_layer.ack,
+                    'payload_len': len(tcp_layer.payload),
+                    'header_len': tcp_layer.dataofs if hasattr(tcp_layer, 'dataofs') else 5,
+                    'checksum': tcp_layer.chksum if hasattr(tcp_layer, 'chksum') else None,
+                    'options': tcp_layer.options if hasattr(tcp_layer, 'options') else [],
+                    'raw_payload': bytes(tcp_layer.payload),
+                    'timestamp': float(pkt.time) if hasattr(pkt, 'time') else None,
+                })
+            except Exception as packet_error:
+                logger.warning(f"Error parsing packet with Scapy: {packet_error}")
+                continue
+
+        logger.info(f"Successfully parsed {len(data)} packets with Scapy")
+        return data
+
+    except Exception as scapy_e:
+        logger.error(f"Error parsing PCAP with Scapy: {scapy_e}")
+        return []
@@ -0,0 +1,454 @@
+import mmap
+import socket
+import struct
+
+# Native pcap/pcapng reader. The capture is memory-mapped and headers are
+# decoded with precompiled structs, so payloads come back as zero-copy
+# memoryview slices of the mapped file instead of per-packet bytes objects.
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+VLAN_ETHERTYPES = (0x8100, 0x88A8, 0x9100)
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+PROTOCOL_NAMES = {IPPROTO_TCP: 'tcp', IPPROTO_UDP: 'udp'}
+IPV6_EXT_HEADERS = (0, 43, 60, 51)
+IPV6_FRAGMENT = 44
+
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_BYTE_ORDER_MAGIC_SWAPPED = 0x4D3C2B1A
+PCAPNG_IDB = 0x00000001
+PCAPNG_PB = 0x00000002
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_OPT_IF_TSRESOL = 9
+# Fixed part of the body of the blocks decoded, before packet data and options
+PCAPNG_BODY_LENGTHS = {PCAPNG_IDB: 8, PCAPNG_EPB: 20, PCAPNG_PB: 20, PCAPNG_SPB: 4}
+
+# Flag letters in bit order, matching scapy's str(TCP.flags) ('S', 'PA', ...)
+TCP_FLAG_LETTERS = 'FSRPAUECN'
+TCP_FLAG_STRINGS = [
+    ''.join(letter for bit, letter in enumerate(TCP_FLAG_LETTERS) if value & (1 << bit))
+    for value in range(1 << len(TCP_FLAG_LETTERS))
+]
+
+_ETH_TYPE = struct.Struct('!H')
+_IPV4_HDR = struct.Struct('!BBHHHBBH4s4s')
+_IPV6_HDR = struct.Struct('!IHBB16s16s')
+_TCP_HDR = struct.Struct('!HHIIBBHHH')
+_UDP_HDR = struct.Struct('!HHHH')
+
+
+class PcapFormatError(ValueError):
+    pass
+
+
+def tcp_flags_to_str(flag_bits):
+    return TCP_FLAG_STRINGS[flag_bits & 0x1FF]
+
+
+def open_capture(file_path):
+    """Memory-map a capture file read-only and return the mapping."""
+    with open(file_path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # mmap refuses empty files
+            raise PcapFormatError(f"{file_path} is empty")
+
+
+def close_capture(mm):
+    # Payload memoryviews may still reference the mapping; in that case it is
+    # released by the garbage collector once the last view goes away.
+    try:
+        mm.close()
+    except BufferError:
+        pass
+
+
+def _pcap_header(buf):
+    if len(buf) < 24:
+        raise PcapFormatError("truncated pcap global header")
+    for endian in ('<', '>'):
+        magic, = struct.unpack_from(endian + 'I', buf, 0)
+        if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            linktype, = struct.unpack_from(endian + 'I', buf, 20)
+            ts_mult = 1000 if magic == PCAP_MAGIC_USEC else 1
+            return endian, ts_mult, linktype & 0xFFFF
+    return None
+
+
+def _iter_pcap(buf, start=24, end=None, state=None):
+    header = _pcap_header(buf)
+    endian, ts_mult, linktype = header
+    rec_hdr = struct.Struct(endian + 'IIII')
+    view = memoryview(buf)
+    end = len(buf) if end is None else min(end, len(buf))
+    offset = start
+    while offset + 16 <= end:
+        ts_sec, ts_frac, incl_len, _orig_len = rec_hdr.unpack_from(buf, offset)
+        data_start = offset + 16
+        data_end = data_start + incl_len
+        if data_end > len(buf):
+            break  # truncated trailing record
+        yield ts_sec * 1_000_000_000 + ts_frac * ts_mult, linktype, view[data_start:data_end], offset
+        offset = data_end
+    if state is not None:
+        state['offset'] = offset
+
+
+def _tsresol_to_ns(ticks, tsresol):
+    value = tsresol & 0x7F
+    if tsresol & 0x80:
+        return (ticks * 1_000_000_000) >> value
+    if value <= 9:
+        return ticks * 10 ** (9 - value)
+    return ticks // 10 ** (value - 9)
+
+
+def _idb_tsresol(buf, endian, body_start, body_end):
+    # Walk the IDB options looking for if_tsresol (default is microseconds)
+    opt_hdr = struct.Struct(endian + 'HH')
+    offset = body_start + 8
+    while offset + 4 <= body_end:
+        code, length = opt_hdr.unpack_from(buf, offset)
+        if code == 0:
+            break
+        if code == PCAPNG_OPT_IF_TSRESOL and length >= 1 and offset + 4 < body_end:
+            return buf[offset + 4]
+        offset += 4 + ((length + 3) & ~3)
+    return 6
+
+
+def _interface(interfaces, if_id, offset):
+    if if_id >= len(interfaces):
+        raise PcapFormatError(f"pcapng block at byte {offset} refers to undeclared interface {if_id}")
+    return interfaces[if_id]
+
+
+def _packet_data(data_start, cap_len, body_end, offset):
+    if data_start + cap_len > body_end:
+        raise PcapFormatError(f"pcapng block at byte {offset} holds less data than its captured length")
+    return data_start
+
+
+def _iter_pcapng(buf, start=0, end=None, state=None):
+    # state carries the section byte order and interface table; it is updated
+    # in place so a caller can snapshot it to resume parsing mid-file.
+    view = memoryview(buf)
+    size = len(buf)
+    end = size if end is None else min(end, size)
+    if state is None:
+        state = {'endian': '<', 'interfaces': []}
+    endian = state['endian']
+    interfaces = state['interfaces']
+    offset = start
+    while offset + 12 <= end:
+        block_type, = struct.unpack_from(endian + 'I', buf, offset)
+        if block_type == PCAPNG_SHB:
+            # Every section can switch byte order, re-detect it
+            magic, = struct.unpack_from('<I', buf, offset + 8)
+            if magic == PCAPNG_BYTE_ORDER_MAGIC:
+                endian = '<'
+            elif magic == PCAPNG_BYTE_ORDER_MAGIC_SWAPPED:
+                endian = '>'
+            else:
+                raise PcapFormatError("bad pcapng byte-order magic")
+            interfaces = []
+            state['endian'] = endian
+            state['interfaces'] = interfaces
+        block_len, = struct.unpack_from(endian + 'I', buf, offset + 4)
+        if block_len < 12 or offset + block_len > size:
+            break  # truncated or corrupt trailing block
+        body = offset + 8
+        body_end = offset + block_len - 4
+        if body_end - body < PCAPNG_BODY_LENGTHS.get(block_type, 0):
+            raise PcapFormatError(f"pcapng block at byte {offset} is too short")
+        if block_type == PCAPNG_IDB:
+            linktype, _reserved, snaplen = struct.unpack_from(endian + 'HHI', buf, body)
+            interfaces.append((linktype, snaplen, _idb_tsresol(buf, endian, body, body_end)))
+        elif block_type == PCAPNG_EPB:
+            if_id, ts_high, ts_low, cap_len, _orig = struct.unpack_from(endian + 'IIIII', buf, body)
+            linktype, _snaplen, tsresol = _interface(interfaces, if_id, offset)
+            data_start = _packet_data(body + 20, cap_len, body_end, offset)
+            ts_ns = _tsresol_to_ns((ts_high << 32) | ts_low, tsresol)
+            yield ts_ns, linktype, view[data_start:data_start + cap_len], offset
+        elif block_type == PCAPNG_PB:
+            if_id, _drops, ts_high, ts_low, cap_len, _orig = struct.unpack_from(endian + 'HHIIII', buf, body)
+            linktype, _snaplen, tsresol = _interface(interfaces, if_id, offset)
+            data_start = _packet_data(body + 20, cap_len, body_end, offset)
+            ts_ns = _tsresol_to_ns((ts_high << 32) | ts_low, tsresol)
+            yield ts_ns, linktype, view[data_start:data_start + cap_len], offset
+        elif block_type == PCAPNG_SPB:
+            orig_len, = struct.unpack_from(endian + 'I', buf, body)
+            linktype, snaplen, _tsresol = _interface(interfaces, 0, offset)
+            cap_len = min(orig_len, snaplen) if snaplen else orig_len
+            data_start = _packet_data(body + 4, cap_len, body_end, offset)
+            yield None, linktype, view[data_start:data_start + cap_len], offset
+        offset += block_len
+    state['offset'] = offset
+
+
+def _is_pcapng(buf):
+    return len(buf) >= 4 and struct.unpack_from('<I', buf, 0)[0] == PCAPNG_SHB
+
+
+def capture_header_length(buf):
+    """Length of the file header buf starts with (pcap global header or pcapng
+    section header block), or None if buf doesn't hold all of it yet."""
+    if _is_pcapng(buf):
+        if len(buf) < 12:
+            return None
+        magic, = struct.unpack_from('<I', buf, 8)
+        length, = struct.unpack_from('<I' if magic == PCAPNG_BYTE_ORDER_MAGIC else '>I', buf, 4)
+        return length if len(buf) >= length else None
+    if len(buf) < 24:
+        return None
+    if _pcap_header(buf) is None:
+        raise PcapFormatError("not a pcap or pcapng file")
+    return 24
+
+
+def iter_records(buf, start=None, end=None, context=None, position=None):
+    """Yield (timestamp_ns, linktype, frame, record_offset) for every record in buf.
+
+    start/end restrict the walk to a byte range whose start is a record
+    boundary taken from build_record_index, together with its context.
+    position, if given, is a dict that gets the 'offset' and 'context' to
+    resume from once the walk is complete: just past the last complete
+    record, as a capture still being written may end in half a record.
+    """
+    if _is_pcapng(buf):
+        state = {'endian': '<', 'interfaces': []}
+        if context is not None:
+            endian, interfaces = context
+            state = {'endian': endian, 'interfaces': list(interfaces)}
+        records = _iter_pcapng(buf, start or 0, end, state)
+    elif _pcap_header(buf) is not None:
+        state = {}
+        records = _iter_pcap(buf, start or 24, end, state)
+    else:
+        raise PcapFormatError("not a pcap or pcapng file")
+    return records if position is None else _track_position(records, state, position)
+
+
+def _track_position(records, state, position):
+    yield from records
+    position['offset'] = state['offset']
+    position['context'] = (state['endian'], tuple(state['interfaces'])) if 'interfaces' in state else None
+
+
+def build_record_index(buf, every=4096):
+    """Record the byte offset of every `every`-th packet record.
+
+    Returns a list of (offset, context) pairs that iter_records can resume
+    from; only record headers are read, nothing is decoded.
+    """
+    index = []
+    if _is_pcapng(buf):
+        state = {'endian': '<', 'interfaces': []}
+        for n, (_ts, _linktype, _frame, offset) in enumerate(_iter_pcapng(buf, state=state)):
+            if n % every == 0:
+                index.append((offset, (state['endian'], tuple(state['interfaces']))))
+        return index
+    header = _pcap_header(buf)
+    if header is None:
+        raise PcapFormatError("not a pcap or pcapng file")
+    incl_len_at = struct.Struct(header[0] + 'I')
+    size = len(buf)
+    offset = 24
+    n = 0
+    while offset + 16 <= size:
+        if n % every == 0:
+            index.append((offset, None))
+        offset += 16 + incl_len_at.unpack_from(buf, offset + 8)[0]
+        n += 1
+    return index
+
+
+def pcapng_contexts(buf):
+    """(offset, context) of the first record after every change of section or
+    interfaces in a pcapng capture, for iter_records to start anywhere; empty for pcap."""
+    if not _is_pcapng(buf):
+        return []
+    state = {'endian': '<', 'interfaces': []}
+    contexts = []
+    last = None
+    for _ts, _linktype, _frame, offset in _iter_pcapng(buf, state=state):
+        # A new section brings a new interface list, an IDB grows the current one
+        current = (state['endian'], id(state['interfaces']), len(state['interfaces']))
+        if current != last:
+            contexts.append((offset, (state['endian'], tuple(state['interfaces']))))
+            last = current
+    return contexts
+
+
+def _network_layer(frame, linktype):
+    # Returns (ethertype, offset of the network header) or None
+    if linktype == LINKTYPE_ETHERNET:
+        if len(frame) < 14:
+            return None
+        ethertype, = _ETH_TYPE.unpack_from(frame, 12)
+        offset = 14
+        while ethertype in VLAN_ETHERTYPES and len(frame) >= offset + 4:
+            ethertype, = _ETH_TYPE.unpack_from(frame, offset + 2)
+            offset += 4
+        return ethertype, offset
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if not len(frame):
+            return None
+        return (ETH_P_IPV6 if frame[0] >> 4 == 6 else ETH_P_IP), 0
+    if linktype == LINKTYPE_LINUX_SLL:
+        if len(frame) < 16:
+            return None
+        return _ETH_TYPE.unpack_from(frame, 14)[0], 16
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if len(frame) < 20:
+            return None
+        return _ETH_TYPE.unpack_from(frame, 0)[0], 20
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        if len(frame) < 5:
+            return None
+        # Address family is host byte order for NULL, network order for LOOP
+        return (ETH_P_IPV6 if frame[4] >> 4 == 6 else ETH_P_IP), 4
+    return None
+
+
+def _transport_layer(frame, ethertype, offset):
+    # Returns (src_ip, dst_ip, ip_proto, l4_offset, l4_end) or None
+    if ethertype == ETH_P_IP:
+        if len(frame) < offset + 20:
+            return None
+        ver_ihl, _tos, total_len, _id, frag, _ttl, proto, _csum, src, dst = _IPV4_HDR.unpack_from(frame, offset)
+        if frag & 0x1FFF:
+            return None  # non-first fragment, no transport header
+        l4_offset = offset + (ver_ihl & 0x0F) * 4
+        # Trim Ethernet padding; total_len of 0 means TSO, trust the capture
+        l4_end = min(offset + total_len, len(frame)) if total_len else len(frame)
+        return src, dst, proto, l4_offset, l4_end
+    if ethertype == ETH_P_IPV6:
+        if len(frame) < offset + 40:
+            return None
+        _vtc, payload_len, next_hdr, _hlim, src, dst = _IPV6_HDR.unpack_from(frame, offset)
+        l4_offset = offset + 40
+        l4_end = min(l4_offset + payload_len, len(frame)) if payload_len else len(frame)
+        while next_hdr in IPV6_EXT_HEADERS or next_hdr == IPV6_FRAGMENT:
+            if l4_offset + 8 > l4_end:
+                return None
+            if next_hdr == IPV6_FRAGMENT:
+                if _ETH_TYPE.unpack_from(frame, l4_offset + 2)[0] & 0xFFF8:
+                    return None
+                ext_len = 8
+            elif next_hdr == 51:
+                ext_len = (frame[l4_offset + 1] + 2) * 4
+            else:
+                ext_len = (frame[l4_offset + 1] + 1) * 8
+            next_hdr = frame[l4_offset]
+            l4_offset += ext_len
+        return src, dst, next_hdr, l4_offset, l4_end
+    return None
+
+
+def decode_headers(frame, linktype):
+    """Decode the transport headers of one frame without building any objects.
+
+    Returns (protocol, src_ip, dst_ip, src_port, dst_port, flag_bits, seq, ack,
+    window, header_len, checksum, options_start, payload_start, payload_end)
+    with the addresses as packed 4/16-byte strings, or None for frames that
+    are not TCP or UDP over IPv4/IPv6.
+    """
+    network = _network_layer(frame, linktype)
+    if network is None:
+        return None
+    transport = _transport_layer(frame, *network)
+    if transport is None:
+        return None
+    src, dst, proto, l4, l4_end = transport
+    if proto == IPPROTO_TCP:
+        if l4 + 20 > l4_end:
+            return None
+        sport, dport, seq, ack, offset_byte, flag_byte, window, checksum, _urg = _TCP_HDR.unpack_from(frame, l4)
+        data_offset = offset_byte >> 4
+        payload_start = min(l4 + max(data_offset * 4, 20), l4_end)
+        return (IPPROTO_TCP, src, dst, sport, dport, ((offset_byte & 0x01) << 8) | flag_byte, seq, ack,
+                window, data_offset, checksum, l4 + 20, payload_start, l4_end)
+    if proto == IPPROTO_UDP:
+        if l4 + 8 > l4_end:
+            return None
+        sport, dport, udp_len, checksum = _UDP_HDR.unpack_from(frame, l4)
+        payload_end = min(l4 + udp_len, l4_end) if udp_len >= 8 else l4_end
+        return (IPPROTO_UDP, src, dst, sport, dport, 0, None, None,
+                None, 2, checksum, l4 + 8, l4 + 8, payload_end)
+    return None
+
+
+def ip_to_str(packed):
+    if len(packed) == 4:
+        return socket.inet_ntoa(packed)
+    return socket.inet_ntop(socket.AF_INET6, packed)
+
+
+def timestamp_ns_to_float(timestamp_ns):
+    if timestamp_ns is None:
+        return None
+    # Split first so large ns counts don't lose precision in the float
+    return timestamp_ns // 1_000_000_000 + (timestamp_ns % 1_000_000_000) / 1e9
+
+
+def decode_packet(frame, linktype, timestamp_ns=None):
+    """Decode one captured frame into the packet dict used by the analyzers.
+
+    Returns None for frames that are not TCP or UDP over IPv4/IPv6.
+    """
+    headers = decode_headers(frame, linktype)
+    if headers is None:
+        return None
+    (proto, src, dst, sport, dport, flag_bits, seq, ack, window, header_len, checksum,
+     options_start, payload_start, payload_end) = headers
+    payload = frame[payload_start:payload_end]
+    return {
+        'protocol': PROTOCOL_NAMES[proto],
+        'src_ip': ip_to_str(src),
+        'dst_ip': ip_to_str(dst),
+        'src_port': sport,
+        'dst_port': dport,
+        'flags': TCP_FLAG_STRINGS[flag_bits],
+        'seq': seq,
+        'ack': ack,
+        'window': window,
+        'payload_len': len(payload),
+        'header_len': header_len,
+        'checksum': checksum,
+        'options': frame[options_start:payload_start],
+        'raw_payload': payload,
+        'timestamp': timestamp_ns_to_float(timestamp_ns),
+    }
+
+
+def read_packets(file_path, protocols=('tcp',)):
+    """Stream decoded packet dicts from a pcap/pcapng file.
+
+    raw_payload and options are memoryviews into the mapped capture; call
+    bytes() on them if they must outlive the capture or cross a process.
+    """
+    mm = open_capture(file_path)
+    try:
+        for ts_ns, linktype, frame, _offset in iter_records(mm):
+            pkt = decode_packet(frame, linktype, ts_ns)
+            if pkt is not None and pkt['protocol'] in protocols:
+                yield pkt
+    finally:
+        close_capture(mm)
@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import tempfile
+
+class StreamingReportWriter:
+    """Writes the report JSON incrementally.
+
+    The file has the same shape as the one generate_report always wrote
+    ({"errors": [...], "latencies": [...], "total_packets": N}), but errors
+    and latencies are appended one at a time so the full lists never have to
+    exist in memory. Sections can be written to in any order: every section
+    is spooled to a temporary file of its own and spliced into the report,
+    one contiguous array each, when it is finished.
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self._file = None
+        self._spools = {}
+        self.counts = {}
+
+    def __enter__(self):
+        self._file = open(self.output_path, 'w')
+        self._file.write('{')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._file is not None:
+            if exc_type is not None:
+                # Leave a well-formed file behind even if the analysis died
+                self._splice()
+                self._file.write('}\n')
+            self._file.close()
+            self._file = None
+        self._close_spools()
+
+    def _close_spools(self):
+        for spool in self._spools.values():
+            spool.close()
+        self._spools = {}
+
+    def _spool(self, section):
+        spool = self._spools.get(section)
+        if spool is None:
+            spool = self._spools[section] = tempfile.TemporaryFile(
+                'w+', dir=os.path.dirname(os.path.abspath(self.output_path)))
+            self.counts[section] = 0
+        return spool
+
+    def write_item(self, section, item):
+        spool = self._spool(section)
+        if self.counts[section]:
+            spool.write(',\n')
+        spool.write(json.dumps(item))
+        self.counts[section] += 1
+
+    def write_error(self, err):
+        self.write_item('errors', err)
+
+    def write_latency(self, latency):
+        self.write_item('latencies', latency)
+
+    def _splice(self):
+        for i, (name, spool) in enumerate(self._spools.items()):
+            self._file.write(f'{", " if i else ""}{json.dumps(name)}: [\n')
+            spool.seek(0)
+            shutil.copyfileobj(spool, self._file)
+            self._file.write('\n]')
+        self._close_spools()
+
+    def finish(self, **fields):
+        # Sections that never received an item still have to exist
+        for name in ('errors', 'latencies', 'unmatched_orders'):
+            self._spool(name)
+        self._splice()
+        for key, value in fields.items():
+            self._file.write(f', {json.dumps(key)}: {json.dumps(value)}')
+        self._file.write('}\n')
+        self._file.close()
+        self._file = None
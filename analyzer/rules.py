@@ -0,0 +1,170 @@
+import time
+from collections import namedtuple
+import numpy as np
+
+# Detection rules by key, in registration order. A rule's position is its
+# issue type number in hit arrays. Modules register rules on import with
+# @rule; the built-in ones live in analyzer.error_detector.
+RULES = {}
+
+# Per-flow state shared by stateful rules, by name. A state is built with
+# (max_memory, spill_dir=...), fed each batch once and closed at the end;
+# its feed() output goes to every enabled rule that names it.
+FLOW_STATES = {}
+
+Rule = namedtuple('Rule', ['key', 'issue_type', 'number', 'fields', 'state', 'params', 'predicate'])
+
+def rule(key, issue_type, fields=(), state=None, **params):
+    """Register predicate(columns, [state_output,] **params) -> bool mask.
+
+    fields are the packet columns it reads, state the FLOW_STATES entry it
+    needs (None for a stateless rule) and params its tunable defaults.
+    Every rule also takes ports: when set, only packets to or from one of
+    them can hit.
+    """
+    def register(predicate):
+        number = RULES[key].number if key in RULES else len(RULES)
+        RULES[key] = Rule(key, issue_type, number, tuple(fields), state, dict(params, ports=None), predicate)
+        return predicate
+    return register
+
+def register_flow_state(name, factory):
+    FLOW_STATES[name] = factory
+
+def get_rules():
+    # The built-in rules register themselves when their module loads
+    import analyzer.error_detector  # noqa: F401
+    return RULES
+
+def issue_types():
+    """Issue type names indexed by rule number."""
+    return tuple(r.issue_type for r in sorted(get_rules().values(), key=lambda r: r.number))
+
+def parse_param_value(text):
+    """'5' -> 5, '0.5' -> 0.5, '9000,9001' -> [9000, 9001]."""
+    if ',' in text:
+        return [parse_param_value(part) for part in text.split(',') if part]
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+def rule_config(only=None, disabled=(), params=()):
+    """RuleSet config from CLI-style options.
+
+    only is a comma separated list of rule keys (None for all), disabled a
+    list of keys and params a list of 'rule.param=value' strings.
+    """
+    config = {'disabled': list(disabled), 'params': {}}
+    if only:
+        config['enabled'] = [key.strip() for key in only.split(',') if key.strip()]
+    for item in params:
+        name, sep, value = item.partition('=')
+        key, dot, param = name.partition('.')
+        if not sep or not dot:
+            raise ValueError(f"Rule parameters look like rule.param=value, got {item!r}")
+        config['params'].setdefault(key.strip(), {})[param.strip()] = parse_param_value(value.strip())
+    return config
+
+class RuleSet:
+    """The enabled rules of a config, compiled for one detector.
+
+    config is {'enabled': [keys] (default all), 'disabled': [keys],
+    'params': {key: {param: value}}}. Each batch gathers the columns the
+    rules declare once, feeds every flow state they need once, and lays the
+    rule masks out as the columns of one (packets x rules) matrix, so a
+    single nonzero() yields the hits in packet order, then rule order.
+    Hits and time spent are counted per rule, and per flow state.
+    """
+
+    def __init__(self, config=None, max_memory=None, spill_dir=None):
+        config = config or {}
+        rules = get_rules()
+        for key in list(config.get('enabled') or []) + list(config.get('disabled') or []) + list(config.get('params') or {}):
+            if key not in rules:
+                raise ValueError(f"Unknown rule {key!r}, expected one of: {', '.join(rules)}")
+        enabled = set(rules if config.get('enabled') is None else config['enabled'])
+        enabled -= set(config.get('disabled') or ())
+        self.rules = sorted((r for r in rules.values() if r.key in enabled), key=lambda r: r.number)
+        self.params = {}
+        for r in self.rules:
+            params = dict(r.params)
+            for name, value in (config.get('params') or {}).get(r.key, {}).items():
+                if name not in params:
+                    raise ValueError(f"Rule {r.key!r} has no parameter {name!r}, expected one of: {', '.join(params)}")
+                params[name] = value
+            if params['ports'] is not None:
+                params['ports'] = np.atleast_1d(np.asarray(params['ports'], dtype=np.uint16))
+            self.params[r.key] = params
+        self.numbers = np.array([r.number for r in self.rules], dtype=np.int64)
+        self.fields = sorted({field for r in self.rules for field in r.fields})
+        self.states = {name: FLOW_STATES[name](max_memory, spill_dir=spill_dir)
+                       for name in sorted({r.state for r in self.rules if r.state})}
+        self.counts = {r.key: 0 for r in self.rules}
+        self.seconds = dict.fromkeys([r.key for r in self.rules] + [f'state:{name}' for name in self.states], 0.0)
+
+    def find(self, table):
+        """Return (packet_index, rule_number) arrays for this batch, in packet order."""
+        cols = table.columns
+        if not self.rules or not len(cols):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        columns = {field: cols[field] for field in self.fields}
+        outputs = {}
+        for name, state in self.states.items():
+            started = time.perf_counter()
+            outputs[name] = state.feed(table)
+            self.seconds[f'state:{name}'] += time.perf_counter() - started
+        hits = np.empty((len(cols), len(self.rules)), dtype=bool)
+        for j, r in enumerate(self.rules):
+            started = time.perf_counter()
+            params = dict(self.params[r.key])
+            ports = params.pop('ports')
+            if r.state is None:
+                mask = r.predicate(columns, **params)
+            else:
+                mask = r.predicate(columns, outputs[r.state], **params)
+            if ports is not None:
+                mask = mask & (np.isin(cols['src_port'], ports) | np.isin(cols['dst_port'], ports))
+            hits[:, j] = mask
+            self.seconds[r.key] += time.perf_counter() - started
+        hit_index, column = np.nonzero(hits)
+        for j, count in enumerate(np.bincount(column, minlength=len(self.rules)).tolist()):
+            self.counts[self.rules[j].key] += count
+        return hit_index, self.numbers[column]
+
+    def stats(self):
+        """{'rules': {key: {issue_type, hits, seconds}}, 'flow_state': {name: seconds}}"""
+        return {
+            'rules': {r.key: {'issue_type': r.issue_type, 'hits': self.counts[r.key], 'seconds': self.seconds[r.key]}
+                      for r in self.rules},
+            'flow_state': {name: self.seconds[f'state:{name}'] for name in self.states},
+        }
+
+    def expire(self, before):
+        """Drop the per-flow state of flows idle since before (capture time, ns)."""
+        for state in self.states.values():
+            state.expire(before)
+
+    def close(self):
+        for state in self.states.values():
+            state.close()
+
+def merge_rule_stats(stats):
+    """Add up RuleSet.stats() from several detectors (e.g. engine partitions)."""
+    merged = {'rules': {}, 'flow_state': {}}
+    for part in stats:
+        for key, entry in part['rules'].items():
+            total = merged['rules'].setdefault(key, dict(entry, hits=0, seconds=0.0))
+            total['hits'] += entry['hits']
+            total['seconds'] += entry['seconds']
+        for name, seconds in part['flow_state'].items():
+            merged['flow_state'][name] = merged['flow_state'].get(name, 0.0) + seconds
+    return merged
+
+def rule_catalog():
+    """Every registered rule with its defaults, for help text and UIs."""
+    return [{'key': r.key, 'issue_type': r.issue_type, 'stateful': r.state is not None,
+             'params': {name: value for name, value in r.params.items() if name != 'ports'}}
+            for r in sorted(get_rules().values(), key=lambda r: r.number)]
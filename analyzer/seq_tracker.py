@@ -0,0 +1,264 @@
+from bisect import bisect_left, bisect_right
+import numpy as np
+from analyzer.packet_table import PacketTable, FLAG_SYN, FLAG_FIN, FLAG_RST, FLAG_ACK
+from analyzer.flow_state import FlowStateStore
+
+# Per-packet findings of SeqTracker.feed()
+SEQ_EVENTS = ('retransmission', 'spurious_retransmission', 'out_of_order', 'dup_ack', 'keep_alive')
+
+NONE = np.iinfo(np.int64).min
+
+class IntervalSet:
+    """Disjoint half-open integer ranges kept as one flat sorted list.
+
+    bounds is [start0, end0, start1, end1, ...]; a point lies inside the
+    set when bisect_right(bounds, point) is odd. Memory is two ints per
+    range no matter how many bytes the ranges span.
+    """
+
+    __slots__ = ('bounds',)
+
+    def __init__(self, bounds=None):
+        self.bounds = bounds or []
+
+    def __len__(self):
+        return len(self.bounds) // 2
+
+    def __iter__(self):
+        return iter(zip(self.bounds[0::2], self.bounds[1::2]))
+
+    def add(self, start, end):
+        if start >= end:
+            return
+        b = self.bounds
+        # Left/right bisection so touching ranges merge
+        i, j = bisect_left(b, start), bisect_right(b, end)
+        b[i:j] = ([] if i % 2 else [start]) + ([] if j % 2 else [end])
+
+    def overlap(self, start, end):
+        """Number of points of [start, end) inside the set."""
+        b = self.bounds
+        i, j = bisect_right(b, start), bisect_left(b, end)
+        inner = ([start] if i % 2 else []) + b[i:j] + ([end] if j % 2 else [])
+        return sum(inner[1::2]) - sum(inner[0::2])
+
+    def remove(self, start, end):
+        if start >= end:
+            return
+        b = self.bounds
+        i, j = bisect_right(b, start), bisect_left(b, end)
+        head = tail = []
+        if i % 2:
+            if b[i - 1] == start:
+                i -= 1
+            else:
+                head = [start]
+        if j % 2:
+            if b[j] == end:
+                j += 1
+            else:
+                tail = [end]
+        b[i:j] = head + tail
+
+    def discard_below(self, point):
+        i = bisect_right(self.bounds, point)
+        self.bounds[:i] = [point] if i % 2 else []
+
+    def drop_lowest(self, count):
+        del self.bounds[:2 * count]
+
+class SeqState:
+    """Sequence space of one direction of a connection.
+
+    Positions are unwrapped to Python ints, so comparisons need no modular
+    arithmetic. Everything below high counts as sent except the holes:
+    ranges skipped over that have not shown up yet. Holes below the peer's
+    cumulative ACK are forgotten (the receiver has those bytes, the capture
+    just missed them), so the state is O(holes), not O(packets).
+    """
+
+    __slots__ = ('high', 'acked', 'last', 'holes')
+
+    def __init__(self):
+        self.high = None    # end of the highest segment sent
+        self.acked = None   # highest cumulative ACK from the peer
+        self.last = None    # raw (seq, ack, window) of the previous packet, for dup ACKs
+        self.holes = IntervalSet()
+
+    @property
+    def nbytes(self):
+        return 200 + 16 * len(self.holes.bounds)
+
+def _unwrap(values, ref):
+    # Absolute positions for 32-bit sequence numbers; the first is taken
+    # nearest to ref, the rest follow by signed 32-bit steps
+    values = values.astype(np.int64)
+    out = np.empty(len(values), dtype=np.int64)
+    if len(values):
+        out[0] = ref + ((int(values[0]) - ref + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        steps = ((np.diff(values) + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        np.cumsum(steps, out=out[1:])
+        out[1:] += out[0]
+    return out
+
+def _flow_indices(flows):
+    # Packet indices of each flow, in flow order
+    order = np.argsort(flows.ids, kind='stable')
+    return np.split(order, np.cumsum(flows.counts)[:-1])
+
+def _group_connections(table):
+    """FlowGroups over connections, plus a mask of packets sent by the second endpoint.
+
+    Each packet's endpoints are put in canonical (lower, higher) order so
+    both directions of a connection group together. Also returns the
+    canonical raw key of every connection.
+    """
+    cols = table.columns
+    ends = (('src_ip_hi', 'dst_ip_hi'), ('src_ip_lo', 'dst_ip_lo'), ('src_port', 'dst_port'))
+    reverse = np.zeros(len(cols), dtype=bool)
+    decided = np.zeros(len(cols), dtype=bool)
+    for src, dst in ends:
+        reverse |= ~decided & (cols[src] > cols[dst])
+        decided |= cols[src] != cols[dst]
+    canonical = cols.copy()
+    for src, dst in ends:
+        canonical[src][reverse] = cols[dst][reverse]
+        canonical[dst][reverse] = cols[src][reverse]
+    canonical = PacketTable(canonical)
+    groups = canonical.group_flows()
+    return groups, reverse, [canonical.raw_flow_key(i) for i in groups.first_index]
+
+class SeqTracker:
+    """Classifies TCP segments by where they fall in their sequence space.
+
+    feed() takes consecutive PacketTable batches and returns one boolean
+    mask per SEQ_EVENTS entry:
+
+    - retransmission: payload (or SYN/FIN) covering bytes already sent
+    - spurious_retransmission: every byte was already ACKed by the peer
+    - out_of_order: arrives behind the highest sequence but only fills a hole
+    - dup_ack: pure ACK repeating the previous seq, ack and (non-zero) window
+    - keep_alive: zero or one byte at one below the next expected sequence
+
+    Each connection is handled with whole-array passes; only segments that
+    open or land behind a hole go through the per-segment interval logic.
+    Per-direction SeqStates live in a FlowStateStore, and no direction keeps
+    more than max_holes holes (the lowest are given up on first).
+    """
+
+    def __init__(self, max_memory=None, spill_dir=None, max_holes=1024):
+        self.flows = FlowStateStore(max_memory, spill_dir=spill_dir)
+        self.max_holes = max_holes
+
+    def feed(self, table):
+        cols = table.columns
+        masks = {name: np.zeros(len(cols), dtype=bool) for name in SEQ_EVENTS}
+        if not len(cols):
+            return masks
+        self.flows.advance(cols['timestamp_ns'])
+        flags = cols['flags']
+        # Per-packet (sequence length, SYN/FIN/RST, ACK) of this batch only
+        segments = (cols['payload_len'].astype(np.int64) + ((flags & FLAG_SYN) != 0) + ((flags & FLAG_FIN) != 0),
+                    (flags & (FLAG_SYN | FLAG_FIN | FLAG_RST)) != 0,
+                    (flags & FLAG_ACK) != 0)
+        has_ack = segments[2]
+        groups, reverse, keys = _group_connections(table)
+        for conn, idx in enumerate(_flow_indices(groups)):
+            key = keys[conn]
+            peer_key = (key[2], key[3], key[0], key[1], key[5], key[4])
+            sides = reverse[idx]
+            for side, side_key in ((False, key), (True, peer_key)):
+                own = np.flatnonzero(sides == side)
+                peer = np.flatnonzero(sides != side)
+                peer = peer[has_ack[idx[peer]]]
+                state = self.flows.get(side_key)
+                if state is None:
+                    if not len(own) and not len(peer):
+                        continue
+                    state = SeqState()
+                self._update(state, table, idx, own, peer, segments, masks)
+                self.flows[side_key] = state
+        return masks
+
+    def _update(self, state, table, idx, own, peer, segments, masks):
+        cols = table.columns
+        # Every position in this direction's space is unwrapped near one reference
+        if state.high is not None:
+            ref = state.high
+        elif state.acked is not None:
+            ref = state.acked
+        elif len(own):
+            ref = int(cols['seq'][idx[own[0]]])
+        else:
+            ref = int(cols['ack'][idx[peer[0]]])
+        # Highest peer ACK seen before each of our packets
+        running = np.full(len(idx), NONE, dtype=np.int64)
+        running[peer] = _unwrap(cols['ack'][idx[peer]], ref)
+        if state.acked is not None:
+            running[0] = max(running[0], state.acked)
+        np.maximum.accumulate(running, out=running)
+        if running[-1] != NONE:
+            state.acked = int(running[-1])
+        if len(own):
+            self._advance(state, table, idx[own], running[own], segments, masks)
+        if state.acked is not None:
+            state.holes.discard_below(state.acked)
+
+    def _advance(self, state, table, rows, acked_before, segments, masks):
+        cols = table.columns
+        seq_raw, ack_raw, window = cols['seq'][rows], cols['ack'][rows], cols['window'][rows]
+        seg_len, control, has_ack = segments
+        length = seg_len[rows]
+        control = control[rows]
+        start = _unwrap(seq_raw, state.high if state.high is not None else
+                        state.acked if state.acked is not None else int(seq_raw[0]))
+        end = start + length
+        first_high = state.high if state.high is not None else int(start[0])
+        prior = np.maximum.accumulate(np.concatenate(([first_high], end[:-1])))
+
+        keep_alive = (length <= 1) & ~control & (start == prior - 1)
+        behind = (length > 0) & (start < prior) & ~keep_alive
+        # Jumped past bytes the capture hasn't seen (yet)
+        ahead = start > prior
+        masks['keep_alive'][rows[keep_alive]] = True
+
+        pure_ack = (cols['payload_len'][rows] == 0) & has_ack[rows] & ~control & (window != 0)
+        if state.last is None:
+            prev_seq, prev_ack, prev_window = seq_raw[:-1], ack_raw[:-1], window[:-1]
+            pure_ack = pure_ack[1:]
+            offset = 1
+        else:
+            prev_seq = np.concatenate(([state.last[0]], seq_raw[:-1]))
+            prev_ack = np.concatenate(([state.last[1]], ack_raw[:-1]))
+            prev_window = np.concatenate(([state.last[2]], window[:-1]))
+            offset = 0
+        dup = pure_ack & (seq_raw[offset:] == prev_seq) & (ack_raw[offset:] == prev_ack) & (window[offset:] == prev_window)
+        masks['dup_ack'][rows[offset:][dup]] = True
+
+        holes = state.holes
+        for k in np.flatnonzero(behind | ahead).tolist():
+            if ahead[k]:
+                holes.add(int(prior[k]), int(start[k]))
+                continue
+            seg_start, seg_end, acked = int(start[k]), int(end[k]), int(acked_before[k])
+            if acked != NONE:
+                holes.discard_below(acked)
+                if seg_end <= acked:
+                    masks['spurious_retransmission'][rows[k]] = True
+                    continue
+            # Bytes past the highest sequence so far are new either way
+            top = min(seg_end, int(prior[k]))
+            missing = holes.overlap(seg_start, top)
+            holes.remove(seg_start, top)
+            event = 'retransmission' if top - seg_start > missing else 'out_of_order'
+            masks[event][rows[k]] = True
+        if len(holes) > self.max_holes:
+            holes.drop_lowest(len(holes) - self.max_holes)
+        state.high = max(int(prior[-1]), int(end[-1]))
+        state.last = (int(seq_raw[-1]), int(ack_raw[-1]), int(window[-1]))
+
+    def expire(self, before):
+        return len(self.flows.expire(before))
+
+    def close(self):
+        self.flows.close()
@@ -0,0 +1,300 @@
+import heapq
+import numpy as np
+from analyzer.packet_table import FLAG_SYN, FLAG_FIN, FLAG_RST, FLOW_KEY_COLUMNS, NO_TIMESTAMP
+from analyzer.pcap_reader import timestamp_ns_to_float, IPPROTO_TCP
+from analyzer.flow_state import FlowStateStore
+from analyzer.engine import FlowAnalyzer, register_analyzer, only_protocol
+
+# Application-layer decoders fed by the reassembler, by name. A decoder gets
+# the in-order bytes of one TCP direction and returns framed messages.
+STREAM_DECODERS = {}
+
+def register_stream_decoder(cls):
+    STREAM_DECODERS[cls.name] = cls
+    return cls
+
+def get_stream_decoder(name):
+    if name not in STREAM_DECODERS:
+        import analyzer.fix_decoder  # noqa: F401
+    return STREAM_DECODERS[name]
+
+class StreamDecoder:
+    """Base class for application decoders.
+
+    feed() receives contiguous stream bytes and returns a list of decoded
+    messages; reset() is called after a gap, when framing must resync.
+    Set active to False once the stream clearly isn't this protocol so the
+    reassembler can stop buffering it. buffered_bytes is what the decoder
+    holds of a message not yet complete, counted against max_memory.
+    """
+
+    name = None
+    active = True
+    buffered_bytes = 0
+
+    def feed(self, data):
+        return []
+
+    def reset(self):
+        pass
+
+def seq_diff(a, b):
+    """Signed distance a - b in 32-bit sequence space (handles wraparound)."""
+    return ((a - b + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+class TcpStream:
+    """One direction of a TCP connection, reassembled into in-order bytes.
+
+    Segments ahead of the next expected sequence number are held until the
+    hole fills. If more than max_buffer bytes are waiting, the hole is
+    declared lost and the stream skips ahead to the earliest buffered data.
+    Retransmitted bytes that were already delivered are trimmed off.
+
+    Held segments are also kept in a heap by their position in the stream
+    (bytes from where reassembly started, not wrapping like sequence
+    numbers), so the next one to deliver is always at the top.
+    """
+
+    def __init__(self, decoders, max_buffer=1 << 20):
+        self.decoders = decoders
+        self.max_buffer = max_buffer
+        self.next_seq = None
+        self.position = 0
+        self.pending = {}
+        self._order = []
+        self.pending_bytes = 0
+        self.delivered_bytes = 0
+        self.overlap_bytes = 0
+        self.gaps = 0
+        self.gap_bytes = 0
+        # Set by TcpReassembler: the direction's flow_key() and the
+        # (packet number, timestamp ns) of its latest segment
+        self.session = None
+        self.latest = None
+
+    @property
+    def active(self):
+        return any(decoder.active for decoder in self.decoders)
+
+    def add(self, seq, payload, syn=False):
+        """Add one segment; returns the messages it completed."""
+        if syn:
+            self._restart((seq + 1) & 0xFFFFFFFF)
+            if not payload:
+                return []
+            seq = self.next_seq
+        if not payload or not self.active:
+            return []
+        if self.next_seq is None:
+            # Picked up mid-stream, start from the first segment we see
+            self._restart(seq)
+        offset = seq_diff(seq, self.next_seq)
+        if offset + len(payload) <= 0:
+            self.overlap_bytes += len(payload)
+            return []
+        if offset > 0:
+            self._hold(seq, payload)
+            if self.pending_bytes > self.max_buffer:
+                return self._skip_gap()
+            return []
+        if offset < 0:
+            self.overlap_bytes += -offset
+            payload = payload[-offset:]
+        return self._deliver(payload) + self._drain()
+
+    def _restart(self, next_seq):
+        # Held segments are positioned relative to next_seq
+        self.next_seq = next_seq
+        self.position = 0
+        self._order = [(seq_diff(seq, next_seq), seq) for seq in self.pending]
+        heapq.heapify(self._order)
+
+    def _hold(self, seq, payload):
+        held = self.pending.get(seq)
+        if held is not None:
+            if len(held) >= len(payload):
+                self.overlap_bytes += len(payload)
+                return
+            self.pending_bytes -= len(held)
+        else:
+            heapq.heappush(self._order, (self.position + seq_diff(seq, self.next_seq), seq))
+        self.pending[seq] = bytes(payload)
+        self.pending_bytes += len(payload)
+
+    def _deliver(self, data):
+        self.next_seq = (self.next_seq + len(data)) & 0xFFFFFFFF
+        self.position += len(data)
+        self.delivered_bytes += len(data)
+        messages = []
+        for decoder in self.decoders:
+            if decoder.active:
+                messages.extend((decoder.name, message) for message in decoder.feed(data))
+        return messages
+
+    def _drain(self):
+        messages = []
+        while self._order:
+            position, seq = self._order[0]
+            offset = position - self.position
+            if offset > 0:
+                break
+            heapq.heappop(self._order)
+            data = self.pending.pop(seq)
+            self.pending_bytes -= len(data)
+            if offset + len(data) <= 0:
+                self.overlap_bytes += len(data)
+                continue
+            self.overlap_bytes += -offset
+            messages.extend(self._deliver(data[-offset:] if offset else data))
+        return messages
+
+    def _skip_gap(self):
+        position, seq = self._order[0]
+        self.gaps += 1
+        self.gap_bytes += position - self.position
+        self.position = position
+        self.next_seq = seq
+        for decoder in self.decoders:
+            decoder.reset()
+        return self._drain()
+
+    def close(self):
+        """Deliver what is still held behind gaps; returns the messages it completes."""
+        messages = []
+        while self.pending:
+            messages.extend(self._skip_gap())
+        return messages
+
+    def stats(self):
+        return {'delivered_bytes': self.delivered_bytes, 'overlap_bytes': self.overlap_bytes,
+                'gaps': self.gaps, 'gap_bytes': self.gap_bytes, 'buffered_bytes': self.pending_bytes}
+
+def _stream_size(stream):
+    return 512 + stream.pending_bytes + sum(decoder.buffered_bytes for decoder in stream.decoders)
+
+class TcpReassembler:
+    """Reassembles every TCP direction in a stream of PacketTable batches.
+
+    Returns decoded application messages as dicts with the packet number of
+    the segment that completed them. Streams are dropped on FIN/RST, when
+    idle (expire()) and by flush(); data held behind a gap is delivered
+    then, its messages attributed to the stream's latest segment. Streams
+    per-direction state goes through a FlowStateStore so max_memory bounds
+    the number of idle streams kept in memory. decoder_options maps a
+    decoder name to the keyword arguments its instances are built with.
+    """
+
+    def __init__(self, decoders=('fix',), max_flow_buffer=1 << 20, max_memory=None, decoder_options=None):
+        decoder_options = decoder_options or {}
+        self.decoder_specs = [(get_stream_decoder(name), decoder_options.get(name, {})) for name in decoders]
+        self.max_flow_buffer = max_flow_buffer
+        self.streams = FlowStateStore(max_memory, size_of=_stream_size)
+        self.totals = {'streams': 0, 'messages': 0, 'gaps': 0, 'gap_bytes': 0, 'overlap_bytes': 0}
+        self.packets_seen = 0
+
+    def _stream(self, key, table, i):
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = TcpStream([cls(**kwargs) for cls, kwargs in self.decoder_specs], self.max_flow_buffer)
+            stream.session = table.flow_key(i)
+            self.totals['streams'] += 1
+        return stream
+
+    def _count(self, stream):
+        decoded = stream.close()
+        stats = stream.stats()
+        for name in ('gaps', 'gap_bytes', 'overlap_bytes'):
+            self.totals[name] += stats[name]
+        return decoded
+
+    def _messages(self, decoded, stream):
+        packet_index, ts = stream.latest
+        messages = [{
+            'packet_index': packet_index,
+            'session': stream.session,
+            'timestamp': None if ts == NO_TIMESTAMP else timestamp_ns_to_float(ts),
+            'protocol': protocol,
+            'message': message,
+        } for protocol, message in decoded]
+        self.totals['messages'] += len(messages)
+        return messages
+
+    def feed(self, table, index=None):
+        if index is None:
+            index = np.arange(self.packets_seen, self.packets_seen + len(table))
+        self.packets_seen += len(table)
+        cols = table.columns
+        self.streams.advance(cols['timestamp_ns'])
+        flags = cols['flags']
+        # Pure ACKs carry nothing to reassemble
+        wanted = np.flatnonzero((cols['payload_len'] > 0) | ((flags & (FLAG_SYN | FLAG_FIN | FLAG_RST)) != 0))
+        messages = []
+        # raw_flow_key() of every wanted row at once; per row it dominated reassembly time
+        keys = cols[list(FLOW_KEY_COLUMNS)][wanted].tolist()
+        for i, key in zip(wanted.tolist(), keys):
+            stream = self._stream(key, table, i)
+            flag_bits = int(flags[i])
+            stream.latest = (int(index[i]), int(cols['timestamp_ns'][i]))
+            decoded = stream.add(int(cols['seq'][i]), table.payload(i), syn=bool(flag_bits & FLAG_SYN))
+            if flag_bits & (FLAG_FIN | FLAG_RST):
+                decoded += self._count(stream)
+                self.streams.pop(key)
+            else:
+                self.streams[key] = stream
+            if decoded:
+                messages.extend(self._messages(decoded, stream))
+        return messages
+
+    def expire(self, before):
+        """Retire the streams idle since before (capture time, ns); returns the messages they still held."""
+        messages = []
+        for _key, stream in self.streams.expire(before):
+            messages.extend(self._messages(self._count(stream), stream))
+        return messages
+
+    def flush(self):
+        """Retire every stream; returns the messages they still held, in packet order."""
+        messages = []
+        for key, stream in list(self.streams.items()):
+            messages.extend(self._messages(self._count(stream), stream))
+            self.streams.pop(key)
+        messages.sort(key=lambda m: m['packet_index'])
+        return messages
+
+    def finish(self):
+        """Totals of the whole run; call flush() first to get the messages of streams still open."""
+        self.flush()
+        self.streams.close()
+        return dict(self.totals)
+
+@register_analyzer
+class ReassemblyAnalyzer(FlowAnalyzer):
+    """TCP reassembly plus application decoding as an AnalysisEngine analyzer.
+
+    feed() records are message dicts; finish() adds one {'stats': ...}
+    record with the partition's reassembly counters.
+    """
+
+    name = 'app_messages'
+
+    def __init__(self, decoders=('fix',), max_flow_buffer=1 << 20, max_memory=None):
+        self.reassembler = TcpReassembler(decoders, max_flow_buffer, max_memory)
+
+    def feed(self, table, index):
+        return self.reassembler.feed(*only_protocol(table, index, IPPROTO_TCP))
+
+    def expire(self, now, idle):
+        return self.reassembler.expire(now - idle)
+
+    def finish(self):
+        return self.reassembler.flush() + [{'stats': self.reassembler.finish()}]
+
+    @classmethod
+    def merge(cls, partials):
+        records = [r for partial in partials if partial for r in partial]
+        messages = sorted((r for r in records if 'stats' not in r), key=lambda r: r['packet_index'])
+        stats = [r['stats'] for r in records if 'stats' in r]
+        if stats:
+            merged = {name: sum(s[name] for s in stats) for name in stats[0]}
+            messages.append({'stats': merged})
+        return messages
@@ -0,0 +1,60 @@
+"""Compare decode_fix_message with the batch decoder on synthetic messages.
+
+    python benchmarks/bench_fix_decoder.py --messages 200000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyzer.fix_decoder import decode_fix_message, decode_fix_batch, fix_checksum, frame_fix_messages
+
+def make_messages(count):
+    messages = []
+    for i in range(count):
+        body = (f'35={"D8"[i % 2]}\x0149=SENDER\x0156=TARGET\x0134={i + 1}\x01'
+                f'52=20240101-09:30:00.{i % 1000:03d}\x0111=ORD{i:08d}\x0155=AAPL\x01'
+                f'54=1\x0138=100\x0140=2\x0144=187.25\x0160=20240101-09:30:00.{i % 1000:03d}\x01')
+        head = f'8=FIX.4.4\x019={len(body)}\x01'.encode()
+        message = head + body.encode()
+        messages.append(message + b'10=%03d\x01' % fix_checksum(message))
+    return messages
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<28} {elapsed:8.3f}s {count / elapsed:12,.0f} msgs/s')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=50000, help='messages per decode_fix_batch call')
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    stream = b''.join(messages)
+    print(f'{args.messages} messages, {len(stream) / 1e6:.1f} MB')
+
+    timed('decode_fix_message', args.messages, lambda: [decode_fix_message(m) for m in messages])
+    timed('frame_fix_messages', args.messages, lambda: frame_fix_messages(stream))
+
+    def batch_stream():
+        # Split the stream on message boundaries into ~batch-sized chunks
+        step = len(stream) * args.batch // args.messages
+        pos = 0
+        while pos < len(stream):
+            batch = decode_fix_batch(memoryview(stream)[pos:pos + step])
+            assert batch.valid.all()
+            pos += int(batch.ends[-1]) if len(batch) else len(stream)
+    timed('decode_fix_batch (stream)', args.messages, batch_stream)
+
+    def batch_list():
+        for pos in range(0, len(messages), args.batch):
+            decode_fix_batch(messages[pos:pos + args.batch])
+    timed('decode_fix_batch (framed)', args.messages, batch_list)
+
+if __name__ == '__main__':
+    main()
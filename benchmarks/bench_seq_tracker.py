@@ -0,0 +1,92 @@
+"""Run SeqTracker over one long synthetic TCP flow with injected anomalies.
+
+    python benchmarks/bench_seq_tracker.py --segments 10000000
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyzer.packet_table import PACKET_DTYPE, PacketTable, FLAG_ACK, FLAG_PSH
+from analyzer.seq_tracker import SeqTracker, SEQ_EVENTS
+
+MSS = 1448
+CLIENT_ISN = 0xFFF00000   # wraps within the first ~700 segments
+SERVER_ISN = 7
+
+def make_batch(lo, hi):
+    """Segments lo..hi-1 client->server, an ACK after every second one.
+
+    Every 1000th segment (offset 500) is resent 3 segments later, before
+    the receiver acks it; offset 900 is resent 20 later, after the ACK
+    (spurious); every 5000th is swapped with its successor (out of order).
+    """
+    g = np.arange(lo, hi, dtype=np.int64)
+    key = 2.0 * g
+    key[(g % 5000 == 0) & (g > 0) & (g + 1 < hi)] += 2.5
+    retrans = g[(g % 1000 == 500) & (g + 3 < hi)]
+    spurious = g[(g % 1000 == 900) & (g + 20 < hi)]
+    acks = g[(g % 2 == 1) & (g >= 8)]
+    data = np.concatenate([g, retrans, spurious])
+    keys = np.concatenate([key, 2.0 * (retrans + 3) + 0.5, 2.0 * (spurious + 20) + 0.5, 2.0 * acks + 1])
+    order = np.argsort(keys, kind='stable')
+
+    cols = np.zeros(len(data) + len(acks), dtype=PACKET_DTYPE)
+    n = len(data)
+    cols['src_ip_lo'][:n], cols['dst_ip_lo'][:n] = 1, 2
+    cols['src_port'][:n], cols['dst_port'][:n] = 40000, 9000
+    cols['flags'][:n] = FLAG_PSH | FLAG_ACK
+    cols['seq'][:n] = (CLIENT_ISN + data * MSS) & 0xFFFFFFFF
+    cols['ack'][:n] = SERVER_ISN
+    cols['payload_len'][:n] = MSS
+    cols['src_ip_lo'][n:], cols['dst_ip_lo'][n:] = 2, 1
+    cols['src_port'][n:], cols['dst_port'][n:] = 9000, 40000
+    cols['flags'][n:] = FLAG_ACK
+    cols['seq'][n:] = SERVER_ISN
+    # Acks lag eight segments behind, so reordering never looks acked
+    cols['ack'][n:] = (CLIENT_ISN + (acks - 7) * MSS) & 0xFFFFFFFF
+    cols['protocol'] = 6
+    cols['header_len'] = 5
+    cols['window'] = 65535
+    expected = {'retransmission': len(retrans), 'spurious_retransmission': len(spurious),
+                'out_of_order': int(((g % 5000 == 0) & (g > 0) & (g + 1 < hi)).sum())}
+    return PacketTable(cols[order]), expected
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--segments', type=int, default=10_000_000)
+    parser.add_argument('--batch', type=int, default=65536, help='data segments per PacketTable batch')
+    args = parser.parse_args()
+
+    tracker = SeqTracker()
+    counts = dict.fromkeys(SEQ_EVENTS, 0)
+    expected = dict.fromkeys(SEQ_EVENTS, 0)
+    packets = 0
+    max_state = 0
+    elapsed = 0.0
+    for lo in range(0, args.segments, args.batch):
+        table, batch_expected = make_batch(lo, min(lo + args.batch, args.segments))
+        start = time.perf_counter()
+        masks = tracker.feed(table)
+        elapsed += time.perf_counter() - start
+        packets += len(table)
+        for name in SEQ_EVENTS:
+            counts[name] += int(masks[name].sum())
+        for name, value in batch_expected.items():
+            expected[name] += value
+        max_state = max(max_state, sum(state.nbytes for _key, state in tracker.flows.items()))
+
+    print(f'{args.segments:,} data segments, {packets:,} packets in {elapsed:.2f}s '
+          f'({packets / elapsed:,.0f} packets/s)')
+    for name in SEQ_EVENTS:
+        print(f'  {name:<24} {counts[name]:>10,}   expected {expected[name]:>10,}')
+    print(f'peak tracker state {max_state:,} bytes '
+          f'(a sorted uint32 array of every seq would be {args.segments * 4:,})')
+    print(f'max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB')
+
+if __name__ == '__main__':
+    main()
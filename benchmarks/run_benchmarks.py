@@ -0,0 +1,232 @@
+"""Measure throughput and peak RSS of every pipeline stage on a synthetic capture.
+
+    python benchmarks/run_benchmarks.py --packets 1000000 --save-baseline
+    python benchmarks/run_benchmarks.py --packets 1000000            # fails on regressions
+
+Each stage runs in a fresh process, so its peak RSS is its own, and the
+fastest of --repeat runs counts; setup (parsing the capture for the
+stages after parse_pcap) is not timed. The capture is generated once per
+size and seed and reused. Results go to
+--output as JSON; with a baseline of the same capture, a stage slower or
+bigger than the baseline by more than --threshold fails the run.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synth_capture import FIX_PORT, write_capture
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+WORK_DIR = 'output/benchmarks'
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _table(capture, protocols=('tcp', 'udp')):
+    from analyzer.packet_table import PacketTable
+    return PacketTable.from_pcap(capture, protocols=protocols)
+
+def _report(capture):
+    # What a report holds, built from the stages below without the LLM
+    from analyzer.error_detector import ErrorDetector
+    from analyzer.issue_store import IssueStore
+    from analyzer.latency_checker import calculate_latency
+    from main import session_latency_histogram
+    table = _table(capture, ('tcp',))
+    issues = IssueStore()
+    errors = issues.add(*ErrorDetector().find(table), table)
+    latencies = calculate_latency(table)
+    return {'total_packets': len(table), 'issue_summary': issues.summary(), 'errors': errors,
+            'latencies': latencies, 'session_latency': session_latency_histogram(latencies).to_dict()}
+
+def _report_rows(report):
+    return len(report['errors']) + len(report['latencies']) + len(report['issue_summary']['by_flow'])
+
+def bench_parse_pcap(capture, work_dir):
+    from analyzer.pcap_parser import parse_pcap
+    yield
+    table = parse_pcap(capture, as_table=True, protocols=('tcp', 'udp'))
+    yield len(table), 'packets'
+
+def bench_detect_errors(capture, work_dir):
+    from analyzer.error_detector import detect_errors
+    table = _table(capture, ('tcp',))
+    yield
+    detect_errors(table)
+    yield len(table), 'packets'
+
+def bench_calculate_latency(capture, work_dir):
+    from analyzer.latency_checker import calculate_latency
+    table = _table(capture, ('tcp',))
+    yield
+    calculate_latency(table)
+    yield len(table), 'packets'
+
+def bench_decode_fix_message(capture, work_dir):
+    from analyzer.fix_decoder import decode_fix_message, frame_fix_messages
+    # The capture's FIX streams are lossless, so their payloads in packet order are the byte streams
+    table = _table(capture, ('tcp',))
+    streams = {}
+    for i in range(len(table)):
+        row = table.columns[i]
+        if row['payload_len'] and FIX_PORT in (row['src_port'], row['dst_port']):
+            streams.setdefault(table.raw_flow_key(i), []).append(table.payload(i))
+    messages = []
+    for chunks in streams.values():
+        buf = b''.join(chunks)
+        messages.extend(buf[start:end] for start, end in frame_fix_messages(buf)[0])
+    yield
+    for message in messages:
+        decode_fix_message(message)
+    yield len(messages), 'messages'
+
+def bench_decode_itch(capture, work_dir):
+    from analyzer.itch_decoder import ItchDecoder
+    table = _table(capture)
+    yield
+    decoder = ItchDecoder()
+    decoder.feed(table)
+    yield decoder.totals['messages'], 'messages'
+
+def bench_write_report(capture, work_dir):
+    from analyzer.columnar_report import write_report
+    report = _report(capture)
+    path = os.path.join(work_dir, 'report')
+    shutil.rmtree(path, ignore_errors=True)
+    yield
+    write_report(report, path)
+    yield _report_rows(report), 'rows'
+
+def bench_create_pdf_report(capture, work_dir):
+    from analyzer.columnar_report import open_report, write_report
+    from ui.pdf_report import create_pdf_report
+    path = os.path.join(work_dir, 'pdf_report')
+    shutil.rmtree(path, ignore_errors=True)
+    report = _report(capture)
+    write_report(report, path)
+    rows = _report_rows(report)
+    del report
+    yield
+    create_pdf_report(open_report(path), os.path.join(work_dir, 'report.pdf'))
+    yield rows, 'rows'
+
+# Pipeline order; each is a generator that sets up, yields, runs the timed
+# part and yields (items processed, unit)
+STAGES = {
+    'parse_pcap': bench_parse_pcap,
+    'detect_errors': bench_detect_errors,
+    'calculate_latency': bench_calculate_latency,
+    'decode_fix_message': bench_decode_fix_message,
+    'decode_itch': bench_decode_itch,
+    'write_report': bench_write_report,
+    'create_pdf_report': bench_create_pdf_report,
+}
+
+def _run_stage(name, capture, work_dir, results):
+    try:
+        steps = STAGES[name](capture, work_dir)
+        next(steps)
+        setup_rss = _rss_mb()
+        start = time.perf_counter()
+        items, unit = next(steps)
+        seconds = time.perf_counter() - start
+        results.put({'seconds': seconds, 'items': items, 'unit': unit, 'per_second': items / seconds,
+                     'setup_rss_mb': round(setup_rss, 1), 'peak_rss_mb': round(_rss_mb(), 1)})
+    except Exception as e:
+        results.put({'error': f"{type(e).__name__}: {e}"})
+
+def run_stage(name, capture, work_dir, repeat=1):
+    """Run one stage in a fresh interpreter repeat times; returns the fastest run's measurements."""
+    context = multiprocessing.get_context('spawn')
+    best = None
+    for _ in range(repeat):
+        results = context.Queue()
+        process = context.Process(target=_run_stage, args=(name, capture, work_dir, results))
+        process.start()
+        result = results.get()
+        process.join()
+        if 'error' in result:
+            raise RuntimeError(f"stage {name} failed: {result['error']}")
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+def compare(results, baseline, threshold):
+    """Regressions of results against baseline: one message per stage that got slower or bigger."""
+    problems = []
+    for name, base in baseline['stages'].items():
+        current = results['stages'].get(name)
+        if current is None:
+            continue
+        if current['per_second'] < base['per_second'] * (1 - threshold):
+            problems.append(f"{name}: {current['per_second']:,.0f} {current['unit']}/s, "
+                            f"baseline {base['per_second']:,.0f} "
+                            f"(-{1 - current['per_second'] / base['per_second']:.0%})")
+        if current['peak_rss_mb'] > base['peak_rss_mb'] * (1 + threshold):
+            problems.append(f"{name}: peak RSS {current['peak_rss_mb']:,.0f} MB, "
+                            f"baseline {base['peak_rss_mb']:,.0f} MB "
+                            f"(+{current['peak_rss_mb'] / base['peak_rss_mb'] - 1:.0%})")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packets', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--anomaly-rate', type=float, default=0.01)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage; the fastest counts')
+    parser.add_argument('--stage', action='append', choices=list(STAGES),
+                        help='run only this stage (repeatable)')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline JSON to compare with or save to')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed throughput drop / peak RSS growth against the baseline, e.g. 0.2 = 20%%')
+    parser.add_argument('--output', default=os.path.join(WORK_DIR, 'results.json'))
+    args = parser.parse_args()
+
+    os.makedirs(WORK_DIR, exist_ok=True)
+    capture_info = {'packets': args.packets, 'seed': args.seed, 'anomaly_rate': args.anomaly_rate}
+    capture = os.path.join(WORK_DIR, f'synth-{args.packets}-{args.seed}-{args.anomaly_rate}.pcap')
+    if not os.path.exists(capture):
+        start = time.perf_counter()
+        write_capture(capture + '.tmp', args.packets, args.seed, args.anomaly_rate)
+        os.replace(capture + '.tmp', capture)
+        print(f'generated {capture} ({os.path.getsize(capture) / 1e6:,.0f} MB) in {time.perf_counter() - start:.1f}s')
+
+    results = {'capture': capture_info, 'python': platform.python_version(), 'machine': platform.machine(),
+               'cpus': os.cpu_count(), 'created': time.time(), 'stages': {}}
+    for name in args.stage or STAGES:
+        result = results['stages'][name] = run_stage(name, capture, WORK_DIR, args.repeat)
+        print(f"{name:<20} {result['seconds']:8.2f}s {result['per_second']:12,.0f} {result['unit']}/s "
+              f"peak RSS {result['peak_rss_mb']:8,.0f} MB")
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'saved baseline {args.baseline}')
+        return
+    if not os.path.exists(args.baseline):
+        print(f'no baseline at {args.baseline}; run with --save-baseline to create one')
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['capture'] != capture_info:
+        sys.exit(f"baseline was measured on {baseline['capture']}, not {capture_info}")
+    problems = compare(results, baseline, args.threshold)
+    for problem in problems:
+        print(f'REGRESSION {problem}')
+    if problems:
+        sys.exit(1)
+    print(f'no stage regressed by more than {args.threshold:.0%}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+"""Write a deterministic synthetic capture of TCP sessions, FIX order flow and ITCH market data.
+
+    python benchmarks/synth_capture.py synth.pcap --packets 10000000 --anomaly-rate 0.01
+
+The same arguments always give the same bytes. Alongside the capture the
+generator returns (and the CLI prints) what it put in: packets per source,
+every injected anomaly, FIX orders and responses, ITCH messages and gaps,
+so analyzers can be checked against it at any scale.
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyzer.fix_decoder import fix_checksum
+
+MSS = 1448
+FIX_PORT = 9001
+ITCH_PORT = 26400
+# Share of packets per source
+DEFAULT_MIX = {'tcp': 0.5, 'fix': 0.3, 'itch': 0.2}
+# Anomalies injected into plain TCP sessions: one of the first five in place
+# of a data segment, session_reset in place of a close
+SEGMENT_ANOMALIES = ('retransmission', 'out_of_order', 'dup_ack', 'zero_window', 'invalid_checksum')
+TCP_ANOMALIES = SEGMENT_ANOMALIES + ('session_reset',)
+# Issue type the analyzers report for each
+ANOMALY_ISSUE_TYPES = {'retransmission': 'TCP Retransmission', 'out_of_order': 'TCP Out-Of-Order',
+                       'dup_ack': 'TCP Dup ACK', 'zero_window': 'TCP Zero Window',
+                       'invalid_checksum': 'Invalid TCP Checksum', 'session_reset': 'Session Reset'}
+
+_PCAP_HEADER = struct.pack('<IHHiIII', 0xA1B23C4D, 2, 4, 0, 0, 65535, 1)
+_RECORD = struct.Struct('<IIII')
+_ETH_IP = struct.Struct('!12sHBBHHHBBH4s4s')
+_TCP = struct.Struct('!HHIIBBHHH')
+_UDP = struct.Struct('!HHHH')
+_ETH_ADDRS = bytes(range(1, 13))
+_PAYLOAD = bytes(range(32, 127)) * 16
+_FLAGS = {'S': 0x02, 'SA': 0x12, 'A': 0x10, 'PA': 0x18, 'FA': 0x11, 'R': 0x04}
+
+def _ip(a, b, c, d):
+    return bytes((a, b, c, d))
+
+def tcp_frame(src, dst, sport, dport, seq, ack, flags, payload=b'', window=65535, checksum=None):
+    # Checksums aren't computed, as in captures taken where the NIC offloads
+    # them; 0 marks an invalid one
+    if checksum is None:
+        checksum = (seq & 0xFFFF) or 1
+    tcp = _TCP.pack(sport, dport, seq & 0xFFFFFFFF, ack & 0xFFFFFFFF, 5 << 4, _FLAGS[flags], window, checksum, 0)
+    return _ETH_IP.pack(_ETH_ADDRS, 0x0800, 0x45, 0, 40 + len(payload), 0, 0, 64, 6, 0, src, dst) + tcp + payload
+
+def udp_frame(src, dst, sport, dport, payload):
+    udp = _UDP.pack(sport, dport, 8 + len(payload), 0)
+    return _ETH_IP.pack(_ETH_ADDRS, 0x0800, 0x45, 0, 28 + len(payload), 0, 0, 64, 17, 0, src, dst) + udp + payload
+
+def fix_message(fields, seq_num):
+    body = f'35={fields[0][1]}\x0149=CLIENT\x0156=EXCH\x0134={seq_num}\x01'
+    body += ''.join(f'{tag}={value}\x01' for tag, value in fields[1:])
+    message = f'8=FIX.4.4\x019={len(body)}\x01{body}'.encode()
+    return message + b'10=%03d\x01' % fix_checksum(message)
+
+class _TcpConnection:
+    def __init__(self, client, server, sport, dport, rng):
+        self.client, self.server, self.sport, self.dport = client, server, sport, dport
+        self.cseq = rng.getrandbits(32)
+        self.sseq = rng.getrandbits(32)
+
+    def client_segment(self, flags, payload=b'', **kwargs):
+        frame = tcp_frame(self.client, self.server, self.sport, self.dport, self.cseq, self.sseq, flags, payload,
+                          **kwargs)
+        self.cseq += len(payload) + (flags in ('S', 'FA'))
+        return frame
+
+    def server_segment(self, flags, payload=b'', **kwargs):
+        frame = tcp_frame(self.server, self.client, self.dport, self.sport, self.sseq, self.cseq, flags, payload,
+                          **kwargs)
+        self.sseq += len(payload) + (flags in ('SA', 'FA'))
+        return frame
+
+    def handshake(self):
+        return [self.client_segment('S'), self.server_segment('SA'), self.client_segment('A')]
+
+    def close(self):
+        return [self.client_segment('FA'), self.server_segment('FA'), self.client_segment('A')]
+
+class TcpSessions:
+    """Bulk client -> server transfers over many concurrent connections.
+
+    Each step moves one random connection along: handshake, a data segment
+    (acked by the server every second one), or the close. At anomaly_rate
+    a data segment comes with one of SEGMENT_ANOMALIES, built so the
+    analyzers see exactly one issue for it, and a session ends in a reset
+    rather than a FIN.
+    """
+
+    def __init__(self, rng, stats, anomaly_rate, concurrent=64):
+        self.rng = rng
+        self.stats = stats
+        self.anomaly_rate = anomaly_rate
+        self.concurrent = concurrent
+        self.active = []
+        self.opened = 0
+
+    def _open(self):
+        n = self.opened
+        self.opened += 1
+        conn = _TcpConnection(_ip(10, 1, (n >> 8) & 0xFF, n & 0xFF), _ip(10, 2, 0, 1 + n % 8),
+                              1024 + n % 60000, 8080, self.rng)
+        conn.segments = self.rng.randint(20, 2000)
+        conn.unacked = 0
+        conn.started = False
+        return conn
+
+    def _ack(self, conn, window=65535):
+        conn.unacked = 0
+        return conn.server_segment('A', window=window)
+
+    def step(self):
+        rng = self.rng
+        while len(self.active) < self.concurrent:
+            self.active.append(self._open())
+        slot = rng.randrange(len(self.active))
+        conn = self.active[slot]
+        if not conn.started:
+            conn.started = True
+            return conn.handshake()
+        if conn.segments <= 0:
+            del self.active[slot]
+            frames = [self._ack(conn)] if conn.unacked else []
+            if rng.random() < self.anomaly_rate:
+                self.stats['session_reset'] += 1
+                return frames + [conn.client_segment('R')]
+            return frames + conn.close()
+        anomaly = rng.choice(SEGMENT_ANOMALIES) if rng.random() < self.anomaly_rate else None
+        if anomaly is not None:
+            self.stats[anomaly] += 1
+        size = rng.randint(100, MSS)
+        if anomaly == 'out_of_order' and conn.segments >= 2:
+            # The second segment overtakes the first
+            first = conn.client_segment('PA', _PAYLOAD[:size])
+            frames = [conn.client_segment('PA', _PAYLOAD[:size]), first]
+            conn.segments -= 2
+            conn.unacked += 2
+        else:
+            if anomaly == 'out_of_order':
+                # No room left in this session; inject a retransmission instead
+                self.stats['out_of_order'] -= 1
+                self.stats['retransmission'] += 1
+                anomaly = 'retransmission'
+            checksum = 0 if anomaly == 'invalid_checksum' else None
+            frames = [conn.client_segment('PA', _PAYLOAD[:size], checksum=checksum)]
+            if anomaly == 'retransmission':
+                # Resent before the server could ack it
+                frames.append(frames[0])
+            conn.segments -= 1
+            conn.unacked += 1
+        if conn.unacked >= 2 or anomaly in ('dup_ack', 'zero_window'):
+            ack = self._ack(conn, window=0 if anomaly == 'zero_window' else 65535)
+            frames.append(ack)
+            if anomaly == 'dup_ack':
+                frames.append(ack)
+        return frames
+
+class FixOrderFlow:
+    """Order entry sessions: bursts of NewOrderSingles, answered by ExecutionReports.
+
+    A burst of orders is written to the socket at once, so orders share
+    segments and straddle segment boundaries; segment sizes vary like
+    a real sender's do. Every order gets an ack (150=0) and some a fill
+    after a latency of tens to hundreds of microseconds; at anomaly_rate
+    an order is never answered.
+    """
+
+    def __init__(self, rng, stats, anomaly_rate, sessions=16):
+        self.rng = rng
+        self.stats = stats
+        self.anomaly_rate = anomaly_rate
+        self.sessions = []
+        for n in range(sessions):
+            conn = _TcpConnection(_ip(10, 3, 0, 1 + n), _ip(10, 4, 0, 1), 40000 + n, FIX_PORT, rng)
+            conn.started = False
+            conn.busy_until = 0
+            conn.msg_seq = [1, 1]
+            conn.orders = 0
+            self.sessions.append(conn)
+
+    def _segments(self, send, data):
+        frames = []
+        while data:
+            # Mostly full segments, now and then a short write
+            size = MSS if self.rng.random() < 0.7 else self.rng.randint(64, 600)
+            frames.append(send('PA', data[:size]))
+            data = data[size:]
+        return frames
+
+    def step(self, now):
+        """Returns (timestamp_ns, frame) pairs, none earlier than now."""
+        rng = self.rng
+        conn = min(self.sessions, key=lambda c: c.busy_until) if rng.random() < 0.5 else rng.choice(self.sessions)
+        start = max(now, conn.busy_until)
+        if not conn.started:
+            conn.started = True
+            conn.busy_until = start + 3000
+            return [(start + 1000 * i, frame) for i, frame in enumerate(conn.handshake())]
+        orders = []
+        for _ in range(rng.randint(1, 6)):
+            conn.orders += 1
+            cl_ord_id = f'{conn.sport}-{conn.orders}'
+            price = 100 + rng.randrange(10000) / 100
+            orders.append((cl_ord_id, fix_message((('35', 'D'), ('11', cl_ord_id), ('55', 'AAPL'),
+                                                   ('54', 1 + rng.randrange(2)), ('38', 100 * rng.randint(1, 50)),
+                                                   ('40', 2), ('44', f'{price:.2f}')), conn.msg_seq[0])))
+            conn.msg_seq[0] += 1
+        self.stats['fix_orders'] += len(orders)
+        frames = [(start + 1000 * i, frame)
+                  for i, frame in enumerate(self._segments(conn.client_segment, b''.join(m for _id, m in orders)))]
+        t = frames[-1][0]
+        frames.append((t + 5000, conn.server_segment('A')))
+        responses = []
+        for cl_ord_id, _message in orders:
+            if rng.random() < self.anomaly_rate:
+                self.stats['fix_unanswered'] += 1
+                continue
+            exec_types = ['0', 'F'] if rng.random() < 0.3 else ['0']
+            for exec_type in exec_types:
+                responses.append(fix_message((('35', '8'), ('11', cl_ord_id), ('37', f'X{cl_ord_id}'),
+                                              ('17', f'E{conn.msg_seq[1]}'), ('150', exec_type),
+                                              ('39', '2' if exec_type == 'F' else '0')), conn.msg_seq[1]))
+                conn.msg_seq[1] += 1
+            self.stats['fix_answered'] += 1
+        self.stats['fix_responses'] += len(responses)
+        if responses:
+            t += int(rng.lognormvariate(11.5, 0.6))
+            for i, frame in enumerate(self._segments(conn.server_segment, b''.join(responses))):
+                frames.append((t + 1000 * i, frame))
+            t = frames[-1][0]
+            frames.append((t + 5000, conn.client_segment('A')))
+        conn.busy_until = frames[-1][0] + 1000
+        return frames
+
+class ItchFeed:
+    """NASDAQ ITCH 5.0 over MoldUDP64 multicast: add, execute and delete orders.
+
+    At anomaly_rate a packet's worth of sequence numbers is skipped, as
+    when the feed loses a packet; now and then a heartbeat goes out.
+    """
+
+    def __init__(self, rng, stats, anomaly_rate, session=b'SYNTH00001'):
+        self.rng = rng
+        self.stats = stats
+        self.anomaly_rate = anomaly_rate
+        self.session = session
+        self.sequence = 1
+        self.order_ref = 0
+        self.live = []
+
+    def _message(self, timestamp):
+        rng = self.rng
+        ts = (timestamp % 86_400_000_000_000).to_bytes(6, 'big')
+        kind = rng.random()
+        if self.live and kind < 0.25:
+            ref = self.live[rng.randrange(len(self.live))]
+            return b'E' + struct.pack('!HH', 1, 0) + ts + struct.pack('!QIQ', ref, 100, self.sequence)
+        if self.live and kind < 0.45:
+            ref = self.live.pop(rng.randrange(len(self.live)))
+            return b'D' + struct.pack('!HH', 1, 0) + ts + struct.pack('!Q', ref)
+        self.order_ref += 1
+        self.live.append(self.order_ref)
+        if len(self.live) > 10000:
+            self.live.pop(0)
+        return b'A' + struct.pack('!HH', 1, 0) + ts + struct.pack('!QcI8sI', self.order_ref, b'B' if kind < 0.7 else b'S',
+                                                                  100, b'AAPL    ', 1_000_000 + rng.randrange(10000))
+
+    def step(self):
+        rng = self.rng
+        if rng.random() < self.anomaly_rate:
+            lost = rng.randint(1, 10)
+            self.sequence += lost
+            self.stats['itch_gaps'] += 1
+            self.stats['itch_missing_messages'] += lost
+        if rng.random() < 0.01:
+            self.stats['itch_heartbeats'] += 1
+            return struct.pack('!10sQH', self.session, self.sequence, 0)
+        messages = [self._message(self.sequence) for _ in range(rng.randint(1, 8))]
+        header = struct.pack('!10sQH', self.session, self.sequence, len(messages))
+        self.sequence += len(messages)
+        self.stats['itch_messages'] += len(messages)
+        return header + b''.join(struct.pack('!H', len(m)) + m for m in messages)
+
+def new_stats():
+    stats = dict.fromkeys(('packets', 'tcp_packets', 'fix_packets', 'itch_packets', 'fix_orders', 'fix_answered',
+                           'fix_unanswered', 'fix_responses', 'itch_messages', 'itch_gaps', 'itch_missing_messages',
+                           'itch_heartbeats'), 0)
+    stats.update(dict.fromkeys(TCP_ANOMALIES, 0))
+    return stats
+
+def write_capture(path, packets=100_000, seed=0, anomaly_rate=0.01, mix=None, rate=100_000,
+                  start_ns=1_700_000_000_000_000_000):
+    """Write a nanosecond pcap of about `packets` packets at `rate` packets/s; returns the stats.
+
+    mix gives each source's share of packets (DEFAULT_MIX). A step of a
+    source may emit a few packets, so the last step can overshoot by a
+    handful.
+    """
+    mix = dict(DEFAULT_MIX if mix is None else mix)
+    rng = random.Random(seed)
+    stats = new_stats()
+    tcp = TcpSessions(rng, stats, anomaly_rate)
+    fix = FixOrderFlow(rng, stats, anomaly_rate)
+    itch = ItchFeed(rng, stats, anomaly_rate)
+    # Steps emit about this many packets each, so steps are picked to match the mix
+    per_step = {'tcp': 1.6, 'fix': 5.0, 'itch': 1.0}
+    sources = [name for name in ('tcp', 'fix', 'itch') if mix.get(name)]
+    weights = [mix[name] / per_step[name] for name in sources]
+    gap = 1_000_000_000 // rate
+    now = start_ns
+    pending = []
+    counter = 0
+    chunk = []
+    with open(path, 'wb') as f:
+        f.write(_PCAP_HEADER)
+
+        def emit(until):
+            while pending and pending[0][0] <= until:
+                ts, _n, frame = heapq.heappop(pending)
+                chunk.append(_RECORD.pack(ts // 1_000_000_000, ts % 1_000_000_000, len(frame), len(frame)))
+                chunk.append(frame)
+            if len(chunk) > 65536:
+                f.write(b''.join(chunk))
+                chunk.clear()
+        while stats['packets'] < packets:
+            source = rng.choices(sources, weights)[0]
+            if source == 'fix':
+                timed = fix.step(now)
+            elif source == 'tcp':
+                timed = [(now + gap * i, frame) for i, frame in enumerate(tcp.step())]
+            else:
+                timed = [(now, udp_frame(_ip(10, 5, 0, 1), _ip(233, 54, 12, 1), 40000, ITCH_PORT, itch.step()))]
+            for ts, frame in timed:
+                heapq.heappush(pending, (ts, counter, frame))
+                counter += 1
+            stats[f'{source}_packets'] += len(timed)
+            stats['packets'] += len(timed)
+            now += gap * len(timed)
+            # Nothing later steps emit can be earlier than now
+            emit(now)
+        emit(float('inf'))
+        f.write(b''.join(chunk))
+    return stats
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, share = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown source {name!r}, expected one of: {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(share)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output', help='pcap file to write')
+    parser.add_argument('--packets', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--anomaly-rate', type=float, default=0.01,
+                        help='chance per data segment / order / feed packet of an injected anomaly')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help='share of packets per source, '
+                        'e.g. tcp=0.5,fix=0.3,itch=0.2')
+    parser.add_argument('--rate', type=int, default=100_000, help='packets per second of capture time')
+    args = parser.parse_args()
+    stats = write_capture(args.output, args.packets, args.seed, args.anomaly_rate, args.mix, args.rate)
+    print(json.dumps(stats, indent=2))
+
+if __name__ == '__main__':
+    main()
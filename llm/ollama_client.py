@@ -1,11 +1,312 @@
-import requests
-
-def query_llm(prompt):
-    url = "http://localhost:11434/api/generate"
-    payload = {
-        "model": "phi",
-        "prompt": prompt,
-        "stream": False
-    }
-    response = requests.post(url, json=payload)
-    return response.json()['response'] 
\ No newline at end of file
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import ssl
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = "http://localhost:11434"
+DEFAULT_MODEL = "phi"
+# Worth retrying: rate limited, or the server is restarting/overloaded
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class OllamaHTTPError(Exception):
+    def __init__(self, status, body):
+        super().__init__(f"Ollama returned HTTP {status}: {body[:200]!r}")
+        self.status = status
+
+class BudgetExhausted(Exception):
+    """The RequestBudget shared by the clients has no requests left."""
+
+class RequestBudget:
+    """LLM requests shared by the clients of several processes.
+
+    At most max_in_flight requests are in flight across all of them and,
+    with max_requests, that many are sent in total (retries included);
+    after that acquire() raises BudgetExhausted. Create it before the
+    processes and hand it to them when they start, as with any
+    multiprocessing lock.
+    """
+
+    def __init__(self, max_in_flight=4, max_requests=None, poll_interval=0.02):
+        self.poll_interval = poll_interval
+        self._slots = multiprocessing.BoundedSemaphore(max_in_flight)
+        self._remaining = multiprocessing.Value('q', -1 if max_requests is None else max_requests)
+
+    @property
+    def remaining(self):
+        """Requests left, None without a total."""
+        value = self._remaining.value
+        return None if value < 0 else value
+
+    async def acquire(self):
+        with self._remaining.get_lock():
+            if self._remaining.value == 0:
+                raise BudgetExhausted("LLM request budget used up")
+            if self._remaining.value > 0:
+                self._remaining.value -= 1
+        # The semaphore would block the event loop, so it is polled
+        while not self._slots.acquire(False):
+            await asyncio.sleep(self.poll_interval)
+
+    def release(self):
+        self._slots.release()
+
+class AdaptiveLimiter:
+    """Concurrency limit that follows the server's time to first byte.
+
+    The limit creeps up by 1/limit per fast response and is cut back when
+    a response is much slower than the best one seen (the server is
+    queueing), or halved when the server says it is overloaded.
+    """
+
+    def __init__(self, initial=2, minimum=1, maximum=8, tolerance=2.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.best_latency = None
+        self._cond = None
+
+    async def acquire(self):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency=None, overloaded=False):
+        async with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(self.minimum, self.limit / 2)
+            elif latency is not None:
+                # Let the baseline drift up slowly so one lucky sample doesn't pin it
+                best = latency if self.best_latency is None else min(latency, self.best_latency * 1.01)
+                self.best_latency = best
+                if latency > self.tolerance * best:
+                    self.limit = max(self.minimum, self.limit * 0.75)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+class AsyncOllamaClient:
+    """Minimal asyncio HTTP/1.1 client for Ollama's /api/generate.
+
+    Keeps a pool of keep-alive connections, streams responses
+    ("stream": true) and hands the text so far to on_chunk as it arrives,
+    and retries failed requests with exponential backoff and full jitter.
+    Concurrency is bounded by an AdaptiveLimiter between min_in_flight and
+    max_in_flight, and by budget, a RequestBudget, if one is shared with
+    other clients. https:// URLs are verified against the system's CA
+    certificates.
+    """
+
+    def __init__(self, url=DEFAULT_URL, model=DEFAULT_MODEL, max_in_flight=4, min_in_flight=1,
+                 timeout=300.0, connect_timeout=5.0, retries=4, backoff=0.5, max_backoff=30.0, budget=None):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported LLM URL scheme {parts.scheme!r} in {url}, use http:// or https://")
+        self.ssl = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or (443 if self.ssl else 80)
+        self.base_path = parts.path.rstrip('/')
+        self.model = model
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limiter = AdaptiveLimiter(min(2, max_in_flight), min_in_flight, max_in_flight)
+        self.budget = budget
+        self._idle = []
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'connections': 0}
+        # Seconds taken by every successful request, for latency percentiles
+        self.latencies = []
+
+    async def _connection(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        self.stats['connections'] += 1
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port, ssl=self.ssl),
+                                      self.connect_timeout)
+
+    async def _read_headers(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed before the response")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return status, headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    async def _body_chunks(self, reader, headers):
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # Skip trailers up to the final blank line
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return
+                yield await reader.readexactly(size)
+                await reader.readexactly(2)
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining:
+                chunk = await reader.read(min(remaining, 65536))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                yield chunk
+
+    async def _request_once(self, prompt, on_chunk):
+        body = json.dumps({'model': self.model, 'prompt': prompt, 'stream': True}).encode()
+        request = (f"POST {self.base_path}/api/generate HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                   f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                   f"Connection: keep-alive\r\n\r\n").encode() + body
+        reader, writer = await self._connection()
+        reusable = False
+        try:
+            started = time.monotonic()
+            writer.write(request)
+            await writer.drain()
+            status, headers = await asyncio.wait_for(self._read_headers(reader), self.timeout)
+            first_byte = time.monotonic() - started
+            text = []
+            pending = b''
+            chunks = self._body_chunks(reader, headers)
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    break
+                pending += chunk
+                if status != 200:
+                    continue
+                *lines, pending = pending.split(b'\n')
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    message = json.loads(line)
+                    if 'error' in message:
+                        raise OllamaHTTPError(status, message['error'].encode())
+                    text.append(message.get('response', ''))
+                    if on_chunk is not None and message.get('response'):
+                        on_chunk(''.join(text))
+            if status != 200:
+                raise OllamaHTTPError(status, pending)
+            if pending.strip():
+                # A non-streaming server answers with one JSON document
+                text.append(json.loads(pending).get('response', ''))
+            reusable = headers.get('connection', '').lower() != 'close'
+            return ''.join(text), first_byte
+        finally:
+            if reusable:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+
+    async def generate(self, prompt, on_chunk=None):
+        """Answer one prompt; retries transient failures, raises the last error."""
+        for attempt in range(self.retries + 1):
+            if self.budget is not None:
+                try:
+                    await self.budget.acquire()
+                except BudgetExhausted:
+                    self.stats['failures'] += 1
+                    raise
+            try:
+                await self.limiter.acquire()
+                latency, overloaded = None, False
+                try:
+                    self.stats['requests'] += 1
+                    started = time.monotonic()
+                    response, latency = await self._request_once(prompt, on_chunk)
+                    self.latencies.append(time.monotonic() - started)
+                    return response
+                except OllamaHTTPError as e:
+                    overloaded = e.status in RETRY_STATUSES
+                    if not overloaded or attempt == self.retries:
+                        self.stats['failures'] += 1
+                        raise
+                    error = e
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                    if attempt == self.retries:
+                        self.stats['failures'] += 1
+                        raise
+                    error = e
+                finally:
+                    await self.limiter.release(latency, overloaded)
+            finally:
+                # Also when waiting for the limiter fails or is cancelled
+                if self.budget is not None:
+                    self.budget.release()
+            self.stats['retries'] += 1
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            logger.warning(f"LLM request failed ({error}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def generate_many(self, prompts, on_chunk=None):
+        """Answer prompts concurrently, in order; failures come back as exceptions.
+
+        on_chunk(i, text_so_far) is called as prompt i streams in.
+        """
+        def callback(i):
+            return None if on_chunk is None else (lambda text: on_chunk(i, text))
+        return await asyncio.gather(*(self.generate(p, callback(i)) for i, p in enumerate(prompts)),
+                                    return_exceptions=True)
+
+    def close(self):
+        for _reader, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+class OllamaPool:
+    """Synchronous front end for AsyncOllamaClient.
+
+    Owns an event loop that is driven from the calling thread, so pooled
+    connections survive between query_many() calls and on_chunk callbacks
+    run in the caller's thread.
+    """
+
+    def __init__(self, **client_options):
+        self.loop = asyncio.new_event_loop()
+        self.client = AsyncOllamaClient(**client_options)
+
+    def query_many(self, prompts, on_chunk=None):
+        return self.loop.run_until_complete(self.client.generate_many(prompts, on_chunk))
+
+    def close(self):
+        self.client.close()
+        # Let the transports finish closing before the loop goes away
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+
+def query_llm(prompt, url=DEFAULT_URL, model=DEFAULT_MODEL):
+    pool = OllamaPool(url=url, model=model)
+    try:
+        result = pool.query_many([prompt])[0]
+    finally:
+        pool.close()
+    if isinstance(result, Exception):
+        raise result
+    return result
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from llm.ollama_client import DEFAULT_MODEL
+
+class ResponseCache:
+    """On-disk prompt -> response cache, content-addressed by SHA-256.
+
+    Each entry is one small JSON file named after the hash of the model and
+    prompt. Reads refresh the file's mtime, and once the entries add up to
+    more than max_bytes the least recently used ones are deleted. Safe to
+    share between the threads of one process. Processes can share the
+    directory too, but each only counts the entries that were there when
+    it started plus its own against max_bytes.
+    """
+
+    def __init__(self, cache_dir='output/llm_cache', max_bytes=64 << 20, model=DEFAULT_MODEL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        for root, _dirs, files in os.walk(cache_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    stat = os.stat(os.path.join(root, name))
+                    self._entries[name[:-5]] = [stat.st_mtime, stat.st_size]
+                    self._bytes += stat.st_size
+
+    def key(self, prompt):
+        return hashlib.sha256(f'{self.model}\0{prompt}'.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def get(self, prompt):
+        key = self.key(prompt)
+        try:
+            with open(self._path(key)) as f:
+                response = json.load(f)['response']
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        now = time.time()
+        try:
+            os.utime(self._path(key), (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries[key][0] = now
+        return response
+
+    def put(self, prompt, response):
+        key = self.key(prompt)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({'model': self.model, 'prompt': prompt, 'response': response})
+        # Write then rename, so a reader never sees half an entry
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = [time.time(), len(data)]
+            self._bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        if self._bytes <= self.max_bytes:
+            return
+        for key, (_mtime, size) in sorted(self._entries.items(), key=lambda item: item[1][0]):
+            if self._bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            del self._entries[key]
+            self._bytes -= size
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'bytes': self._bytes}
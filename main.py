@@ -1,82 +1,869 @@
-from analyzer.pcap_parser import parse_pcap
-from analyzer.error_detector import detect_errors
-from analyzer.latency_checker import calculate_latency
-from llm.ollama_client import query_llm
-import json, os, sys, copy, binascii
+from analyzer.pcap_parser import parse_pcap, iter_packet_batches
+from analyzer.issue_store import IssueStore
+from analyzer.rules import issue_types, rule_catalog, rule_config
+from analyzer.engine import AnalysisEngine
+from analyzer.flow_state import parse_size
+from analyzer.report_writer import StreamingReportWriter
+from analyzer.columnar_report import (ColumnarReportWriter, ROW_GROUP_SIZE, copy_report, open_report, table_records,
+                                      table_rows, write_report)
+from analyzer.analysis_cache import AnalysisCache, config_key
+from analyzer.capture_index import INDEX_DIR, CaptureIndexBuilder, build_index, index_path, open_index
+from analyzer.batch import BatchState, capture_summary, combine_summaries, find_captures, report_names
+from analyzer.histogram import LatencyHistogram, format_ns, merge_histograms
+from analyzer.live import CaptureTail, RollingMetrics
+from analyzer.instrumentation import Instruments
+from llm.ollama_client import OllamaPool, RequestBudget, DEFAULT_MODEL
+from llm.response_cache import ResponseCache
+from analyzer.issue_groups import group_issues
+import copy, json, os, sys, time, binascii, argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from collections.abc import Mapping
 import logging
-from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def bytes_to_hex(obj):
-    if isinstance(obj, dict):
+    if isinstance(obj, Mapping):
         return {k: bytes_to_hex(v) for k, v in obj.items()}
     elif isinstance(obj, list):
         return [bytes_to_hex(i) for i in obj]
     elif isinstance(obj, tuple):
         return tuple(bytes_to_hex(i) for i in obj)
-    elif isinstance(obj, bytes):
+    elif isinstance(obj, (bytes, memoryview)):
         return binascii.hexlify(obj).decode()
     else:
         return obj
 
-def process_error(err):
-    err_for_llm = copy.deepcopy(err)
-    err_for_llm = bytes_to_hex(err_for_llm)
-    
-    prompt = f"""You are a network engineer specializing in equity trading systems.\nAnalyze this packet summary for signs of TCP-level errors, session mismanagement,\nor malformed trading messages (e.g., FIX). Explain the anomalies, their likely causes,\nand provide recommended remediation steps.\n\nPacket Summary: {json.dumps(err_for_llm)}"""
-    ai_insight = query_llm(prompt)
-    err['llm_response'] = ai_insight
-    return err
+def build_prompt(signature):
+    return f"""You are a network engineer specializing in equity trading systems.\nAnalyze this packet summary for signs of TCP-level errors, session mismanagement,\nor malformed trading messages (e.g., FIX). Explain the anomalies, their likely causes,\nand provide recommended remediation steps.\n\nPacket Summary: {json.dumps(signature, sort_keys=True)}"""
+
+class IssueInsights:
+    """LLM insights per issue signature, fanned out to every matching issue.
+
+    Issues are grouped by issue_signature(); only one prompt per distinct
+    signature is built, and it is answered from the ResponseCache when
+    possible, so re-analyzing the same or similar captures needs no LLM
+    calls at all. The rest go to the LLM together through a pooled
+    OllamaPool (created on first use). Insights are remembered across
+    batches; failed ones are retried with the next batch.
+    """
+
+    def __init__(self, cache=None, llm_options=None):
+        self.cache = cache
+        self.llm_options = llm_options or {}
+        self.llm = None
+        self.client_stats = None
+        self.insights = {}
+        self.latencies = []
+        self.issues = 0
+        self.llm_calls = 0
+        self.failures = 0
+
+    def _ask(self, keys, prompts, on_partial):
+        if self.llm is None:
+            self.llm = OllamaPool(**self.llm_options)
+        callback = None if on_partial is None else (lambda i, text: on_partial(keys[i], text))
+        self.llm_calls += len(prompts)
+        results = self.llm.query_many(prompts, callback)
+        client = self.llm.client
+        self.client_stats = dict(client.stats, in_flight_limit=round(client.limiter.limit, 2))
+        self.latencies = client.latencies
+        return results
+
+    def annotate(self, errors, on_partial=None):
+        """Set llm_response and issue_group on every error; returns the errors.
+
+        on_partial(group, text_so_far) sees insights while they stream in.
+        """
+        groups = group_issues(errors)
+        prompts = {key: build_prompt(signature) for key, (signature, _members) in groups.items()
+                   if key not in self.insights}
+        missing = []
+        for key, prompt in prompts.items():
+            response = self.cache.get(prompt) if self.cache is not None else None
+            if response is None:
+                missing.append(key)
+            else:
+                self.insights[key] = response
+        failed = {}
+        if missing:
+            for key, result in zip(missing, self._ask(missing, [prompts[k] for k in missing], on_partial)):
+                if isinstance(result, Exception):
+                    self.failures += 1
+                    failed[key] = f"LLM analysis unavailable: {result}"
+                    continue
+                self.insights[key] = result
+                if self.cache is not None:
+                    self.cache.put(prompts[key], result)
+        for key, (_signature, members) in groups.items():
+            insight = self.insights.get(key, failed.get(key))
+            for err in members:
+                err['llm_response'] = insight
+                err['issue_group'] = key
+        self.issues += len(errors)
+        return errors
+
+    def summary(self):
+        summary = {'issues': self.issues, 'groups': len(self.insights), 'llm_calls': self.llm_calls,
+                   'llm_failures': self.failures}
+        if self.client_stats is not None:
+            summary['client'] = self.client_stats
+        if self.cache is not None:
+            summary['cache'] = self.cache.stats()
+        return summary
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.llm is not None:
+            self.llm.close()
+            self.llm = None
+
+def _issue_insights(llm_cache, llm_cache_size, llm_options=None):
+    model = (llm_options or {}).get('model', DEFAULT_MODEL)
+    cache = ResponseCache(llm_cache, parse_size(llm_cache_size), model=model) if llm_cache else None
+    return IssueInsights(cache, llm_options)
+
+LLM_CACHE_DIR = 'output/llm_cache'
+ANALYSIS_CACHE_DIR = 'output/analysis_cache'
+LIVE_DIR = 'output/live'
+METRICS_DIR = 'output/metrics'
+BATCH_DIR = 'output/batch'
+
+# Analyzers run over every capture by the AnalysisEngine
+ANALYZERS = ('errors', 'latency', 'app_messages', 'order_latency')
+
+def _engine_options(rules, max_memory, workers):
+    options = {'errors': {'rules': rules}}
+    if max_memory:
+        # Budget is split across analysis workers; sequence tracking
+        # dominates per-flow state, so it gets the largest part of each share
+        share = max_memory // max(1, workers)
+        options['errors']['max_memory'] = share // 2
+        options['latency'] = {'max_memory': share // 4}
+        options['app_messages'] = {'max_memory': share // 4}
+    return options
+
+def _analysis_setup(market_data):
+    # UDP is only parsed when market data (MoldUDP64/ITCH) is wanted
+    if market_data:
+        return ANALYZERS + ('itch',), ('tcp', 'udp')
+    return ANALYZERS, ('tcp',)
+
+def market_data_summary(records):
+    for record in records:
+        if 'summary' in record:
+            return record['summary']
+    return {}
+
+def summarize_app_messages(records, summary=None):
+    """Fold reassembled application messages into per-protocol/MsgType counts."""
+    summary = summary if summary is not None else {}
+    for record in records:
+        if 'stats' in record:
+            summary['reassembly'] = record['stats']
+            continue
+        protocol = summary.setdefault(record['protocol'], {'total': 0, 'by_msg_type': {}})
+        protocol['total'] += 1
+        msg_type = record['message'].get('35', 'unknown')
+        protocol['by_msg_type'][msg_type] = protocol['by_msg_type'].get(msg_type, 0) + 1
+    return summary
+
+def summarize_order_latency(records, summary=None):
+    """Collect the matcher's counters and latency histograms; returns the unmatched order records."""
+    summary = summary if summary is not None else {}
+    unmatched = []
+    for record in records:
+        if 'stats' in record:
+            summary.update(record['stats'])
+            summary['by_msg_type'] = record['histograms']
+            overall = merge_histograms(record['histograms'].values())
+            summary['latency'] = overall.to_dict() if overall is not None else None
+        elif record['status'] == 'unmatched':
+            unmatched.append(record)
+    return unmatched
+
+def session_latency_histogram(latencies, hist=None):
+    hist = hist if hist is not None else LatencyHistogram()
+    hist.record([latency['latency_ms'] * 1e6 for latency in latencies])
+    return hist
+
+def capture_info(pcap_file, protocols):
+    # Lets viewers load payloads of issue examples back from the capture by packet number
+    return {'path': os.path.abspath(pcap_file), 'protocols': list(protocols)}
+
+def report_suffix(report_format='parquet'):
+    # Parquet reports are a directory of column files plus a manifest
+    return '.json' if report_format == 'json' else '.report'
+
+def report_path(pcap_file, report_format='parquet'):
+    return f"output/reports/{os.path.basename(pcap_file)}{report_suffix(report_format)}"
+
+def log_rule_stats(stats):
+    for key, entry in stats['rules'].items():
+        logger.info(f"Rule {key}: {entry['hits']} hits in {entry['seconds'] * 1e3:.1f} ms")
+    for name, seconds in stats['flow_state'].items():
+        logger.info(f"Flow state {name}: {seconds * 1e3:.1f} ms")
+
+def _write_atomically(path, text):
+    with open(path + '.tmp', 'w') as f:
+        f.write(text)
+    os.replace(path + '.tmp', path)
+
+def export_instrumentation(instruments, pcap_file, metrics_dir=METRICS_DIR):
+    """Write an analysis' Instruments as <capture>.prom and <capture>.trace.json; returns their paths.
+
+    Profiles of a profile=True run go to <capture>.profile/.
+    """
+    os.makedirs(metrics_dir, exist_ok=True)
+    name = os.path.basename(pcap_file)
+    prom = os.path.join(metrics_dir, f'{name}.prom')
+    trace = os.path.join(metrics_dir, f'{name}.trace.json')
+    _write_atomically(prom, instruments.to_prometheus({'capture': name}))
+    _write_atomically(trace, json.dumps(instruments.to_trace()))
+    paths = [prom, trace]
+    if instruments.profile:
+        paths += instruments.dump_profiles(os.path.join(metrics_dir, f'{name}.profile'))
+    return paths
+
+def analysis_config(market_data, rules, max_examples, report_format, llm_options):
+    # Everything that changes what a report says; streaming, batch size and workers don't
+    return {'market_data': market_data, 'rules': rules or {}, 'rule_catalog': rule_catalog(),
+            'max_examples': max_examples, 'report_format': report_format,
+            'llm_model': (llm_options or {}).get('model', DEFAULT_MODEL)}
+
+def _no_progress(stage, counts, partial=None):
+    pass
+
+def _detection_results(issues, session_latency, order_latency):
+    # What the UI shows of a finished detection stage while insights are pending
+    summary = issues.summary()
+    return {'issue_summary': {'total': summary['total'], 'by_type': summary['by_type']},
+            'session_latency': session_latency, 'order_latency': order_latency}
+
+def _insight_counts(insights):
+    return {'groups': len(insights.insights), 'llm_calls': insights.llm_calls, 'llm_failures': insights.failures}
+
+def _record_totals(instruments, total_packets, issues, insights, rule_stats):
+    instruments.counts.update(packets=total_packets, issues=issues.total, issue_groups=len(insights.insights),
+                              llm_calls=insights.llm_calls, llm_failures=insights.failures)
+    instruments.observe_llm_latencies(insights.latencies)
+    instruments.rules = rule_stats['rules']
+
+def _index_builder(index):
+    return CaptureIndexBuilder() if index else None
+
+def _write_index(builder, index, pcap_file, protocols, instruments):
+    with instruments.stage('index'):
+        written = builder.finish(index, pcap_file, protocols)
+    if written is None:
+        logger.warning("No capture index written, the packets were not read by the native reader")
+    else:
+        logger.info(f"Capture index written to {written}")
+
+def ensure_index(pcap_file, protocols=('tcp',), instruments=None):
+    """The CaptureIndex of a capture, indexing it first if it has no current one."""
+    found = open_index(pcap_file, protocols)
+    if found is None:
+        logger.info(f"Indexing {pcap_file}")
+        with (instruments or Instruments()).stage('index'):
+            build_index(pcap_file, index_path(pcap_file), protocols)
+        found = open_index(pcap_file, protocols)
+    return found
+
+def generate_report(pcap_file, streaming=False, max_memory=None, batch_size=65536, workers=1, market_data=False,
+                    llm_cache=LLM_CACHE_DIR, llm_cache_size='64M', llm_options=None, on_insight=None, rules=None,
+                    max_examples=100, report_format='parquet', cache_dir=None, cache_size='1G', on_progress=None,
+                    instruments=None, output_path=None, index=False):
+    """Analyze a capture and write its report to output_path (report_path() by default); returns the report's path.
 
-def generate_report(pcap_file):
+    With cache_dir, analyses are kept in an AnalysisCache: a capture that
+    was analyzed before with the same config gets its cached report back
+    without being read, and one that has only grown since is analyzed from
+    where the cached run stopped. Either way a copy of the report is also
+    written to output_path.
+
+    on_progress(stage, counts, partial=None) follows the analysis: counts
+    are the running totals of the 'parse' (packets), 'detect' (issues) and
+    'insights' (groups, llm_calls, llm_failures) stages, and partial is
+    given once a stage is finished, with report fields that are final by
+    then. An exception it raises aborts the analysis.
+
+    instruments, an Instruments, gets the time and memory every stage
+    ('cache', 'parse', 'detect', 'index', 'insights', 'write') took; the report
+    holds its summary as 'instrumentation', up to the start of 'write'.
+
+    index=True also writes the capture's CaptureIndex (see index_path())
+    for drill-down queries, while the analysis reads the capture; if the
+    analysis is served from the cache, the capture is indexed on its own.
+    """
     logger.info(f"Starting analysis of {pcap_file}")
-    
+    instruments = instruments or Instruments()
+    output_path = output_path or report_path(pcap_file, report_format)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    analyze = generate_report_in_memory
+    if streaming or max_memory is not None:
+        analyze = partial(generate_report_streaming, max_memory=max_memory, batch_size=batch_size)
+    options = dict(workers=workers, market_data=market_data, llm_cache=llm_cache, llm_cache_size=llm_cache_size,
+                   llm_options=llm_options, on_insight=on_insight, rules=rules, max_examples=max_examples,
+                   report_format=report_format, on_progress=on_progress, instruments=instruments,
+                   index=index_path(pcap_file) if index else None)
+    if not cache_dir:
+        return analyze(pcap_file, output_path=output_path, **options)
+
+    cache = AnalysisCache(cache_dir, parse_size(cache_size))
+    config = analysis_config(market_data, rules, max_examples, report_format, llm_options)
+    with instruments.stage('cache'):
+        lookup = cache.lookup(pcap_file, config)
+    if lookup.status == 'hit':
+        cached = cache.report_path(lookup.entry)
+        with instruments.stage('cache'):
+            copy_report(cached, output_path)
+        logger.info(f"Capture was analyzed before, cached report copied to {output_path}")
+        if index:
+            ensure_index(pcap_file, _analysis_setup(market_data)[1], instruments)
+        return cached
+    if lookup.status == 'tail':
+        resume = cache.load_checkpoint(lookup.entry)
+        resume['report'] = cache.report_path(lookup.entry)
+        logger.info(f"Capture has grown since it was analyzed, resuming at byte {resume['offset']}")
+        analyze = partial(generate_report_streaming, max_memory=max_memory, batch_size=batch_size, resume=resume)
+        if index:
+            # The resumed analysis only reads what was appended
+            ensure_index(pcap_file, _analysis_setup(market_data)[1], instruments)
+
+    staging = cache.begin()
+    staged = os.path.join(staging, os.path.basename(output_path))
+    checkpoint = {}
+    try:
+        if analyze(pcap_file, output_path=staged, checkpoint=checkpoint, **options) is None:
+            cache.discard(staging)
+            return None
+        if checkpoint.pop('llm_failures'):
+            # Failed insights would be served from the cache from now on
+            copy_report(staged, output_path)
+            cache.discard(staging)
+            logger.info(f"Some LLM insights failed, report not cached; saved to {output_path}")
+            return output_path
+        with instruments.stage('cache'):
+            entry = cache.commit(lookup, staging, config, os.path.basename(output_path), pcap_file,
+                                 checkpoint if 'offset' in checkpoint else None)
+    except BaseException:
+        cache.discard(staging)
+        raise
+    cached = cache.report_path(entry)
+    with instruments.stage('cache'):
+        copy_report(cached, output_path)
+    logger.info(f"Report cached as {cached}, copied to {output_path}")
+    return cached
+
+def generate_report_in_memory(pcap_file, output_path=None, workers=1, market_data=False, llm_cache=LLM_CACHE_DIR,
+                              llm_cache_size='64M', llm_options=None, on_insight=None, rules=None, max_examples=100,
+                              report_format='parquet', checkpoint=None, on_progress=None, instruments=None,
+                              index=None):
+    """generate_report for captures that fit in memory: parse everything, then analyze it in one go.
+
+    checkpoint, if given, is a dict that gets the state to resume this
+    analysis from once the capture grows (see AnalysisCache). index is
+    the path to write the capture's CaptureIndex to, if any.
+    """
+    output_path = output_path or report_path(pcap_file, report_format)
+    on_progress = on_progress or _no_progress
+    instruments = instruments or Instruments()
     # Parse PCAP file
-    packets = parse_pcap(pcap_file)
+    analyzers, protocols = _analysis_setup(market_data)
+    position = {}
+    with instruments.stage('parse'):
+        packets = parse_pcap(pcap_file, as_table=True, workers=workers, protocols=protocols, position=position)
     if not packets:
         logger.error("No packets were parsed successfully")
         return
         
     logger.info(f"Found {len(packets)} packets to analyze")
+    if index:
+        builder = _index_builder(index)
+        with instruments.stage('index'):
+            builder.add(packets)
+        _write_index(builder, index, pcap_file, protocols, instruments)
+    on_progress('parse', {'packets': len(packets)}, {'total_packets': len(packets)})
     
-    # Detect errors and calculate latencies in parallel
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        errors_future = executor.submit(detect_errors, packets)
-        latencies_future = executor.submit(calculate_latency, packets)
-        
-        errors = errors_future.result()
-        latencies = latencies_future.result()
+    # Detect errors and calculate latencies, partitioned by connection across workers
+    snapshot = []
+
+    def take_snapshot(fed):
+        # What a resumed analysis starts from: the state before finish() flushed any streams
+        snapshot.append((engine.snapshot(), summarize_app_messages(fed('app_messages'))))
+    with instruments.stage('detect'):
+        with AnalysisEngine(analyzers, workers=workers, options={'errors': {'rules': rules}}) as engine:
+            results = engine.run(packets, None if checkpoint is None else take_snapshot)
+        # Every issue is aggregated per flow and type; only the first few of each type are kept
+        issues = IssueStore(max_examples)
+        errors = issues.add(*results['errors'], packets)
+        latencies = results['latency']
+        app_messages = summarize_app_messages(results['app_messages'])
+        order_latency = {}
+        unmatched_orders = summarize_order_latency(results['order_latency'], order_latency)
+        session_latency = session_latency_histogram(latencies).to_dict()
+    log_rule_stats(results['errors'].stats)
     
-    logger.info(f"Detected {len(errors)} errors and {len(latencies)} latency measurements")
+    logger.info(f"Detected {issues.total} issues ({len(errors)} kept as examples) "
+                f"and {len(latencies)} latency measurements")
+    on_progress('detect', {'issues': issues.total}, _detection_results(issues, session_latency, order_latency))
     
-    # Process errors with LLM in parallel
-    with ThreadPoolExecutor() as executor:
-        full_report = list(tqdm(
-            executor.map(process_error, errors),
-            total=len(errors),
-            desc="Analyzing errors with LLM"
-        ))
+    # One LLM analysis per group of similar issues, in parallel
+    with instruments.stage('insights'), _issue_insights(llm_cache, llm_cache_size, llm_options) as insights:
+        full_report = insights.annotate(errors, on_insight)
+    on_progress('insights', _insight_counts(insights), {'llm': insights.summary()})
+    logger.info(f"Analyzed {len(errors)} errors in {len(insights.insights)} groups "
+                f"with {insights.llm_calls} LLM calls")
     
     # Save report
-    os.makedirs('output/reports', exist_ok=True)
-    output_path = f"output/reports/{os.path.basename(pcap_file)}.json"
+    _record_totals(instruments, len(packets), issues, insights, results['errors'].stats)
     report_data = {
+        'capture': capture_info(pcap_file, protocols),
+        'issue_summary': issues.summary(),
         'errors': full_report,
         'latencies': latencies,
-        'total_packets': len(packets)
+        'app_messages': app_messages,
+        'session_latency': session_latency,
+        'order_latency': order_latency,
+        'unmatched_orders': unmatched_orders,
+        'llm': insights.summary(),
+        'rules': results['errors'].stats,
+        'total_packets': len(packets),
+        'instrumentation': instruments.summary()
     }
-    report_data = bytes_to_hex(report_data)
-    
-    with open(output_path, 'w') as f:
-        json.dump(report_data, f, indent=2)
+    if market_data:
+        report_data['market_data'] = market_data_summary(results['itch'])
+    with instruments.stage('write'):
+        report_data = bytes_to_hex(report_data)
+        if report_format == 'json':
+            with open(output_path, 'w') as f:
+                json.dump(report_data, f, indent=2)
+        else:
+            write_report(report_data, output_path)
+    if checkpoint is not None:
+        engine_state, fed_app_messages = snapshot[0]
+        checkpoint.update(engine=engine_state, issues=issues, app_messages=fed_app_messages,
+                          total_packets=len(packets), llm_failures=insights.failures, **position)
     
     logger.info(f"Report saved to {output_path}")
+    return output_path
+
+def _carry_over(report_file, writer):
+    # Issue examples and expired or evicted orders came from packets a resumed
+    # analysis won't read again; latencies and orders still waiting for a
+    # response are reported again when it finishes
+    report = open_report(report_file)
+    for section in ('errors', 'unmatched_orders'):
+        for start in range(0, table_rows(report, section), ROW_GROUP_SIZE):
+            for item in table_records(report, section, start=start, stop=start + ROW_GROUP_SIZE):
+                if item.get('reason') != 'no_response':
+                    writer.write_item(section, item)
+
+def generate_report_streaming(pcap_file, output_path=None, max_memory=None, batch_size=65536, workers=1,
+                              market_data=False, llm_cache=LLM_CACHE_DIR, llm_cache_size='64M', llm_options=None,
+                              on_insight=None, rules=None, max_examples=100, report_format='parquet', resume=None,
+                              checkpoint=None, on_progress=None, instruments=None, index=None):
+    """Bounded-memory variant of generate_report.
+
+    Packets are read in batches, the detectors keep only per-flow state and
+    every issue is written to the report as soon as its LLM insight is back.
+    max_memory caps the per-flow state; flows beyond it are spilled to disk.
+    checkpoint is filled in as by generate_report_in_memory; passing such
+    a checkpoint (plus the 'report' it belongs to) as resume carries on
+    with the records appended to the capture since. index is the path to
+    write the capture's CaptureIndex to, if any; resumed analyses don't,
+    as they only read the appended records. on_progress hears about
+    every batch.
+    """
+    options = _engine_options(rules, parse_size(max_memory), workers)
+    output_path = output_path or report_path(pcap_file, report_format)
+    on_progress = on_progress or _no_progress
+    instruments = instruments or Instruments()
+    writer_class = StreamingReportWriter if report_format == 'json' else ColumnarReportWriter
+    resume = resume or {}
+    total_packets = resume.get('total_packets', 0)
+    app_messages = resume.get('app_messages', {})
+    order_latency = {}
+    analyzers, protocols = _analysis_setup(market_data)
+    issues = resume.get('issues') or IssueStore(max_examples)
+    builder = _index_builder(index and not resume)
+    position = {}
+    with AnalysisEngine(analyzers, workers=workers, options=options, state=resume.get('engine'),
+                        packets_seen=total_packets) as engine, \
+            _issue_insights(llm_cache, llm_cache_size, llm_options) as insights, \
+            writer_class(output_path) as writer, \
+            tqdm(desc="Analyzing packets", unit="pkt") as progress:
+        if resume:
+            with instruments.stage('write'):
+                _carry_over(resume['report'], writer)
+        batches = iter_packet_batches(pcap_file, batch_size=batch_size, workers=workers, protocols=protocols,
+                                      start=resume.get('offset'), context=resume.get('context'), position=position)
+        for batch in instruments.timed_iter('parse', batches):
+            with instruments.stage('detect'):
+                results = engine.feed(batch)
+                summarize_app_messages(results['app_messages'], app_messages)
+                unmatched = summarize_order_latency(results['order_latency'], order_latency)
+                errors = issues.add(*results['errors'], batch, base=total_packets)
+            if builder is not None:
+                with instruments.stage('index'):
+                    builder.add(batch)
+            total_packets += len(batch)
+            on_progress('parse', {'packets': total_packets})
+            on_progress('detect', {'issues': issues.total})
+            with instruments.stage('insights'):
+                errors = insights.annotate(errors, on_insight)
+            with instruments.stage('write'):
+                for order in unmatched:
+                    writer.write_item('unmatched_orders', order)
+                for err in errors:
+                    writer.write_error(err)
+            on_progress('insights', _insight_counts(insights))
+            progress.update(len(batch))
+        on_progress('parse', {'packets': total_packets}, {'total_packets': total_packets})
+        if builder is not None:
+            _write_index(builder, index, pcap_file, protocols, instruments)
+        if checkpoint is not None:
+            # finish() below adds the flushed streams' messages to app_messages, a resume flushes them again
+            checkpoint.update(engine=engine.snapshot(), issues=issues, app_messages=copy.deepcopy(app_messages),
+                              total_packets=total_packets, **position)
+        with instruments.stage('detect'):
+            final = engine.finish()
+            session_latency = session_latency_histogram(final['latency']).to_dict()
+            summarize_app_messages(final['app_messages'], app_messages)
+            unmatched = summarize_order_latency(final['order_latency'], order_latency)
+        with instruments.stage('write'):
+            for latency in final['latency']:
+                writer.write_latency(latency)
+            for order in unmatched:
+                writer.write_item('unmatched_orders', order)
+        on_progress('detect', {'issues': issues.total}, _detection_results(issues, session_latency, order_latency))
+        # Issues only come from batches, so every insight is in by now
+        on_progress('insights', _insight_counts(insights), {'llm': insights.summary()})
+        extra = {'market_data': market_data_summary(final['itch'])} if market_data else {}
+        log_rule_stats(final['errors'].stats)
+        _record_totals(instruments, total_packets, issues, insights, final['errors'].stats)
+        with instruments.stage('write'):
+            writer.finish(capture=capture_info(pcap_file, protocols), issue_summary=issues.summary(),
+                          app_messages=app_messages, session_latency=session_latency,
+                          order_latency=order_latency, llm=insights.summary(), rules=final['errors'].stats,
+                          total_packets=total_packets, instrumentation=instruments.summary(), **extra)
+
+    if checkpoint is not None:
+        checkpoint['llm_failures'] = insights.failures
+    logger.info(f"Detected {issues.total} issues ({writer.counts.get('errors', 0)} kept as examples) and "
+                f"{writer.counts.get('latencies', 0)} latency measurements in {total_packets} packets")
+    logger.info(f"Report saved to {output_path}")
+    return output_path
+
+def live_metrics_path(pcap_file):
+    name = 'stdin' if pcap_file == '-' else os.path.basename(pcap_file)
+    return f"{LIVE_DIR}/{name}.metrics.json"
+
+def write_live_metrics(path, snapshot):
+    # Replaced in one step, so dashboards polling the file never read half of it
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _write_atomically(path, json.dumps(snapshot, indent=2))
+
+def _update_live_metrics(metrics, batch, base, results, types):
+    timestamps = batch.columns['timestamp_ns']
+    metrics.add_packets(timestamps, batch.columns['protocol'])
+    hit_index, hit_check = results['errors'][:2]
+    metrics.add_issues(timestamps[hit_index - base], [types[check] for check in hit_check.tolist()])
+    # An order's latency is counted at the time its response arrived
+    matched = [order for order in results['order_latency'] if order.get('status') == 'matched']
+    metrics.add_latencies('order', timestamps[[order['response_packet'] - base for order in matched]],
+                          [order['latency_us'] * 1e3 for order in matched])
+
+def _add_session_latencies(metrics, latencies):
+    # Sessions are timed once they end, which is as of the newest packet
+    metrics.add_latencies('session', [metrics.newest] * len(latencies),
+                          [latency['latency_ms'] * 1e6 for latency in latencies])
+
+def follow_capture(pcap_file, window=60, idle_timeout=300, poll_interval=0.1, publish_interval=1.0,
+                   on_metrics=None, stop=None, workers=1, market_data=False, rules=None, max_memory=None):
+    """Analyze a capture while it is being written, publishing rolling metrics.
+
+    pcap_file is a file a tap keeps appending to, a FIFO, or '-' for stdin.
+    New records are run through the same analyzers as generate_report every
+    poll_interval seconds. Every publish_interval seconds the flows idle for
+    idle_timeout seconds of capture time are expired, which bounds the flow
+    state of an endless capture and times the sessions that ended, and
+    on_metrics gets the RollingMetrics snapshot of the last window seconds
+    plus lag_s (wall clock minus the newest packet's time) and backlog_bytes
+    (written but not yet read). Runs until a stream ends, stop() returns
+    true or Ctrl-C; returns the final snapshot. No report is written and no
+    LLM insights are fetched.
+    """
+    analyzers, protocols = _analysis_setup(market_data)
+    options = _engine_options(rules, parse_size(max_memory), workers)
+    types = issue_types()
+    metrics = RollingMetrics(window)
+    idle_ns = int(idle_timeout * 1e9)
+    published = 0.0
+
+    def publish(tail):
+        snapshot = metrics.snapshot()
+        snapshot['lag_s'] = time.time() - snapshot['capture_time'] if snapshot['capture_time'] is not None else None
+        snapshot['backlog_bytes'] = tail.backlog
+        if on_metrics is not None:
+            on_metrics(snapshot)
+        return snapshot
+
+    with CaptureTail(pcap_file, protocols) as tail, \
+            AnalysisEngine(analyzers, workers=workers, options=options) as engine:
+        try:
+            while not tail.eof and not (stop is not None and stop()):
+                batch = tail.read()
+                if len(batch):
+                    base = engine.packets_seen
+                    _update_live_metrics(metrics, batch, base, engine.feed(batch), types)
+                if time.monotonic() - published >= publish_interval:
+                    if metrics.newest is not None:
+                        _add_session_latencies(metrics, engine.expire(metrics.newest, idle_ns)['latency'])
+                    publish(tail)
+                    published = time.monotonic()
+                if not len(batch):
+                    time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            logger.info(f"Stopped following {pcap_file}")
+        final = engine.finish()
+        if metrics.newest is not None:
+            _add_session_latencies(metrics, final['latency'])
+        return publish(tail)
+
+# The RequestBudget of a batch, handed to every pool process when it starts
+_llm_budget = None
+
+def _batch_init(budget):
+    global _llm_budget
+    _llm_budget = budget
+
+def _batch_job(pcap_file, output_path, options):
+    start = time.perf_counter()
+    options = dict(options, llm_options=dict(options.get('llm_options') or {}, budget=_llm_budget))
+    if generate_report(pcap_file, output_path=output_path, **options) is None:
+        raise ValueError("no packets could be parsed")
+    return dict(capture_summary(open_report(output_path)), report=os.path.abspath(output_path),
+                seconds=time.perf_counter() - start)
+
+def analyze_batch(paths, batch_dir=BATCH_DIR, jobs=None, llm_budget=None, on_done=None, **options):
+    """Analyze every capture named by paths in a pool of jobs processes; returns the combined summary.
+
+    paths are files, directories or globs (see find_captures); captures
+    are started largest first. Reports go to <batch_dir>/reports/, named
+    after each capture's path below the captures' common directory, and
+    each finished capture is recorded in <batch_dir>/batch.json, so a
+    batch run again (after a crash, say) skips the captures already done.
+    All jobs share the LLM: at most llm_options['max_in_flight'] requests
+    at once and llm_budget requests in total; insights beyond the budget
+    are reported as unavailable. The summary of combine_summaries() is
+    also written to <batch_dir>/summary.json. on_done(capture, entry)
+    hears about every capture as it finishes. The other options are
+    those of generate_report.
+    """
+    captures = find_captures(paths)
+    if not captures:
+        raise FileNotFoundError(f"No captures found in {', '.join(paths)}")
+    report_format = options.get('report_format', 'parquet')
+    llm_options = options.get('llm_options') or {}
+    config = analysis_config(options.get('market_data', False), options.get('rules'),
+                             options.get('max_examples', 100), report_format, llm_options)
+    state = BatchState(os.path.join(batch_dir, 'batch.json'), config_key(config))
+    names = report_names(captures)
+    pending = [capture for capture in captures if not state.done(capture)]
+    logger.info(f"{len(captures) - len(pending)} of {len(captures)} captures were analyzed before, "
+                f"{len(pending)} to go")
+    budget = RequestBudget(llm_options.get('max_in_flight', 4), llm_budget)
+    if pending:
+        with ProcessPoolExecutor(jobs, initializer=_batch_init, initargs=(budget,)) as pool:
+            futures = {}
+            for capture in pending:
+                output_path = os.path.join(batch_dir, 'reports', names[capture] + report_suffix(report_format))
+                stat = os.stat(capture)
+                futures[pool.submit(_batch_job, capture, output_path, options)] = (capture, stat)
+            for future in as_completed(futures):
+                capture, stat = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    logger.error(f"Analysis of {capture} failed: {e}")
+                    entry = {'error': f"{type(e).__name__}: {e}"}
+                state.record(capture, entry, stat)
+                if on_done is not None:
+                    on_done(capture, entry)
+    summary = combine_summaries(captures, state.files)
+    summary['llm_budget_left'] = budget.remaining
+    _write_atomically(os.path.join(batch_dir, 'summary.json'), json.dumps(summary, indent=2))
+    return summary
+
+def parse_flow(text):
+    """(src_ip, src_port, dst_ip, dst_port) of 'SRC:PORT-DST:PORT'; IPv6 addresses go in brackets."""
+    try:
+        ends = []
+        for end in text.split('-'):
+            ip, port = end.rsplit(':', 1)
+            ends += [ip.strip('[]'), int(port)]
+        src_ip, src_port, dst_ip, dst_port = ends
+    except ValueError:
+        raise ValueError(f"Flow {text!r} is not SRC:PORT-DST:PORT")
+    return src_ip, src_port, dst_ip, dst_port
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Analyze a PCAP of exchange trading traffic.")
+    parser.add_argument("pcap", nargs='+',
+                        help="path to the pcap/pcapng file ('-' reads stdin with --follow); with --batch, "
+                             "any number of files, directories and glob patterns")
+    parser.add_argument("--stream", action="store_true",
+                        help="analyze in bounded memory, writing the report as issues are found")
+    parser.add_argument("--max-memory", default=None,
+                        help="per-flow state budget for streaming mode, e.g. 512M or 2G (implies --stream)")
+    parser.add_argument("--batch-size", type=int, default=65536,
+                        help="packets per batch in streaming mode")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes used both to parse the capture in parallel shards and to run the "
+                             "analyzers, partitioned by connection (--max-memory is split between the latter)")
+    parser.add_argument("--llm-cache", default=LLM_CACHE_DIR,
+                        help="directory of the on-disk LLM response cache")
+    parser.add_argument("--llm-cache-size", default='64M',
+                        help="size bound of the LLM response cache, e.g. 64M")
+    parser.add_argument("--no-llm-cache", action="store_true", help="always query the LLM")
+    parser.add_argument("--llm-url", default="http://localhost:11434", help="Ollama server URL")
+    parser.add_argument("--llm-max-in-flight", type=int, default=4,
+                        help="upper bound on concurrent LLM requests (adapted to server latency)")
+    parser.add_argument("--market-data", action="store_true",
+                        help="also decode NASDAQ ITCH 5.0 over MoldUDP64 from UDP packets")
+    parser.add_argument("--max-examples", type=int, default=100,
+                        help="individual issues kept per issue type, the per-flow counts cover all of them "
+                             "(-1 keeps every issue)")
+    parser.add_argument("--cache-dir", default=ANALYSIS_CACHE_DIR,
+                        help="directory of the analysis cache, keyed by capture content and analysis options")
+    parser.add_argument("--cache-size", default='1G', help="disk budget of the analysis cache, e.g. 4G")
+    parser.add_argument("--no-cache", action="store_true", help="always analyze the capture from scratch")
+    parser.add_argument("--report-format", choices=('parquet', 'json'), default='parquet',
+                        help="parquet writes a directory of compressed column files plus a JSON manifest that "
+                             "viewers page through; json writes one self-contained file")
+    rule_keys = ', '.join(r['key'] for r in rule_catalog())
+    parser.add_argument("--rules", default=None,
+                        help=f"comma separated detection rules to run (default all): {rule_keys}")
+    parser.add_argument("--disable-rule", action="append", default=[], metavar="RULE",
+                        help="skip a detection rule (repeatable)")
+    parser.add_argument("--rule-param", action="append", default=[], metavar="RULE.PARAM=VALUE",
+                        help="override a rule parameter, e.g. bogus_header_length.min_words=6 "
+                             "or zero_window.ports=9000,9001 (repeatable)")
+    parser.add_argument("--metrics-dir", default=METRICS_DIR,
+                        help="where per-stage timings are written as <capture>.prom (Prometheus text format) "
+                             "and <capture>.trace.json (Chrome trace)")
+    parser.add_argument("--profile", action="store_true",
+                        help="also run every stage under cProfile, written to <metrics-dir>/<capture>.profile/")
+    parser.add_argument("--batch", action="store_true",
+                        help="analyze many captures in parallel processes, largest first, with reports and a "
+                             "combined summary in --batch-dir; a rerun skips the captures already done")
+    parser.add_argument("--batch-dir", default=BATCH_DIR, help="where --batch keeps reports and its progress")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="captures --batch analyzes at the same time")
+    parser.add_argument("--llm-budget", type=int, default=None,
+                        help="LLM requests a --batch may send in total, shared by all jobs (default unlimited); "
+                             "--llm-max-in-flight is shared too")
+    parser.add_argument("--follow", action="store_true",
+                        help="keep analyzing a capture that is still being written (or a pipe) and print rolling "
+                             f"metrics as JSON lines, also kept in {LIVE_DIR}/<capture>.metrics.json")
+    parser.add_argument("--window", type=float, default=60,
+                        help="seconds of capture time the --follow metrics cover")
+    parser.add_argument("--idle-timeout", type=float, default=300,
+                        help="seconds of capture time after which --follow forgets an idle flow")
+    parser.add_argument("--index", action="store_true",
+                        help=f"also index the capture in {INDEX_DIR}/ while analyzing it, for --drill-down")
+    parser.add_argument("--drill-down", action="store_true",
+                        help="print the packets matching --flow/--start/--end/--packet as JSON lines, read "
+                             "through the capture's index (built first if missing or stale) instead of a full parse")
+    parser.add_argument("--flow", type=parse_flow, default=None, metavar="SRC:PORT-DST:PORT",
+                        help="--drill-down into this flow, both directions, e.g. 10.0.0.1:40000-10.0.0.2:9878")
+    parser.add_argument("--start", type=float, default=None,
+                        help="--drill-down from this packet timestamp (Unix seconds, as in reports)")
+    parser.add_argument("--end", type=float, default=None, help="--drill-down up to this packet timestamp")
+    parser.add_argument("--packet", type=int, default=None,
+                        help="--drill-down to this packet number, as numbered in reports")
+    parser.add_argument("--around", type=int, default=0, help="also show this many packets before and after --packet")
+    parser.add_argument("--limit", type=int, default=None, help="print at most this many --drill-down packets")
+    return parser
+
+def _report_options(args):
+    # generate_report options given on the command line
+    return dict(streaming=args.stream, max_memory=args.max_memory, batch_size=args.batch_size, workers=args.workers,
+                market_data=args.market_data, llm_cache=None if args.no_llm_cache else args.llm_cache,
+                llm_cache_size=args.llm_cache_size,
+                llm_options={'url': args.llm_url, 'max_in_flight': args.llm_max_in_flight},
+                rules=rule_config(args.rules, args.disable_rule, args.rule_param),
+                max_examples=None if args.max_examples < 0 else args.max_examples,
+                report_format=args.report_format, cache_dir=None if args.no_cache else args.cache_dir,
+                cache_size=args.cache_size, index=args.index)
+
+def batch_main(args):
+    done = []
+
+    def on_done(capture, entry):
+        done.append(capture)
+        if 'error' in entry:
+            print(f"[{len(done)}] {capture}: failed, {entry['error']}", flush=True)
+        else:
+            print(f"[{len(done)}] {capture}: {entry['packets']} packets, {entry['issues']} issues "
+                  f"in {entry['seconds']:.1f}s", flush=True)
+    summary = analyze_batch(args.pcap, batch_dir=args.batch_dir, jobs=args.jobs, llm_budget=args.llm_budget,
+                            on_done=on_done, **_report_options(args))
+    print(f"{'capture':<50} {'packets':>12} {'issues':>8} {'session p50':>12} {'session p99':>12}")
+    merged = dict(summary['merged'], capture='(all)')
+    for row in summary['files'] + [merged]:
+        latency = row['session_latency'] or {}
+        print(f"{os.path.basename(row['capture']):<50} {row['packets']:>12} {row['issues']:>8} "
+              f"{format_ns(latency.get('p50')):>12} {format_ns(latency.get('p99')):>12}")
+    print(f"{summary['done']} of {summary['captures']} captures analyzed, {len(summary['failed'])} failed; "
+          f"summary in {os.path.join(args.batch_dir, 'summary.json')}")
+    return 1 if summary['failed'] else 0
+
+def follow_main(args):
+    path = live_metrics_path(args.pcap)
+
+    def on_metrics(snapshot):
+        print(json.dumps(snapshot), flush=True)
+        write_live_metrics(path, snapshot)
+    follow_capture(args.pcap, window=args.window, idle_timeout=args.idle_timeout, on_metrics=on_metrics,
+                   workers=args.workers, market_data=args.market_data, max_memory=args.max_memory,
+                   rules=rule_config(args.rules, args.disable_rule, args.rule_param))
+
+def drill_down_main(args):
+    packets = None
+    if args.packet is not None:
+        packets = range(max(0, args.packet - args.around), args.packet + args.around + 1)
+    index = ensure_index(args.pcap, _analysis_setup(args.market_data)[1])
+    if index is None:
+        sys.exit(f"{args.pcap} could not be indexed")
+    for packet in index.query(flow=args.flow, start=args.start, end=args.end, packets=packets, limit=args.limit):
+        print(json.dumps(bytes_to_hex(packet)), flush=True)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python main.py <path_to_pcap>")
-        sys.exit(1)
-    generate_report(sys.argv[1])
\ No newline at end of file
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    if args.batch:
+        sys.exit(batch_main(args))
+    if len(args.pcap) > 1:
+        parser.error("several captures need --batch")
+    args.pcap = args.pcap[0]
+    if args.follow:
+        follow_main(args)
+        sys.exit()
+    if args.drill_down:
+        drill_down_main(args)
+        sys.exit()
+    instruments = Instruments(profile=args.profile)
+    generate_report(args.pcap, instruments=instruments, **_report_options(args))
+    for path in export_instrumentation(instruments, args.pcap, args.metrics_dir):
+        logger.info(f"Instrumentation written to {path}")
\ No newline at end of file
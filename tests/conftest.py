@@ -0,0 +1,69 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+class _FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.prompts.append(request['prompt'])
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            fail = server.failures > 0
+            server.failures -= fail
+        try:
+            if fail:
+                self._send(503, b'{"error": "server busy"}')
+                return
+            time.sleep(server.delay)
+            text = server.respond(request['prompt'])
+            if not request.get('stream'):
+                self._send(200, json.dumps({'response': text, 'done': True}).encode())
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            pieces = [{'response': word, 'done': False} for word in text.split(' ')[:-1]]
+            pieces = [dict(p, response=p['response'] + ' ') for p in pieces]
+            pieces += [{'response': text.split(' ')[-1], 'done': False}, {'response': '', 'done': True}]
+            for piece in pieces:
+                data = json.dumps(piece).encode() + b'\n'
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        finally:
+            with server.lock:
+                server.active -= 1
+
+@pytest.fixture
+def fake_ollama():
+    """Local stand-in for the Ollama HTTP API (POST /api/generate)."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeOllamaHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.prompts = []
+    server.active = server.max_active = server.failures = 0
+    server.delay = 0
+    server.respond = lambda prompt: 'insight'
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import main
+from analyzer.analysis_cache import AnalysisCache, hash_capture
+from analyzer.columnar_report import load_report
+from analyzer.packet_table import PacketTable
+
+DEMO = os.path.abspath('pcap_files/Demos/checksum-multi-sessions.pcap')
+FIX = os.path.abspath('pcap_files/FIX/fix.pcap')
+
+def _comparable(report):
+    # Timings, LLM counters and the capture path differ between runs
+    return {key: value for key, value in report.items() if key not in ('rules', 'llm', 'capture', 'instrumentation')}
+
+def test_unchanged_capture_is_served_from_the_cache(tmp_path, monkeypatch, fake_ollama):
+    monkeypatch.chdir(tmp_path)
+    options = {'llm_options': {'url': fake_ollama.url}, 'cache_dir': 'cache'}
+    first = main.generate_report(DEMO, **options)
+    prompts = len(fake_ollama.prompts)
+
+    def no_parsing(*args, **kwargs):
+        raise AssertionError("cache hit must not read the capture")
+    monkeypatch.setattr(main, 'parse_pcap', no_parsing)
+    assert main.generate_report(DEMO, **options) == first
+    assert len(fake_ollama.prompts) == prompts
+    assert load_report(main.report_path(DEMO)) == load_report(first)
+    # Another config is another entry
+    monkeypatch.undo()
+    monkeypatch.chdir(tmp_path)
+    assert main.generate_report(DEMO, max_examples=2, **options) != first
+
+def test_appended_capture_resumes_from_the_checkpoint(tmp_path, monkeypatch, fake_ollama):
+    monkeypatch.chdir(tmp_path)
+    with open(DEMO, 'rb') as f:
+        data = f.read()
+    capture = tmp_path / 'live.pcap'
+    # Cut in the middle of a record, as a capture still being written would be
+    capture.write_bytes(data[:len(data) // 2 + 7])
+    options = {'llm_options': {'url': fake_ollama.url}, 'cache_dir': 'cache', 'batch_size': 50}
+    main.generate_report(str(capture), **options)
+
+    starts = []
+    iter_packet_batches = main.iter_packet_batches
+    def tracked(*args, **kwargs):
+        starts.append(kwargs.get('start'))
+        return iter_packet_batches(*args, **kwargs)
+    monkeypatch.setattr(main, 'iter_packet_batches', tracked)
+    capture.write_bytes(data)
+    resumed = load_report(main.generate_report(str(capture), **options))
+    assert len(starts) == 1 and 24 < starts[0] <= len(data) // 2 + 7
+
+    fresh = load_report(main.generate_report(DEMO, llm_options={'url': fake_ollama.url}))
+    assert _comparable(resumed) == _comparable(fresh)
+
+def test_resumed_app_messages_match_a_full_analysis(tmp_path, monkeypatch, fake_ollama):
+    monkeypatch.chdir(tmp_path)
+    data = open(FIX, 'rb').read()
+    offsets = PacketTable.from_pcap(FIX).record_offsets.tolist() + [len(data)]
+    # Without one segment the rest of its stream is held behind the gap until the capture ends
+    records = [data[start:end] for i, (start, end) in enumerate(zip(offsets, offsets[1:])) if i != 100]
+    full = tmp_path / 'full.pcap'
+    full.write_bytes(data[:24] + b''.join(records))
+    fresh = load_report(main.generate_report(str(full), llm_options={'url': fake_ollama.url}))
+    assert fresh['app_messages']['reassembly']['gaps']
+
+    for streaming in (False, True):
+        capture = tmp_path / f'live-{streaming}.pcap'
+        capture.write_bytes(data[:24] + b''.join(records[:240]))
+        options = {'llm_options': {'url': fake_ollama.url}, 'cache_dir': f'cache-{streaming}',
+                   'streaming': streaming, 'batch_size': 50}
+        main.generate_report(str(capture), **options)
+        capture.write_bytes(full.read_bytes())
+        resumed = load_report(main.generate_report(str(capture), **options))
+        assert resumed['app_messages'] == fresh['app_messages']
+
+def test_hash_capture_snapshots_prefixes(tmp_path):
+    path = tmp_path / 'blob'
+    path.write_bytes(bytes(range(256)) * 10)
+    size, digest, prefixes = hash_capture(str(path), [0, 100, 2560, 9999], chunk_size=64)
+    assert size == 2560 and digest == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert prefixes == {n: hashlib.sha256(path.read_bytes()[:n]).hexdigest() for n in (0, 100, 2560)}
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = AnalysisCache(str(tmp_path / 'cache'), max_bytes=3500)
+    captures = []
+    for i in range(3):
+        capture = tmp_path / f'{i}.pcap'
+        capture.write_bytes(bytes([i]) * 100)
+        captures.append(str(capture))
+        lookup = cache.lookup(str(capture), {})
+        staging = cache.begin()
+        with open(os.path.join(staging, 'report.json'), 'w') as f:
+            f.write('x' * 1000)
+        cache.commit(lookup, staging, {}, 'report.json', str(capture))
+    assert [cache.lookup(c, {}).status for c in captures] == ['miss', 'hit', 'hit']
@@ -0,0 +1,48 @@
+import json
+import os
+import shutil
+import main
+from analyzer.batch import find_captures, report_names
+from analyzer.columnar_report import load_report
+from benchmarks.synth_capture import write_capture
+
+DEMO = os.path.abspath('pcap_files/Demos/checksum-multi-sessions.pcap')
+
+def test_find_captures_walks_directories_and_globs_largest_first(tmp_path):
+    for name, size in (('a/x.pcap', 10), ('a/x.pcap1', 30), ('b/x.pcap', 20), ('b/notes.txt', 40)):
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b'\0' * size)
+    found = find_captures([str(tmp_path / 'a'), str(tmp_path / 'b' / '*.pcap')])
+    assert [os.path.relpath(p, tmp_path) for p in found] == ['a/x.pcap1', 'b/x.pcap', 'a/x.pcap']
+    assert sorted(report_names(found).values()) == ['a/x.pcap', 'a/x.pcap1', 'b/x.pcap']
+
+def test_batch_reports_every_capture_and_resumes(tmp_path, monkeypatch, fake_ollama):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('venue1')
+    os.makedirs('venue2')
+    shutil.copy(DEMO, 'venue1/session.pcap')
+    write_capture('venue2/session.pcap', packets=3000, seed=1, anomaly_rate=0.02)
+    options = dict(jobs=2, llm_budget=100, llm_options={'url': fake_ollama.url, 'max_in_flight': 2},
+                   cache_dir=None)
+    summary = main.analyze_batch(['venue1', 'venue2/*.pcap'], **options)
+    assert summary['done'] == summary['captures'] == 2 and not summary['failed']
+    # Largest first, each to its own report despite the shared file name
+    assert [os.path.relpath(row['capture']) for row in summary['files']] == ['venue2/session.pcap',
+                                                                            'venue1/session.pcap']
+    for row in summary['files']:
+        report = load_report(row['report'])
+        assert row['packets'] == report['total_packets'] and row['issues'] == report['issue_summary']['total']
+    merged = summary['merged']
+    assert merged['packets'] == sum(row['packets'] for row in summary['files'])
+    assert merged['session_latency']['count'] == sum(row['session_latency']['count'] for row in summary['files'])
+    assert summary['llm_budget_left'] == 100 - len(fake_ollama.prompts)
+    assert json.load(open('output/batch/summary.json')) == summary
+
+    # Done captures are skipped when the batch runs again; a changed one is analyzed again
+    write_capture('venue2/session.pcap', packets=2000, seed=2)
+    finished = []
+    again = main.analyze_batch(['venue1', 'venue2'], on_done=lambda capture, entry: finished.append(capture),
+                               **options)
+    assert finished == [os.path.abspath('venue2/session.pcap')] and again['done'] == 2
+    assert again['merged']['packets'] < merged['packets']
@@ -0,0 +1,48 @@
+import hashlib
+import numpy as np
+from analyzer.engine import AnalysisEngine
+from analyzer.packet_table import PacketTable
+from analyzer.rules import issue_types
+from benchmarks.run_benchmarks import compare
+from benchmarks.synth_capture import ANOMALY_ISSUE_TYPES, write_capture
+
+def _digest(path):
+    return hashlib.sha256(open(path, 'rb').read()).hexdigest()
+
+def test_synthetic_capture_is_deterministic_and_analyzers_find_what_was_injected(tmp_path):
+    path = str(tmp_path / 'synth.pcap')
+    stats = write_capture(path, packets=20000, seed=7, anomaly_rate=0.02)
+    assert stats == write_capture(str(tmp_path / 'again.pcap'), packets=20000, seed=7, anomaly_rate=0.02)
+    assert _digest(path) == _digest(str(tmp_path / 'again.pcap'))
+    other = str(tmp_path / 'other.pcap')
+    write_capture(other, packets=20000, seed=8, anomaly_rate=0.02)
+    assert _digest(other) != _digest(path)
+
+    table = PacketTable.from_pcap(path, protocols=('tcp', 'udp'))
+    assert len(table) == stats['packets'] >= 20000
+    with AnalysisEngine(('errors', 'order_latency', 'itch')) as engine:
+        hits = engine.feed(table)['errors']
+        final = engine.finish()
+    found = dict(zip(*np.unique(hits[1], return_counts=True)))
+    types = issue_types()
+    found = {types[check]: int(count) for check, count in found.items()}
+    for anomaly, issue_type in ANOMALY_ISSUE_TYPES.items():
+        assert found.get(issue_type, 0) == stats[anomaly], anomaly
+    assert stats['retransmission'] and stats['out_of_order'] and stats['dup_ack']
+
+    orders = final['order_latency'][-1]['stats']
+    assert orders['orders'] == stats['fix_orders']
+    assert orders['matched'] == stats['fix_answered'] and orders['no_response'] == stats['fix_unanswered']
+    feed = final['itch'][0]['summary']
+    assert feed['messages'] == stats['itch_messages'] and feed['undecoded'] == 0
+    assert (feed['gaps'], feed['missing_messages']) == (stats['itch_gaps'], stats['itch_missing_messages'])
+
+def test_compare_flags_slower_or_bigger_stages():
+    def results(per_second, rss):
+        return {'stages': {'parse_pcap': {'per_second': per_second, 'unit': 'packets', 'peak_rss_mb': rss}}}
+    baseline = results(100_000, 500)
+    assert compare(results(85_000, 590), baseline, 0.2) == []
+    problems = compare(results(70_000, 610), baseline, 0.2)
+    assert len(problems) == 2 and all(p.startswith('parse_pcap') for p in problems)
+    # Stages missing from either side are not compared
+    assert compare({'stages': {}}, baseline, 0.2) == []
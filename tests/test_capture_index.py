@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import main
+from analyzer.capture_index import CaptureIndex, CaptureIndexBuilder, build_index, index_path, open_index
+from analyzer.packet_table import FLOW_KEY_COLUMNS, PacketTable
+from benchmarks.synth_capture import write_capture
+from test_live import DEMO, _to_pcapng
+
+def _index(path, protocols, block_packets=16, batch_size=100):
+    # Small blocks and batches that end mid-block
+    builder = CaptureIndexBuilder(block_packets)
+    for table in PacketTable.iter_pcap(path, batch_size=batch_size, protocols=protocols):
+        builder.add(table)
+    return CaptureIndex(builder.finish(path + '.index', path, protocols))
+
+def _check(index, table, mask, **query):
+    found = index.query(**query)
+    assert [p['packet'] for p in found] == np.flatnonzero(mask).tolist()
+    assert [p['record_offset'] for p in found] == table.record_offsets[mask].tolist()
+    return found
+
+def test_queries_match_a_scan_of_the_capture(tmp_path):
+    synth = str(tmp_path / 'synth.pcap')
+    write_capture(synth, packets=3000, seed=3, anomaly_rate=0.02)
+    pcapng = str(tmp_path / 'demo.pcapng')
+    with open(pcapng, 'wb') as f:
+        f.write(_to_pcapng(open(DEMO, 'rb').read()))
+    for path, protocols in ((synth, ('tcp', 'udp')), (synth, ('tcp',)), (pcapng, ('tcp',))):
+        table = PacketTable.from_pcap(path, protocols=protocols)
+        index = _index(path, protocols)
+        assert index.packets == len(table) and index.fresh()
+        numbers = np.arange(len(table))
+
+        wanted = [0, 15, 16, 17, len(table) // 2, len(table) - 1]
+        found = _check(index, table, np.isin(numbers, wanted), packets=wanted + [len(table) + 5])
+        assert found[-1]['raw_payload'] == table.payload(len(table) - 1)
+
+        timestamps = table.columns['timestamp_ns']
+        start, end = timestamps[len(table) // 3] / 1e9, timestamps[len(table) // 2] / 1e9
+        # Float seconds don't hold every nanosecond, the bounds are the rounded ones
+        in_window = (timestamps >= round(start * 1e9)) & (timestamps <= round(end * 1e9))
+        _check(index, table, in_window, start=start, end=end)
+
+        row = table.columns[len(table) // 4]
+        keys = table.columns[list(FLOW_KEY_COLUMNS)]
+        forward = np.ones(len(table), dtype=bool)
+        backward = np.ones(len(table), dtype=bool)
+        for column, other in zip(FLOW_KEY_COLUMNS, ('dst_ip_hi', 'dst_ip_lo', 'src_ip_hi', 'src_ip_lo',
+                                                   'dst_port', 'src_port')):
+            forward &= keys[column] == row[column]
+            backward &= keys[column] == row[other]
+        packet = index.query(packets=[len(table) // 4])[0]
+        flow = (packet['src_ip'], packet['src_port'], packet['dst_ip'], packet['dst_port'])
+        _check(index, table, forward | backward, flow=flow)
+        _check(index, table, forward, flow=flow, both_directions=False)
+        _check(index, table, (forward | backward) & in_window, flow=flow, start=start, end=end)
+        assert len(index.query(flow=flow, limit=2)) == min(2, int((forward | backward).sum()))
+        assert sum(f['packets'] for f in index.flow(flow)) == int((forward | backward).sum())
+
+def test_analysis_indexes_the_capture_and_changed_captures_are_reindexed(tmp_path, monkeypatch, fake_ollama):
+    monkeypatch.chdir(tmp_path)
+    capture = str(tmp_path / 'demo.pcap')
+    data = open(os.path.join(os.path.dirname(os.path.dirname(__file__)), DEMO), 'rb').read()
+    with open(capture, 'wb') as f:
+        f.write(data)
+    main.generate_report(capture, streaming=True, batch_size=50, index=True,
+                         llm_options={'url': fake_ollama.url})
+    index = open_index(capture, ('tcp',))
+    assert index is not None and open_index(capture, ('tcp', 'udp')) is None
+    alone = CaptureIndex(build_index(capture, str(tmp_path / 'alone.index')))
+    for name in ('blocks', 'flows', 'flow_blocks'):
+        assert (getattr(index, name) == getattr(alone, name)).all()
+
+    with open(capture, 'ab') as f:
+        f.write(data[24:])
+    assert open_index(capture) is None
+    index = main.ensure_index(capture)
+    assert index.fresh() and index.packets == 2 * alone.packets
+    assert os.path.isdir(index_path(capture))
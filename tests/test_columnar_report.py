@@ -0,0 +1,54 @@
+import os
+import main
+from analyzer.columnar_report import ReportReader, histogram, load_report, query, write_report
+
+DEMO = os.path.abspath('pcap_files/Demos/checksum-multi-sessions.pcap')
+
+def test_parquet_report_reads_back_like_the_json_export(tmp_path, monkeypatch, fake_ollama):
+    monkeypatch.chdir(tmp_path)
+    reports = {}
+    for report_format in ('json', 'parquet'):
+        main.generate_report(DEMO, llm_options={'url': fake_ollama.url}, report_format=report_format)
+        reports[report_format] = load_report(main.report_path(DEMO, report_format))
+    assert os.path.isdir(main.report_path(DEMO))
+    for report in reports.values():
+        # Timings and LLM cache counters differ between the two runs
+        del report['rules'], report['llm'], report['instrumentation']
+    assert reports['parquet'] == reports['json']
+    assert reports['parquet']['errors'] and reports['parquet']['latencies']
+
+def test_reader_pages_through_row_groups_and_columns(tmp_path):
+    latencies = [{'session': ('10.0.0.1', 1000 + i, '10.0.0.2', 9000), 'latency_ms': i / 2} for i in range(35)]
+    write_report({'latencies': latencies, 'total_packets': 70}, str(tmp_path / 'report'), row_group_size=10)
+    reader = ReportReader(str(tmp_path / 'report'))
+    assert reader.get('total_packets') == 70
+    assert reader.rows('latencies') == 35 and reader.rows('errors') == 0
+    assert reader._file('latencies').metadata.num_row_groups == 4
+
+    page = reader.read('latencies', columns=['latency_ms'], start=12, stop=27)
+    assert page.column_names == ['latency_ms']
+    assert page.column('latency_ms').to_pylist() == [i / 2 for i in range(12, 27)]
+    assert reader.records('latencies', start=33) == [
+        {'session': ['10.0.0.1', 1000 + i, '10.0.0.2', 9000], 'latency_ms': i / 2} for i in (33, 34)]
+    assert reader.records('latencies', start=40) == []
+    assert reader.records('errors', columns=['type']) == []
+
+def test_query_filters_sorts_and_pages_like_a_report_dict(tmp_path):
+    report = {'latencies': [{'session': ('10.0.0.1', 1000 + i % 7, '10.0.0.2', 9000 + i % 2), 'latency_ms': (i * 37) % 50}
+                            for i in range(100)]}
+    write_report(report, str(tmp_path / 'report'), row_group_size=8)
+    reader = ReportReader(str(tmp_path / 'report'))
+    filters = [('dst_port', '==', 9001), ('latency_ms', '>=', 10)]
+    matched = sorted((item for item in report['latencies'] if item['session'][3] == 9001 and item['latency_ms'] >= 10),
+                     key=lambda item: -item['latency_ms'])
+    total, page = query(reader, 'latencies', filters, sort='latency_ms', descending=True, start=5, stop=15)
+    assert total == len(matched)
+    assert [item['latency_ms'] for item in page] == [item['latency_ms'] for item in matched[5:15]]
+    assert query(report, 'latencies', filters, 'latency_ms', True, start=5, stop=15) == (total, matched[5:15])
+    assert [tuple(item['session']) for item in page] == [item['session'] for item in matched[5:15]]
+    assert query(reader, 'latencies', [('src_ip', '==', 'nope')]) == (0, [])
+
+    bins = histogram(reader, 'latencies', 'latency_ms', bins=5, filters=filters)
+    assert bins == histogram(report, 'latencies', 'latency_ms', bins=5, filters=filters)
+    assert [count for _low, _high, count in bins] and sum(count for _l, _h, count in bins) == total
+    assert bins[0][0] == matched[-1]['latency_ms'] and bins[-1][1] == matched[0]['latency_ms']
@@ -0,0 +1,49 @@
+import pytest
+from analyzer.engine import AnalysisEngine, FlowAnalyzer
+from analyzer.error_detector import detect_errors, issues_from_hits
+from analyzer.latency_checker import calculate_latency
+from analyzer.packet_table import PacketTable
+
+DEMO = 'pcap_files/Demos/checksum-multi-sessions.pcap'
+
+class ConnectionCounter(FlowAnalyzer):
+    # Example third-party analyzer: counts packets per connection
+    name = 'connections'
+
+    def __init__(self):
+        self.counts = {}
+
+    def feed(self, table, index):
+        for row in table:
+            ends = sorted([(row['src_ip'], row['src_port']), (row['dst_ip'], row['dst_port'])])
+            self.counts[tuple(ends)] = self.counts.get(tuple(ends), 0) + 1
+
+    def finish(self):
+        return list(self.counts.items())
+
+def test_parallel_engine_matches_single_process():
+    table = PacketTable.from_pcap(DEMO)
+    expected_errors = [(e['type'], e['details']['seq']) for e in detect_errors(table)]
+    expected_latency = calculate_latency(table)
+    for workers in (1, 3):
+        with AnalysisEngine(['errors', 'latency', ConnectionCounter], workers=workers) as engine:
+            # Two batches, so per-flow state has to survive between feeds
+            half = len(table) // 2
+            hits = [engine.feed(table[:half])['errors'], engine.feed(table[half:])['errors']]
+            final = engine.finish()
+        errors = [(e['type'], e['details']['seq']) for hit in hits for e in issues_from_hits(*hit, table)]
+        assert errors == expected_errors
+        assert final['latency'] == expected_latency
+        # Both directions of a connection are seen by the same worker
+        counts = dict(final['connections'])
+        assert len(counts) == len(final['connections'])
+        assert sum(counts.values()) == len(table)
+
+def test_dead_worker_fails_the_analysis_instead_of_hanging():
+    table = PacketTable.from_pcap(DEMO)
+    with AnalysisEngine(['errors'], workers=2) as engine:
+        engine.feed(table)
+        engine._processes[1].kill()
+        engine._processes[1].join()
+        with pytest.raises(RuntimeError, match='worker 1 died'):
+            engine.feed(table)
@@ -0,0 +1,40 @@
+from analyzer.fix_decoder import (
+    FixStreamDecoder, decode_fix_batch, decode_fix_message, fix_checksum, parse_fix_fields,
+)
+
+def fix(msg_type, seq_num, extra=''):
+    body = f'35={msg_type}\x0134={seq_num}\x0111=ORD{seq_num}\x0152=20240101-09:30:00\x01{extra}'
+    message = f'8=FIXT.1.1\x019={len(body)}\x01{body}'.encode()
+    return message + b'10=%03d\x01' % fix_checksum(message)
+
+def test_batch_matches_per_message_decoder():
+    messages = [fix('D', 1), fix('8', 2, '60=20240101-09:30:01\x01'), fix('F', 3)]
+    for data in (messages, b''.join(messages) + fix('D', 4)[:12]):
+        batch = decode_fix_batch(data)
+        assert len(batch) == 3
+        assert batch.valid.all()
+        assert batch.columns[35].tolist() == [b'D', b'8', b'F']
+        assert batch.columns[34].tolist() == [1, 2, 3]
+        assert batch.columns[60].tolist() == [b'', b'20240101-09:30:01', b'']
+        for i, message in enumerate(messages):
+            expected = decode_fix_message(message)
+            fields = {str(tag): bytes(value).decode() for tag, value in batch.fields(i).items()}
+            assert fields == expected
+            assert parse_fix_fields(message).keys() == batch.fields(i).keys()
+
+def test_batch_flags_checksum_and_body_length_errors():
+    good = fix('D', 1)
+    bad_checksum = good[:-4] + b'%03d\x01' % ((fix_checksum(good[:-7]) + 1) % 256)
+    bad_length = good.replace(b'9=', b'9=1', 1)
+    batch = decode_fix_batch([good, bad_checksum, bad_length])
+    assert batch.checksum_ok.tolist() == [True, False, False]
+    assert batch.body_length_ok.tolist() == [True, True, False]
+
+def test_stream_decoder_projects_fields():
+    decoder = FixStreamDecoder(fields=(35, 34, 11))
+    data = fix('D', 7) + fix('8', 8)
+    assert decoder.feed(data[:30]) == []
+    assert decoder.feed(data[30:]) == [
+        {'valid': True, '35': 'D', '34': '7', '11': 'ORD7'},
+        {'valid': True, '35': '8', '34': '8', '11': 'ORD8'},
+    ]
@@ -0,0 +1,26 @@
+import json
+import numpy as np
+from analyzer.histogram import LatencyHistogram, merge_histograms
+
+def test_percentiles_within_precision_and_merge_matches_single_pass():
+    values = np.random.default_rng(7).lognormal(11, 1.5, 200_000).astype(np.int64)
+    whole = LatencyHistogram()
+    whole.record(values)
+    shards = []
+    for part in np.array_split(values, 3):
+        shard = LatencyHistogram()
+        shard.record(part)
+        # Round trip through the report format on the way
+        shards.append(json.loads(json.dumps(shard.to_dict())))
+    merged = merge_histograms(shards)
+    assert merged.summary() == whole.summary()
+    for p in (50, 90, 99, 99.9):
+        exact = np.percentile(values, p, method='inverted_cdf')
+        assert abs(whole.percentile(p) - exact) <= exact / 100
+    assert whole.percentile(100) == values.max() and whole.min == values.min()
+
+def test_small_values_are_exact():
+    hist = LatencyHistogram(significant_digits=3)
+    hist.record(np.arange(1000))
+    assert hist.percentile(50) == 499
+    assert hist.buckets()[:2] == [(0, 0, 1), (1, 1, 1)]
@@ -0,0 +1,47 @@
+import json
+import os
+import re
+import main
+from analyzer.columnar_report import load_report
+from analyzer.instrumentation import Instruments
+
+DEMO = os.path.abspath('pcap_files/Demos/checksum-multi-sessions.pcap')
+
+def test_report_carries_stage_timings_and_exports(tmp_path, monkeypatch, fake_ollama):
+    monkeypatch.chdir(tmp_path)
+    for streaming in (False, True):
+        instruments = Instruments()
+        main.generate_report(DEMO, streaming=streaming, batch_size=50, llm_options={'url': fake_ollama.url},
+                             llm_cache=None, instruments=instruments)
+        report = load_report(main.report_path(DEMO))
+        recorded = report['instrumentation']
+        assert {'parse', 'detect', 'insights'} <= set(recorded['stages'])
+        assert recorded['counts']['packets'] == report['total_packets']
+        assert recorded['counts']['issues'] == report['issue_summary']['total']
+        assert recorded['llm_latency']['count'] == report['llm']['llm_calls'] > 0
+        assert recorded['peak_rss_bytes'] > 0
+        # Writing the report happened after it was recorded
+        assert instruments.stages['write']['calls'] >= 1
+    assert instruments.stages['parse']['calls'] > 1
+
+    prom, trace = main.export_instrumentation(instruments, DEMO, 'metrics')
+    text = open(prom).read()
+    sample = re.compile(r'^exchlytics_\w+(\{(\w+="[^"]*",?)+\})? (NaN|[-+0-9.e]+)$')
+    assert all(line.startswith('#') or sample.match(line) for line in text.splitlines())
+    assert 'exchlytics_stage_wall_seconds{capture="checksum-multi-sessions.pcap",stage="detect"}' in text
+    assert 'exchlytics_llm_request_seconds_count{capture="checksum-multi-sessions.pcap"}' in text
+    events = json.load(open(trace))['traceEvents']
+    spans = [e for e in events if e['ph'] == 'X']
+    assert len(spans) == sum(stage['calls'] for stage in instruments.stages.values())
+
+def test_profile_mode_writes_a_profile_per_stage(tmp_path):
+    instruments = Instruments(profile=True)
+    for _ in range(2):
+        with instruments.stage('work'):
+            sorted(range(10000), key=lambda i: -i)
+    with instruments.stage('other'):
+        pass
+    paths = instruments.dump_profiles(str(tmp_path))
+    assert sorted(os.path.basename(p) for p in paths) == ['other.prof', 'work.prof']
+    assert '<lambda>' in open(tmp_path / 'work.txt').read()
+    assert instruments.stages['work']['calls'] == 2
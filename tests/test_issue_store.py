@@ -0,0 +1,43 @@
+import os
+import main
+from analyzer.columnar_report import load_report
+from analyzer.error_detector import ErrorDetector
+from analyzer.issue_store import IssueStore
+from analyzer.packet_table import PacketTable
+from analyzer.pcap_parser import load_packets
+
+DEMO = os.path.abspath('pcap_files/Demos/checksum-multi-sessions.pcap')
+
+def test_aggregates_count_everything_but_examples_are_capped():
+    table = PacketTable.from_pcap(DEMO)
+    hits = ErrorDetector().find(table)
+    store = IssueStore(max_examples=3)
+    half = len(table) // 2
+    first = hits[0] < half
+    examples = store.add(hits[0][first], hits[1][first], table[:half])
+    examples += store.add(hits[0][~first], hits[1][~first], table[half:], base=half)
+    summary = store.summary()
+    assert summary['total'] == len(hits[0])
+    assert sum(entry['count'] for entry in summary['by_flow']) == len(hits[0])
+    for issue_type, entry in summary['by_type'].items():
+        assert entry['examples'] == min(3, entry['count'])
+        assert sum(e['type'] == issue_type for e in examples) == entry['examples']
+    example = examples[0]
+    assert 'raw_payload' not in example['details']
+    assert summary['flows'][example['flow']]['src_port'] == example['details']['src_port']
+    # Payloads are loaded back from the capture on demand
+    packet = load_packets(DEMO, [example['packet']])[example['packet']]
+    assert packet['raw_payload'] == bytes(table[example['packet']]['raw_payload'])
+
+def test_report_keeps_aggregates_and_capped_examples(tmp_path, monkeypatch, fake_ollama):
+    monkeypatch.chdir(tmp_path)
+    reports = []
+    for streaming in (False, True):
+        main.generate_report(DEMO, streaming=streaming, batch_size=100, max_examples=2,
+                             llm_options={'url': fake_ollama.url})
+        reports.append(load_report(main.report_path(DEMO)))
+    in_memory, streamed = reports
+    assert streamed['issue_summary'] == in_memory['issue_summary']
+    assert [(e['type'], e['packet']) for e in streamed['errors']] == [(e['type'], e['packet']) for e in in_memory['errors']]
+    assert len(in_memory['errors']) == sum(min(2, t['count']) for t in in_memory['issue_summary']['by_type'].values())
+    assert in_memory['capture']['path'] == DEMO
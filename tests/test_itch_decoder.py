@@ -0,0 +1,76 @@
+import socket
+import struct
+from analyzer.engine import AnalysisEngine
+from analyzer.itch_decoder import ItchDecoder, decode_itch
+from analyzer.pcap_parser import parse_pcap
+
+def _udp_frame(payload):
+    udp = struct.pack('!HHHH', 40000, 26400, 8 + len(payload), 0) + payload
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 1, 0, 64, 17, 0,
+                     socket.inet_aton('10.1.1.1'), socket.inet_aton('233.54.12.1'))
+    return b'\x00' * 12 + struct.pack('!H', 0x0800) + ip + udp
+
+def _tcp_frame(payload):
+    tcp = struct.pack('!HHIIBBHHH', 1234, 80, 1000, 0, 5 << 4, 0x14, 65535, 0xBEEF, 0) + payload
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp), 1, 0, 64, 6, 0,
+                     socket.inet_aton('10.0.0.1'), socket.inet_aton('10.0.0.2'))
+    return b'\x00' * 12 + struct.pack('!H', 0x0800) + ip + tcp
+
+def _write_pcap(path, frames):
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        for i, frame in enumerate(frames):
+            f.write(struct.pack('<IIII', 1700000000, i, len(frame), len(frame)) + frame)
+
+def _ts(ns):
+    return ns.to_bytes(6, 'big')
+
+def add_order(ref, side, shares, stock, price, ts=34200_000000000):
+    return b'A' + struct.pack('!HH', 7, 0) + _ts(ts) + struct.pack('!Qc I8sI', ref, side, shares, stock, price)
+
+def order_executed(ref, shares, match):
+    return b'E' + struct.pack('!HH', 7, 0) + _ts(1) + struct.pack('!QIQ', ref, shares, match)
+
+def mold(sequence, messages, session=b'SESSION001'):
+    body = b''.join(struct.pack('!H', len(m)) + m for m in messages)
+    return session + struct.pack('!QH', sequence, len(messages)) + body
+
+def test_decode_itch_message_layouts():
+    messages = [add_order(42, b'B', 100, b'AAPL    ', 1872500), order_executed(42, 60, 9001), b'Z' * 5]
+    buf = b''.join(messages)
+    starts = [0, len(messages[0]), len(messages[0]) + len(messages[1])]
+    decoded = decode_itch(buf, starts, [len(m) for m in messages])
+    add = decoded[b'A'][0]
+    assert (add['order_ref'], add['side'], add['shares'], add['stock'], add['price']) == \
+        (42, b'B', 100, b'AAPL    ', 1872500)
+    assert add['timestamp'] == 34200_000000000
+    assert decoded[b'E'][0]['executed_shares'] == 60 and decoded[b'E'][0]['match_number'] == 9001
+    assert decoded[b'?'] == {'count': 1}
+
+def test_moldudp64_sequence_gaps_and_udp_parsing(tmp_path):
+    path = tmp_path / 'feed.pcap'
+    packets = [
+        mold(1, [add_order(1, b'S', 10, b'MSFT    ', 4000000), add_order(2, b'B', 5, b'MSFT    ', 3990000)]),
+        _tcp_frame(b'hello'),
+        mold(6, [order_executed(1, 10, 77)]),  # 3..5 lost
+        mold(3, [order_executed(2, 5, 78)]),   # late replay of part of the gap
+        mold(7, []),                           # heartbeat
+    ]
+    _write_pcap(path, [p if p.startswith(b'\x00') else _udp_frame(p) for p in packets])
+    table = parse_pcap(str(path), as_table=True, protocols=('tcp', 'udp'))
+    assert len(table) == 5 and len(parse_pcap(str(path), as_table=True)) == 1
+
+    decoder = ItchDecoder()
+    decoded = decoder.feed(table)
+    assert decoded[b'A']['sequence'].tolist() == [1, 2]
+    assert decoded[b'E']['packet_index'].tolist() == [2, 3]
+    summary = decoder.summary()
+    assert summary['gaps'] == 1 and summary['missing_messages'] == 3
+    assert summary['replayed_packets'] == 1 and summary['heartbeats'] == 1
+    assert summary['by_type'] == {'add_order': 2, 'order_executed': 2}
+
+    # The TCP analyzers skip the UDP rows of a mixed batch
+    with AnalysisEngine(['errors', 'itch']) as engine:
+        results = engine.run(table)
+    assert set(results['errors'][0].tolist()) == {1}
+    assert results['itch'][-1]['summary']['messages'] == 4
@@ -0,0 +1,74 @@
+import os
+import threading
+import main
+from analyzer.jobs import JobPool
+
+DEMO = os.path.abspath('pcap_files/Demos/checksum-multi-sessions.pcap')
+
+def _wait(job, timeout=60):
+    for _ in range(timeout * 20):
+        if job.status not in ('queued', 'running'):
+            return job.snapshot()
+        threading.Event().wait(0.05)
+    raise AssertionError(f"job {job.id} still {job.status}")
+
+def test_owners_are_served_round_robin():
+    gate, started = threading.Event(), threading.Event()
+    order = []
+    pool = JobPool(workers=1)
+    blocker = pool.submit('a', lambda job: started.set() or gate.wait())
+    started.wait(5)
+    jobs = [pool.submit(owner, lambda job, name=name: order.append(name), label=name)
+            for owner, name in (('a', 'a1'), ('a', 'a2'), ('a', 'a3'), ('b', 'b1'), ('b', 'b2'))]
+    gate.set()
+    for job in [blocker] + jobs:
+        _wait(job)
+    assert order == ['a1', 'b1', 'a2', 'b2', 'a3']
+    pool.shutdown()
+
+def test_cancel_queued_and_running_jobs():
+    started = threading.Event()
+    pool = JobPool(workers=1)
+
+    def loop(job):
+        started.set()
+        while True:
+            job.progress('parse', {'packets': 1})
+            threading.Event().wait(0.01)
+    running = pool.submit('a', loop)
+    queued = pool.submit('b', lambda job: 'never')
+    started.wait(5)
+    assert pool.cancel(queued.id) and queued.status == 'cancelled'
+    pool.cancel(running.id)
+    assert _wait(running)['status'] == 'cancelled'
+    failing = pool.submit('a', lambda job: 1 / 0)
+    assert _wait(failing)['error'].startswith('ZeroDivisionError')
+    pool.shutdown()
+
+def test_analysis_reports_stage_progress(tmp_path, monkeypatch, fake_ollama):
+    monkeypatch.chdir(tmp_path)
+    pool = JobPool(workers=1)
+    job = pool.submit('a', lambda job: main.generate_report(
+        DEMO, streaming=True, batch_size=50, llm_options={'url': fake_ollama.url}, on_progress=job.progress))
+    state = _wait(job)
+    assert state['status'] == 'done' and state['result'] == main.report_path(DEMO)
+    assert all(entry['done'] for entry in state['stages'].values())
+    assert state['stages']['parse']['counts']['packets'] == state['partial']['total_packets'] > 0
+    issues = state['stages']['detect']['counts']['issues']
+    assert issues == state['partial']['issue_summary']['total'] > 0
+    assert state['stages']['insights']['counts']['llm_calls'] == len(fake_ollama.prompts)
+
+    # Cancelling mid-analysis leaves no cache entry behind
+    cancelled = []
+    def cancel_after_first_batch(job):
+        def progress(stage, counts, partial=None):
+            job.progress(stage, counts, partial)
+            if stage == 'parse' and not cancelled:
+                cancelled.append(pool.cancel(job.id))
+        return main.generate_report(DEMO, streaming=True, batch_size=50, max_examples=3, cache_dir='cache',
+                                    llm_options={'url': fake_ollama.url}, on_progress=progress)
+    job = pool.submit('a', cancel_after_first_batch)
+    state = _wait(job)
+    assert state['status'] == 'cancelled' and state['stages']['parse']['counts']['packets'] == 50
+    assert os.listdir('cache') == []
+    pool.shutdown()
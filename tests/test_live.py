@@ -0,0 +1,105 @@
+import os
+import struct
+import threading
+import numpy as np
+import main
+from analyzer.engine import AnalysisEngine
+from analyzer.flow_state import FlowStateStore
+from analyzer.live import CaptureTail, RollingMetrics
+from analyzer.packet_table import PacketTable
+from analyzer.pcap_reader import iter_records
+
+DEMO = 'pcap_files/Demos/checksum-multi-sessions.pcap'
+
+def _to_pcapng(data):
+    # The demo capture's records as a nanosecond pcapng
+    def block(block_type, body):
+        body += b'\x00' * (-len(body) % 4)
+        return struct.pack('<II', block_type, 12 + len(body)) + body + struct.pack('<I', 12 + len(body))
+    out = [block(0x0A0D0D0A, struct.pack('<IHHq', 0x1A2B3C4D, 1, 0, -1)),
+           block(1, struct.pack('<HHI', 1, 0, 0) + struct.pack('<HHB3x', 9, 1, 9) + struct.pack('<HH', 0, 0))]
+    for ts, _linktype, frame, _offset in iter_records(data):
+        out.append(block(6, struct.pack('<IIIII', 0, ts >> 32, ts & 0xFFFFFFFF, len(frame), len(frame)) + frame))
+    return b''.join(out)
+
+def test_tail_decodes_records_as_they_are_written(tmp_path):
+    data = open(DEMO, 'rb').read()
+    expected = PacketTable.from_pcap(DEMO)
+    for name, content in (('grow.pcap', data), ('grow.pcapng', _to_pcapng(data))):
+        path = str(tmp_path / name)
+        open(path, 'wb').close()
+        tables = []
+        with CaptureTail(path) as tail, open(path, 'ab') as f:
+            # Cuts land inside the file header and inside records
+            for start in range(0, len(content), 1000):
+                f.write(content[start:start + 1000])
+                f.flush()
+                tables.append(tail.read())
+                assert tail.backlog == 0
+            assert not tail.eof and not len(tail.read())
+        table = PacketTable.concat(tables)
+        assert len(table) == len(expected) and sum(1 for t in tables if len(t)) > 10
+        assert (table.columns == expected.columns).all()
+        assert table.payload(len(table) - 1) == expected.payload(len(expected) - 1)
+
+def test_flow_state_expires_idle_flows():
+    store = FlowStateStore()
+    store.advance(np.array([100]))
+    store['a'] = 1
+    store['b'] = 2
+    store.advance(np.array([200]))
+    store['a'] = 3
+    assert store.expire(150) == [('b', 2)]
+    assert store.expire(201) == [('a', 3)] and len(store) == 0
+
+def test_engine_expire_reports_sessions_that_went_idle():
+    def segment(port, timestamp):
+        return {'src_ip': '10.0.0.1', 'dst_ip': '10.0.0.2', 'src_port': port, 'dst_port': 80,
+                'flags': 'A', 'seq': 1, 'timestamp': timestamp}
+    with AnalysisEngine(('errors', 'latency', 'order_latency')) as engine:
+        # Flows are stamped with the newest time of the batch they were last seen in
+        engine.feed(PacketTable.from_packets([segment(1000, 1.0), segment(1000, 2.0), segment(2000, 1.5)]))
+        engine.feed(PacketTable.from_packets([segment(2000, 9.0)]))
+        expired = engine.expire(10_000_000_000, 5_000_000_000)
+        # Only the session last seen at 2s was idle for 5s at 10s
+        assert [(l['session'][1], l['latency_ms']) for l in expired['latency']] == [(1000, 1000.0)]
+        final = engine.finish()
+    assert [l['session'][1] for l in final['latency']] == [2000]
+
+def test_rolling_metrics_window():
+    metrics = RollingMetrics(window=2)
+    second = 1_000_000_000
+    metrics.add_packets([0, second // 2, second, 3 * second], [6, 6, 17, 6])
+    metrics.add_issues([second // 2, 3 * second], ['TCP Retransmission', 'TCP Dup ACK'])
+    metrics.add_latencies('order', [3 * second], [5000])
+    snapshot = metrics.snapshot()
+    # Seconds 0 and 1 fell out of the window that ends in second 3
+    assert snapshot['packets'] == 1 and snapshot['packets_per_s'] == 0.5
+    assert snapshot['issues_by_type'] == {'TCP Dup ACK': 1} and snapshot['retransmission_rate'] == 0.0
+    assert snapshot['latency']['order']['count'] == 1
+    assert snapshot['totals'] == {'packets': 4, 'issues': 2}
+
+def test_follow_capture_from_a_pipe_matches_batch_analysis(tmp_path):
+    path = str(tmp_path / 'feed')
+    os.mkfifo(path)
+    data = open(DEMO, 'rb').read()
+
+    def writer():
+        with open(path, 'wb') as f:
+            for start in range(0, len(data), 4096):
+                f.write(data[start:start + 4096])
+    thread = threading.Thread(target=writer)
+    thread.start()
+    snapshots = []
+    final = main.follow_capture(path, window=3600 * 24 * 365 * 100, poll_interval=0.01, publish_interval=0,
+                                on_metrics=snapshots.append)
+    thread.join()
+    table = PacketTable.from_pcap(DEMO)
+    with AnalysisEngine(main.ANALYZERS) as engine:
+        hits = engine.feed(table)['errors']
+        sessions = engine.finish()['latency']
+    assert final is snapshots[-1] and len(snapshots) > 1
+    assert final['packets'] == final['totals']['packets'] == len(table)
+    assert final['issues'] == len(hits[0])
+    assert final['latency']['session']['count'] == len(sessions)
+    assert final['backlog_bytes'] == 0 and final['lag_s'] > 0
@@ -0,0 +1,56 @@
+import os
+import main
+from analyzer.columnar_report import load_report
+from llm.response_cache import ResponseCache
+
+DEMO = os.path.abspath('pcap_files/Demos/bogus-multi-sessions.pcap')
+
+def test_similar_issues_share_one_llm_call_and_reruns_hit_the_cache(tmp_path, monkeypatch, fake_ollama):
+    monkeypatch.chdir(tmp_path)
+    prompts = fake_ollama.prompts
+    fake_ollama.respond = lambda prompt: f'insight {len(prompts)}'
+    llm_options = {'url': fake_ollama.url}
+
+    main.generate_report(DEMO, llm_options=llm_options)
+    first = load_report(main.report_path(DEMO))
+    groups = {e['issue_group'] for e in first['errors']}
+    assert len(prompts) == len(groups) < len(first['errors'])
+    assert first['llm']['cache'] == dict(first['llm']['cache'], hits=0, misses=len(groups))
+    # Every member of a group carries its representative's insight
+    by_group = {}
+    for err in first['errors']:
+        assert by_group.setdefault(err['issue_group'], err['llm_response']) == err['llm_response']
+
+    main.generate_report(DEMO, streaming=True, batch_size=20, llm_options=llm_options)
+    second = load_report(main.report_path(DEMO))
+    assert len(prompts) == len(groups)
+    assert second['llm']['llm_calls'] == 0 and second['llm']['cache']['hits'] == len(groups)
+    assert [e['llm_response'] for e in second['errors']] == [e['llm_response'] for e in first['errors']]
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=600)
+    for i in range(3):
+        cache.put(f'prompt {i}', 'x' * 100)
+    os.utime(cache._path(cache.key('prompt 1')), (1, 1))
+    cache._entries[cache.key('prompt 1')][0] = 1
+    assert cache.get('prompt 0') is not None
+    cache.put('prompt 3', 'x' * 100)
+    # Reopening rebuilds the index from the files on disk
+    reopened = ResponseCache(str(tmp_path), max_bytes=600)
+    assert reopened.get('prompt 1') is None
+    assert [reopened.get(f'prompt {i}') for i in (0, 2, 3)] == ['x' * 100] * 3
+    assert reopened.stats()['hits'] == 3 and reopened.stats()['misses'] == 1
+
+def test_responses_are_cached_per_model(tmp_path, monkeypatch, fake_ollama):
+    monkeypatch.chdir(tmp_path)
+    phi = ResponseCache(str(tmp_path / 'cache'))
+    phi.put('prompt', 'from phi')
+    assert ResponseCache(str(tmp_path / 'cache'), model='llama3').get('prompt') is None
+    assert ResponseCache(str(tmp_path / 'cache')).get('prompt') == 'from phi'
+
+    main.generate_report(DEMO, llm_options={'url': fake_ollama.url})
+    calls = len(fake_ollama.prompts)
+    main.generate_report(DEMO, llm_options={'url': fake_ollama.url, 'model': 'llama3'})
+    assert len(fake_ollama.prompts) == 2 * calls
+    main.generate_report(DEMO, llm_options={'url': fake_ollama.url, 'model': 'llama3'})
+    assert len(fake_ollama.prompts) == 2 * calls
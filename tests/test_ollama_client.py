@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from llm.ollama_client import (AdaptiveLimiter, AsyncOllamaClient, BudgetExhausted, OllamaHTTPError, OllamaPool,
+                               RequestBudget, query_llm)
+
+def test_streaming_with_partial_text_and_bounded_concurrency(fake_ollama):
+    fake_ollama.respond = lambda prompt: f'answer to {prompt}'
+    fake_ollama.delay = 0.02
+    pool = OllamaPool(url=fake_ollama.url, max_in_flight=2)
+    partial = {}
+    try:
+        answers = pool.query_many([f'q{i}' for i in range(8)], lambda i, text: partial.setdefault(i, []).append(text))
+        again = pool.query_many(['q8'])
+    finally:
+        pool.close()
+    assert answers == [f'answer to q{i}' for i in range(8)] and again == ['answer to q8']
+    assert partial[3] == ['answer ', 'answer to ', 'answer to q3']
+    assert fake_ollama.max_active <= 2
+    # Keep-alive connections are pooled and reused across calls
+    assert pool.client.stats['connections'] <= 2
+
+def test_retries_with_backoff_then_gives_up(fake_ollama):
+    fake_ollama.failures = 2
+    client = AsyncOllamaClient(url=fake_ollama.url, retries=2, backoff=0.01)
+    assert asyncio.run(client.generate('hello')) == 'insight'
+    assert client.stats['retries'] == 2
+    fake_ollama.failures = 10
+    pool = OllamaPool(url=fake_ollama.url, retries=1, backoff=0.01)
+    [result] = pool.query_many(['hello'])
+    pool.close()
+    assert isinstance(result, OllamaHTTPError) and result.status == 503
+    fake_ollama.failures = 0
+    assert query_llm('hello', url=fake_ollama.url) == 'insight'
+
+def test_limiter_backs_off_when_latency_climbs():
+    async def run():
+        limiter = AdaptiveLimiter(initial=2, minimum=1, maximum=8)
+        for latency in [0.1] * 20:
+            await limiter.acquire()
+            await limiter.release(latency)
+        grown = limiter.limit
+        for latency in [1.0] * 5:
+            await limiter.acquire()
+            await limiter.release(latency)
+        shrunk = limiter.limit
+        await limiter.acquire()
+        await limiter.release(overloaded=True)
+        return grown, shrunk, limiter.limit
+    grown, shrunk, overloaded = asyncio.run(run())
+    assert grown > 4 and shrunk < grown / 2 and overloaded == max(1, shrunk / 2)
+
+def test_shared_budget_bounds_concurrency_and_total_requests(fake_ollama):
+    fake_ollama.delay = 0.02
+    budget = RequestBudget(max_in_flight=1, max_requests=5)
+    pools = [OllamaPool(url=fake_ollama.url, max_in_flight=4, budget=budget) for _ in range(2)]
+    try:
+        answers = pools[0].query_many(['a', 'b', 'c']) + pools[1].query_many(['d', 'e', 'f'])
+    finally:
+        for pool in pools:
+            pool.close()
+    assert answers[:5] == ['insight'] * 5 and isinstance(answers[5], BudgetExhausted)
+    assert fake_ollama.max_active == 1 and len(fake_ollama.prompts) == 5
+    assert budget.remaining == 0 and pools[1].client.stats['failures'] == 1
+
+def test_url_scheme_and_budget_slot_kept_on_limiter_failure():
+    assert AsyncOllamaClient(url='https://llm.example:8443').port == 8443
+    assert AsyncOllamaClient(url='https://llm.example').port == 443
+    assert AsyncOllamaClient(url='http://llm.example').ssl is None
+    with pytest.raises(ValueError):
+        AsyncOllamaClient(url='ftp://llm.example')
+
+    budget = RequestBudget(max_in_flight=1)
+    client = AsyncOllamaClient(budget=budget)
+
+    async def cancelled():
+        raise asyncio.CancelledError
+    client.limiter.acquire = cancelled
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(client.generate('prompt'))
+    # The slot went back, so the only one there is can be taken again
+    assert budget._slots.acquire(False)
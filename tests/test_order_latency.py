@@ -0,0 +1,45 @@
+from analyzer.engine import AnalysisEngine
+from analyzer.order_latency import OrderLatencyMatcher
+from analyzer.packet_table import PacketTable
+
+CLIENT = ('10.0.0.1', 5000, '10.0.0.2', 9000)
+SERVER = ('10.0.0.2', 9000, '10.0.0.1', 5000)
+
+def msg(index, timestamp, session, msg_type, cl_ord_id, **extra):
+    message = dict({'35': msg_type, '11': cl_ord_id}, **extra)
+    return {'packet_index': index, 'timestamp': timestamp, 'session': session, 'protocol': 'fix', 'message': message}
+
+def test_matcher_pairs_first_response_and_expires_stale_orders():
+    matcher = OrderLatencyMatcher(ttl=5.0, max_pending=2)
+    results = matcher.add([
+        msg(0, 100.0, CLIENT, 'D', 'A'),
+        msg(1, 100.5, CLIENT, 'D', 'B'),
+        msg(2, 100.0015, SERVER, '8', 'A', **{'150': '0'}),
+        msg(3, 100.002, SERVER, '8', 'A', **{'150': 'F'}),  # later fill, order already acked
+        msg(4, 101.0, SERVER, '8', 'B', **{'150': '0'}),
+        msg(5, 102.0, CLIENT, 'F', 'C'),
+        msg(6, 103.0, CLIENT, 'D', 'E'),
+        msg(7, 104.0, CLIENT, 'G', 'F'),  # evicts C once more than 2 are pending
+        msg(8, 200.0, CLIENT, 'D', 'G'),  # E and F are past the TTL by now
+    ])
+    matched = [r for r in results if r['status'] == 'matched']
+    assert [(r['cl_ord_id'], r['exec_type'], r['order_packet'], r['response_packet']) for r in matched] == \
+        [('A', '0', 0, 2), ('B', '0', 1, 4)]
+    assert round(matched[0]['latency_us']) == 1500
+    assert [(r['cl_ord_id'], r['reason']) for r in results if r['status'] == 'unmatched'] == \
+        [('C', 'evicted'), ('E', 'expired'), ('F', 'expired')]
+    assert [(r['cl_ord_id'], r['reason']) for r in matcher.finish()] == [('G', 'no_response')]
+    assert matcher.stats['unmatched_responses'] == 1
+
+def test_order_latency_on_fix_capture():
+    table = PacketTable.from_pcap('pcap_files/FIX/fix.pcap')
+    with AnalysisEngine(['order_latency']) as engine:
+        # Matches the messages of the shared reassembly, added as its source
+        assert [cls.name for cls in engine.analyzer_classes] == ['app_messages', 'order_latency']
+        records = engine.run(table)['order_latency']
+    stats = records[-1]['stats']
+    assert stats['orders'] == stats['matched'] == 51
+    assert records[-1]['histograms']['D']['count'] == 51
+    matched = records[:-1]
+    assert all(r['response_type'] == '8' and r['latency_us'] >= 0 for r in matched)
+    assert all(r['response_packet'] > r['order_packet'] for r in matched)
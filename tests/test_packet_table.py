@@ -0,0 +1,35 @@
+from analyzer.packet_table import PacketTable
+from analyzer.pcap_parser import parse_pcap
+from analyzer.error_detector import detect_errors
+from analyzer.latency_checker import calculate_latency
+
+DEMO = 'pcap_files/Demos/bogus-multi-sessions.pcap'
+
+def test_row_view_matches_packet_dicts():
+    packets = parse_pcap(DEMO)
+    table = parse_pcap(DEMO, as_table=True)
+    assert len(table) == len(packets)
+    for pkt, row in zip(packets, table):
+        for key in ('src_ip', 'dst_ip', 'src_port', 'dst_port', 'flags', 'seq', 'ack',
+                    'payload_len', 'header_len', 'checksum', 'timestamp'):
+            assert row[key] == pkt[key]
+        assert bytes(row['raw_payload']) == bytes(pkt['raw_payload'])
+
+def test_from_packets_and_slices():
+    table = PacketTable.from_packets([
+        {'src_ip': '1.1.1.1', 'src_port': 1, 'dst_ip': 'fe80::1', 'dst_port': 2, 'flags': 'PA',
+         'seq': 7, 'raw_payload': b'abc', 'payload_len': 3, 'timestamp': 1.5},
+        {'src_ip': '2.2.2.2', 'flags': 'R', 'payload_len': 0},
+        {'src_ip': '1.1.1.1', 'src_port': 1, 'dst_ip': 'fe80::1', 'dst_port': 2, 'flags': 'A',
+         'seq': 7, 'raw_payload': b'de', 'payload_len': 2, 'timestamp': 2.0},
+    ])
+    assert table[0]['dst_ip'] == 'fe80::1'
+    assert table[1]['timestamp'] is None and table[1]['checksum'] is None
+    tail = table[1:]
+    assert len(tail) == 2
+    assert bytes(tail[1]['raw_payload']) == b'de'
+    flows = table.group_flows()
+    assert list(flows.ids) == [0, 1, 0]
+    assert list(flows.counts) == [2, 1]
+    assert [i['type'] for i in detect_errors(table) if i['type'] == 'TCP Retransmission'] == ['TCP Retransmission']
+    assert calculate_latency(table) == [{'session': ('1.1.1.1', 1, 'fe80::1', 2), 'latency_ms': 500.0}]
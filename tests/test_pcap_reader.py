@@ -0,0 +1,112 @@
+import socket
+import struct
+import pytest
+from analyzer.pcap_reader import PcapFormatError, read_packets, iter_records, open_capture
+from analyzer.pcap_parser import parse_pcap
+
+def _tcp_ipv4_frame(payload, flags=0x18, vlan=None):
+    tcp = struct.pack('!HHIIBBHHH', 1234, 80, 1000, 2000, 5 << 4, flags, 65535, 0xBEEF, 0) + payload
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp), 1, 0, 64, 6, 0,
+                     socket.inet_aton('10.0.0.1'), socket.inet_aton('10.0.0.2'))
+    eth = b'\x00' * 12
+    if vlan is not None:
+        eth += struct.pack('!HH', 0x8100, vlan)
+    eth += struct.pack('!H', 0x0800)
+    # Ethernet minimum frame padding must not leak into the payload
+    return (eth + ip + tcp).ljust(60, b'\x00')
+
+def _udp_ipv6_frame(payload):
+    udp = struct.pack('!HHHH', 5000, 6000, 8 + len(payload), 0x1234) + payload
+    ip6 = struct.pack('!IHBB16s16s', 6 << 28, len(udp), 17, 64,
+                      socket.inet_pton(socket.AF_INET6, 'fe80::1'), socket.inet_pton(socket.AF_INET6, 'fe80::2'))
+    return b'\x00' * 12 + struct.pack('!H', 0x86DD) + ip6 + udp
+
+def _write_pcap(path, frames):
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        for i, frame in enumerate(frames):
+            f.write(struct.pack('<IIII', 1700000000 + i, 250000, len(frame), len(frame)))
+            f.write(frame)
+
+def _write_pcapng(path, frames):
+    def block(block_type, body):
+        body += b'\x00' * (-len(body) % 4)
+        length = 12 + len(body)
+        return struct.pack('<II', block_type, length) + body + struct.pack('<I', length)
+    with open(path, 'wb') as f:
+        f.write(block(0x0A0D0D0A, struct.pack('<IHHq', 0x1A2B3C4D, 1, 0, -1)))
+        # if_tsresol = 9 (nanoseconds)
+        f.write(block(1, struct.pack('<HHI', 1, 0, 0) + struct.pack('<HHB3x', 9, 1, 9) + struct.pack('<HH', 0, 0)))
+        for i, frame in enumerate(frames):
+            ts = 1700000000_000000123 + i
+            f.write(block(6, struct.pack('<IIIII', 0, ts >> 32, ts & 0xFFFFFFFF, len(frame), len(frame)) + frame))
+
+def test_pcap_tcp_with_vlan_and_padding(tmp_path):
+    path = tmp_path / 'vlan.pcap'
+    _write_pcap(path, [_tcp_ipv4_frame(b'', flags=0x10, vlan=1001), _tcp_ipv4_frame(b'8=FIX.4.2', flags=0x04)])
+    packets = parse_pcap(str(path))
+    assert len(packets) == 2
+    assert packets[0]['flags'] == 'A'
+    assert packets[0]['payload_len'] == 0
+    assert packets[1]['flags'] == 'R'
+    assert packets[1]['src_ip'] == '10.0.0.1' and packets[1]['dst_port'] == 80
+    assert bytes(packets[1]['raw_payload']) == b'8=FIX.4.2'
+    assert isinstance(packets[1]['raw_payload'], memoryview)
+    assert packets[1]['timestamp'] == 1700000001.25
+
+def test_pcapng_udp_ipv6_nanosecond_timestamps(tmp_path):
+    path = tmp_path / 'feed.pcapng'
+    _write_pcapng(path, [_udp_ipv6_frame(b'itch'), _tcp_ipv4_frame(b'x')])
+    packets = list(read_packets(str(path), protocols=('tcp', 'udp')))
+    assert [p['protocol'] for p in packets] == ['udp', 'tcp']
+    assert packets[0]['src_ip'] == 'fe80::1'
+    assert bytes(packets[0]['raw_payload']) == b'itch'
+    mm = open_capture(str(path))
+    timestamps = [ts for ts, _linktype, _frame, _offset in iter_records(mm)]
+    assert timestamps == [1700000000_000000123, 1700000000_000000124]
+
+def test_corrupt_pcapng_blocks_are_format_errors(tmp_path):
+    path = tmp_path / 'good.pcapng'
+    _write_pcapng(path, [_tcp_ipv4_frame(b'x')])
+    data = path.read_bytes()
+    epb = data.rindex(struct.pack('<I', 6))
+    corrupt = {
+        'interface': data[:epb + 8] + struct.pack('<I', 3) + data[epb + 12:],
+        'captured_length': data[:epb + 20] + struct.pack('<I', 4096) + data[epb + 24:],
+        'short_block': data[:epb] + struct.pack('<III', 6, 16, 0) + struct.pack('<I', 16),
+    }
+    for name, content in corrupt.items():
+        bad = tmp_path / f'{name}.pcapng'
+        bad.write_bytes(content)
+        with pytest.raises(PcapFormatError):
+            list(read_packets(str(bad)))
+        # Reported and handed to the fallback parser rather than crashing
+        parse_pcap(str(bad))
+
+def test_native_reader_matches_scapy():
+    from scapy.all import rdpcap, Raw
+    path = 'pcap_files/Demos/checksum-single-session.pcap'
+    expected = [p for p in rdpcap(path) if 'TCP' in p]
+    packets = parse_pcap(path)
+    assert len(packets) == len(expected)
+    for pkt, ref in zip(packets, expected):
+        tcp = ref['TCP']
+        assert (pkt['src_ip'], pkt['src_port'], pkt['seq'], pkt['flags'], pkt['checksum']) == \
+            (ref['IP'].src, tcp.sport, tcp.seq, str(tcp.flags), tcp.chksum)
+        assert bytes(pkt['raw_payload']) == (bytes(tcp[Raw].load) if Raw in tcp else b'')
+
+def test_sharded_parse_matches_single_process(tmp_path):
+    from analyzer.packet_table import PacketTable
+    from analyzer.pcap_parser import iter_sharded_tables
+    # pcapng shards have to carry the interface table along
+    pcapng_path = str(tmp_path / 'many.pcapng')
+    _write_pcapng(pcapng_path, [_tcp_ipv4_frame(bytes([i]) * i) for i in range(50)])
+    for path in ('pcap_files/Demos/checksum-multi-sessions.pcap', pcapng_path):
+        expected = PacketTable.from_pcap(path)
+        sharded = PacketTable.concat(iter_sharded_tables(path, workers=2, index_every=7))
+        assert (sharded.columns == expected.columns).all()
+        assert bytes(sharded.payloads) == bytes(expected.payloads)
+        assert (sharded.payload_offsets == expected.payload_offsets).all()
+    packets = parse_pcap('pcap_files/Demos/checksum-multi-sessions.pcap')
+    assert [p['seq'] for p in parse_pcap('pcap_files/Demos/checksum-multi-sessions.pcap', workers=2)] == \
+        [p['seq'] for p in packets]
@@ -0,0 +1,37 @@
+import os
+import sys
+from analyzer.columnar_report import write_report
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ui'))
+from pdf_report import create_pdf_report, render_pdf
+
+def _report(issues):
+    errors = [{'type': f'Issue {i % 3}', 'type_id': i % 3, 'packet': i, 'flow': i % 7, 'issue_group': f'g{i % 3}',
+               'llm_response': f'insight {i % 3} ' * 50,
+               'details': {'protocol': 'TCP', 'src_ip': '10.0.0.1', 'src_port': 1000 + i % 7, 'dst_ip': '10.0.0.2',
+                           'dst_port': 9000, 'flags': 'PA', 'seq': i, 'timestamp': float(i)}}
+              for i in range(issues)]
+    latencies = [{'session': ('10.0.0.1', 1000 + i, '10.0.0.2', 9000), 'latency_ms': i % 97 / 3}
+                 for i in range(issues)]
+    return {'errors': errors, 'latencies': latencies, 'total_packets': issues * 2}
+
+def test_pdf_size_does_not_grow_with_the_report(tmp_path):
+    sizes = []
+    for issues in (20, 5000):
+        progress = []
+        create_pdf_report(_report(issues), str(tmp_path / 'report.pdf'),
+                          on_progress=lambda stage, counts, partial=None: progress.append((stage, partial)))
+        sizes.append(os.path.getsize(tmp_path / 'report.pdf'))
+        assert [stage for stage, partial in progress if partial] == ['collect', 'layout']
+    assert sizes[1] < sizes[0] * 1.2
+
+def test_render_pdf_in_a_child_process(tmp_path):
+    write_report(_report(100), str(tmp_path / 'report'))
+    progress = []
+    pdf = render_pdf(str(tmp_path / 'report'), str(tmp_path / 'report.pdf'),
+                     on_progress=lambda stage, counts, partial=None: progress.append((stage, counts, partial)))
+    with open(pdf, 'rb') as f:
+        assert f.read(5) == b'%PDF-'
+    layout = [counts for stage, counts, _partial in progress if stage == 'layout' and counts]
+    assert layout and layout[-1]['flowables'] == layout[-1]['total']
+    assert progress[-1] == ('layout', {}, {'pdf': pdf})
@@ -0,0 +1,58 @@
+import pytest
+from analyzer import rules
+from analyzer.engine import AnalysisEngine
+from analyzer.error_detector import detect_errors, ErrorDetector
+from analyzer.packet_table import PacketTable
+from analyzer.rules import RuleSet, rule, rule_config
+
+DEMO = 'pcap_files/Demos/checksum-multi-sessions.pcap'
+
+PACKETS = [
+    {'src_ip': '1.1.1.1', 'src_port': 5000, 'dst_ip': '2.2.2.2', 'dst_port': 80, 'flags': 'A', 'header_len': 4,
+     'payload_len': 0, 'window': 0},
+    {'src_ip': '1.1.1.1', 'src_port': 5001, 'dst_ip': '2.2.2.2', 'dst_port': 443, 'flags': 'A', 'header_len': 5,
+     'payload_len': 10, 'window': 100},
+]
+
+def _types(config):
+    return [issue['type'] for issue in detect_errors(PACKETS, rules=config)]
+
+def test_rules_toggle_and_take_parameters():
+    assert 'Bogus TCP Payload' in _types(None)
+    assert 'Bogus TCP Payload' not in _types(rule_config(disabled=['bogus_payload']))
+    assert _types(rule_config('session_reset,zero_window')) == ['TCP Zero Window']
+    config = rule_config('bogus_header_length,zero_window',
+                         params=['bogus_header_length.min_words=6', 'zero_window.max_window=100'])
+    assert _types(config) == ['Bogus TCP Header Length', 'TCP Zero Window',
+                              'Bogus TCP Header Length', 'TCP Zero Window']
+    config = rule_config('bogus_header_length', params=['bogus_header_length.min_words=6',
+                                                        'bogus_header_length.ports=443,8443'])
+    assert [i['details']['dst_port'] for i in detect_errors(PACKETS, rules=config)] == [443]
+    with pytest.raises(ValueError):
+        RuleSet(rule_config('no_such_rule'))
+    with pytest.raises(ValueError):
+        RuleSet(rule_config(params=['zero_window.threshold=3']))
+
+def test_custom_rule_gets_hit_counts(monkeypatch):
+    monkeypatch.setattr(rules, 'RULES', dict(rules.RULES))
+
+    @rule('big_segment', 'Big Segment', fields=('payload_len',), min_bytes=5)
+    def _big_segment(cols, min_bytes):
+        return cols['payload_len'] >= min_bytes
+
+    detector = ErrorDetector(rules=rule_config('big_segment,bogus_payload'))
+    assert [i['type'] for i in detector.feed(PacketTable.from_packets(PACKETS))] == ['Bogus TCP Payload', 'Big Segment']
+    stats = detector.rules.stats()
+    assert {key: entry['hits'] for key, entry in stats['rules'].items()} == {'bogus_payload': 1, 'big_segment': 1}
+    # No sequence rule enabled, so no sequence tracking either
+    assert stats['flow_state'] == {}
+
+def test_engine_merges_rule_stats_across_workers():
+    table = PacketTable.from_pcap(DEMO)
+    expected = detect_errors(table)
+    with AnalysisEngine(['errors'], workers=2) as engine:
+        hits = engine.run(table)['errors']
+    assert len(hits[0]) == len(expected)
+    stats = hits.stats['rules']
+    assert sum(entry['hits'] for entry in stats.values()) == len(expected)
+    assert stats['retransmission']['hits'] == sum(i['type'] == 'TCP Retransmission' for i in expected)
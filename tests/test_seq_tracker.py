@@ -0,0 +1,76 @@
+from analyzer.packet_table import PacketTable
+from analyzer.seq_tracker import IntervalSet, SeqTracker
+from analyzer.error_detector import detect_errors
+
+def _segment(seq, length=0, ack=0, flags='A', window=1000, reply=False):
+    ends = [('10.0.0.1', 40000), ('10.0.0.2', 9000)]
+    (src_ip, src_port), (dst_ip, dst_port) = ends[::-1] if reply else ends
+    return {'src_ip': src_ip, 'src_port': src_port, 'dst_ip': dst_ip, 'dst_port': dst_port, 'flags': flags,
+            'seq': seq, 'ack': ack, 'window': window, 'payload_len': length, 'raw_payload': b'x' * length}
+
+def _events(tracker, packets):
+    masks = tracker.feed(PacketTable.from_packets(packets))
+    return [sorted(name for name, mask in masks.items() if mask[i]) for i in range(len(packets))]
+
+def test_interval_set_merges_splits_and_counts():
+    s = IntervalSet()
+    s.add(10, 20)
+    s.add(20, 30)
+    s.add(40, 50)
+    assert list(s) == [(10, 30), (40, 50)]
+    assert s.overlap(25, 45) == 10
+    s.remove(15, 42)
+    assert list(s) == [(10, 15), (42, 50)]
+    s.discard_below(12)
+    assert list(s) == [(12, 15), (42, 50)]
+    s.remove(42, 50)
+    assert list(s) == [(12, 15)]
+
+def test_classifies_sequence_events():
+    packets = [
+        _segment(1000, flags='S'),
+        _segment(5000, flags='SA', ack=1001, reply=True),
+        _segment(1001, 100, ack=5001),           # 1001-1101
+        _segment(1201, 100, ack=5001),           # skips 1101-1201
+        _segment(5001, ack=1101, reply=True),
+        _segment(5001, ack=1101, reply=True),    # dup ACK
+        _segment(1101, 100, ack=5001),           # fills the hole
+        _segment(1001, 100, ack=5001),           # resent, but already acked
+        _segment(5001, ack=1301, reply=True),
+        _segment(1201, 100, ack=5001),           # resent after the ack too
+        _segment(1300, ack=5001),                # keep-alive
+        _segment(5001, ack=1301, window=0, reply=True),
+    ]
+    events = _events(SeqTracker(), packets)
+    assert events == [[], [], [], [], [], ['dup_ack'], ['out_of_order'], ['spurious_retransmission'],
+                      [], ['spurious_retransmission'], ['keep_alive'], []]
+
+def test_retransmission_across_batches_and_wraparound():
+    tracker = SeqTracker()
+    start = 0xFFFFFF00
+    first = [_segment(start + i * 0x40 & 0xFFFFFFFF, 0x40) for i in range(8)]
+    assert _events(tracker, first) == [[]] * 8
+    # Resend of bytes on both sides of the wrap, not acked yet
+    again = [_segment((start + 0xE0) & 0xFFFFFFFF, 0x40), _segment(0x100, 0x40)]
+    assert _events(tracker, again) == [['retransmission'], []]
+    # Pure ACKs repeating a seq are not retransmissions any more
+    acks = [_segment(0x140, ack=1, reply=False), _segment(0x140, ack=2)]
+    assert _events(tracker, acks) == [[], []]
+
+def test_state_stays_bounded_by_holes():
+    tracker = SeqTracker(max_holes=4)
+    packets = [_segment(1000 + i * 200, 100) for i in range(50)]
+    tracker.feed(PacketTable.from_packets(packets))
+    [state] = [state for key, state in tracker.flows.items() if key[4] == 40000]
+    assert len(state.holes) == 4
+    # The receiver acking everything clears the holes
+    tracker.feed(PacketTable.from_packets([_segment(1, ack=1000 + 50 * 200, reply=True)]))
+    [state] = [state for key, state in tracker.flows.items() if key[4] == 40000]
+    assert len(state.holes) == 0
+    # Nothing of the batches is kept beyond the per-direction states
+    assert set(vars(tracker)) == {'flows', 'max_holes'}
+
+def test_detect_errors_reports_new_issue_types():
+    packets = [_segment(1, 10), _segment(1, 10), _segment(7, ack=1, reply=True, window=0)]
+    types = [i['type'] for i in detect_errors(packets)]
+    assert 'TCP Retransmission' in types and 'TCP Zero Window' in types
@@ -0,0 +1,48 @@
+import json
+import os
+import main
+from benchmarks.synth_capture import write_capture
+from analyzer.columnar_report import load_report
+from analyzer.flow_state import FlowStateStore, parse_size
+
+DEMO = os.path.abspath('pcap_files/Demos/checksum-multi-sessions.pcap')
+
+def _run(tmp_path, monkeypatch, fake_ollama, **kwargs):
+    monkeypatch.chdir(tmp_path)
+    main.generate_report(DEMO, llm_options={'url': fake_ollama.url}, **kwargs)
+    return load_report(main.report_path(DEMO, kwargs.get('report_format', 'parquet')))
+
+def test_streaming_report_matches_in_memory_report(tmp_path, monkeypatch, fake_ollama):
+    expected = _run(tmp_path, monkeypatch, fake_ollama)
+    # Tiny batches and a tiny budget force cross-batch state and disk spills
+    streamed = _run(tmp_path, monkeypatch, fake_ollama, streaming=True, max_memory='4k', batch_size=50)
+    assert streamed['total_packets'] == expected['total_packets']
+    assert [(e['type'], e['details']['seq']) for e in streamed['errors']] == \
+        [(e['type'], e['details']['seq']) for e in expected['errors']]
+    assert all(e['llm_response'] == 'insight' for e in streamed['errors'])
+    assert streamed['latencies'] == expected['latencies']
+
+def test_json_report_keeps_sections_contiguous_across_batches(tmp_path, monkeypatch, fake_ollama):
+    monkeypatch.chdir(tmp_path)
+    # 100 s of capture time, so unanswered orders expire between batches
+    stats = write_capture('synth.pcap', packets=5000, seed=2, rate=50)
+    options = dict(report_format='json', market_data=True, llm_options={'url': fake_ollama.url}, llm_cache=None)
+    path = main.generate_report('synth.pcap', streaming=True, batch_size=200, **options)
+    keys = json.load(open(path), object_pairs_hook=lambda pairs: [key for key, _value in pairs])
+    assert len(keys) == len(set(keys))
+    report = json.load(open(path))
+    reasons = [order['reason'] for order in report['unmatched_orders']]
+    assert 'expired' in reasons and len(reasons) == stats['fix_unanswered']
+    expected = json.load(open(main.generate_report('synth.pcap', output_path=str(tmp_path / 'memory.json'), **options)))
+    assert sorted(map(json.dumps, report['unmatched_orders'])) == sorted(map(json.dumps, expected['unmatched_orders']))
+    assert len(report['errors']) == len(expected['errors'])
+
+def test_flow_state_store_spills_and_reloads():
+    store = FlowStateStore(max_bytes=parse_size('1k'), size_of=lambda value: 400)
+    for i in range(10):
+        store[('flow', i)] = [i]
+    assert store.spilled_flows > 0
+    assert len(store) == 10
+    assert store[('flow', 0)] == [0]
+    assert sorted(value[0] for _key, value in store.items()) == list(range(10))
+    store.close()
@@ -0,0 +1,78 @@
+from analyzer.tcp_reassembly import TcpStream, TcpReassembler, seq_diff, _stream_size
+from analyzer.fix_decoder import FixStreamDecoder
+from analyzer.packet_table import PacketTable
+
+def fix(msg_type, seq_num):
+    body = f'35={msg_type}\x0134={seq_num}\x01'
+    head = f'8=FIX.4.2\x019={len(body)}\x01'
+    return (head + body + '10=000\x01').encode()
+
+def _types(messages):
+    return [fields['35'] for _name, fields in messages]
+
+def test_split_coalesced_and_out_of_order_segments():
+    stream = TcpStream([FixStreamDecoder()])
+    data = fix('D', 1) + fix('8', 2) + fix('8', 3)
+    base = 0xFFFFFFF0  # the stream wraps around 2**32
+    assert stream.add(base, b'', syn=True) == []
+    start = base + 1
+    cut1, cut2 = 10, len(fix('D', 1)) + 5
+    # Middle segment first, then a retransmission overlapping the head
+    assert stream.add((start + cut1) & 0xFFFFFFFF, data[cut1:cut2]) == []
+    assert _types(stream.add(start & 0xFFFFFFFF, data[:cut1 + 3])) == ['D']
+    assert _types(stream.add((start + cut2) & 0xFFFFFFFF, data[cut2:])) == ['8', '8']
+    assert stream.overlap_bytes == 3
+    assert stream.gaps == 0
+
+def test_gap_is_skipped_once_buffer_cap_is_hit():
+    stream = TcpStream([FixStreamDecoder()], max_buffer=len(fix('8', 2)) + 1)
+    first, lost, later = fix('D', 1), fix('8', 2), fix('8', 3) + fix('8', 4)
+    assert _types(stream.add(100, first)) == ['D']
+    after_gap = 100 + len(first) + len(lost)
+    assert _types(stream.add(after_gap, later)) == ['8', '8']
+    assert stream.gaps == 1 and stream.gap_bytes == len(lost)
+    assert seq_diff(stream.next_seq, after_gap) == len(later)
+
+def test_reassembler_finds_messages_split_across_packets():
+    payload = fix('D', 1) + fix('8', 2)
+    packets = [
+        {'src_ip': '10.0.0.1', 'src_port': 5000, 'dst_ip': '10.0.0.2', 'dst_port': 9000,
+         'flags': 'PA', 'seq': 1, 'raw_payload': chunk, 'payload_len': len(chunk), 'timestamp': 1.0 + i}
+        for i, chunk in enumerate([payload[:20], payload[20:50], payload[50:]])
+    ]
+    for pkt, offset in zip(packets, (0, 20, 50)):
+        pkt['seq'] += offset
+    reassembler = TcpReassembler()
+    messages = reassembler.feed(PacketTable.from_packets(packets))
+    assert [m['message']['35'] for m in messages] == ['D', '8']
+    assert messages[-1]['packet_index'] == 2
+    assert reassembler.finish()['messages'] == 2
+
+def test_data_held_behind_a_gap_is_delivered_when_the_stream_ends():
+    first, lost, later = fix('D', 1), fix('8', 2), fix('8', 3)
+
+    def segment(src_port, seq, payload, timestamp, flags='PA'):
+        return {'src_ip': '10.0.0.1', 'src_port': src_port, 'dst_ip': '10.0.0.2', 'dst_port': 9000, 'flags': flags,
+                'seq': seq, 'raw_payload': payload, 'payload_len': len(payload), 'timestamp': timestamp}
+    after_gap = 1 + len(first) + len(lost)
+    packets = [segment(5000, 1, first, 1.0), segment(5000, after_gap, later, 2.0),
+               segment(5000, after_gap + len(later), b'', 3.0, 'FA'),
+               # Never closed, flushed at the end
+               segment(5001, 1, first, 4.0), segment(5001, after_gap, later, 5.0)]
+    reassembler = TcpReassembler()
+    messages = reassembler.feed(PacketTable.from_packets(packets))
+    assert [(m['message']['34'], m['packet_index']) for m in messages] == [('1', 0), ('3', 2), ('1', 3)]
+    flushed = reassembler.flush()
+    assert [(m['message']['34'], m['packet_index'], m['timestamp']) for m in flushed] == [('3', 4, 5.0)]
+    assert flushed[0]['session'][1] == 5001
+    totals = reassembler.finish()
+    assert totals['messages'] == 4 and totals['gaps'] == 2 and totals['gap_bytes'] == 2 * len(lost)
+
+def test_stream_size_counts_the_unframed_message_bytes():
+    stream = TcpStream([FixStreamDecoder()])
+    empty = _stream_size(stream)
+    message = fix('D', 1)
+    assert stream.add(1, message[:-5]) == []
+    assert _stream_size(stream) == empty + len(message) - 5
+    assert _types(stream.add(1 + len(message) - 5, message[-5:])) == ['D']
+    assert _stream_size(stream) == empty
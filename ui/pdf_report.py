@@ -10,10 +10,65 @@ import io
 import plotly.io as pio
 import json
 import os
+import multiprocessing
+import queue
 from datetime import datetime
+from analyzer.histogram import PERCENTILES, format_ns
+from analyzer.issue_store import count_issues
+from analyzer.columnar_report import open_report, query, table_records, table_rows
 
-def create_pdf_report(report_data, output_path):
-    """Generate a PDF report from the analysis data."""
+# Examples per issue type, flows and slowest sessions in the PDF. With
+# these caps the PDF is about the same size however big the capture is.
+TOP_N = 5
+# Rows per Table flowable; ReportLab lays out a Table in one piece, so long
+# tables are cut into chunks that repeat the header
+CHUNK_ROWS = 40
+
+SUMMARY_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.aliceblue),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 14),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.lightblue),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 12),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+]
+
+LIST_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.aliceblue),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+]
+
+def chunked_tables(data, col_widths, style, chunk_rows=CHUNK_ROWS):
+    """Table flowables of at most chunk_rows rows each; data[0] is the header of every one."""
+    header, rows = data[0], data[1:]
+    tables = []
+    for start in range(0, max(1, len(rows)), chunk_rows):
+        table = Table([header] + rows[start:start + chunk_rows], colWidths=col_widths, repeatRows=1)
+        table.setStyle(TableStyle(style))
+        tables.append(table)
+    return tables
+
+def _endpoints(item):
+    return f"{item['src_ip']}:{item['src_port']} -> {item['dst_ip']}:{item['dst_port']}"
+
+def create_pdf_report(report_data, output_path, top_n=TOP_N, on_progress=None):
+    """Generate a PDF report from a report dict or a ReportReader.
+
+    The PDF holds aggregates (issue counts by type, latency percentiles)
+    and only the top_n flows, examples per issue type and slowest sessions,
+    fetched with query(); each distinct AI insight is printed once.
+    on_progress(stage, counts, partial=None) hears about the 'collect'
+    (sections) and 'layout' (flowables) stages.
+    """
+    on_progress = on_progress or (lambda stage, counts, partial=None: None)
     doc = SimpleDocTemplate(
         output_path,
         pagesize=letter,
@@ -22,7 +77,7 @@ def create_pdf_report(report_data, output_path):
         topMargin=72,
         bottomMargin=72
     )
-    
+
     styles = getSampleStyleSheet()
     title_style = ParagraphStyle(
         'CustomTitle',
@@ -31,94 +86,163 @@ def create_pdf_report(report_data, output_path):
         fontSize=24,
         spaceAfter=30
     )
-    
+    sections = 4
+
     # Container for PDF elements
     elements = []
-    
+
     # Title
     elements.append(Paragraph("Exchlytics AI Analysis Report", title_style))
     elements.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles["Normal"]))
     elements.append(Spacer(1, 20))
-    
+
     # Summary Statistics
     elements.append(Paragraph("Summary Statistics", styles["Heading2"]))
     elements.append(Spacer(1, 12))
-    
-    # Create summary table
+
+    issue_summary = report_data.get('issue_summary') or {}
+    order_latency = report_data.get('order_latency', {})
     summary_data = [
         ["Metric", "Value"],
         ["Total Packets", str(report_data.get('total_packets', 0))],
-        ["TCP Retransmissions", str(len([err for err in report_data.get('errors', []) if err['type'] == 'TCP Retransmission']))],
+        ["Issues", str(issue_summary.get('total', table_rows(report_data, 'errors')))],
+        ["TCP Retransmissions", str(count_issues(report_data, 'TCP Retransmission'))],
+        ["Latency Measurements", str(table_rows(report_data, 'latencies'))],
     ]
-    
-    # Add latency statistics if available
-    all_latencies_ms = [lat['latency_ms'] for lat in report_data.get('latencies', []) if 'latency_ms' in lat]
-    if all_latencies_ms:
-        avg_latency = sum(all_latencies_ms) / len(all_latencies_ms)
-        min_latency = min(all_latencies_ms)
-        max_latency = max(all_latencies_ms)
-        summary_data.extend([
-            ["Average Latency", f"{avg_latency:.2f} ms"],
-            ["Minimum Latency", f"{min_latency:.2f} ms"],
-            ["Maximum Latency", f"{max_latency:.2f} ms"]
-        ])
-    
-    summary_table = Table(summary_data, colWidths=[2*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.aliceblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.lightblue),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    elements.append(summary_table)
+    if order_latency:
+        summary_data.append(["Matched Orders", str(order_latency.get('matched', 0))])
+        summary_data.append(["Unmatched Orders", str(table_rows(report_data, 'unmatched_orders'))])
+    elements.extend(chunked_tables(summary_data, [2*inch, 2*inch], SUMMARY_STYLE))
     elements.append(Spacer(1, 20))
-    
-    # Error Analysis
-    if report_data.get('errors'):
+    on_progress('collect', {'sections': 1, 'total': sections})
+
+    # Error Analysis: totals per type and the busiest flows first, then a few examples of each type
+    by_type = issue_summary.get('by_type', {})
+    types = sorted(by_type, key=lambda issue_type: -by_type[issue_type]['count'])
+    if by_type:
+        elements.append(Paragraph("Issues by Type", styles["Heading2"]))
+        elements.append(Spacer(1, 12))
+        type_data = [["Issue Type", "Count", "Flows"]]
+        for issue_type in types:
+            type_data.append([issue_type, str(by_type[issue_type]['count']), str(by_type[issue_type]['flows'])])
+        elements.extend(chunked_tables(type_data, [3*inch, 1.25*inch, 1.25*inch], LIST_STYLE))
+        elements.append(Spacer(1, 20))
+    if table_rows(report_data, 'issue_flows'):
+        elements.append(Paragraph(f"Top {top_n} Flows by Issue Count", styles["Heading2"]))
+        elements.append(Spacer(1, 12))
+        flow_data = [["Flow", "Issue Type", "Count", "Per Second"]]
+        for entry in query(report_data, 'issue_flows', sort='count', descending=True, stop=top_n)[1]:
+            rate = entry['rate_per_s']
+            flow_data.append([_endpoints(entry), entry['type'], str(entry['count']),
+                              f"{rate:.1f}" if rate is not None else "-"])
+        elements.extend(chunked_tables(flow_data, [2.6*inch, 1.6*inch, 0.8*inch, 0.9*inch], LIST_STYLE))
+        elements.append(Spacer(1, 20))
+    on_progress('collect', {'sections': 2, 'total': sections})
+
+    if table_rows(report_data, 'errors'):
         elements.append(Paragraph("Error Analysis", styles["Heading2"]))
         elements.append(Spacer(1, 12))
-        
-        for i, err in enumerate(report_data['errors']):
-            elements.append(Paragraph(f"Error {i+1}: {err['type']}", styles["Heading3"]))
-            elements.append(Paragraph(f"Packet Sequence: {err['details'].get('seq', 'N/A')}", styles["Normal"]))
-            if 'llm_response' in err:
-                elements.append(Paragraph("AI Insight:", styles["Heading4"]))
-                elements.append(Paragraph(err['llm_response'], styles["Normal"]))
+        if not types:
+            # Reports without an issue summary
+            types = sorted({err['type'] for err in table_records(report_data, 'errors', ['type'])})
+        columns = ['type', 'packet', 'issue_group', 'llm_response', 'src_ip', 'src_port', 'dst_ip', 'dst_port',
+                   'seq', 'flags']
+        shown_insights = set()
+        for issue_type in types:
+            matching, examples = query(report_data, 'errors', [('type', '==', issue_type)], columns=columns,
+                                       stop=top_n)
+            if not examples:
+                continue
+            elements.append(Paragraph(f"{issue_type}: {len(examples)} of {matching} examples", styles["Heading3"]))
+            example_data = [["Packet", "Flow", "Seq", "Flags"]]
+            for err in examples:
+                example_data.append([str(err.get('packet', 'N/A')), _endpoints(err['details']),
+                                     str(err['details'].get('seq', 'N/A')), str(err['details'].get('flags', ''))])
+            elements.extend(chunked_tables(example_data, [0.9*inch, 3*inch, 1.2*inch, 0.8*inch], LIST_STYLE))
+            # Issues of a group share their insight; print it once
+            for err in examples:
+                key = err.get('issue_group', err.get('llm_response'))
+                if err.get('llm_response') and key not in shown_insights:
+                    shown_insights.add(key)
+                    elements.append(Paragraph("AI Insight:", styles["Heading4"]))
+                    elements.append(Paragraph(err['llm_response'], styles["Normal"]))
             elements.append(Spacer(1, 12))
-    
-    # Latency Analysis
-    if report_data.get('latencies'):
-        elements.append(Paragraph("Latency Analysis", styles["Heading2"]))
+    on_progress('collect', {'sections': 3, 'total': sections})
+
+    # Latency Analysis: percentiles from the report's histograms, then the slowest sessions
+    histograms = [("Session", report_data.get('session_latency')), ("Order", order_latency.get('latency'))]
+    histograms += [(f"Order {msg_type}", hist) for msg_type, hist in sorted(order_latency.get('by_msg_type', {}).items())]
+    histograms = [(label, hist) for label, hist in histograms if hist and hist['count']]
+    if histograms:
+        elements.append(Paragraph("Latency Percentiles", styles["Heading2"]))
+        elements.append(Spacer(1, 12))
+        percentile_data = [["Latency", "Count"] + [f"p{p:g}" for p in PERCENTILES] + ["Max"]]
+        for label, hist in histograms:
+            percentile_data.append([label, str(hist['count'])] + [format_ns(hist[f'p{p:g}']) for p in PERCENTILES]
+                                   + [format_ns(hist['max'])])
+        width = 4.5*inch / (len(PERCENTILES) + 2)
+        elements.extend(chunked_tables(percentile_data, [1.5*inch] + [width] * (len(PERCENTILES) + 2), LIST_STYLE))
+        elements.append(Spacer(1, 20))
+    if table_rows(report_data, 'latencies'):
+        elements.append(Paragraph(f"Top {top_n} Slowest Sessions", styles["Heading2"]))
         elements.append(Spacer(1, 12))
-        
+
         latency_data = [["Session", "Latency (ms)"]]
-        for i, lat in enumerate(report_data['latencies']):
+        for lat in query(report_data, 'latencies', sort='latency_ms', descending=True, stop=top_n)[1]:
             session_key = lat['session']
             formatted_session = f"{session_key[0]}:{session_key[1]} -> {session_key[2]}:{session_key[3]}"
             latency_data.append([formatted_session, f"{lat['latency_ms']:.2f}"])
-        
-        latency_table = Table(latency_data, colWidths=[4*inch, 2*inch])
-        latency_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.aliceblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightblue),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(latency_table)
-    
+        elements.extend(chunked_tables(latency_data, [4*inch, 2*inch], SUMMARY_STYLE))
+    on_progress('collect', {'sections': sections, 'total': sections}, {'flowables': len(elements)})
+
+    layout = {}
+    def layout_progress(kind, value):
+        if kind == 'SIZE_EST':
+            layout['total'] = value
+        elif kind == 'PROGRESS':
+            on_progress('layout', {'flowables': value, 'total': layout.get('total', value)})
+    doc.setProgressCallBack(layout_progress)
+
     # Build the PDF
-    doc.build(elements) 
\ No newline at end of file
+    doc.build(elements)
+    on_progress('layout', {}, {'pdf': output_path})
+
+def _render(report_path, output_path, top_n, messages):
+    def progress(stage, counts, partial=None):
+        messages.put(('progress', stage, counts, partial))
+    try:
+        create_pdf_report(open_report(report_path), output_path, top_n, progress)
+        messages.put(('done',))
+    except Exception as e:
+        messages.put(('error', f"{type(e).__name__}: {e}"))
+
+def render_pdf(report_path, output_path, top_n=TOP_N, on_progress=None):
+    """create_pdf_report for the report at report_path, in a child process.
+
+    Layout then neither blocks the caller nor grows its memory. The child's
+    progress reports are passed to on_progress in this process; if that
+    raises (a cancelled job, say) the child is killed. Returns output_path.
+    """
+    messages = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_render, args=(report_path, output_path, top_n, messages), daemon=True)
+    process.start()
+    try:
+        while True:
+            try:
+                message = messages.get(timeout=0.5)
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f"PDF renderer exited with code {process.exitcode}")
+                continue
+            if message[0] == 'done':
+                break
+            if message[0] == 'error':
+                raise RuntimeError(message[1])
+            if on_progress is not None:
+                on_progress(*message[1:])
+    except BaseException:
+        process.terminate()
+        raise
+    finally:
+        process.join()
+    return output_path
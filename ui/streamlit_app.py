@@ -4,15 +4,23 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import streamlit as st
 from analyzer.pcap_parser import parse_pcap
 from analyzer.error_detector import detect_errors
-from llm.ollama_client import query_llm
 import json, tempfile
 import glob
-from main import generate_report 
+import uuid
+from main import generate_report, ANALYSIS_CACHE_DIR
+from analyzer.columnar_report import ReportReader, histogram, query
+from analyzer.jobs import JobPool
+from analyzer.rules import rule_catalog
+from analyzer.issue_store import count_issues
+from analyzer.pcap_parser import load_packets
+from analyzer.capture_index import open_index
+from analyzer.histogram import LatencyHistogram, PERCENTILES, format_ns
 import pandas as pd
 import plotly.express as px
-from pdf_report import create_pdf_report
+from pdf_report import render_pdf
 import base64
 from datetime import datetime
+from functools import partial
 
 # session state for PDF generation
 if 'pdf_generated' not in st.session_state:
@@ -23,6 +31,80 @@ if 'pdf_filename' not in st.session_state:
     st.session_state.pdf_filename = None
 if 'report_data' not in st.session_state:
     st.session_state.report_data = None
+# Identifies this browser session to the shared job pool
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+    st.session_state.last_job_id = None
+if 'pdf_job_id' not in st.session_state:
+    st.session_state.pdf_job_id = None
+    st.session_state.pdf_error = None
+
+# Analyses running at once across all sessions; each session gets one of them at a time
+JOB_WORKERS = 2
+# Seconds between progress refreshes of a running analysis
+POLL_INTERVAL = 1
+
+@st.cache_resource
+def job_pool():
+    # One pool per server process, outside the script's reruns
+    return JobPool(workers=JOB_WORKERS, per_owner=1)
+
+def run_analysis(pcap_file, workers, rules, remove_after, job):
+    try:
+        # Streamed in batches, so progress and cancelling don't wait for the whole capture
+        # Indexed on the way, so issue details can show the packets around them without a reparse
+        return generate_report(pcap_file, streaming=True, workers=workers, rules=rules, index=True,
+                               cache_dir=ANALYSIS_CACHE_DIR, on_insight=job.on_insight, on_progress=job.progress)
+    finally:
+        if remove_after:
+            os.remove(pcap_file)
+
+def build_pdf(report_path, pdf_path, job):
+    # Laid out in a process of its own, the pool thread only relays progress
+    return render_pdf(report_path, pdf_path, on_progress=job.progress)
+
+# Rows of a report table rendered per page; only the page shown is read from disk
+PAGE_SIZE = 50
+
+def report_page(report, section, label, filters=None, sort=None, descending=False):
+    """Pick a page of a report table, filtered and sorted server-side.
+
+    Returns (first row, rows matching, records on the page); only the page is read from disk.
+    """
+    total, _none = query(report, section, filters, sort, stop=0)
+    pages = max(1, -(-total // PAGE_SIZE))
+    key = f"page_{section}"
+    # Narrower filters can leave the page picked before out of range
+    if st.session_state.get(key, 1) > pages:
+        st.session_state[key] = pages
+    page = st.number_input(f"{label} page (of {pages})", min_value=1, max_value=pages, value=1,
+                           key=key) if pages > 1 else 1
+    start = (page - 1) * PAGE_SIZE
+    _total, records = query(report, section, filters, sort, descending, start=start, stop=start + PAGE_SIZE)
+    return start, total, records
+
+def bar_chart(bins, title, label, scale=1, log_x=False):
+    """Plot pre-binned (low, high, count) rows, never one point per report row."""
+    frame = pd.DataFrame(bins, columns=['low', 'high', 'count'])
+    frame['x'] = frame['low'] * scale
+    st.plotly_chart(px.bar(frame, x='x', y='count', log_x=log_x, title=title, labels={'x': label, 'count': 'Count'}))
+
+def endpoint_filters(section, columns=('src_ip', 'dst_port')):
+    """Source IP / destination port inputs as query filters."""
+    filters = []
+    left, right = st.columns(2)
+    with left:
+        src_ip = st.text_input("Source IP", key=f"filter_{section}_src_ip").strip()
+    with right:
+        dst_port = st.number_input("Destination port (0 for any)", min_value=0, max_value=65535, value=0,
+                                   key=f"filter_{section}_dst_port")
+    if src_ip:
+        filters.append(('src_ip', '==', src_ip))
+    if dst_port:
+        filters.append(('dst_port', '==', dst_port))
+    return filters
 
 # --- UI Structure --- #
 st.set_page_config(
@@ -44,14 +126,31 @@ selected_demo_pcap = st.sidebar.selectbox("Select a demo PCAP File", demo_pcap_o
 
 uploaded_file = st.sidebar.file_uploader("Or upload your own PCAP file", type=['pcap'])
 
+parser_workers = st.sidebar.number_input(
+    "Parser worker processes", min_value=1, max_value=os.cpu_count() or 1, value=1,
+    help="Decode large captures in parallel shards"
+)
+
+# Detection rules: toggles plus their numeric parameters
+rule_options = {'enabled': [], 'params': {}}
+with st.sidebar.expander("Detection rules"):
+    for entry in rule_catalog():
+        if st.checkbox(entry['issue_type'], value=True, key=f"rule_{entry['key']}"):
+            rule_options['enabled'].append(entry['key'])
+            for name, default in entry['params'].items():
+                value = st.number_input(f"{entry['issue_type']}: {name}", value=default, key=f"rule_{entry['key']}_{name}")
+                rule_options['params'].setdefault(entry['key'], {})[name] = value
+    rule_ports = st.text_input("Only check ports", help="Comma separated, e.g. 9000,9001; empty for all")
+    if rule_ports.strip():
+        ports = [int(port) for port in rule_ports.replace(' ', '').split(',') if port]
+        for key in rule_options['enabled']:
+            rule_options['params'].setdefault(key, {})['ports'] = ports
+
 file_to_analyze = None
 if selected_demo_pcap != "-- Select a demo PCAP --":
     file_to_analyze = selected_demo_pcap
 elif uploaded_file:
-    # Save uploaded file to a temp file for analysis
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pcap') as tmp_file:
-        tmp_file.write(uploaded_file.getvalue())
-        file_to_analyze = tmp_file.name
+    file_to_analyze = uploaded_file.name
 
 st.sidebar.markdown("""
 ### Features
@@ -71,66 +170,132 @@ tcp_retransmissions_count = 0
 packet_loss_info = "N/A"
 order_latency_info = "N/A"
 
-report_loaded = False
-report_data = {}
-
-if st.button("Run Analysis") and file_to_analyze:
-    with st.spinner(f"Analyzing {os.path.basename(file_to_analyze)}..."):
-        try:
-            generate_report(file_to_analyze)
-            # Load the generated report
-            report_path = f"output/reports/{os.path.basename(file_to_analyze)}.json"
-            if os.path.exists(report_path):
-                with open(report_path, 'r') as f:
-                    report_data = json.load(f)
-                st.session_state.report_data = report_data  # Store in session state
-                report_loaded = True
-                st.success("Analysis complete and report loaded!")
-            else:
-                st.error("Analysis ran, but report file not found.")
-        except Exception as e:
-            st.error(f"An error occurred during analysis: {e}")
-
-elif not file_to_analyze:
+pool = job_pool()
+running = st.session_state.job_id is not None
+if st.button("Run Analysis", disabled=running) and file_to_analyze:
+    remove_after = False
+    if file_to_analyze != selected_demo_pcap:
+        # The job outlives this run of the script, so it gets its own copy of the upload
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pcap') as tmp_file:
+            tmp_file.write(uploaded_file.getvalue())
+            file_to_analyze = tmp_file.name
+        remove_after = True
+    job = pool.submit(st.session_state.session_id,
+                      partial(run_analysis, file_to_analyze, parser_workers, rule_options, remove_after),
+                      label=os.path.basename(file_to_analyze))
+    st.session_state.job_id = st.session_state.last_job_id = job.id
+    st.session_state.report_data = None
+    st.session_state.pdf_generated = False
+    st.rerun()
+elif not file_to_analyze and not running:
     st.info("Please select or upload a PCAP file to analyze.")
 
-if st.session_state.report_data:  # Use session state data instead of local variable
+STAGES = (('parse', "Packets parsed", 'packets'), ('detect', "Issues found", 'issues'),
+          ('insights', "LLM calls done", 'llm_calls'))
+
+def job_status():
+    """Progress of this session's analysis, refreshed on its own until the job ends."""
+    job = pool.get(st.session_state.job_id) if st.session_state.job_id else None
+    if job is None:
+        return
+    state = job.snapshot()
+    if state['status'] == 'done':
+        st.session_state.job_id = None
+        # Open the generated report; only the manifest is read up front
+        if state['result'] and os.path.exists(state['result']):
+            st.session_state.report_data = ReportReader(state['result'])
+        st.rerun(scope="app")
+    if state['status'] in ('failed', 'cancelled'):
+        st.session_state.job_id = None
+        st.rerun(scope="app")
+
+    if state['status'] == 'queued':
+        st.info(f"{state['label']} is waiting for a free analysis slot...")
+    else:
+        st.markdown(f"**Analyzing {state['label']}** ({state['elapsed']:.0f}s)")
+    columns = st.columns(len(STAGES))
+    for column, (stage, label, counter) in zip(columns, STAGES):
+        entry = state['stages'].get(stage, {'counts': {}, 'done': False})
+        with column:
+            st.metric(label=label + (" ✓" if entry['done'] else ""), value=entry['counts'].get(counter, 0))
+    # Results of the stages that are already finished
+    by_type = state['partial'].get('issue_summary', {}).get('by_type')
+    if by_type:
+        st.dataframe(pd.DataFrame([{'Issue': issue_type, 'Count': entry['count'], 'Flows': entry['flows']}
+                                   for issue_type, entry in by_type.items()]), hide_index=True)
+    if state['insight']:
+        group, text = state['insight']
+        st.info(f"Issue group {group}: {text}")
+    if st.button("Cancel analysis", disabled=state['cancelling']):
+        pool.cancel(job.id)
+    elif state['cancelling']:
+        st.warning("Cancelling...")
+
+if st.session_state.job_id:
+    st.fragment(run_every=POLL_INTERVAL)(job_status)()
+
+report_data = st.session_state.report_data
+report_loaded = report_data is not None
+# How this session's last analysis ended
+last = pool.get(st.session_state.last_job_id) if st.session_state.last_job_id else None
+status = last.status if last else None
+if status == 'done':
+    if report_loaded:
+        st.success("Analysis complete and report loaded!")
+    else:
+        st.error("Analysis ran, but report file not found.")
+elif status == 'failed':
+    st.error(f"An error occurred during analysis: {last.error}")
+elif status == 'cancelled':
+    st.warning("Analysis cancelled.")
+
+if report_loaded:
     st.sidebar.markdown("---")
     st.sidebar.header("📄 Generate Report")
     
-    def generate_pdf_report():
-        try:
-            os.makedirs('output/pdf_reports', exist_ok=True)
-            
-            # Generate PDF report
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            pdf_filename = f"analysis_report_{timestamp}.pdf"
-            pdf_path = os.path.join('output/pdf_reports', pdf_filename)
-            
-            with st.spinner('Generating PDF report...'):
-                create_pdf_report(st.session_state.report_data, pdf_path)
-                
-                # Read the generated PDF
-                with open(pdf_path, "rb") as f:
-                    pdf_bytes = f.read()
-                
-                # Store in session state
-                st.session_state.pdf_generated = True
-                st.session_state.pdf_bytes = pdf_bytes
-                st.session_state.pdf_filename = pdf_filename
-            
-            return True
-        except Exception as e:
-            st.error(f"Error generating PDF report: {e}")
-            st.session_state.pdf_generated = False
-            st.session_state.pdf_bytes = None
-            st.session_state.pdf_filename = None
-            return False
-
-    # Generate PDF button with callback
-    if st.sidebar.button("Generate PDF Report", key="generate_pdf"):
-        if generate_pdf_report():
-            st.sidebar.success("PDF report generated successfully!")
+    def pdf_status():
+        """Progress of the PDF being rendered, until it is ready to download."""
+        job = pool.get(st.session_state.pdf_job_id)
+        state = job.snapshot() if job else {'status': 'failed', 'error': "job was dropped"}
+        if state['status'] == 'done':
+            # Read the generated PDF
+            with open(state['result'], "rb") as f:
+                st.session_state.pdf_bytes = f.read()
+            st.session_state.pdf_generated = True
+            st.session_state.pdf_job_id = None
+            st.rerun(scope="app")
+        if state['status'] in ('failed', 'cancelled'):
+            st.session_state.pdf_job_id = None
+            st.session_state.pdf_error = state['error'] or "PDF generation was cancelled"
+            st.rerun(scope="app")
+        layout = state['stages'].get('layout', {}).get('counts', {})
+        collected = state['stages'].get('collect', {}).get('counts', {})
+        if layout:
+            st.progress(layout['flowables'] / max(1, layout['total']), text="Laying out PDF...")
+        elif collected:
+            st.progress(collected['sections'] / collected['total'] / 2, text="Collecting report sections...")
+        else:
+            st.progress(0.0, text="Waiting to generate PDF...")
+        if st.button("Cancel PDF", key="cancel_pdf"):
+            pool.cancel(job.id)
+
+    if st.sidebar.button("Generate PDF Report", key="generate_pdf", disabled=bool(st.session_state.pdf_job_id)):
+        os.makedirs('output/pdf_reports', exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        pdf_filename = f"analysis_report_{timestamp}.pdf"
+        pdf_path = os.path.join('output/pdf_reports', pdf_filename)
+        job = pool.submit(st.session_state.session_id, partial(build_pdf, report_data.path, pdf_path),
+                          label=pdf_filename)
+        st.session_state.pdf_job_id = job.id
+        st.session_state.pdf_filename = pdf_filename
+        st.session_state.pdf_generated = False
+        st.session_state.pdf_error = None
+        st.rerun()
+    if st.session_state.pdf_job_id:
+        with st.sidebar:
+            st.fragment(run_every=POLL_INTERVAL)(pdf_status)()
+    elif st.session_state.pdf_error:
+        st.sidebar.error(f"Error generating PDF report: {st.session_state.pdf_error}")
     #if generated, show download button
     if st.session_state.pdf_generated and st.session_state.pdf_bytes:
         st.sidebar.download_button(
@@ -143,18 +308,16 @@ if st.session_state.report_data:  # Use session state data instead of local vari
 
 if report_loaded:
     total_packets = report_data.get('total_packets', 0)
-    tcp_retransmissions_count = len([err for err in report_data.get('errors', []) if err['type'] == 'TCP Retransmission'])
+    tcp_retransmissions_count = count_issues(report_data, 'TCP Retransmission')
     
     # Basic Packet Loss indication (can be refined with more sophisticated logic)
     packet_loss_info = f"{tcp_retransmissions_count} retransmissions detected (indicates potential loss)" if tcp_retransmissions_count > 0 else "No retransmissions detected"
 
-    # Order Latency Display Refinement
-    all_latencies_ms = [lat['latency_ms'] for lat in report_data.get('latencies', []) if 'latency_ms' in lat]
-    if all_latencies_ms:
-        avg_latency = sum(all_latencies_ms) / len(all_latencies_ms)
-        min_latency = min(all_latencies_ms)
-        max_latency = max(all_latencies_ms)
-        order_latency_info = f"Avg: {avg_latency:.2f}ms, Min: {min_latency:.2f}ms, Max: {max_latency:.2f}ms"
+    # Order-to-execution latency from ClOrdID matching (per FIX MsgType)
+    order_latency = report_data.get('order_latency', {})
+    latency_hist = order_latency.get('latency')
+    if latency_hist:
+        order_latency_info = ", ".join(f"p{p:g}: {format_ns(latency_hist[f'p{p:g}'])}" for p in PERCENTILES)
     else:
         order_latency_info = "N/A"
 
@@ -171,62 +334,160 @@ if report_loaded:
             st.markdown(f"{packet_loss_info}")
 
     st.markdown("**Order Latency:**")
-    if all_latencies_ms:
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric(label="Average Latency", value=f"{avg_latency:.2f} ms")
-        with col2:
-            st.metric(label="Minimum Latency", value=f"{min_latency:.2f} ms")
-        with col3:
-            st.metric(label="Maximum Latency", value=f"{max_latency:.2f} ms")
+    if latency_hist:
+        # Tail percentiles come straight from the serialized histogram
+        columns = st.columns(len(PERCENTILES) + 1)
+        for column, p in zip(columns, PERCENTILES):
+            with column:
+                st.metric(label=f"p{p:g}", value=format_ns(latency_hist[f'p{p:g}']))
+        with columns[-1]:
+            st.metric(label="Max", value=format_ns(latency_hist['max']))
+        per_type = pd.DataFrame([
+            dict({'MsgType': msg_type, 'Orders': hist['count']},
+                 **{f"p{p:g}": format_ns(hist[f'p{p:g}']) for p in PERCENTILES}, Max=format_ns(hist['max']))
+            for msg_type, hist in sorted(order_latency.get('by_msg_type', {}).items())
+        ])
+        st.dataframe(per_type, hide_index=True)
+        unmatched = report_data.rows('unmatched_orders')
+        st.markdown(f"{order_latency.get('matched', 0)} orders matched to a response, {unmatched} unmatched")
     else:
         st.info("No order latency data available.")
 
     st.header("📈 Visual Insights")
 
     # Error Type Distribution
-    errors_df = pd.DataFrame(report_data.get('errors', []))
-    if not errors_df.empty:
-        error_counts = errors_df['type'].value_counts().reset_index()
-        error_counts.columns = ['Error Type', 'Count']
+    issue_summary = report_data.get('issue_summary') or {}
+    error_counts = pd.DataFrame([{'Error Type': issue_type, 'Count': entry['count']}
+                                 for issue_type, entry in issue_summary.get('by_type', {}).items()])
+    if not error_counts.empty:
         fig_errors = px.bar(error_counts, x='Error Type', y='Count', title='Distribution of Detected Error Types')
         st.plotly_chart(fig_errors)
 
     # Latency Distribution
-    latencies_df = pd.DataFrame(report_data.get('latencies', []))
-    if not latencies_df.empty:
-        fig_latency = px.histogram(latencies_df, x='latency_ms', nbins=10, title='Latency Distribution (ms)', labels={'latency_ms': 'Latency (ms)'})
-        st.plotly_chart(fig_latency)
+    for title, hist in (("Order Latency Distribution", latency_hist),
+                        ("Session Latency Distribution", report_data.get('session_latency'))):
+        if hist and hist['count']:
+            bar_chart(LatencyHistogram.from_dict(hist).buckets(), title, "Latency (ms)", scale=1e-6, log_x=True)
+
+    rule_stats = report_data.get('rules', {}).get('rules', {})
+    if rule_stats:
+        st.markdown("**Detection rules:**")
+        st.dataframe(pd.DataFrame([
+            {'Rule': entry['issue_type'], 'Hits': entry['hits'], 'Time (ms)': round(entry['seconds'] * 1e3, 2)}
+            for entry in rule_stats.values()
+        ]), hide_index=True)
+
+    stages = (report_data.get('instrumentation') or {}).get('stages', {})
+    if stages:
+        st.markdown("**Analysis stages:**")
+        st.dataframe(pd.DataFrame([
+            {'Stage': name, 'Wall (s)': round(entry['wall_seconds'], 3), 'CPU (s)': round(entry['cpu_seconds'], 3),
+             'Peak RSS (MB)': round(entry['peak_rss_bytes'] / 2**20, 1)}
+            for name, entry in stages.items()
+        ]), hide_index=True)
 
     st.header("📊 Detected Issues")
-    if report_data.get('errors'):
-        for i, err in enumerate(report_data['errors']):
-            with st.expander(f"Error {i+1}: {err['type']} - Packet {err['details'].get('seq', 'N/A')}"):
-                st.json(err['details'])
-                if 'llm_response' in err:
-                    st.subheader("AI Insight")
-                    st.write(err['llm_response'])
+    issue_types = sorted(issue_summary.get('by_type', {}))
+    shown_types = st.multiselect("Issue types", issue_types, default=issue_types, key="filter_issue_types")
+    issue_filters = [('type', 'in', shown_types)] + endpoint_filters('errors')
+    if report_data.rows('issue_flows'):
+        # Aggregates cover every issue; the examples below are capped per type
+        _start, flow_count, by_flow = report_page(report_data, 'issue_flows', "Flows", issue_filters,
+                                                  sort='count', descending=True)
+        st.dataframe(pd.DataFrame([
+            {'Flow': "{src_ip}:{src_port} -> {dst_ip}:{dst_port}".format(**entry),
+             'Issue': entry['type'], 'Count': entry['count'],
+             'First Seen': entry['first_seen'], 'Last Seen': entry['last_seen'], 'Per Second': entry['rate_per_s']}
+            for entry in by_flow
+        ]), hide_index=True)
+        st.markdown(f"{issue_summary['total']} issues in total over {flow_count} matching flow/type pairs, "
+                    f"at most {issue_summary['max_examples']} examples kept per type")
+    capture = report_data.get('capture', {})
+    if report_data.rows('errors'):
+        sorts = {"Packet": 'packet', "Time": 'timestamp', "Payload size": 'payload_len', "Issue type": 'type'}
+        sort_by = st.selectbox("Sort issues by", list(sorts), key="sort_errors")
+        timeline = histogram(report_data, 'errors', 'timestamp', filters=issue_filters)
+        if timeline:
+            bar_chart(timeline, "Issue Examples Over Time", "Capture time (s)")
+        start, matching, errors = report_page(report_data, 'errors', "Issues", issue_filters, sorts[sort_by])
+        st.markdown(f"{matching} matching issue examples")
+        st.dataframe(pd.DataFrame([
+            {'#': i + 1, 'Packet': err.get('packet'), 'Issue': err['type'],
+             'Source': f"{err['details'].get('src_ip')}:{err['details'].get('src_port')}",
+             'Destination': f"{err['details'].get('dst_ip')}:{err['details'].get('dst_port')}",
+             'Flags': err['details'].get('flags'), 'Seq': err['details'].get('seq'),
+             'Payload': err['details'].get('payload_len')}
+            for i, err in enumerate(errors, start)
+        ]), hide_index=True)
+        # Full details of one issue of the page at a time
+        picked = st.selectbox("Issue details", range(len(errors)), key="issue_detail",
+                              format_func=lambda k: f"#{start + k + 1}: {errors[k]['type']} - Packet "
+                                                    f"{errors[k].get('packet', errors[k]['details'].get('seq', 'N/A'))}")
+        if picked is not None and picked < len(errors):
+            err = errors[picked]
+            st.json(err['details'])
+            available = os.path.exists(capture.get('path', ''))
+            index = open_index(capture['path'], capture['protocols']) if available else None
+            if 'packet' in err and st.button("Load payload", key=f"payload_{start + picked}"):
+                # Payloads are not stored in the report, read them back from the capture
+                if index is not None:
+                    found = index.query(packets=[err['packet']])
+                    packet = found[0] if found else None
+                    st.code(packet['raw_payload'].hex() if packet else "Packet not found in the capture")
+                elif available:
+                    packet = load_packets(capture['path'], [err['packet']], capture['protocols']).get(err['packet'])
+                    st.code(packet['raw_payload'].hex() if packet else "Packet not found in the capture")
                 else:
-                    st.info("No AI insight available for this error.")
+                    st.info("The capture is no longer available.")
+            if index is not None:
+                details = err['details']
+                around = None
+                if 'packet' in err and st.button("Packets around this issue", key=f"around_{start + picked}"):
+                    around = index.query(packets=range(max(0, err['packet'] - 10), err['packet'] + 11))
+                if details.get('timestamp') is not None and st.button("Session packets near this issue",
+                                                                      key=f"session_{start + picked}"):
+                    flow = (details['src_ip'], details['src_port'], details['dst_ip'], details['dst_port'])
+                    around = index.query(flow=flow, start=details['timestamp'] - 1, end=details['timestamp'] + 1,
+                                         limit=500)
+                if around is not None:
+                    st.dataframe(pd.DataFrame([
+                        {'Packet': p['packet'], 'Time': p['timestamp'],
+                         'Source': f"{p['src_ip']}:{p['src_port']}", 'Destination': f"{p['dst_ip']}:{p['dst_port']}",
+                         'Flags': p.get('flags'), 'Seq': p.get('seq'), 'Ack': p.get('ack'),
+                         'Payload': p['payload_len'], 'Issue': '◀' if p['packet'] == err.get('packet') else ''}
+                        for p in around
+                    ]), hide_index=True)
+            if err.get('llm_response'):
+                st.subheader("AI Insight")
+                st.write(err['llm_response'])
+            else:
+                st.info("No AI insight available for this error.")
     else:
         st.info("No issues detected in this PCAP.")
 
     st.header("⏱️ Latency Analysis")
-    if report_data.get('latencies'):
-        for i, lat in enumerate(report_data['latencies']):
-            with st.container(border=True):
-                session_key = lat['session']
-                
-                formatted_session = f"{session_key[0]}:{session_key[1]} -> {session_key[2]}:{session_key[3]}"
-                st.markdown(f"**Session {i+1}:** {formatted_session}")
-                st.markdown(f"**Latency:** {lat['latency_ms']:.2f} ms")
+    if report_data.rows('latencies'):
+        latency_filters = endpoint_filters('latencies')
+        min_latency = st.number_input("Minimum latency (ms)", min_value=0.0, value=0.0, key="filter_min_latency")
+        if min_latency:
+            latency_filters.append(('latency_ms', '>=', min_latency))
+        orders = {"Capture order": (None, False), "Slowest first": ('latency_ms', True),
+                  "Fastest first": ('latency_ms', False)}
+        sort, descending = orders[st.selectbox("Sort sessions by", list(orders), key="sort_latencies")]
+        distribution = histogram(report_data, 'latencies', 'latency_ms', filters=latency_filters, log=True)
+        if distribution:
+            bar_chart(distribution, "Matching Session Latencies", "Latency (ms)", log_x=True)
+        start, matching, latencies = report_page(report_data, 'latencies', "Latencies", latency_filters,
+                                                 sort, descending)
+        st.markdown(f"{matching} matching latency measurements")
+        st.dataframe(pd.DataFrame([
+            {'#': i + 1, 'Session': "{}:{} -> {}:{}".format(*lat['session']),
+             'Latency (ms)': round(lat['latency_ms'], 2)}
+            for i, lat in enumerate(latencies, start)
+        ]), hide_index=True)
     else:
         st.info("No latency data available.")
 
-# Clean up temp file if it was created
-if uploaded_file and file_to_analyze and os.path.exists(file_to_analyze) and file_to_analyze.startswith(tempfile.gettempdir()):
-    os.remove(file_to_analyze)
-
 # Footer
 st.markdown("---")
 st.markdown("""